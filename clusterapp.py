@@ -33,6 +33,25 @@ def cli():
     pass
 
 
+@cli.command('migrate-weblogger-meta')
+def migrate_weblogger_meta():
+    """Moves task metadata stored by older versions into redis hashes"""
+    from clustermgr.extensions import wlogger
+    print "Migrated {} weblogger metadata keys".format(wlogger.migrate_meta())
+
+
+@cli.command('worker-options')
+def worker_options():
+    """Prints the celery multi arguments starting a worker per queue"""
+    concurrency = app.config['QUEUE_CONCURRENCY']
+    queues = sorted(concurrency)
+    options = list(queues)
+    for queue in queues:
+        options += ['-Q:{}'.format(queue), queue,
+                    '-c:{}'.format(queue), str(concurrency[queue])]
+    print ' '.join(options)
+
+
 def run_celerybeat():
     """Function that starts the scheduled tasks in celery using celery.beat"""
     runner = beat.beat(app=celery)
@@ -1,15 +1,18 @@
 # -*- coding: utf-8 -*-
 import os
-import re
 
 from flask import Flask
 from flask import url_for
 from flask import request
+from celery.signals import task_postrun
 
-from clustermgr.extensions import db, csrf, migrate, wlogger, \
+from clustermgr.extensions import db, csrf, migrate, wlogger, redis_client, \
     login_manager, mailer
 from .core.license import license_manager
-from clustermgr.models import AppConfiguration
+from clustermgr.core.config_cache import get_app_config
+from clustermgr.core.assets import AssetManifest
+from clustermgr.core import profiling
+from clustermgr.core.task_locks import locked_task, LockTimeout
 from . import __version__
 
 
@@ -19,13 +22,61 @@ def init_celery(app, celery):
 
     class ContextTask(TaskBase):
         abstract = True
+        # function returning the hostnames the task reconfigures, and
+        # whether a run is skipped while the previous one is going, see
+        # clustermgr.core.task_locks
+        locked_hosts = None
+        skip_if_running = False
 
         def __call__(self, *args, **kwargs):
-            with app.app_context():
+            with app.app_context(), self.__profile():
+                try:
+                    with self.__locks(args, kwargs) as free:
+                        if not free:
+                            return
+                        return self.__run(*args, **kwargs)
+                except LockTimeout as e:
+                    wlogger.log(self.request.id,
+                                "Server {} is being reconfigured by task {}, "
+                                "try again later".format(
+                                    e.name[len('host:'):], e.holder), 'error')
+                    return False
+
+        def __run(self, *args, **kwargs):
+            if not app.config.get('WEBLOGGER_BUFFERED'):
                 return TaskBase.__call__(self, *args, **kwargs)
+            # batch the task's log writes, remaining messages are
+            # flushed when the task returns or raises
+            with wlogger.buffered(self.request.id):
+                return TaskBase.__call__(self, *args, **kwargs)
+
+        def __locks(self, args, kwargs):
+            def waiting(hostname, holder):
+                wlogger.log(self.request.id,
+                            "Waiting for task {} to finish with {}".format(
+                                holder, hostname), 'warning')
+
+            return locked_task(self, args, kwargs,
+                               wait=app.config.get('HOST_LOCK_WAIT', 0),
+                               on_wait=waiting)
+
+        def __profile(self):
+            # remote operations of the task are timed and stored with its id
+            task_id = self.request.id if app.config.get('TASK_PROFILING') \
+                else None
+            return profiling.profile(
+                task_id, self.name,
+                min_duration=app.config.get('TASK_PROFILE_MIN_DURATION', 0),
+                keep=app.config.get('TASK_PROFILE_KEEP', 200))
 
     celery.Task = ContextTask
 
+    @task_postrun.connect(weak=False)
+    def publish_task_state(task_id=None, **kwargs):
+        # the result is stored by now, let the log streams pick it up
+        if task_id:
+            wlogger.publish(task_id, 'state')
+
 
 def create_app():
     app = Flask(__name__)
@@ -51,6 +102,7 @@ def create_app():
     migrate.init_app(app, db, directory=os.path.join(os.path.dirname(__file__),
                                                      "migrations"))
     wlogger.init_app(app)
+    redis_client.init_app(app)
     license_manager.init_app(app, "license.index")
     login_manager.init_app(app)
     mailer.init_app(app)
@@ -103,19 +155,14 @@ def create_app():
 
 
 
+    # hashed builds of the static files are looked up once, not per render
+    asset_manifest = AssetManifest(os.path.join(app.root_path, 'static'))
+    if app.config.get("ASSET_MANIFEST_WATCH", app.debug):
+        asset_manifest.watch()
+
     @app.context_processor
     def hash_processor():
-        def hashed_url(filepath):
-            directory, filename = filepath.rsplit('/')
-            name, extension = filename.rsplit(".")
-            folder = os.path.join(app.root_path, 'static', directory)
-            files = os.listdir(folder)
-            for f in files:
-                regex = name + "\.[a-z0-9]+\." + extension
-                if re.match(regex, f):
-                    return os.path.join('/static', directory, f)
-            return os.path.join('/static', filepath)
-        return dict(hashed_url=hashed_url)
+        return dict(hashed_url=asset_manifest.url)
 
     def url_for_next_page(page):
         args = {k: v for k, v in request.values.iteritems()}
@@ -151,7 +198,7 @@ def create_app():
 
     @app.before_request
     def before_request():
-        appconfig = AppConfiguration.query.first()
+        appconfig = get_app_config()
 
         use_ldap_cache = False
 
@@ -14,6 +14,18 @@ class Config(object):
     REDIS_HOST = 'localhost'
     REDIS_PORT = 6379
     REDIS_LOG_DB = 0
+    WEBLOGGER_BUFFERED = True
+    WEBLOGGER_BUFFER_SIZE = 50
+    WEBLOGGER_FLUSH_INTERVAL = 1.0
+    # the logger pages follow a task log over a stream that is held open
+    # until the task ends, which needs an async web worker (gunicorn -k
+    # gevent, see clustermgr-cli). Set to False when serving with sync
+    # workers, the pages then poll the log.
+    TASK_LOG_STREAM = True
+    # seconds the log of a finished task is kept for paging through it
+    WEBLOGGER_KEEP_FINISHED = 3600
+    # messages per page of the task log pages
+    LOG_PAGE_SIZE = 100
     OX11_PORT = '8190'
     DATA_DIR = os.environ.get(
         "DATA_DIR",
@@ -30,6 +42,8 @@ class Config(object):
     
     
     LOG_FILE = os.path.join(LOGS_DIR, 'clustermgr.log')
+    WEBLOGGER_MAX_MESSAGES = 2000
+    WEBLOGGER_SPILL_DIR = os.path.join(LOGS_DIR, 'tasks')
     JAVALIBS_DIR = os.path.join(DATA_DIR, "javalibs")
     APP_INSTANCE_DIR = os.path.join(DATA_DIR, "instance")
     SCHEMA_DIR = os.path.join(DATA_DIR, "schema")
@@ -37,6 +51,8 @@ class Config(object):
     CERTS_DIR = os.path.join(DATA_DIR, "certs")
     JKS_PATH = os.path.join(CERTS_DIR, "oxauth-keys.jks")
     LDIF_DIR = os.path.join(DATA_DIR, "ldif")
+    LDIF_IMPORT_WORKERS = 4
+    LDIF_IMPORT_BATCH_SIZE = 500
     GLUU_REPO = os.path.join(DATA_DIR, "gluu_repo")
 
     LICENSE_CONFIG_FILE = os.path.join(DATA_DIR, "license.ini")
@@ -47,6 +63,68 @@ class Config(object):
     AUTH_CONFIG_FILE = os.path.join(DATA_DIR, "auth.ini")
     OXD_CLIENT_CONFIG_FILE = os.path.join(DATA_DIR, "oxd-client.ini")
 
+    # long running deployments, periodic monitoring tasks and the short
+    # tasks the pages wait for are consumed by separate workers, so
+    # deployments don't hold up monitoring. Tasks which are not routed go
+    # to the interactive queue.
+    CELERY_DEFAULT_QUEUE = 'interactive'
+    CELERY_QUEUES = {
+        'deploy': {'exchange': 'deploy', 'routing_key': 'deploy'},
+        'monitoring': {'exchange': 'monitoring', 'routing_key': 'monitoring'},
+        'interactive': {'exchange': 'interactive',
+                        'routing_key': 'interactive'},
+    }
+    CELERY_ROUTES = dict(
+        [(t, {'queue': 'deploy'}) for t in (
+            'clustermgr.tasks.cluster.installGluuServer',
+            'clustermgr.tasks.cluster.install_gluu_cluster',
+            'clustermgr.tasks.cluster.opendjenablereplication',
+            'clustermgr.tasks.cluster.opendj_disable_replication_task',
+            'clustermgr.tasks.cluster.remove_server_from_cluster',
+            'clustermgr.tasks.cluster.installNGINX',
+            'clustermgr.tasks.cluster.setup_filesystem_replication',
+            'clustermgr.tasks.cluster.update_filesystem_replication_paths',
+            'clustermgr.tasks.cluster.remove_filesystem_replication',
+            'clustermgr.tasks.cluster.register_objectclass',
+            'clustermgr.tasks.cluster.update_httpd_certs_task',
+            'clustermgr.tasks.cluster.upgrade_clustermgr_task',
+            'clustermgr.tasks.cache.install_cache_cluster',
+            'clustermgr.tasks.wizard.wizard_step1',
+            'clustermgr.tasks.wizard.wizard_step2',
+            'clustermgr.tasks.monitoring.install_local',
+            'clustermgr.tasks.monitoring.install_monitoring',
+            'clustermgr.tasks.monitoring.remove_monitoring',
+            'clustermgr.tasks.log.setup_filebeat',
+            'clustermgr.tasks.log.remove_filebeat',
+            'clustermgr.tasks.ldif_transfer.import_ldif',
+            'clustermgr.tasks.ldif_transfer.export_ldif_task',
+            'clustermgr.tasks.keyrotation.rotate_keys',
+        )] +
+        [(t, {'queue': 'monitoring'}) for t in (
+            'clustermgr.tasks.get_remote_stats.get_remote_stats',
+            'clustermgr.tasks.get_remote_stats.probe_replication_lag',
+            'clustermgr.tasks.get_remote_stats.probe_ldap_health',
+            'clustermgr.tasks.get_remote_stats.check_service_health',
+            'clustermgr.tasks.get_remote_stats.check_config_drift',
+            'clustermgr.tasks.cluster.poll_replication_status',
+            'clustermgr.tasks.cluster.check_latest_version',
+            'clustermgr.tasks.keyrotation.schedule_key_rotation',
+            'clustermgr.tasks.license.send_reminder_email',
+        )]
+    )
+    # worker processes per queue, see `clusterapp.py worker-options`
+    QUEUE_CONCURRENCY = {'deploy': 4, 'monitoring': 4, 'interactive': 4}
+    # a worker process reserves one task at a time, so short tasks are not
+    # queued behind a long one in the same process
+    CELERYD_PREFETCH_MULTIPLIER = 1
+
+    # seconds a task waits for the servers reconfigured by another task
+    HOST_LOCK_WAIT = 600
+    # seconds after which the task locks of a dead worker expire
+    TASK_LOCK_TIMEOUT = 300
+
+    # runs of the monitoring tasks which could not start before the next
+    # one is due are dropped
     CELERYBEAT_SCHEDULE = {
 
         'send_reminder_email': {
@@ -65,8 +143,44 @@ class Config(object):
             'task': 'clustermgr.tasks.get_remote_stats.get_remote_stats',
             'schedule': timedelta(seconds=60 * 5),
             'args': (),
+            'options': {'expires': 60 * 5},
+        },
+
+
+        'poll_replication_status': {
+            'task': 'clustermgr.tasks.cluster.poll_replication_status',
+            'schedule': timedelta(seconds=60),
+            'args': (),
+            'options': {'expires': 60},
+        },
+
+        'probe_ldap_health': {
+            'task': 'clustermgr.tasks.get_remote_stats.probe_ldap_health',
+            'schedule': timedelta(seconds=30),
+            'args': (),
+            'options': {'expires': 30},
+        },
+
+        'check_service_health': {
+            'task': 'clustermgr.tasks.get_remote_stats.check_service_health',
+            'schedule': timedelta(seconds=30),
+            'args': (),
+            'options': {'expires': 30},
         },
 
+        'check_config_drift': {
+            'task': 'clustermgr.tasks.get_remote_stats.check_config_drift',
+            'schedule': timedelta(seconds=60),
+            'args': (),
+            'options': {'expires': 60},
+        },
+
+        'probe_replication_lag': {
+            'task': 'clustermgr.tasks.get_remote_stats.probe_replication_lag',
+            'schedule': timedelta(seconds=60),
+            'args': (),
+            'options': {'expires': 60},
+        },
 
         'check_latest_version': {
             'task': 'clustermgr.tasks.cluster.check_latest_version',
@@ -89,6 +203,39 @@ class Config(object):
 
     INFLUXDB_LOGGING_DB = "gluu_logs"
 
+    # seconds a replication lag probe waits for its marker on other servers
+    REPLICATION_LAG_TIMEOUT = 30
+
+    # seconds an ldap health check waits for a server to answer
+    LDAP_HEALTH_TIMEOUT = 5
+
+    # seconds a service health check waits for a service to answer
+    SERVICE_HEALTH_TIMEOUT = 10
+
+    # servers installed at once by a cluster installation
+    CLUSTER_INSTALL_PARALLELISM = 5
+
+    # seconds a step of a deployment may run before the deployment fails
+    DEPLOYMENT_STEP_TIMEOUT = 7200
+
+    # keep the app configuration and servers in memory between requests
+    CONFIG_CACHE_ENABLED = True
+
+    # time the remote operations of celery tasks, profiles of tasks shorter
+    # than TASK_PROFILE_MIN_DURATION seconds are not stored
+    TASK_PROFILING = True
+    TASK_PROFILE_MIN_DURATION = 30
+    TASK_PROFILE_KEEP = 200
+
+    # seconds the facts gathered from the servers are kept, see
+    # clustermgr.core.host_facts
+    HOST_FACT_TTLS = {
+        'os_type': 60 * 60 * 24 * 7,
+        'gluu_versions': 60 * 60,
+        'oxauth_versions': 60 * 60,
+        'gluu_installed': 60 * 60,
+    }
+
     SUPPORTED_OS = ['CentOS 7', 'RHEL 7', 'Ubuntu 16']
 
 
@@ -111,3 +258,4 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite://'
     LICENSE_ENFORCEMENT_ENABLED = False
     INFLUXDB_LOGGING_DB = "gluu_logs_test"
+    CONFIG_CACHE_ENABLED = False
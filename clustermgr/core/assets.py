@@ -0,0 +1,101 @@
+"""assets.py - manifest of the hashed static files built by webpack.
+"""
+import os
+import re
+import time
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# name.<hash>.extension, as written by webpack's [name].[chunkhash] pattern
+HASHED_NAME = re.compile(r'^(?P<name>.+)\.[a-z0-9]+\.(?P<ext>[^.]+)$')
+
+
+class AssetManifest(object):
+    """Maps the paths of static files to the paths of their hashed builds,
+    e.g. build/main.js to /static/build/main.3e1f2a.js.
+
+    The static folder is scanned once, lookups are dictionary lookups. If
+    a file has several hashed builds the newest one is used. With watch()
+    the manifest is rebuilt when the static folder changes, which is meant
+    for development.
+
+    Args:
+        static_folder (string): absolute path of the static folder
+        url_prefix (string): url path the static folder is served at
+    """
+    def __init__(self, static_folder, url_prefix='/static'):
+        self.static_folder = static_folder
+        self.url_prefix = url_prefix
+        self._manifest = {}
+        self._stamp = None
+        self._watcher = None
+        self.build()
+
+    def __scan(self):
+        # path of the unhashed name -> (mtime, hashed path)
+        found = {}
+        for root, dirs, files in os.walk(self.static_folder):
+            directory = os.path.relpath(root, self.static_folder)
+            for f in files:
+                m = HASHED_NAME.match(f)
+                if not m:
+                    continue
+                name = '{}.{}'.format(m.group('name'), m.group('ext'))
+                path = name if directory == '.' else \
+                    '/'.join([directory.replace(os.sep, '/'), name])
+                hashed = path[:-len(name)] + f
+                mtime = os.path.getmtime(os.path.join(root, f))
+                if path not in found or found[path][0] < mtime:
+                    found[path] = (mtime, hashed)
+        return found
+
+    def __directory_stamp(self):
+        # adding or removing files changes the mtime of their directory
+        stamp = []
+        for root, dirs, files in os.walk(self.static_folder):
+            stamp.append((root, os.path.getmtime(root)))
+        return stamp
+
+    def build(self):
+        """Scans the static folder and replaces the manifest"""
+        self._stamp = self.__directory_stamp()
+        self._manifest = dict(
+            (path, '/'.join([self.url_prefix, hashed]))
+            for path, (mtime, hashed) in self.__scan().items())
+        logger.debug("Asset manifest built with %d files", len(self._manifest))
+
+    def url(self, filepath):
+        """Returns the url of the hashed build of filepath, or of filepath
+        itself if there is no hashed build
+
+        Args:
+            filepath (string): path relative to the static folder
+        """
+        return self._manifest.get(filepath) or \
+            '/'.join([self.url_prefix, filepath])
+
+    def watch(self, interval=1):
+        """Rebuilds the manifest in a background thread whenever a file is
+        added to or removed from the static folder
+
+        Args:
+            interval (int): seconds between two checks of the folder
+        """
+        if self._watcher:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    if self.__directory_stamp() != self._stamp:
+                        self.build()
+                except OSError as e:
+                    logger.debug("Checking static folder failed: %s", e)
+
+        self._watcher = threading.Thread(target=run)
+        self._watcher.daemon = True
+        self._watcher.start()
@@ -5,6 +5,7 @@ import argparse
 
 from clustermgr.core.remote import RemoteClient
 from clustermgr.core.clustermgr_installer import Installer
+from clustermgr.core.ldap_functions import paged_search, search_first
 
 
 from ldap3 import Server, Connection, SUBTREE, BASE, LEVEL, \
@@ -120,23 +121,19 @@ class ChangeGluuHostname:
 
         return True
     def get_appliance_inum(self):
-        self.conn.search(search_base='ou=appliances,o=gluu',
-                    search_filter='(objectclass=*)',
-                    search_scope=SUBTREE, attributes=['inum'])
-
-        for r in self.conn.response:
-            if r['attributes']['inum']:
-                return r['attributes']['inum'][0]
+        r = search_first(self.conn, 'ou=appliances,o=gluu',
+                         '(&(objectclass=gluuAppliance)(inum=*))',
+                         attributes=['inum'], search_scope=LEVEL)
+        if r:
+            return r['attributes']['inum'][0]
 
 
     def get_base_inum(self):
-        self.conn.search(search_base='o=gluu',
-                search_filter='(objectclass=gluuOrganization)',
-                search_scope=SUBTREE, attributes=['o'])
-
-        for r in self.conn.response:
-            if r['attributes']['o']:
-                return r['attributes']['o'][0]
+        r = search_first(self.conn, 'o=gluu',
+                         '(&(objectclass=gluuOrganization)(o=*))',
+                         attributes=['o'], search_scope=LEVEL)
+        if r:
+            return r['attributes']['o'][0]
 
 
     def change_appliance_config(self):
@@ -176,16 +173,12 @@ class ChangeGluuHostname:
     def change_clients(self):
         print "Changing LDAP Clients configurations"
         dn = "ou=clients,o={},o=gluu".format(self.base_inum)
-        self.conn.search(search_base=dn,
-                    search_filter='(objectClass=oxAuthClient)',
-                    search_scope=SUBTREE, attributes=[
-                                                'oxAuthPostLogoutRedirectURI',
-                                                'oxAuthRedirectURI',
-                                                'oxClaimRedirectURI',
-                                                'oxAuthLogoutURI'
-                                                ])
-
-        for client_entry in self.conn.response:
+        attributes = ['oxAuthPostLogoutRedirectURI', 'oxAuthRedirectURI',
+                      'oxClaimRedirectURI', 'oxAuthLogoutURI']
+
+        for client_entry in paged_search(self.conn, dn,
+                                         '(objectClass=oxAuthClient)',
+                                         attributes):
             dn = client_entry['dn']
             for atr in client_entry['attributes']:
                 if client_entry['attributes'][atr]:
@@ -210,10 +203,8 @@ class ChangeGluuHostname:
 
             dn = "ou={},ou=uma,o={},o=gluu".format(ou, self.base_inum)
 
-            self.conn.search(search_base=dn, search_filter='(objectClass=*)', search_scope=SUBTREE, attributes=[cattr])
-            result = self.conn.response
-
-            for r in result:
+            for r in paged_search(self.conn, dn,
+                                  '({}=*)'.format(cattr), [cattr]):
                 for i in range(len( r['attributes'][cattr])):
                     changeAttr = False
                     if self.old_host in r['attributes'][cattr][i]:
@@ -3,6 +3,7 @@ import os
 
 from clustermgr.extensions import wlogger
 from clustermgr.core.remote import RemoteClient
+from clustermgr.core.host_facts import host_facts, container_layout
 
 class Installer:
     def __init__(self, c, gluu_version, server_os=None, logger_tid=None, server_id=None):
@@ -13,7 +14,7 @@ class Installer:
         self.server_id=server_id
         
         if not "RemoteClient" in str(type(c)):
-            self.server_os = c.os
+            self.server_os = host_facts.os_type(c.hostname, c.os)
             self.server_id = c.id
             self.c = RemoteClient(c.hostname, c.ip)
 
@@ -51,11 +52,11 @@ class Installer:
             
             self.container = '/opt/gluu-server-{}'.format(self.gluu_version)
         
-            if ('Ubuntu' in self.server_os) or ('Debian' in self.server_os):
+            if container_layout(self.server_os) == 'chroot':
                 self.run_command = 'chroot {} /bin/bash -c "{}"'.format(self.container,'{}')
                 self.install_command = 'chroot {} /bin/bash -c "apt-get install -y {}"'.format(self.container,'{}')
 
-            elif self.server_os in ( 'CentOS 7', 'RHEL 7', 'Ubuntu 18'):
+            else:
                 self.run_command = ('ssh -o IdentityFile=/etc/gluu/keys/gluu-console '
                                 '-o Port=60022 -o LogLevel=QUIET -o '
                                 'StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null '
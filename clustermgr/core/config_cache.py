@@ -0,0 +1,172 @@
+"""config_cache.py - cached application configuration and server list.
+
+The application configuration and the servers are read by almost every
+request and task, but change rarely. They are read from the database once
+per request (or task) and kept by every process between requests. The
+process level copies are stamped with a version number kept in redis, which
+is increased when a commit changes a server or the configuration, so the
+web application and the celery workers drop their copies on the next read.
+
+Usage::
+
+    from clustermgr.core.config_cache import get_app_config, get_servers
+
+    appconf = get_app_config()
+    servers = get_servers()
+
+The returned objects belong to the current database session and can be
+modified and committed as usual.
+"""
+import cPickle
+import logging
+import threading
+
+import redis
+from flask import g, has_app_context, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from clustermgr.extensions import db, redis_client
+from clustermgr.models import AppConfiguration, Server
+
+
+logger = logging.getLogger(__name__)
+
+CACHED_MODELS = (AppConfiguration, Server)
+
+
+class ConfigCache(object):
+    """Keeps detached copies of query results per process, valid as long as
+    the version number in redis doesn't change. If redis can't be reached
+    nothing is cached and the database is queried.
+    """
+    version_key = 'clustermgr:config_version'
+
+    def __init__(self):
+        self.r = redis_client
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def version(self):
+        """Returns the current version, None if it is not available"""
+        try:
+            return self.r.get(self.version_key) or '0'
+        except redis.RedisError as e:
+            logger.debug("Can't read configuration version: %s", e)
+
+    def bump(self):
+        """Marks the cached copies of all the processes outdated"""
+        with self._lock:
+            self._entries = {}
+        try:
+            self.r.incr(self.version_key)
+        except redis.RedisError as e:
+            logger.warning("Can't update configuration version: %s", e)
+
+    def load(self, name, query):
+        """Returns the result of `query`, from the process level cache if
+        the cached copy is up to date.
+
+        Args:
+            name (string): name of the cached result
+            query (callable): function querying the database, returns a
+                model instance, a list of them or None
+        """
+        version = self.version()
+        if version is not None:
+            with self._lock:
+                cached = self._entries.get(name)
+            if cached and cached[0] == version:
+                return self.__merge(cached[1])
+
+        result = query()
+        if version is not None:
+            # pickling makes a detached copy with all the loaded attributes
+            copy = cPickle.loads(cPickle.dumps(result,
+                                               cPickle.HIGHEST_PROTOCOL))
+            with self._lock:
+                self._entries[name] = (version, copy)
+        return result
+
+    @staticmethod
+    def __merge(cached):
+        # copies the cached instances into the current session without
+        # querying the database
+        if cached is None:
+            return None
+        if isinstance(cached, list):
+            return [db.session.merge(o, load=False) for o in cached]
+        return db.session.merge(cached, load=False)
+
+
+config_cache = ConfigCache()
+
+
+def _memo():
+    # results are memoized on the application context, which lives as long
+    # as a request or a celery task
+    if not has_app_context():
+        return {}
+    if not hasattr(g, '_config_cache'):
+        g._config_cache = {}
+    return g._config_cache
+
+
+def _cached(name, query):
+    memo = _memo()
+    if name not in memo:
+        if has_app_context() and \
+                not current_app.config.get('CONFIG_CACHE_ENABLED', True):
+            memo[name] = query()
+        else:
+            memo[name] = config_cache.load(name, query)
+    return memo[name]
+
+
+def get_app_config():
+    """Returns the AppConfiguration, None if the application is not
+    configured yet
+    """
+    return _cached('app_config', lambda: AppConfiguration.query.first())
+
+
+def get_servers():
+    """Returns all the servers"""
+    return list(_cached('servers', lambda: Server.query.all()))
+
+
+def get_server(server_id):
+    """Returns the server with the given id, None if there is none"""
+    for server in get_servers():
+        if server.id == server_id:
+            return server
+
+
+def get_primary_server():
+    """Returns the primary server, None if there is none"""
+    for server in get_servers():
+        if server.primary_server:
+            return server
+
+
+@event.listens_for(Session, 'after_flush')
+def _detect_changes(session, flush_context):
+    # new, dirty and deleted still hold the flushed instances here
+    for obj in list(session.new) + list(session.dirty) + \
+            list(session.deleted):
+        if isinstance(obj, CACHED_MODELS):
+            session.info['config_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate(session):
+    if session.info.pop('config_changed', False):
+        if has_app_context():
+            g.pop('_config_cache', None)
+        config_cache.bump()
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_changes(session, previous_transaction):
+    session.info.pop('config_changed', None)
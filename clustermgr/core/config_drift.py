@@ -0,0 +1,261 @@
+"""config_drift.py - detects configuration differences between ldap servers.
+
+The Gluu configuration attributes are large JSON documents. To keep a check
+cheap, only the version of the entries holding them is read from every
+server: oxRevision of the oxAuth configuration entry and modifyTimestamp of
+the appliance entry. The values are fetched and hashed only when a version
+differs from the one seen on the previous check, otherwise the hash kept in
+redis is used. The hashes of the servers are then compared with the ones of
+the primary server, and the differing values are diffed key by key.
+"""
+import json
+import time
+import hashlib
+import logging
+from multiprocessing.pool import ThreadPool
+
+from ldap3 import BASE
+
+from clustermgr.extensions import redis_client
+from clustermgr.core.ldap_functions import ldap_pool
+
+
+logger = logging.getLogger(__name__)
+
+APPLIANCE_DN = 'inum={},ou=appliances,o=gluu'
+OXAUTH_DN = 'ou=oxauth,ou=configuration,' + APPLIANCE_DN
+
+# attribute: (dn template of the entry, attribute holding the entry version)
+CONFIG_ATTRIBUTES = {
+    'oxAuthConfDynamic': (OXAUTH_DN, 'oxRevision'),
+    'oxCacheConfiguration': (APPLIANCE_DN, 'modifyTimestamp'),
+    'oxIDPAuthentication': (APPLIANCE_DN, 'modifyTimestamp'),
+}
+
+
+class ConfigNode(object):
+    """An ldap server whose configuration is checked.
+
+    Args:
+        name (string): hostname of the server
+        addr (string): address passed to the ldap pool, e.g. host:1636
+        binddn (string): dn to bind with
+        password (string): password of binddn
+    """
+    def __init__(self, name, addr, binddn, password):
+        self.name = name
+        self.addr = addr
+        self.binddn = binddn
+        self.password = password
+
+
+def load_value(values):
+    """Parses the values of a configuration attribute. JSON strings nested
+    in the documents, such as the config of oxIDPAuthentication, are parsed
+    as well so that they can be diffed key by key.
+    """
+    def parse(value):
+        if isinstance(value, basestring) and value.lstrip()[:1] in ('{', '['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                return value
+        if isinstance(value, dict):
+            return dict((k, parse(v)) for k, v in value.items())
+        if isinstance(value, list):
+            return [parse(v) for v in value]
+        return value
+
+    loaded = [parse(value) for value in values]
+    return loaded[0] if len(loaded) == 1 else loaded
+
+
+def value_hash(value):
+    """Returns a hash of a loaded value that doesn't depend on key order"""
+    return hashlib.sha1(json.dumps(value, sort_keys=True)).hexdigest()
+
+
+def json_diff(expected, actual, path=''):
+    """Compares two loaded JSON documents.
+
+    Returns:
+        list: a dictionary with the keys key, expected and actual for every
+            differing key, key is the dotted path of the key. A key missing
+            from a document has the value None.
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        diffs = []
+        for key in sorted(set(expected) | set(actual)):
+            key_path = '{}.{}'.format(path, key) if path else key
+            if key not in actual or key not in expected:
+                diffs.append({'key': key_path,
+                              'expected': expected.get(key),
+                              'actual': actual.get(key)})
+            else:
+                diffs += json_diff(expected[key], actual[key], key_path)
+        return diffs
+    if expected != actual:
+        return [{'key': path, 'expected': expected, 'actual': actual}]
+    return []
+
+
+def _single(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return str(value) if value is not None else None
+
+
+def read_node(node, inum_appliance, known):
+    """Reads the versions of the configuration entries of a server and the
+    values whose version changed.
+
+    Args:
+        node (:object:`ConfigNode`): the server
+        inum_appliance (string): inum of the Gluu appliance
+        known (dict): {attribute: {'version', 'hash', 'value'}} as returned
+            by the previous check of the server
+
+    Returns:
+        dict: {attribute: {'version', 'hash', 'value'}}
+    """
+    with ldap_pool.connection(node.addr, node.binddn, node.password) as conn:
+        if not conn.bound:
+            raise ValueError("Can't bind to {}: {}".format(
+                             node.name, conn.result['description']))
+
+        entries = {}
+        for attribute, (dn, version_attr) in CONFIG_ATTRIBUTES.items():
+            entries.setdefault(dn.format(inum_appliance), set()).add(
+                                                                version_attr)
+
+        versions = {}
+        for dn, version_attrs in entries.items():
+            conn.search(search_base=dn, search_filter='(objectClass=*)',
+                        search_scope=BASE, attributes=list(version_attrs))
+            attrs = conn.response[0]['attributes'] if conn.response else {}
+            for version_attr in version_attrs:
+                versions[(dn, version_attr)] = _single(attrs.get(version_attr))
+
+        state = {}
+        fetch = {}
+        for attribute, (dn, version_attr) in CONFIG_ATTRIBUTES.items():
+            dn = dn.format(inum_appliance)
+            version = versions[(dn, version_attr)]
+            previous = known.get(attribute)
+            if previous and version and previous['version'] == version:
+                state[attribute] = previous
+            else:
+                fetch.setdefault(dn, []).append(attribute)
+                state[attribute] = {'version': version}
+
+        for dn, attributes in fetch.items():
+            conn.search(search_base=dn, search_filter='(objectClass=*)',
+                        search_scope=BASE, attributes=attributes)
+            attrs = conn.response[0]['attributes'] if conn.response else {}
+            for attribute in attributes:
+                values = attrs.get(attribute) or []
+                if not isinstance(values, list):
+                    values = [values]
+                value = load_value(values) if values else None
+                state[attribute]['value'] = value
+                state[attribute]['hash'] = value_hash(value) \
+                    if value is not None else None
+
+        return state
+
+
+class ConfigDriftDetector(object):
+    """Checks the configuration of the servers and keeps the state of every
+    server and the last report in redis.
+
+    The report is a dictionary with the keys:
+        reference: name of the server the others are compared to
+        servers: {name: {attribute: {'version', 'hash'}}}
+        drift: {attribute: {name: list of json_diff() results}} of the
+            servers that differ from the reference
+        errors: {name: error message} of the servers that couldn't be read
+        checked_at: unix time of the check
+    """
+    key = 'clustermgr:config_drift'
+
+    def __init__(self):
+        self.r = redis_client
+
+    def __known(self, name):
+        data = self.r.hget(self.key + ':nodes', name)
+        return json.loads(data) if data else {}
+
+    def __read(self, args):
+        node, inum_appliance = args
+        try:
+            return read_node(node, inum_appliance, self.__known(node.name)), \
+                None
+        except Exception as e:
+            logger.warning("Can't read configuration of %s: %s",
+                           node.name, e)
+            return None, str(e)
+
+    def check(self, nodes, inum_appliance):
+        """Reads all the servers concurrently and compares them with the
+        first one.
+
+        Args:
+            nodes (list): :object:`ConfigNode` of each server, the reference
+                server first
+            inum_appliance (string): inum of the Gluu appliance
+
+        Returns:
+            dict: the report
+        """
+        report = {'reference': nodes[0].name if nodes else None,
+                  'servers': {}, 'drift': {}, 'errors': {},
+                  'checked_at': time.time()}
+        if not nodes:
+            return report
+
+        pool = ThreadPool(len(nodes))
+        try:
+            results = pool.map(self.__read,
+                               [(node, inum_appliance) for node in nodes])
+        finally:
+            pool.close()
+            pool.join()
+
+        removed = set(self.r.hkeys(self.key + ':nodes')) - \
+            set(node.name for node in nodes)
+        if removed:
+            self.r.hdel(self.key + ':nodes', *removed)
+
+        states = {}
+        for node, (state, error) in zip(nodes, results):
+            if error:
+                report['errors'][node.name] = error
+                continue
+            states[node.name] = state
+            self.r.hset(self.key + ':nodes', node.name, json.dumps(state))
+            report['servers'][node.name] = dict(
+                (attribute, {'version': s['version'], 'hash': s['hash']})
+                for attribute, s in state.items())
+
+        reference = states.get(report['reference'])
+        if reference:
+            for name, state in states.items():
+                if name == report['reference']:
+                    continue
+                for attribute, s in state.items():
+                    expected = reference[attribute]
+                    if s['hash'] != expected['hash']:
+                        report['drift'].setdefault(attribute, {})[name] = \
+                            json_diff(expected['value'], s['value'])
+
+        self.r.set(self.key, json.dumps(report))
+        return report
+
+    def get_report(self):
+        """Returns the last report or None if there is none"""
+        data = self.r.get(self.key)
+        if data:
+            return json.loads(data)
+
+
+config_drift = ConfigDriftDetector()
@@ -0,0 +1,505 @@
+"""dry_run.py - plans deployment tasks without touching the servers.
+
+A planned task runs its own code, with the SSH client replaced by a client
+which records the commands and the file transfers instead of doing them and
+the LDAP clients replaced by stubs which record the changes. The steps of a
+:class:`clustermgr.core.step_graph.StepGraph` are run one after the other in
+the calling thread, and the duration of the run is estimated from the step
+timings recorded by earlier runs of the same operation. Nothing is committed
+to the database and no other task is queued.
+
+Usage::
+
+    from clustermgr.core.dry_run import plan_task
+    from clustermgr.tasks.cluster import opendjenablereplication
+
+    plan = plan_task(opendjenablereplication, 'all')
+    for host, operations in plan.hosts.items():
+        ...
+    plan.estimate  # seconds, None if none of the steps ran before
+
+The answers of the recording client are made up: files exist only if the
+task wrote them (or they are Gluu containers) and commands succeed without
+output, except for the commands detecting the OS, which are answered from
+the OS stored for the server. The plan therefore shows what a task does on
+freshly prepared servers.
+"""
+import re
+import json
+import logging
+import threading
+from StringIO import StringIO
+from contextlib import contextmanager
+from collections import OrderedDict
+from importlib import import_module
+
+from sqlalchemy import func, or_
+
+from clustermgr.extensions import db, wlogger
+from clustermgr.models import Server, CacheServer, DeploymentRun, \
+    DeploymentStep
+from clustermgr.core.step_graph import StepGraph
+
+
+logger = logging.getLogger(__name__)
+
+# operations not bound to a server are listed under this name
+LOCAL = 'cluster manager'
+
+# OS assumed for servers whose OS is not known, e.g. cache servers
+DEFAULT_OS = 'Ubuntu 18'
+
+# content of /etc/os-release answered for the OS names stored for servers
+OS_RELEASES = {
+    'Ubuntu 14': 'NAME="Ubuntu"\nVERSION="14.04 LTS"\n',
+    'Ubuntu 16': 'NAME="Ubuntu"\nVERSION="16.04 LTS"\n',
+    'Ubuntu 18': 'NAME="Ubuntu"\nVERSION="18.04 LTS"\n',
+    'CentOS 6': 'CentOS release 6.10 (Final)\n',
+    'CentOS 7': 'CentOS Linux release 7.6.1810 (Core)\n',
+    'RHEL 7': 'Red Hat Enterprise Linux Server release 7.6 (Maipo)\n',
+    'Debian 8': 'PRETTY_NAME="Debian GNU/Linux 8 (jessie)"\n',
+    'Debian 9': 'PRETTY_NAME="Debian GNU/Linux 9 (stretch)"\n',
+}
+
+# paths answered as existing before the task writes them
+EXISTING_PATHS = re.compile(r'^/opt/gluu-server-[^/]+/?$')
+
+# LDAP attributes read by the tasks, as stored by Gluu setup
+APPLIANCE_DEFAULTS = {
+    'oxCacheConfiguration': {'cacheProviderType': 'IN_MEMORY',
+                             'redisConfiguration': {}},
+}
+
+_state = threading.local()
+
+# the stubs are installed module wide, plans are made one at a time
+_planning_lock = threading.Lock()
+
+
+def current_plan():
+    """Returns the :class:`Plan` being made by the current thread"""
+    return getattr(_state, 'plan', None)
+
+
+class Plan(object):
+    """Operations of a planned task per host.
+
+    Attributes:
+        hosts (OrderedDict): {hostname: list of operations}, every operation
+            is a dict with the keys step, kind and detail
+        graphs (list): estimates of the step graph runs, see add_graph()
+        result: value returned by the task
+        error (string): error raised by the task, None if it completed
+    """
+    def __init__(self):
+        self.hosts = OrderedDict()
+        self.graphs = []
+        self.result = None
+        self.error = None
+        # set while a step of a graph runs
+        self.step = None
+        self.host = None
+        self._os = {}
+        self._hostnames = {}
+        self._files = {}
+
+    def add_server(self, hostname, ip=None, os_name=None):
+        """Registers a server, so that its OS can be answered and LDAP
+        connections made to its address are listed under its hostname
+        """
+        if os_name or hostname not in self._os:
+            self._os[hostname] = os_name
+        if ip:
+            self._hostnames[ip] = hostname
+
+    def hostname(self, address):
+        """Returns the hostname of a server address such as ldaps://ip:1636"""
+        address = address.split('://')[-1].rsplit(':', 1)[0]
+        return self._hostnames.get(address, address)
+
+    def os_release(self, host):
+        os_name = self._os.get(host)
+        if os_name not in OS_RELEASES:
+            self.record(host, 'note', 'OS is not known, assuming {}'.format(
+                                                                DEFAULT_OS))
+            self._os[host] = os_name = DEFAULT_OS
+        return OS_RELEASES[os_name]
+
+    def record(self, host, kind, detail):
+        """Adds an operation to the plan of host
+
+        Args:
+            host (string): hostname, None for local operations
+            kind (string): run, upload, download, read, write, ldap, ...
+            detail (string): the command, path or change
+        """
+        step = self.step
+        if step and self.host:
+            step = '{} on {}'.format(step, self.host)
+        self.hosts.setdefault(host or LOCAL, []).append(
+            {'step': step, 'kind': kind, 'detail': detail})
+
+    def write(self, host, path, content=''):
+        self._files[(host, path)] = content
+
+    def read(self, host, path):
+        return self._files.get((host, path))
+
+    def exists(self, host, path):
+        return (host, path) in self._files or bool(EXISTING_PATHS.match(path))
+
+    def add_graph(self, run_key, graph, durations):
+        """Adds the estimate of a step graph run
+
+        Args:
+            run_key (string): key of the run
+            graph (:class:`StepGraph`): the planned graph
+            durations (dict): {node: seconds or None} estimated per node
+        """
+        self.graphs.append({
+            'run_key': run_key,
+            'duration': graph.estimate(durations),
+            'steps': [{'step': name, 'host': host,
+                       'estimate': durations.get((name, host))}
+                      for name, host in graph.order],
+            'unknown': len([d for d in durations.values() if d is None]),
+        })
+
+    @property
+    def estimate(self):
+        """Estimated seconds of the task, None if no step was recorded
+        before. Steps which never ran are counted as instantaneous.
+        """
+        known = [g['duration'] for g in self.graphs
+                 if g['unknown'] < len(g['steps'])]
+        return sum(known) if known else None
+
+    def to_dict(self):
+        return {'hosts': self.hosts, 'graphs': self.graphs,
+                'estimate': self.estimate, 'error': self.error}
+
+
+class RecordingRemoteClient(object):
+    """Stands in for :class:`clustermgr.core.remote.RemoteClient`, records
+    the operations in the current plan instead of doing them.
+    """
+    def __init__(self, host, ip=None, user='root', passphrase=None):
+        self.host = host
+        self.ip = ip
+        self.user = user
+        self.exit_status = None
+        self.plan = current_plan()
+        self.plan.add_server(host, ip)
+
+    def startup(self):
+        pass
+
+    def close(self):
+        pass
+
+    def run(self, command):
+        self.plan.record(self.host, 'run', command)
+        self.exit_status = 0
+        output = ''
+        if command.startswith('ls /etc/*release'):
+            output = '/etc/os-release\n'
+        elif command.startswith('cat /etc/os-release'):
+            output = self.plan.os_release(self.host)
+        return '', output, ''
+
+    def upload(self, local, remote):
+        self.plan.record(self.host, 'upload', '{} -> {}'.format(local,
+                                                                remote))
+        self.plan.write(self.host, remote)
+        return "Upload successful. File at: {0}".format(remote)
+
+    def download(self, remote, local):
+        self.plan.record(self.host, 'download', '{} -> {}'.format(remote,
+                                                                  local))
+        return "Download successful. File at: {0}".format(local)
+
+    def exists(self, filepath):
+        return self.plan.exists(self.host, filepath)
+
+    def get_file(self, filename):
+        self.plan.record(self.host, 'read', filename)
+        return True, StringIO(self.plan.read(self.host, filename) or '')
+
+    def put_file(self, filename, filecontent):
+        self.plan.record(self.host, 'write', '{} ({} bytes)'.format(
+                                                filename, len(filecontent)))
+        self.plan.write(self.host, filename, filecontent)
+
+    def mkdir(self, dirname):
+        self.plan.record(self.host, 'mkdir', dirname)
+        self.plan.write(self.host, dirname)
+        return True
+
+    def listdir(self, dirname):
+        return []
+
+    def rename(self, oldpath, newpath):
+        self.plan.record(self.host, 'rename', '{} -> {}'.format(oldpath,
+                                                                newpath))
+        self.plan.write(self.host, newpath, self.plan.read(self.host,
+                                                           oldpath) or '')
+        return True
+
+
+class _Attribute(object):
+    def __init__(self, value):
+        self.value = value
+
+
+class _Entry(object):
+    def __init__(self, attributes):
+        for name, value in attributes.items():
+            setattr(self, name, _Attribute(json.dumps(value)))
+
+
+class RecordingLdap(object):
+    """Stands in for the LDAP clients (ldap3 connections, LdapOLC and
+    DBManager). Searches find nothing, every other call is recorded as a
+    change and succeeds.
+
+    Args:
+        address (string): address of the LDAP server, the first argument of
+            the replaced classes
+    """
+    bound = True
+    response = []
+    result = {'description': 'success'}
+
+    def __init__(self, address, *args, **kwargs):
+        self.plan = current_plan()
+        self.host = self.plan.hostname(address)
+        self.conn = self
+
+    def connect(self, *args, **kwargs):
+        return True
+
+    def search(self, *args, **kwargs):
+        return False
+
+    def get_appliance_attributes(self, *attributes):
+        return _Entry(dict((a, APPLIANCE_DEFAULTS.get(a, {}))
+                           for a in attributes))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def change(*args, **kwargs):
+            self.plan.record(self.host, 'ldap', '{}({})'.format(name,
+                ', '.join([repr(a) for a in args] +
+                          ['{}={!r}'.format(*kw) for kw in kwargs.items()])))
+            return True
+        return change
+
+
+class RecordingLdapPool(object):
+    """Stands in for :data:`clustermgr.core.ldap_functions.ldap_pool`"""
+    @contextmanager
+    def connection(self, address, *args, **kwargs):
+        yield RecordingLdap(address)
+
+
+class RecordingTask(object):
+    """Stands in for a celery task queued by the planned task"""
+    def __init__(self, name):
+        self.name = name
+
+    def delay(self, *args, **kwargs):
+        current_plan().record(None, 'task', '{}{}'.format(self.name, args))
+
+    apply_async = delay
+
+
+def wait_for_opendj(tid, server, bases=(), *args, **kwargs):
+    """Stands in for :func:`clustermgr.tasks.cluster.wait_for_opendj`"""
+    detail = 'wait for OpenDJ'
+    if bases:
+        detail += ' to replicate ' + ', '.join(bases)
+    current_plan().record(server.hostname, 'wait', detail)
+    return True
+
+
+def log(tid, message, level='info', **kwargs):
+    """Stands in for the web logger, keeps the messages telling what the
+    task does
+    """
+    if level not in ('debug', 'set_step', 'cerror'):
+        plan = current_plan()
+        plan.record(plan.host, 'log', message)
+
+
+def recorded_durations(run_key):
+    """Returns the average seconds the steps took in the successful step
+    runs of the operation of run_key, e.g. of all the opendjenablereplication
+    runs for opendjenablereplication:all
+
+    Returns:
+        dict: {(step, host): seconds}, host is '' for cluster wide steps
+    """
+    operation = run_key.split(':')[0]
+    rows = db.session.query(
+            DeploymentStep.step, DeploymentStep.host,
+            func.avg(DeploymentStep.duration)
+        ).join(DeploymentRun, DeploymentStep.run_id == DeploymentRun.id
+        ).filter(or_(DeploymentRun.run_key == operation,
+                     DeploymentRun.run_key.like(operation + ':%')),
+                 DeploymentStep.status == 'success'
+        ).group_by(DeploymentStep.step, DeploymentStep.host)
+    return dict(((step, host or ''), duration)
+                for step, host, duration in rows)
+
+
+def estimate_durations(graph, recorded):
+    """Returns {node: seconds} for the nodes of the graph. The timing of a
+    step on the same host is used if there is one, else the average of the
+    step on the other hosts, else None.
+    """
+    per_step = {}
+    for (step, host), duration in recorded.items():
+        per_step.setdefault(step, []).append(duration)
+
+    durations = {}
+    for name, host in graph.order:
+        duration = recorded.get((name, host or ''))
+        if duration is None and per_step.get(name):
+            duration = sum(per_step[name]) / len(per_step[name])
+        durations[(name, host)] = duration
+    return durations
+
+
+def planned_run(graph, run_key, ctx, tid=None, workers=10, resume=True,
+                inputs=None, timeout=None):
+    """Stands in for :meth:`StepGraph.run`. Runs all the steps in the
+    calling thread, in dependency order, records the failures of the steps
+    as notes and carries on, so the plan covers every step.
+    """
+    plan = current_plan()
+    for name, host in graph.order:
+        step = graph.steps[name]
+        plan.step, plan.host = name, host
+        try:
+            if step.check and step.check(ctx, host):
+                plan.record(host, 'note', 'already done, skipped')
+            elif step.action(ctx, host) is False:
+                plan.record(host, 'note', 'fails with the simulated answers')
+        except Exception as e:
+            logger.debug("Planned step %s failed", name, exc_info=True)
+            plan.record(host, 'note', 'fails with the simulated answers: '
+                                      '{}'.format(e))
+    plan.step = plan.host = None
+
+    plan.add_graph(run_key, graph,
+                   estimate_durations(graph, recorded_durations(run_key)))
+    return DeploymentRun(run_key=run_key, status='success')
+
+
+# module attribute -> replacement, installed while planning
+STUBS = (
+    ('clustermgr.tasks.cluster', 'RemoteClient', RecordingRemoteClient),
+    ('clustermgr.tasks.cluster', 'ldap_pool', RecordingLdapPool()),
+    ('clustermgr.tasks.cluster', 'LdapOLC', RecordingLdap),
+    ('clustermgr.tasks.cluster', 'wait_for_opendj', wait_for_opendj),
+    ('clustermgr.tasks.cluster', 'poll_replication_status',
+     RecordingTask('poll_replication_status')),
+    ('clustermgr.tasks.cache', 'RemoteClient', RecordingRemoteClient),
+    ('clustermgr.tasks.cache', 'DBManager', RecordingLdap),
+)
+
+_MISSING = object()
+
+
+class _PerThread(object):
+    """Uses the replacement in the planning thread and the original in the
+    other threads of the process, e.g. requests served meanwhile.
+    """
+    def __init__(self, original, replacement):
+        self._original = original
+        self._replacement = replacement
+
+    def _target(self):
+        if current_plan() is not None:
+            return self._replacement
+        return self._original
+
+    def __call__(self, *args, **kwargs):
+        return self._target()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+def _per_thread_method(original, replacement):
+    def method(self, *args, **kwargs):
+        if current_plan() is not None:
+            return replacement(self, *args, **kwargs)
+        return original(self, *args, **kwargs)
+    return method
+
+
+@contextmanager
+def _stubbed(replacements):
+    saved = []
+    try:
+        for target, name, replacement in replacements:
+            own = vars(target).get(name, _MISSING)
+            original = getattr(target, name)
+            if isinstance(target, type):
+                stub = _per_thread_method(own, replacement)
+            else:
+                stub = _PerThread(original, replacement)
+            saved.append((target, name, own))
+            setattr(target, name, stub)
+        yield
+    finally:
+        for target, name, own in reversed(saved):
+            if own is _MISSING:
+                delattr(target, name)
+            else:
+                setattr(target, name, own)
+
+
+def plan_task(task, *args, **kwargs):
+    """Runs the celery task with the stubs installed and returns what it
+    would have done.
+
+    Args:
+        task: the celery task, e.g. setup_filesystem_replication
+        args, kwargs: arguments of the task
+
+    Returns:
+        :class:`Plan`
+    """
+    with _planning_lock:
+        plan = Plan()
+        for server in Server.query.all():
+            plan.add_server(server.hostname, server.ip, server.os)
+        for server in CacheServer.query.all():
+            plan.add_server(server.hostname, server.ip)
+
+        replacements = [(import_module(module), name, replacement)
+                        for module, name, replacement in STUBS]
+        replacements.extend([
+            (StepGraph, 'run', planned_run),
+            (wlogger, 'log', log),
+            # changes are flushed, so the task reads them back, and rolled
+            # back at the end
+            (db.session, 'commit', lambda: db.session.flush()),
+        ])
+
+        _state.plan = plan
+        try:
+            with _stubbed(replacements):
+                plan.result = task.run(*args, **kwargs)
+        except Exception as e:
+            logger.exception("Planning %s failed", task.name)
+            plan.error = str(e)
+        finally:
+            _state.plan = None
+            db.session.rollback()
+
+    return plan
@@ -0,0 +1,328 @@
+"""host_facts.py - facts about the servers, gathered once and kept in the
+database.
+
+The OS of a server, the Gluu Server containers installed on it and the
+oxAuth version in them are needed at the start of most operations. They
+are gathered with SSH commands once, kept as
+:class:`clustermgr.models.HostFact` rows and gathered again when they are
+older than their time to live in HOST_FACT_TTLS. The task
+:func:`clustermgr.tasks.cluster.refresh_host_facts` gathers the facts of
+all the servers again, in parallel.
+
+Usage::
+
+    from clustermgr.core.host_facts import host_facts
+
+    facts = host_facts.get(server.hostname, ['os_type', 'gluu_versions'],
+                           client=c)
+    if facts['os_type'] == 'CentOS 7':
+        ...
+
+The facts are:
+    os_type: the distribution, e.g. 'CentOS 7', None if it is not known
+    gluu_versions: versions of the /opt/gluu-server-<version> containers
+    oxauth_versions: {container version: version of its oxauth.war}
+    gluu_installed: container versions whose setup has completed
+"""
+import re
+import logging
+from datetime import datetime
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from flask import current_app, has_app_context
+
+from clustermgr.config import Config
+from clustermgr.extensions import db
+from clustermgr.models import HostFact
+from clustermgr.core.remote import RemoteClient
+
+
+logger = logging.getLogger(__name__)
+
+# OS types whose Gluu Server container runs under systemd-nspawn and is
+# entered with ssh, the containers of the others are entered with chroot
+SSH_CONTAINER_OS = ('CentOS 7', 'RHEL 7', 'Ubuntu 18')
+
+OXAUTH_WAR = '/opt/gluu-server-{}/opt/gluu/jetty/oxauth/webapps/oxauth.war'
+SETUP_PROPERTIES_LAST = ('/opt/gluu-server-{}/install/'
+                         'community-edition-setup/setup.properties.last')
+
+
+def container_layout(os_type):
+    """Returns 'ssh' if the Gluu Server container of the OS is entered with
+    ssh, 'chroot' otherwise"""
+    return 'ssh' if os_type in SSH_CONTAINER_OS else 'chroot'
+
+
+def parse_os_release(text):
+    """Returns the OS type described by the content of a release file"""
+    if "Ubuntu" in text and "14.04" in text:
+        return "Ubuntu 14"
+    if "Ubuntu" in text and "16.04" in text:
+        return "Ubuntu 16"
+    if "Ubuntu" in text and "18.04" in text:
+        return "Ubuntu 18"
+    if "CentOS" in text and "release 6." in text:
+        return "CentOS 6"
+    if "CentOS" in text and "release 7." in text:
+        return "CentOS 7"
+    if 'Red Hat Enterprise Linux' in text and '7.' in text:
+        return 'RHEL 7'
+    if 'Debian' in text and "(jessie)" in text:
+        return 'Debian 8'
+    if 'Debian' in text and "(stretch)" in text:
+        return 'Debian 9'
+
+
+def parse_manifest_version(text):
+    """Returns the major.minor.patch Implementation-Version of a
+    MANIFEST.MF, None if it has none"""
+    for line in text.split('\n'):
+        line = line.strip()
+        if 'Implementation-Version:' in line:
+            version = line.split(':')[1].strip()
+            return '.'.join(version.split('.')[:3])
+
+
+def gather_os_type(c, facts):
+    cin, cout, cerr = c.run("ls /etc/*release")
+    files = cout.split()
+    if not files:
+        return None
+    if files[0] == '/etc/alpine-release':
+        return 'Alpine'
+    cin, cout, cerr = c.run("cat " + files[0])
+    return parse_os_release(cout)
+
+
+def gather_gluu_versions(c, facts):
+    result = c.listdir('/opt')
+    if not result[0]:
+        return []
+    versions = []
+    for name in result[1]:
+        m = re.search(
+            r'gluu-server-(?P<gluu_version>(\d+).(\d+).(\d+)(.\d+)?)$', name)
+        if m:
+            versions.append(m.group('gluu_version'))
+    return versions
+
+
+def gather_oxauth_versions(c, facts):
+    versions = {}
+    for version in facts['gluu_versions']:
+        cin, cout, cerr = c.run(
+            '''python -c "import zipfile;zf=zipfile.ZipFile('{}','r');'''
+            '''print zf.read('META-INF/MANIFEST.MF')"'''.format(
+                                                OXAUTH_WAR.format(version)))
+        versions[version] = parse_manifest_version(cout)
+    return versions
+
+
+def gather_gluu_installed(c, facts):
+    return [version for version in facts['gluu_versions']
+            if c.exists(SETUP_PROPERTIES_LAST.format(version))]
+
+
+# name -> (function gathering the fact, facts it needs)
+GATHERERS = OrderedDict([
+    ('os_type', (gather_os_type, ())),
+    ('gluu_versions', (gather_gluu_versions, ())),
+    ('oxauth_versions', (gather_oxauth_versions, ('gluu_versions',))),
+    ('gluu_installed', (gather_gluu_installed, ('gluu_versions',))),
+])
+
+FACTS = list(GATHERERS)
+
+
+def _with_dependencies(names):
+    needed = set(names)
+    for name in names:
+        needed.update(GATHERERS[name][1])
+    return [name for name in FACTS if name in needed]
+
+
+def gather(c, names, known=None):
+    """Gathers facts with SSH commands. A fact which can't be gathered or
+    is not known, such as the OS type of an unrecognized distribution, is
+    left out of the result, so it is not stored and is gathered again.
+
+    Args:
+        c (:object:`clustermgr.core.remote.RemoteClient`): connected client
+        names (list): names of the facts
+        known (dict): facts already known, used by facts depending on them
+
+    Returns:
+        dict: {name: value}
+    """
+    facts = dict(known or {})
+    gathered = {}
+    for name in _with_dependencies(names):
+        if name in facts:
+            continue
+        function, requires = GATHERERS[name]
+        if [r for r in requires if r not in facts]:
+            continue
+        try:
+            value = function(c, facts)
+        except Exception as e:
+            logger.warning("Can't gather %s of %s: %s", name,
+                           getattr(c, 'host', 'localhost'), e)
+            continue
+        if value is not None:
+            facts[name] = gathered[name] = value
+    return gathered
+
+
+def _gather_host(app, hostname, ip, names, known):
+    # runs in a worker thread, without database access
+    with app.app_context():
+        c = RemoteClient(hostname, ip=ip)
+        try:
+            c.startup()
+        except Exception as e:
+            logger.warning("Can't connect to %s for its facts: %s",
+                           hostname, e)
+            return {}
+        try:
+            return gather(c, names, known)
+        finally:
+            c.close()
+
+
+class HostFactStore(object):
+    """Keeps the facts of the hosts in the database.
+
+    Args:
+        ttls (dict): {fact name: seconds the fact is valid}
+    """
+    def __init__(self, ttls=None):
+        self.ttls = ttls or {}
+
+    def __valid(self, row, now):
+        age = (now - row.gathered_at).total_seconds() if row.gathered_at \
+            else None
+        return age is not None and age < self.ttls.get(row.name, 0)
+
+    def cached(self, hostname, names=None):
+        """Returns the stored facts of the host which didn't expire"""
+        now = datetime.utcnow()
+        query = HostFact.query.filter_by(hostname=hostname)
+        if names is not None:
+            query = query.filter(HostFact.name.in_(names))
+        return dict((row.name, row.get_value()) for row in query
+                    if self.__valid(row, now))
+
+    def store(self, hostname, facts):
+        """Stores gathered facts of the host"""
+        if not facts:
+            return
+        now = datetime.utcnow()
+        rows = dict((row.name, row) for row in HostFact.query.filter(
+                        HostFact.hostname == hostname,
+                        HostFact.name.in_(list(facts))))
+        for name, value in facts.items():
+            row = rows.get(name)
+            if not row:
+                row = HostFact(hostname=hostname, name=name)
+                db.session.add(row)
+            row.set_value(value)
+            row.gathered_at = now
+        db.session.commit()
+
+    def invalidate(self, hostname, names=None):
+        """Drops the stored facts of the host, so they are gathered again
+        when they are read next"""
+        query = HostFact.query.filter_by(hostname=hostname)
+        if names is not None:
+            query = query.filter(HostFact.name.in_(names))
+        query.delete(synchronize_session=False)
+        db.session.commit()
+
+    def get(self, hostname, names=None, client=None, ip=None, refresh=False):
+        """Returns facts of the host, gathering the missing and expired
+        ones.
+
+        Args:
+            hostname (string): hostname of the server
+            names (list): names of the facts, all of them by default
+            client (:object:`clustermgr.core.remote.RemoteClient`): connected
+                client used to gather the facts, a client is connected if
+                it is not given
+            ip (string): ip address of the server, for the connection
+            refresh (bool): gather all the facts again
+
+        Returns:
+            dict: {name: value}, None for facts which couldn't be gathered
+        """
+        names = list(names or FACTS)
+        needed = _with_dependencies(names)
+        facts = {} if refresh else self.cached(hostname, needed)
+        missing = [name for name in needed if name not in facts]
+
+        if missing:
+            if client is not None:
+                gathered = gather(client, missing, facts)
+            else:
+                app = current_app._get_current_object()
+                gathered = _gather_host(app, hostname, ip, missing, facts)
+            self.store(hostname, gathered)
+            facts.update(gathered)
+
+        return dict((name, facts.get(name)) for name in names)
+
+    def gather_all(self, servers, names=None, refresh=False, workers=10):
+        """Gathers the missing and expired facts of the servers
+        concurrently.
+
+        Args:
+            servers (list): :class:`clustermgr.models.Server` instances
+            names (list): names of the facts, all of them by default
+            refresh (bool): gather all the facts again
+            workers (int): maximum number of servers connected at once
+
+        Returns:
+            dict: {hostname: {name: value}}
+        """
+        names = list(names or FACTS)
+        needed = _with_dependencies(names)
+        known = {}
+        jobs = []
+        for server in servers:
+            known[server.hostname] = {} if refresh else \
+                self.cached(server.hostname, needed)
+            missing = [name for name in needed
+                       if name not in known[server.hostname]]
+            if missing:
+                jobs.append((server.hostname, server.ip, missing))
+
+        if jobs:
+            app = current_app._get_current_object()
+            pool = ThreadPool(min(workers, len(jobs)))
+            try:
+                results = pool.map(
+                    lambda job: _gather_host(app, job[0], job[1], job[2],
+                                             known[job[0]]), jobs)
+            finally:
+                pool.close()
+                pool.join()
+            for (hostname, ip, missing), gathered in zip(jobs, results):
+                self.store(hostname, gathered)
+                known[hostname].update(gathered)
+
+        return dict((hostname, dict((name, facts.get(name))
+                                    for name in names))
+                    for hostname, facts in known.items())
+
+    def os_type(self, hostname, default=None):
+        """Returns the stored OS type of the host without gathering it,
+        `default` if it is not known"""
+        if has_app_context():
+            os_type = self.cached(hostname, ['os_type']).get('os_type')
+            if os_type:
+                return os_type
+        return default
+
+
+host_facts = HostFactStore(Config.HOST_FACT_TTLS)
@@ -1,18 +1,64 @@
+import os
 import re
 import time
 import logging
 import json
+import threading
+from contextlib import contextmanager
 
-from ldap3 import Server, Connection, SUBTREE, BASE, LEVEL, \
+import ldap3
+from ldap3 import Server, SUBTREE, BASE, LEVEL, \
     MODIFY_REPLACE, MODIFY_ADD, MODIFY_DELETE
+from ldap3.core.exceptions import LDAPSocketOpenError
 
 from clustermgr.models import Server as ServerModel
 from clustermgr.core.utils import ldap_encode, get_setup_properties
+from clustermgr.core.schema_catalog import schema_catalog
+from clustermgr.core.schema_changeset import SchemaChangeset
+from clustermgr.core.profiling import timed
 from ldap.schema import AttributeType, ObjectClass, LDAPSyntax
 
 
 logger = logging.getLogger(__name__)
 
+# OID given to the object class of custom attributes when it is created
+CUSTOM_OBJECT_CLASS_OID = '1.3.6.1.4.1.48710.1.4.200'
+
+
+def _ldap_label(operation, argument):
+    # the dn or base of the operation, passed by position or keyword
+    def label(self, *args, **kwargs):
+        return '{} {}'.format(operation, args[0] if args
+                              else kwargs.get(argument, '')).strip()
+    return label
+
+
+def _ldap_host(self):
+    return self.server.host
+
+
+def _response_size(self, *args, **kwargs):
+    return sum(len(value) for entry in self.response or []
+               for values in entry.get('raw_attributes', {}).values()
+               for value in values)
+
+
+class Connection(ldap3.Connection):
+    """ldap3 connection whose operations are timed by the task profiler,
+    see :mod:`clustermgr.core.profiling`
+    """
+    bind = timed('ldap', _ldap_label('bind', None),
+                 host=_ldap_host)(ldap3.Connection.bind)
+    search = timed('ldap', _ldap_label('search', 'search_base'),
+                   size=_response_size,
+                   host=_ldap_host)(ldap3.Connection.search)
+    add = timed('ldap', _ldap_label('add', 'dn'),
+                host=_ldap_host)(ldap3.Connection.add)
+    modify = timed('ldap', _ldap_label('modify', 'dn'),
+                   host=_ldap_host)(ldap3.Connection.modify)
+    delete = timed('ldap', _ldap_label('delete', 'dn'),
+                   host=_ldap_host)(ldap3.Connection.delete)
+
 
 def get_host_port(addr):
     m = re.search('(?:ldap.*://)?(?P<host>[^:/ ]+).?(?P<port>[0-9]*).*',  addr)
@@ -31,6 +77,288 @@ def get_ip_by_hostname(hostname):
         return ldp.ip
 
 
+class LdapPoolTimeout(LDAPSocketOpenError):
+    """Raised when no connection of a full pool is released in time. It is
+    an LDAPSocketOpenError, so callers that move on to another server when
+    one can't be connected do the same here.
+    """
+
+
+class LdapPool(object):
+    """Keeps bound ldap3 connections for reuse, so that repeated operations
+    on the same server don't pay a TLS handshake and bind each time. There
+    is a pool for every (server address, bind dn, password).
+
+    Connections are leased with acquire() and handed back with release(),
+    or with the connection() context manager. A leased connection is used
+    by a single thread only. Idle connections are health checked before they
+    are handed out again and unbound once idle for `idle_timeout` seconds.
+    As sockets can't be shared between processes, a forked process (such as
+    a celery prefork worker) starts with empty pools.
+
+    A pool holds at most `max_size` connections, leased and idle. Once that
+    many are open, acquire() waits for one to be released, so parallel step
+    graphs and probes don't open a bind per thread against the same server.
+
+    Args:
+        max_idle (int): maximum number of idle connections kept per pool
+        idle_timeout (int): seconds after which idle connections are closed
+        check_interval (int): idle connections older than this many seconds
+            are probed with a root DSE search before being reused
+        max_size (int): maximum number of open connections per pool
+        acquire_timeout (int): seconds acquire() waits for a connection of
+            a full pool, None to wait without limit
+    """
+    def __init__(self, max_idle=4, idle_timeout=300, check_interval=30,
+                 max_size=10, acquire_timeout=60):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self._idle = {}
+        self._leased = {}
+        self._open = {}
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self._pid = os.getpid()
+
+    def __reset_after_fork(self):
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._leased = {}
+            self._open = {}
+            self._pid = os.getpid()
+
+    def __closed(self, key):
+        # must be called with the lock held, frees the slot of a connection
+        # of the pool that was unbound or not bound at all
+        count = self._open.pop(key, 0) - 1
+        if count > 0:
+            self._open[key] = count
+        self._released.notify_all()
+
+    def __unbind(self, conn):
+        try:
+            conn.unbind()
+        except Exception as e:
+            logger.debug("Unbinding pooled ldap connection failed: %s", e)
+
+    def __is_healthy(self, conn, idle_for):
+        if conn.closed or not conn.bound:
+            return False
+        if idle_for < self.check_interval:
+            return True
+        try:
+            return conn.search(search_base='', search_filter='(objectClass=*)',
+                               search_scope=BASE, attributes=['1.1'])
+        except Exception:
+            return False
+
+    def __evict(self, now):
+        # must be called with the lock held, returns the evicted connections
+        evicted = []
+        for key, idle in self._idle.items():
+            keep = []
+            for conn, last_used in idle:
+                if now - last_used > self.idle_timeout:
+                    evicted.append(conn)
+                    self.__closed(key)
+                else:
+                    keep.append((conn, last_used))
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return evicted
+
+    def acquire(self, addr, binddn=None, password=None, use_ssl=True,
+                timeout=None):
+        """Leases a connection to the ldap server, binding a new one if no
+        healthy idle connection is available. If the pool is full, waits
+        for a connection to be released. Socket errors are raised as ldap3
+        exceptions.
+
+        Args:
+            addr (string): uri or hostname of the ldap server
+            binddn (string): bind dn, None for an anonymous bind
+            password (string): the password of binddn
+            use_ssl (boolean): if connection should be made over ssl
+            timeout (int): seconds to wait for a connection of a full pool,
+                defaults to `acquire_timeout`
+
+        Returns:
+            ldap3 Connection, check its `bound` attribute for the bind result
+
+        Raises:
+            LdapPoolTimeout: if no connection was released within timeout
+        """
+        key = (addr, binddn, password, use_ssl)
+        if timeout is None:
+            timeout = self.acquire_timeout
+        deadline = None if timeout is None else time.time() + timeout
+
+        while True:
+            now = time.time()
+            slot = expired = False
+            with self._lock:
+                self.__reset_after_fork()
+                evicted = self.__evict(now)
+                idle = self._idle.get(key)
+                conn, last_used = idle.pop() if idle else (None, None)
+                if conn is not None:
+                    self._leased[id(conn)] = key
+                elif self._open.get(key, 0) < self.max_size:
+                    # take the slot of the new connection
+                    self._open[key] = self._open.get(key, 0) + 1
+                    slot = True
+                elif deadline is None or now < deadline:
+                    self._released.wait(
+                        None if deadline is None else deadline - now)
+                else:
+                    expired = True
+
+            for old in evicted:
+                self.__unbind(old)
+
+            if expired:
+                raise LdapPoolTimeout(
+                    "No connection to {} was released within {} "
+                    "seconds".format(addr, timeout))
+            if slot:
+                break
+            if conn is None:
+                continue
+            if self.__is_healthy(conn, now - last_used):
+                return conn
+            self.__unbind(conn)
+            with self._lock:
+                self._leased.pop(id(conn), None)
+                self.__closed(key)
+
+        bound = False
+        try:
+            conn = Connection(Server(addr, use_ssl=use_ssl), user=binddn,
+                              password=password)
+            bound = conn.bind()
+        finally:
+            with self._lock:
+                if bound:
+                    self._leased[id(conn)] = key
+                else:
+                    self.__closed(key)
+        return conn
+
+    def release(self, conn):
+        """Returns a leased connection to its pool. Connections that are not
+        bound, or don't fit in the pool, are unbound.
+
+        Args:
+            conn (ldap3.Connection): connection returned by acquire()
+        """
+        if conn is None:
+            return
+        with self._lock:
+            key = self._leased.pop(id(conn), None)
+            if key is not None:
+                idle = self._idle.setdefault(key, [])
+                if conn.bound and not conn.closed and \
+                        len(idle) < self.max_idle:
+                    idle.append((conn, time.time()))
+                    self._released.notify_all()
+                    return
+                if not idle:
+                    del self._idle[key]
+                self.__closed(key)
+        self.__unbind(conn)
+
+    @contextmanager
+    def connection(self, addr, binddn=None, password=None, use_ssl=True):
+        """Context manager version of acquire() and release()
+
+        Usage::
+
+            with ldap_pool.connection('ldaps://ldp.foo.org:1636') as conn:
+                conn.search(...)
+        """
+        conn = self.acquire(addr, binddn, password, use_ssl)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def clear(self):
+        """Unbinds all the idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            for key, conns in idle.items():
+                for _ in conns:
+                    self.__closed(key)
+        for conns in idle.values():
+            for conn, _ in conns:
+                self.__unbind(conn)
+
+
+ldap_pool = LdapPool()
+
+
+def paged_search(conn, search_base, search_filter, attributes,
+                 search_scope=SUBTREE, page_size=500):
+    """Iterates over the entries matching a search, fetching them page by
+    page with the simple paged results control, so that only one page is
+    held in memory however many entries match.
+
+    The connection may be used for other operations, e.g. to modify the
+    yielded entries, while iterating.
+
+    Args:
+        conn (ldap3.Connection): bound connection
+        search_base (string): base dn of the search
+        search_filter (string): filter of the search
+        attributes (list): attributes to return, only the ones the caller
+            uses should be requested. ['1.1'] returns dns only.
+        search_scope: ldap3 scope of the search
+        page_size (int): number of entries in a page
+
+    Yields:
+        dict: entry with the keys 'dn' and 'attributes'
+    """
+    if not attributes:
+        raise ValueError("attributes to return must be given")
+
+    entries = conn.extend.standard.paged_search(
+        search_base=search_base, search_filter=search_filter,
+        search_scope=search_scope, attributes=attributes,
+        paged_size=page_size, generator=True)
+
+    for entry in entries:
+        if entry.get('type') == 'searchResEntry':
+            yield entry
+
+
+def search_first(conn, search_base, search_filter, attributes,
+                 search_scope=SUBTREE):
+    """Returns the first entry matching a search, asking the server to stop
+    after one entry.
+
+    Args: see paged_search()
+
+    Returns:
+        dict: entry with the keys 'dn' and 'attributes', None if no entry
+            matches
+    """
+    if not attributes:
+        raise ValueError("attributes to return must be given")
+
+    conn.search(search_base=search_base, search_filter=search_filter,
+                search_scope=search_scope, attributes=attributes,
+                size_limit=1)
+
+    for entry in conn.response or []:
+        if entry.get('type') == 'searchResEntry':
+            return entry
+
+
 class LdapOLC(object):
     """A wrapper class to operate on the o=gluu DIT of the LDAP.
 
@@ -46,23 +374,31 @@ class LdapOLC(object):
         self.passwd = passwd
         self.server = None
         self.conn = None
+        self._released = False
         self.hostname = get_host_port(addr)[0]
 
     def connect(self):
-        """Makes connection to ldap server and returns result
+        """Leases a connection to the ldap server from the connection pool
+        and returns the bind result
         
         Returns:
             the ldap connection result
         """
         logger.debug("Making Ldap Connection")
-        self.server = Server(self.addr, use_ssl=True)
-        self.conn = Connection(
-            self.server, user=self.binddn, password=self.passwd)
-        return self.conn.bind()
+        self.close()
+        self.conn = ldap_pool.acquire(self.addr, self.binddn, self.passwd)
+        self._released = False
+        self.server = self.conn.server
+        return self.conn.bound
 
     def close(self):
-        """Closes ldap connection"""
-        self.conn.unbind()
+        """Returns the ldap connection to the pool"""
+        if self.conn is not None and not self._released:
+            ldap_pool.release(self.conn)
+        self._released = True
+
+    def __del__(self):
+        self.close()
 
     def loadModules(self, *modules):
         """This function creates ldap entry on server for loading nodules.
@@ -114,7 +450,7 @@ class LdapOLC(object):
         
         return self.conn.search(search_base='cn=config',
                                 search_filter='(olcSuffix=cn=accesslog)',
-                                search_scope=SUBTREE, attributes=["*"])
+                                search_scope=SUBTREE, attributes=['1.1'])
 
     def accesslogDBEntry(self, replicator_dn, 
                             log_dir="/opt/gluu/data/accesslog"):
@@ -154,7 +490,7 @@ class LdapOLC(object):
         """
         return self.conn.search(search_base='olcDatabase={1}mdb,cn=config',
                                 search_filter='(olcOverlay=syncprov)',
-                                search_scope=SUBTREE, attributes=["*"])
+                                search_scope=SUBTREE, attributes=['1.1'])
 
     def syncprovOverlaysDB1(self):
         """This function creates overlay configuration on first database
@@ -186,7 +522,7 @@ class LdapOLC(object):
         """
         return self.conn.search(search_base='olcDatabase={2}mdb,cn=config',
                                 search_filter='(olcOverlay=syncprov)',
-                                search_scope=SUBTREE, attributes=["*"])
+                                search_scope=SUBTREE, attributes=['1.1'])
 
     def syncprovOverlaysDB2(self):
         """This function creates overlay configuration on second database
@@ -455,7 +791,7 @@ class LdapOLC(object):
         
         return self.conn.search(search_base='cn=config',
                                 search_filter='(olcSuffix=cn=accesslog)',
-                                search_scope=SUBTREE, attributes=["*"])
+                                search_scope=SUBTREE, attributes=['1.1'])
 
     def addTestUser(self,  cn, sn, mail):
         """Adds test user
@@ -709,135 +1045,130 @@ class LdapOLC(object):
             
             self.conn.modify(dn, {'oxCacheConfiguration': [MODIFY_REPLACE, oxCacheConfiguration_js]})        
     
-    def getSyntaxes(self):
-        self.conn.search(search_base='cn=schema',
-                                search_filter='(objectclass=*)',
-                                search_scope=BASE, attributes=["ldapSyntaxes"])
+    def __schema_response(self, attribute):
+        # the schema is served from the catalog instead of being fetched on
+        # every call, in the shape of a search response
+        schema = self.getSchema()
+        values = {
+            'ldapSyntaxes': schema.ldap_syntaxes,
+            'attributeTypes': schema.attribute_types,
+            'objectClasses': schema.object_classes,
+            }
+        return [{'dn': 'cn=schema',
+                 'attributes': {attribute: values[attribute]}}]
 
-        return self.conn.response
+    def getSyntaxes(self):
+        return self.__schema_response('ldapSyntaxes')
     
     def getAttributes(self):
-        self.conn.search(search_base='cn=schema',
-                                search_filter='(objectclass=*)',
-                                search_scope=BASE, attributes=["attributeTypes"])
+        return self.__schema_response('attributeTypes')
 
-        return self.conn.response
 
+    def getSchema(self):
+        """Returns the cached schema of this server, see
+        :object:`clustermgr.core.schema_catalog.SchemaCatalog`
+        """
+        return schema_catalog.get(self.addr, self.conn)
 
-    def getCustomAttributes(self):
+    def schemaChanged(self):
+        """Drops the cached schema after it was modified"""
+        schema_catalog.invalidate(self.addr)
+
+    def __custom_x_origin(self):
         setup_prop = get_setup_properties()
         inumOrg = setup_prop['inumOrg']
         inumOrgFN = inumOrg.replace('@','').replace('!','').replace('.','')
-        x_origin = "X-ORIGIN '{}'".format(inumOrgFN)
-        
-        atrributes = self.getAttributes()
-        ret_list = []
-        for ats in atrributes[0]['attributes']['attributeTypes']:
-            if x_origin in ats:
-                ret_list.append(ats)
-        return ret_list
+        return "X-ORIGIN '{}'".format(inumOrgFN)
 
-    def getObjectClasses(self):
-        self.conn.search(search_base='cn=schema',
-                                search_filter='(objectclass=*)',
-                                search_scope=BASE, attributes=["objectClasses"])
+    def getCustomAttributes(self):
+        custom = self.getSchema().get_custom_attributes(
+                                                    self.__custom_x_origin())
+        return [definition for definition, _ in custom]
+
+    def getCustomAttributeTypes(self):
+        """Returns the parsed AttributeType objects of custom attributes.
+        These are shared with the schema cache and must not be modified.
+        """
+        custom = self.getSchema().get_custom_attributes(
+                                                    self.__custom_x_origin())
+        return [attribute for _, attribute in custom]
 
-        return self.conn.response
+    def getObjectClasses(self):
+        return self.__schema_response('objectClasses')
     
     def getObjectClass(self, object_class_name):
-        object_classes = self.getObjectClasses()
-        name = "'{}'".format(object_class_name)
-        for objcl in object_classes[0]['attributes']['objectClasses']:
-            if name in objcl:
-                return objcl
+        return self.getSchema().get_class_string(object_class_name)
     
+    def schemaChangeset(self):
+        """Returns an empty changeset of the schema of this server, see
+        :object:`clustermgr.core.schema_changeset.SchemaChangeset`
+        """
+        return SchemaChangeset(self.getSchema())
+
+    def applySchemaChanges(self, changeset):
+        """Validates and writes the changes of a changeset to cn=schema
+
+        Returns:
+            tuple: (True, 'success') or (False, error message)
+        """
+        if not len(changeset):
+            return True, 'success'
+        r = changeset.apply(self.conn)
+        self.schemaChanged()
+        return r
+
     def addAtributeToObjectClass(self, object_class_name, attribute_name):
         
         if not type(attribute_name) == type([]):
             attribute_name = [attribute_name]
-        
-        objcl_s = self.getObjectClass(object_class_name)
-        if objcl_s:
-            self.conn.modify("cn=schema", {'objectClasses': [MODIFY_DELETE, objcl_s]})
-            if not self.conn.result['description']== 'success':
-                return False, self.conn.result['description']+'({})'.format(self.conn.result['message'])
-        else:
-            objcl_s = "( 1.3.6.1.4.1.48710.1.4.200 NAME '{}' SUP top AUXILIARY )".format(object_class_name)
-        
-        obcl_obj = ObjectClass(objcl_s)
-        
-        may_list = list(obcl_obj.may)
-        
-        
-        for attribute in attribute_name:
-            if not attribute in may_list:
-                may_list.append(attribute)
-        
-        obcl_obj.may = tuple(may_list)
-        self.conn.modify("cn=schema", {'objectClasses': [MODIFY_ADD, str(obcl_obj)]})
-        if not self.conn.result['description']== 'success':
-            return False, self.conn.result['description']
 
-        return True, 'success'
+        changeset = self.schemaChangeset()
+        changeset.add_to_class(object_class_name, attribute_name,
+                               create_oid=CUSTOM_OBJECT_CLASS_OID)
+        return self.applySchemaChanges(changeset)
     
     def removeAtributeFromObjectClass(self, object_class_name, attribute_name):
-        objcl_s = self.getObjectClass(object_class_name)
-        if objcl_s:
-            obcl_obj = ObjectClass(objcl_s)
-            may_list = list(obcl_obj.may)
-            if attribute_name in may_list:
-                self.conn.modify("cn=schema", {'objectClasses': [MODIFY_DELETE, objcl_s]})
-                if not self.conn.result['description']== 'success':
-                    return False, self.conn.result['description']
-                may_list.remove(attribute_name)
-                obcl_obj.may = tuple(may_list)
-                self.conn.modify("cn=schema", {'objectClasses': [MODIFY_ADD, str(obcl_obj)]})
-                if not self.conn.result['description']== 'success':
-                    return False, self.conn.result['description']
-                    
-        return True, 'success'
+        changeset = self.schemaChangeset()
+        if self.getObjectClass(object_class_name):
+            changeset.remove_from_class(object_class_name, [attribute_name])
+        return self.applySchemaChanges(changeset)
         
     def addAttribute(self, attribute, editing=None, objcls=None):
         
-        print "EDITING", editing
-        
-        name = "'{}'".format(attribute.names[0])
-        
-        atrributes = self.getAttributes()
-        
-        for ats in atrributes[0]['attributes']['attributeTypes']:
-            if editing:
-                if editing in ats:
-                    a = AttributeType(str(ats))
-                    r = self.removeAtributeFromObjectClass(objcls, a.names[0])
-                    if not r:
-                        return False, self.conn.result['description']
-                    r = self.removeAttribute(editing)
-                    if not r[0]:
-                        return r
-            else:
-                if name in ats:
-                    return False, 'This attribute name exists'
+        changeset = self.schemaChangeset()
 
-        r = self.conn.modify("cn=schema", {'attributeTypes': [MODIFY_ADD, attribute]})
+        if editing and self.getAttributebyOID(editing):
+            a = self.getSchema().get_attribute(editing)
+            if objcls and a.names[0] not in attribute.names:
+                changeset.remove_from_class(objcls, [a.names[0]])
+            changeset.add_attribute(attribute, replaces=editing)
+        else:
+            changeset.add_attribute(attribute)
 
-        if r:
+        if objcls:
+            changeset.add_to_class(objcls, [attribute.names[0]],
+                                   create_oid=CUSTOM_OBJECT_CLASS_OID)
+
+        r = self.applySchemaChanges(changeset)
+        if r[0]:
             return True, ''
-        else:
-            return False, self.conn.result['description']
+        return r
 
     def getAttributebyOID(self, oid):
-        atrributes = self.getCustomAttributes()
-        for ats in atrributes:
-            if oid in ats:
-                return ats
-
-    def removeAttribute(self, oid):
-        atrribute = self.getAttributebyOID(oid)
-        if atrribute:
-            r = self.conn.modify("cn=schema", {'attributeTypes': [MODIFY_DELETE, atrribute]})
-            if not r:
-                return False, self.conn.result['description']
+        ats = self.getSchema().get_attribute_string(oid)
+        if ats and self.__custom_x_origin() in ats:
+            return ats
+
+    def removeAttribute(self, oid, objcls=None):
+        if self.getAttributebyOID(oid):
+            changeset = self.schemaChangeset()
+            if objcls and self.getObjectClass(objcls):
+                changeset.remove_from_class(
+                    objcls, self.getSchema().get_attribute(oid).names)
+            changeset.remove_attribute(oid)
+            r = self.applySchemaChanges(changeset)
+            if not r[0]:
+                return r
         return True, ''
 
     def registerObjectClass(self, obcls):
@@ -908,26 +1239,31 @@ class DBManager(object):
         ip (string, optional): ip address of the server for connection fallback
     """
     def __init__(self, hostname, port, password, ssl=True, ip=None):
-        self.server = Server(hostname, port=port, use_ssl=ssl)
-        
         setup_prop = get_setup_properties()
         
         ldap_user = "cn=directory manager"
         if setup_prop['ldap_type'] == "openldap":
             ldap_user += ",o=gluu"
 
-        self.conn = Connection(self.server, 
-                                ldap_user,
-                                password=password)
-        result = self.conn.bind()
+        self.conn = None
+        self.conn = ldap_pool.acquire('{}:{}'.format(hostname, port),
+                                      ldap_user, password, use_ssl=ssl)
+
+        if not self.conn.bound:
+            ldap_pool.release(self.conn)
+            self.conn = ldap_pool.acquire('{}:{}'.format(ip, port),
+                                          ldap_user, password, use_ssl=ssl)
+
+        self.server = self.conn.server
 
-        if not result:
-            self.server = Server(ip, port=port, use_ssl=ssl)
-            self.conn = Connection(
-                self.server, ldap_user,
-                password=password)
+    def close(self):
+        """Returns the ldap connection to the pool"""
+        if self.conn is not None:
+            ldap_pool.release(self.conn)
+            self.conn = None
 
-        self.conn.bind()
+    def __del__(self):
+        self.close()
 
 
     def get_appliance_attributes(self, *args):
@@ -939,9 +1275,10 @@ class DBManager(object):
         Returns:
             the ldap entry
         """
-        self.conn.search(search_base="o=gluu",
+        self.conn.search(search_base="ou=appliances,o=gluu",
                          search_filter='(objectclass=gluuAppliance)',
-                         search_scope=SUBTREE, attributes=list(args))
+                         search_scope=LEVEL, attributes=list(args),
+                         size_limit=1)
         return self.conn.entries[0]
 
     def set_applicance_attribute(self, attribute, value):
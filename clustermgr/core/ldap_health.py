@@ -0,0 +1,156 @@
+"""ldap_health.py - concurrent health checks of the ldap servers.
+
+The servers are checked by the celery task
+:func:`clustermgr.tasks.get_remote_stats.probe_ldap_health` and the results
+are kept in redis, so the number of open dashboards doesn't change the
+number of connections made to the ldap servers.
+"""
+import json
+import time
+import logging
+from multiprocessing.pool import ThreadPool
+
+from ldap3 import Server, Connection, BASE
+
+from clustermgr.extensions import redis_client
+
+
+logger = logging.getLogger(__name__)
+
+
+def check_ldap(hostname, port=1636, timeout=5):
+    """Connects to the ldap server over ssl, binds anonymously and reads the
+    root DSE. A new connection is made on every check, so that the connect
+    and bind times are measured.
+
+    Args:
+        hostname (string): hostname of the ldap server
+        port (int): ldaps port
+        timeout (int): seconds to wait for the connection and the responses
+
+    Returns:
+        dict: with the keys
+            up: True if the root DSE could be read
+            bind: True if the bind succeeded
+            connect_time: seconds to open the connection, None if it failed
+            bind_time: seconds to bind, None if it failed
+            search_time: seconds to read the root DSE, None if it failed
+            error: error message, None if the server is up
+            checked_at: unix time of the check
+    """
+    result = {
+        'up': False,
+        'bind': False,
+        'connect_time': None,
+        'bind_time': None,
+        'search_time': None,
+        'error': None,
+        'checked_at': time.time(),
+    }
+
+    conn = Connection(Server(hostname, port=port, use_ssl=True,
+                             connect_timeout=timeout),
+                      receive_timeout=timeout)
+    try:
+        started = time.time()
+        conn.open()
+        result['connect_time'] = round(time.time() - started, 4)
+
+        started = time.time()
+        result['bind'] = conn.bind()
+        if not result['bind']:
+            result['error'] = conn.result['description']
+            return result
+        result['bind_time'] = round(time.time() - started, 4)
+
+        started = time.time()
+        if conn.search(search_base='', search_filter='(objectClass=*)',
+                       search_scope=BASE, attributes=['1.1']):
+            result['search_time'] = round(time.time() - started, 4)
+            result['up'] = True
+        else:
+            result['error'] = conn.result['description']
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    return result
+
+
+def check_ldap_servers(hostnames, port=1636, timeout=5):
+    """Checks the ldap servers concurrently, see check_ldap()
+
+    Args:
+        hostnames (list): hostnames of the servers
+        port (int): ldaps port
+        timeout (int): seconds to wait for each server
+
+    Returns:
+        dict: {hostname: result of check_ldap()}
+    """
+    if not hostnames:
+        return {}
+
+    pool = ThreadPool(len(hostnames))
+    try:
+        results = pool.map(lambda h: check_ldap(h, port, timeout), hostnames)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(hostnames, results))
+
+
+class LdapHealthCache(object):
+    """Keeps the last health check result of every ldap server in a redis
+    hash, keyed by the id of the server.
+
+    Args:
+        max_age (int): seconds after which a result is considered stale
+    """
+    key = 'clustermgr:ldap_health'
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.r = redis_client
+
+    def store(self, results):
+        """Replaces the stored results, so that removed servers are dropped
+
+        Args:
+            results (dict): {server id: result of check_ldap()}
+        """
+        pipe = self.r.pipeline()
+        pipe.delete(self.key)
+        if results:
+            pipe.hmset(self.key, dict((str(server_id), json.dumps(result))
+                                      for server_id, result
+                                      in results.items()))
+        pipe.execute()
+
+    def get(self, server_id):
+        """Returns the last result of the server, None if there is none"""
+        data = self.r.hget(self.key, str(server_id))
+        if data:
+            return json.loads(data)
+
+    def get_all(self):
+        """Returns {server id: last result} of all the checked servers"""
+        return dict((int(server_id), json.loads(data))
+                    for server_id, data in self.r.hgetall(self.key).items())
+
+    def is_stale(self, result):
+        return not result or \
+            time.time() - result.get('checked_at', 0) > self.max_age
+
+    def acquire_probe_lock(self, timeout=30):
+        """Returns True if no other probe was started in the last `timeout`
+        seconds, so that stale results trigger a single probe.
+        """
+        return bool(self.r.set(self.key + ':lock', 1, nx=True, ex=timeout))
+
+
+ldap_health = LdapHealthCache()
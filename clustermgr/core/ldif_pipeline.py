@@ -0,0 +1,415 @@
+"""ldif_pipeline.py - streaming bulk import and export of LDIF data.
+"""
+import os
+import gzip
+import json
+import time
+import Queue
+import logging
+import threading
+
+from ldif import LDIFParser, LDIFWriter
+from ldap3 import SUBTREE, MODIFY_REPLACE
+
+from clustermgr.core.ldap_functions import ldap_pool
+
+
+logger = logging.getLogger(__name__)
+
+# attributes maintained by the directory server itself, which can't be added
+# and are left out when exports are imported
+OPERATIONAL_ATTRIBUTES = [
+    'entryUUID', 'entryCSN', 'entryDN', 'createTimestamp', 'modifyTimestamp',
+    'creatorsName', 'modifiersName', 'structuralObjectClass',
+    'subschemaSubentry', 'hasSubordinates', 'numSubordinates',
+    'contextCSN', 'ds-sync-hist', 'ds-sync-state', 'ds-sync-generation-id',
+    ]
+
+
+def open_ldif(path, mode='rb'):
+    """Opens an LDIF file, gzip compressed if its name ends with .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class Throughput(object):
+    """Counts processed entries and reports them to a callback at most once
+    in `interval` seconds.
+
+    The callback receives a dictionary with the counters, the elapsed
+    seconds and the average rate in entries per second.
+
+    Args:
+        callback (callable): function called with the statistics
+        interval (int): seconds between two reports
+    """
+    def __init__(self, callback=None, interval=5):
+        self.callback = callback
+        self.interval = interval
+        self.counters = {}
+        self.started_at = time.time()
+        self._reported_at = self.started_at
+        self._lock = threading.Lock()
+
+    def count(self, counter, n=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        elapsed = time.time() - self.started_at
+        stats['elapsed'] = round(elapsed, 1)
+        stats['rate'] = round(stats.get('entries', 0) / elapsed, 1) \
+            if elapsed else 0
+        return stats
+
+    def report(self, force=False):
+        """Calls the callback if `interval` seconds have passed since the
+        last report, or `force` is set.
+        """
+        now = time.time()
+        if not force and now - self._reported_at < self.interval:
+            return
+        self._reported_at = now
+        if self.callback:
+            self.callback(self.stats())
+
+
+class Checkpoint(object):
+    """Remembers how far an import has got, so that an interrupted import
+    can be resumed.
+
+    Batches complete in any order, the checkpoint is advanced only over the
+    batches that completed without a gap. It is stored as json with the dn
+    of the last entry and the number of entries up to that entry.
+
+    Args:
+        path (string): checkpoint file, None to disable checkpointing
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = 0
+        self.dn = None
+        self._next = 0
+        self._completed = {}
+        self._lock = threading.Lock()
+        self._advanced = threading.Condition(self._lock)
+
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.entries = data['entries']
+            self.dn = data['dn']
+
+    def complete(self, seq, last_dn, size):
+        """Marks batch `seq` as completed"""
+        with self._lock:
+            self._completed[seq] = (last_dn, size)
+            advanced = False
+            while self._next in self._completed:
+                dn, n = self._completed.pop(self._next)
+                self.dn = dn
+                self.entries += n
+                self._next += 1
+                advanced = True
+            if advanced:
+                self._advanced.notify_all()
+                if self.path:
+                    self.__write()
+
+    def wait(self, seq, abort):
+        """Waits until all the batches before batch `seq` have completed.
+
+        Args:
+            seq (int): sequence number of the waiting batch
+            abort (callable): checked every second, the wait ends when it
+                returns True
+
+        Returns:
+            True if the batches completed, False if the wait was aborted
+        """
+        with self._lock:
+            while self._next < seq:
+                if abort():
+                    return False
+                self._advanced.wait(1)
+            return True
+
+    def __write(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'dn': self.dn, 'entries': self.entries}, f)
+        os.rename(tmp_path, self.path)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class LdifImporter(LDIFParser):
+    """Streams the entries of an LDIF file into an LDAP server.
+
+    The file is parsed in the calling thread and the entries are handed in
+    batches through a bounded queue to `workers` threads, each writing with
+    its own pooled connection. At most (2 * workers + 1) batches are held in
+    memory at a time, regardless of the size of the file.
+
+    Entries whose parent is not there yet, as it is being added by another
+    worker, are retried at the end of the batch. If the parent is still
+    missing after `retries` attempts, the batch waits until the batches
+    before it have completed and tries once more. Entries that still can't
+    be written are appended to the rejects file.
+
+    Usage::
+
+        importer = LdifImporter('/path/to/data.ldif', 'ldp.foo.org:1636',
+                                'cn=directory manager', 'secret',
+                                checkpoint_file='/path/to/data.checkpoint')
+        stats = importer.run()
+
+    Args:
+        ldif_file (string): path of the LDIF file, may be gzip compressed
+        addr (string): address of the ldap server, e.g. host:1636
+        binddn (string): dn to bind with
+        password (string): password of binddn
+        workers (int): number of concurrent connections
+        batch_size (int): number of entries in a batch
+        update_existing (boolean): replace the attributes of entries that
+            already exist, otherwise they are skipped
+        checkpoint_file (string): file to keep the progress in. If it exists
+            the import resumes after the entry recorded in it.
+        rejects_file (string): LDIF file to write rejected entries to
+        progress (callable): called with the statistics, see Throughput
+        report_interval (int): seconds between two progress reports
+    """
+    def __init__(self, ldif_file, addr, binddn, password, workers=4,
+                 batch_size=500, update_existing=False, checkpoint_file=None,
+                 rejects_file=None, progress=None, report_interval=5):
+        self.ldif_file = ldif_file
+        self.addr = addr
+        self.binddn = binddn
+        self.password = password
+        self.workers = workers
+        self.batch_size = batch_size
+        self.update_existing = update_existing
+        self.rejects_file = rejects_file or ldif_file + '.rejects'
+        self.checkpoint = Checkpoint(checkpoint_file)
+        self.throughput = Throughput(progress, report_interval)
+        self.retries = 3
+
+        self._queue = Queue.Queue(maxsize=workers)
+        self._batch = []
+        self._seq = 0
+        self._read = 0
+        self._rejects = None
+        self._rejects_lock = threading.Lock()
+        self._error = None
+
+    def handle(self, dn, entry):
+        if self._error:
+            # a worker lost the server, stop reading
+            raise self._error
+        self._read += 1
+        if self._read <= self.checkpoint.entries:
+            # already imported by a previous run
+            if self._read == self.checkpoint.entries and \
+                    dn.lower() != self.checkpoint.dn.lower():
+                raise ValueError("{} does not match the checkpoint, expected "
+                                 "{} as entry {}".format(self.ldif_file,
+                                 self.checkpoint.dn, self._read))
+            return
+        self._batch.append((dn, entry))
+        if len(self._batch) >= self.batch_size:
+            self.__put_batch()
+        self.throughput.report()
+
+    def __put_batch(self):
+        if self._batch:
+            self._queue.put((self._seq, self._batch))
+            self._seq += 1
+            self._batch = []
+
+    def run(self):
+        """Imports the file and waits for all the entries to be written.
+
+        Returns:
+            dict: statistics, see Throughput
+        """
+        if self.checkpoint.entries:
+            logger.info("Resuming import of %s after %s", self.ldif_file,
+                        self.checkpoint.dn)
+            self.throughput.count('resumed', self.checkpoint.entries)
+
+        threads = [threading.Thread(target=self.__work)
+                   for _ in range(self.workers)]
+        for t in threads:
+            t.daemon = True
+            t.start()
+
+        try:
+            with open_ldif(self.ldif_file) as f:
+                LDIFParser.__init__(self, f, ignored_attr_types=[
+                                    a.lower() for a in OPERATIONAL_ATTRIBUTES])
+                self.parse()
+            self.__put_batch()
+        finally:
+            for _ in threads:
+                self._queue.put(None)
+            for t in threads:
+                t.join()
+            if self._rejects:
+                self._rejects.close()
+
+        if self._error:
+            # the checkpoint is kept, so that the import can be resumed
+            raise self._error
+
+        self.checkpoint.remove()
+        self.throughput.report(force=True)
+        return self.throughput.stats()
+
+    def __work(self):
+        conn = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                if self._error:
+                    # drain the queue so that the parser is not blocked
+                    continue
+                seq, batch = item
+                try:
+                    conn = self.__write_batch(conn, seq, batch)
+                except Exception as e:
+                    logger.error("LDIF import to %s failed: %s", self.addr, e)
+                    self._error = e
+                    conn = None
+                    continue
+                if self._error:
+                    # the batch gave up waiting for a failed one, the
+                    # checkpoint must not pass its entries
+                    continue
+                self.checkpoint.complete(seq, batch[-1][0], len(batch))
+        finally:
+            ldap_pool.release(conn)
+
+    def __connection(self, conn):
+        if conn is None or conn.closed or not conn.bound:
+            ldap_pool.release(conn)
+            conn = ldap_pool.acquire(self.addr, self.binddn, self.password)
+            if not conn.bound:
+                raise ValueError("Can't bind to {}: {}".format(
+                                    self.addr, conn.result['description']))
+        return conn
+
+    def __write_batch(self, conn, seq, batch):
+        pending = batch
+        for attempt in range(self.retries + 2):
+            last_attempt = attempt == self.retries + 1
+            missing_parent = []
+            for dn, entry in pending:
+                conn = self.__connection(conn)
+                try:
+                    result = self.__write_entry(conn, dn, entry)
+                except Exception as e:
+                    # the connection broke, retry once with a new one
+                    logger.warning("Writing %s failed, reconnecting: %s",
+                                   dn, e)
+                    ldap_pool.release(conn)
+                    conn = self.__connection(None)
+                    result = self.__write_entry(conn, dn, entry)
+
+                if result == 'noSuchObject' and not last_attempt:
+                    missing_parent.append((dn, entry))
+                elif result in ('added', 'updated', 'skipped'):
+                    self.throughput.count(result)
+                    self.throughput.count('entries')
+                else:
+                    self.__reject(dn, entry, result)
+
+            if not missing_parent:
+                break
+            pending = missing_parent
+            if attempt < self.retries:
+                time.sleep(0.5 * (attempt + 1))
+                continue
+            # the parents may be in earlier batches which other workers are
+            # still writing, try once more when those have completed
+            if not self.checkpoint.wait(seq, lambda: self._error):
+                break
+
+        return conn
+
+    def __write_entry(self, conn, dn, entry):
+        conn.add(dn, attributes=entry)
+        result = conn.result['description']
+        if result == 'success':
+            return 'added'
+        if result != 'entryAlreadyExists':
+            return result
+        if not self.update_existing:
+            return 'skipped'
+
+        conn.modify(dn, dict((attr, [(MODIFY_REPLACE, values)])
+                             for attr, values in entry.items()))
+        result = conn.result['description']
+        return 'updated' if result == 'success' else result
+
+    def __reject(self, dn, entry, reason):
+        logger.warning("Entry %s was rejected: %s", dn, reason)
+        self.throughput.count('rejected')
+        self.throughput.count('entries')
+        with self._rejects_lock:
+            if self._rejects is None:
+                self._rejects = open_ldif(self.rejects_file, 'ab')
+            self._rejects.write('# {}\n'.format(reason))
+            LDIFWriter(self._rejects).unparse(dn, entry)
+
+
+def export_ldif(addr, binddn, password, base_dn, ldif_file,
+                search_filter='(objectClass=*)', page_size=1000,
+                progress=None, report_interval=5):
+    """Streams the entries under base_dn into an LDIF file using a paged
+    search, so only one page of entries is held in memory.
+
+    Args:
+        addr (string): address of the ldap server, e.g. host:1636
+        binddn (string): dn to bind with
+        password (string): password of binddn
+        base_dn (string): base of the subtree to export
+        ldif_file (string): path of the output, gzip compressed if it ends
+            with .gz
+        search_filter (string): filter of the entries to export
+        page_size (int): number of entries in a page
+        progress (callable): called with the statistics, see Throughput
+        report_interval (int): seconds between two progress reports
+
+    Returns:
+        dict: statistics, see Throughput
+    """
+    throughput = Throughput(progress, report_interval)
+
+    with ldap_pool.connection(addr, binddn, password) as conn:
+        if not conn.bound:
+            raise ValueError("Can't bind to {}: {}".format(
+                                        addr, conn.result['description']))
+
+        entries = conn.extend.standard.paged_search(
+            search_base=base_dn, search_filter=search_filter,
+            search_scope=SUBTREE, attributes=['*'], paged_size=page_size,
+            generator=True)
+
+        with open_ldif(ldif_file, 'wb') as f:
+            writer = LDIFWriter(f)
+            for entry in entries:
+                if entry.get('type') != 'searchResEntry':
+                    continue
+                writer.unparse(entry['dn'], dict(entry['raw_attributes']))
+                throughput.count('entries')
+                throughput.report()
+
+    throughput.report(force=True)
+    return throughput.stats()
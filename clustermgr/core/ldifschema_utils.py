@@ -2,11 +2,16 @@ from ldap.schema import AttributeType, ObjectClass, LDAPSyntax
 from ldif import LDIFParser
 import os
 
+from clustermgr.core.schema_catalog import index_keys
+
 class OpenDjSchema(LDIFParser):
 
     def __init__(self, schema_file):
         self.attribute_names = []
         self.class_names = []
+        # lower cased names and OIDs, indexed like the schema catalog
+        self._attributes = {}
+        self._classes = {}
         self.schema_file = schema_file
         LDIFParser.__init__(self,open(schema_file, 'rb'))
         self.parse()
@@ -21,26 +26,30 @@ class OpenDjSchema(LDIFParser):
                     }
         
         for ocls in entry.get('objectClasses',[]):
-            o = ObjectClass(ocls)
-            self.schema['objectClasses'].append(o)
-            for name in o.names:
-                self.class_names.append(name)
+            self.__add_class(ObjectClass(ocls))
 
         for atyp in entry.get('attributeTypes',[]):
-            a = AttributeType(atyp)
-            self.schema['attributeTypes'].append(a)
-            for name in a.names:
-                self.attribute_names.append(name)
+            self.__add_attribute(AttributeType(atyp))
+
+    def __add_attribute(self, a):
+        self.schema['attributeTypes'].append(a)
+        for name in a.names:
+            self.attribute_names.append(name)
+        for key in index_keys(a):
+            self._attributes.setdefault(key, a)
+
+    def __add_class(self, o):
+        self.schema['objectClasses'].append(o)
+        for name in o.names:
+            self.class_names.append(name)
+        for key in index_keys(o):
+            self._classes.setdefault(key, o)
 
     def get_attribute_by_name(self, name):
-        for o in self.schema['attributeTypes']:
-            if name in o.names:
-                return o
+        return self._attributes.get(name.lower())
 
     def get_class_by_name(self, name):
-        for o in self.schema['objectClasses']:
-            if name in o.names:
-                return o
+        return self._classes.get(name.lower())
 
     def add_attribute_to_class(self, class_name, attribute_name):
         c = self.get_class_by_name(class_name)
@@ -99,21 +108,13 @@ class OpenDjSchema(LDIFParser):
         a.no_user_mod = no_user_mod
         a.usage = usage
 
-        self.schema['attributeTypes'].append(a)
-        for name in a.names:
-            self.attribute_names.append(name)
+        self.__add_attribute(a)
 
     def add_attributes(self, s):
-        a = AttributeType(s)
-        self.schema['attributeTypes'].append(a)
-        for name in a.names:
-            self.attribute_names.append(name)
+        self.__add_attribute(AttributeType(s))
 
     def add_classs(self, s):
-        o = ObjectClass(s)
-        self.schema['objectClasses'].append(o)
-        for name in o.names:
-            self.class_names.append(name)
+        self.__add_class(ObjectClass(s))
 
 def parse_open_ldap_schema(fn):
     f = open(fn).readlines()
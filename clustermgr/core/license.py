@@ -1,6 +1,8 @@
 import ConfigParser
+import hashlib
 import json
 import os
+import threading
 import time
 from datetime import datetime
 from datetime import timedelta
@@ -32,10 +34,23 @@ def current_date_millis():
     return int(time.time() * 1000)
 
 
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
 class LicenseManager(object):
     def __init__(self, app=None, redirect_endpoint=""):
         self.redirect_endpoint = redirect_endpoint
         self.app = app
+        # validation result, see validate_license()
+        self._license = None
+        # parsed config file, see load_license_config()
+        self._config = None
+        self._lock = threading.Lock()
+        self._refreshing = False
         if app:
             self.init_app(app, redirect_endpoint)
 
@@ -65,6 +80,16 @@ class LicenseManager(object):
             "LICENSE_ENFORCEMENT_ENABLED",
             True,
         )
+        # Seconds a validated license is used before it is validated again
+        # in the background, and the same for a failed validation.
+        app.config.setdefault(
+            "LICENSE_CACHE_TTL",
+            3600,
+        )
+        app.config.setdefault(
+            "LICENSE_ERROR_CACHE_TTL",
+            60,
+        )
 
         app.extensions = getattr(app, "extensions", {})
         app.extensions["license_manager"] = self
@@ -107,7 +132,73 @@ class LicenseManager(object):
                            "instance and no application bound "
                            "to current context")
 
+    def _cache_key(self):
+        app = self._get_app()
+        cfg, cfg_hash = self._load_license_config()
+        return (_mtime(app.config["LICENSE_SIGNED_FILE"]), cfg_hash)
+
     def validate_license(self):
+        """Returns the validation result of the license.
+
+        Decoding the signed license launches a JVM, so the result is kept in
+        memory and validated again only when the signed license file or the
+        config file change. A result older than ``LICENSE_CACHE_TTL`` seconds
+        (``LICENSE_ERROR_CACHE_TTL`` for failed validations) is still
+        returned, while the license is validated again in a background
+        thread.
+
+        :returns: A tuple of the data and error message from validation process.
+        """
+        key = self._cache_key()
+        cached = self._license
+
+        if not cached or cached["key"] != key:
+            return self._validate(key)
+
+        app = self._get_app()
+        ttl = app.config["LICENSE_ERROR_CACHE_TTL"] if cached["err"] \
+            else app.config["LICENSE_CACHE_TTL"]
+        if time.time() - cached["validated_at"] > ttl:
+            self._refresh_in_background(key)
+
+        return cached["data"], cached["err"]
+
+    def _validate(self, key):
+        license_data, err = self.validate_license_uncached()
+        with self._lock:
+            self._license = {
+                "key": key,
+                "data": license_data,
+                "err": err,
+                "validated_at": time.time(),
+            }
+        return license_data, err
+
+    def _refresh_in_background(self, key):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._validate(key)
+            finally:
+                self._refreshing = False
+
+        thread = threading.Thread(target=refresh)
+        thread.daemon = True
+        thread.start()
+
+    def invalidate_license_cache(self):
+        """Drops the cached validation result, so the next call of
+        validate_license() decodes the signed license again.
+        """
+        with self._lock:
+            self._license = None
+            self._config = None
+
+    def validate_license_uncached(self):
         """Validates the license.
 
         The process involves 3 steps:
@@ -179,21 +270,38 @@ class LicenseManager(object):
         app = self._get_app()
         with open(app.config["LICENSE_CONFIG_FILE"], "wb") as fw:
             parser.write(fw)
+        self.invalidate_license_cache()
 
     def load_license_config(self):
         """Reads the config file and extract the data.
 
         :returns: A ``dict`` of configuration items.
         """
+        cfg, _ = self._load_license_config()
+        return dict(cfg)
+
+    def _load_license_config(self):
+        # the parsed config and its hash are kept until the file changes
         app = self._get_app()
+        path = app.config["LICENSE_CONFIG_FILE"]
+        mtime = _mtime(path)
+
+        config = self._config
+        if config and config["path"] == path and config["mtime"] == mtime:
+            return config["cfg"], config["hash"]
+
         parser = ConfigParser.SafeConfigParser()
-        parser.read(app.config["LICENSE_CONFIG_FILE"])
+        parser.read(path)
 
         try:
             cfg = dict(parser.items("license"))
         except ConfigParser.NoSectionError:
             cfg = {}
-        return cfg
+
+        cfg_hash = hashlib.sha1(json.dumps(cfg, sort_keys=True)).hexdigest()
+        self._config = {"path": path, "mtime": mtime, "cfg": cfg,
+                        "hash": cfg_hash}
+        return cfg, cfg_hash
 
     def get_signed_license(self, license_id):
         """Gets signed license either from file. If it can't get the signed
@@ -0,0 +1,251 @@
+"""profiling.py - timings of the remote operations of celery tasks.
+
+While a celery task runs, the SSH commands, file transfers, LDAP operations
+and InfluxDB writes it makes are timed and their sizes counted. The timings
+are summed up per host, step, kind of operation and command, and stored in
+the :class:`clustermgr.models.TaskProfile` of the task when it ends, so the
+profile of a long running operation shows where its time went.
+
+Operations are instrumented with :func:`timed` or :func:`span`::
+
+    class RemoteClient(object):
+
+        @timed('ssh', label=lambda self, command: command)
+        def run(self, command):
+            ...
+
+    with span('influxdb', 'localhost', 'write_points') as s:
+        client.write_points(points)
+        s['bytes'] = len(json.dumps(points))
+
+The profile is collected by the task's process, including the threads the
+task starts, which fits the prefork pool of the celery workers. Outside of
+a profiled task the timers do nothing.
+"""
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from functools import wraps
+
+from clustermgr.extensions import db
+from clustermgr.models import TaskProfile
+
+
+logger = logging.getLogger(__name__)
+
+# labels of the operations are cut to this length
+LABEL_LENGTH = 120
+
+_local = threading.local()
+
+
+class TaskProfiler(object):
+    """Sums up the operations of a task.
+
+    Args:
+        task_id (string): id of the celery task
+        task_name (string): name of the celery task
+    """
+    def __init__(self, task_id, task_name):
+        self.task_id = task_id
+        self.task_name = task_name
+        self.started_at = datetime.utcnow()
+        self.started = time.time()
+        # (host, step, kind, label) -> [count, seconds, bytes]
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, host, kind, label, seconds, size=0):
+        """Adds an operation
+
+        Args:
+            host (string): the server the operation was made with
+            kind (string): ssh, upload, download, ldap, influxdb, ...
+            label (string): the command or the name of the operation
+            seconds (float): the time the operation took
+            size (int): bytes sent and received
+        """
+        label = ' '.join(str(label).split())[:LABEL_LENGTH]
+        key = (host or '', current_step() or '', kind, label)
+        with self._lock:
+            totals = self.spans.setdefault(key, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += size or 0
+
+    def rows(self):
+        """Returns the sums as [host, step, kind, label, count, seconds,
+        bytes] lists"""
+        with self._lock:
+            return [list(key) + [count, round(seconds, 4), size]
+                    for key, (count, seconds, size) in self.spans.items()]
+
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def active_profiler():
+    """Returns the profiler of the task running in this process, None if
+    no task is profiled"""
+    return _active
+
+
+def current_step():
+    """Returns the name of the step the current thread works on"""
+    return getattr(_local, 'step', None)
+
+
+@contextmanager
+def step(name):
+    """Attributes the operations of the current thread to the step name"""
+    previous = current_step()
+    _local.step = name
+    try:
+        yield
+    finally:
+        _local.step = previous
+
+
+@contextmanager
+def span(kind, host, label):
+    """Times the operations of the block. The yielded dict takes the number
+    of bytes of the operation as 'bytes'.
+    """
+    info = {'bytes': 0}
+    profiler = _active
+    if profiler is None:
+        yield info
+        return
+
+    started = time.time()
+    try:
+        yield info
+    finally:
+        profiler.add(host, kind, label, time.time() - started,
+                     info['bytes'])
+
+
+def timed(kind, label, size=None, host=None):
+    """Decorates a method of a client, times its calls
+
+    Args:
+        kind (string): kind of the operation
+        label (callable): called with the arguments of the method, returns
+            the label of the call
+        size (callable): called with the arguments of the method and its
+            result as `result` keyword argument, returns the bytes
+            transferred
+        host (callable): called with the client, returns the host the call
+            was made with; the `host` attribute of the client by default
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return method(self, *args, **kwargs)
+
+            started = time.time()
+            result = None
+            try:
+                result = method(self, *args, **kwargs)
+                return result
+            finally:
+                seconds = time.time() - started
+                try:
+                    nbytes = size(self, *args, result=result, **kwargs) \
+                        if size else 0
+                    profiler.add(host(self) if host else
+                                 getattr(self, 'host', None), kind,
+                                 label(self, *args, **kwargs), seconds,
+                                 nbytes)
+                except Exception as e:
+                    logger.debug("Can't profile %s: %s", method.__name__, e)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profile(task_id, task_name, min_duration=0, keep=200):
+    """Profiles the block as the task task_id and stores the profile when
+    the block ends. Profiles of tasks shorter than min_duration seconds are
+    not stored, and only the latest `keep` profiles are kept. Nested
+    profiles are part of the outer one.
+    """
+    global _active
+
+    with _active_lock:
+        nested = _active is not None or not task_id
+        if not nested:
+            _active = TaskProfiler(task_id, task_name)
+    if nested:
+        yield _active
+        return
+
+    profiler = _active
+    try:
+        yield profiler
+    finally:
+        with _active_lock:
+            _active = None
+        duration = time.time() - profiler.started
+        if duration >= min_duration and profiler.spans:
+            try:
+                save(profiler, duration, keep)
+            except Exception as e:
+                logger.warning("Can't store the profile of task %s: %s",
+                               task_id, e)
+                db.session.rollback()
+
+
+def save(profiler, duration, keep=200):
+    """Stores the profile and deletes the oldest ones beyond `keep`"""
+    # whatever the task left uncommitted is not committed with the profile
+    db.session.rollback()
+    db.session.add(TaskProfile(
+        task_id=profiler.task_id, task_name=profiler.task_name,
+        started_at=profiler.started_at, finished_at=datetime.utcnow(),
+        duration=round(duration, 3), spans=json.dumps(profiler.rows())))
+    db.session.commit()
+
+    oldest = TaskProfile.query.order_by(TaskProfile.id.desc()).offset(
+                                                            keep).first()
+    if oldest:
+        TaskProfile.query.filter(TaskProfile.id <= oldest.id).delete()
+        db.session.commit()
+
+
+def flame_tree(rows):
+    """Nests the sums of a profile as host > step > kind > label for a
+    flame graph. Every node is a dict with the keys name, seconds, count,
+    bytes and children, children sorted by seconds, longest first.
+
+    Args:
+        rows (list): rows as returned by TaskProfile.get_spans()
+    """
+    root = {'name': '', 'seconds': 0.0, 'count': 0, 'bytes': 0,
+            'children': {}}
+    for host, step_name, kind, label, count, seconds, size in rows:
+        node = root
+        for name in (host or 'local', step_name or 'task', kind, label):
+            node['seconds'] += seconds
+            node['count'] += count
+            node['bytes'] += size
+            node = node['children'].setdefault(name, {
+                'name': name, 'seconds': 0.0, 'count': 0, 'bytes': 0,
+                'children': {}})
+        node['seconds'] += seconds
+        node['count'] += count
+        node['bytes'] += size
+
+    def ordered(node):
+        node['children'] = sorted([ordered(c) for c in
+                                   node['children'].values()],
+                                  key=lambda c: -c['seconds'])
+        return node
+
+    return ordered(root)['children']
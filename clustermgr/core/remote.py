@@ -11,6 +11,8 @@ from paramiko.client import SSHClient, AutoAddPolicy
 from paramiko.ssh_exception import PasswordRequiredException 
 from flask import current_app
 
+from clustermgr.core.profiling import timed
+
 
 log_file = os.path.join(os.path.expanduser('~'), '.clustermgr','logs', 'ssh.log')
 
@@ -31,12 +33,40 @@ def decode(key, enc):
         dec.append(dec_c)
     return "".join(dec)
 
+def _file_size(path):
+    return os.path.getsize(path) if os.path.isfile(path) else 0
+
+
+def _output_size(self, command, result=None):
+    return sum(len(o) for o in result) if result else 0
+
+
+def _upload_size(self, local, remote, result=None):
+    return _file_size(local)
+
+
+def _download_size(self, remote, local, result=None):
+    return _file_size(local)
+
+
+def _got_size(self, filename, result=None):
+    if result and result[0] and not isinstance(result[0], bool):
+        return result[0]
+    return 0
+
+
 class ClientNotSetupException(Exception):
     """Exception raised when the client is not initialized because
     of connection failures."""
     pass
 
 
+class RemoteCommandError(Exception):
+    """Exception raised when a command run on the remote server exits with
+    a non-zero status."""
+    pass
+
+
 class mySSHClient(SSHClient):
     def __init__(self):
         super(mySSHClient, self).__init__()
@@ -61,6 +91,8 @@ class RemoteClient(object):
             for all the communications with the remote server.
         sftpclient (:class:`paramiko.sftp_client.SFTPClient`): The SFTP object
             for all the file transfer operations over the SSH.
+        exit_status (int): The exit status of the last command run, None
+            until a command is run
     """
 
     def __init__(self, host, ip=None, user='root', passphrase=None):
@@ -81,6 +113,7 @@ class RemoteClient(object):
         self.passphrase = passphrase
         self.client = mySSHClient()
         self.sftpclient = None
+        self.exit_status = None
         self.client.set_missing_host_key_policy(AutoAddPolicy())
         self.client.load_system_host_keys()
         logging.debug("RemoteClient created for host: %s" % host)
@@ -90,6 +123,7 @@ class RemoteClient(object):
         log_text = '@{}> {}'.format(self.host, text)
         my_logger.info(log_text)
 
+    @timed('connect', label=lambda self: 'connect')
     def startup(self):
         """Function that starts SSH connection and makes client available for
         carrying out the functions. It tries with the hostname, if it fails
@@ -149,6 +183,8 @@ class RemoteClient(object):
         except Exception as err:
             return False
 
+    @timed('download', label=lambda self, remote, local: remote,
+           size=_download_size)
     def download(self, remote, local):
         """Downloads a file from remote server to the local system.
 
@@ -173,6 +209,8 @@ class RemoteClient(object):
         self.log_me(rstr)
         return rstr
 
+    @timed('upload', label=lambda self, local, remote: remote,
+           size=_upload_size)
     def upload(self, local, remote):
         """Uploads the file from local location to remote server.
 
@@ -201,6 +239,7 @@ class RemoteClient(object):
         self.log_me(rstr, err)
         return rstr
 
+    @timed('sftp', label=lambda self, filepath: 'exists ' + filepath)
     def exists(self, filepath):
         """Returns whether a file exists or not in the remote server.
 
@@ -224,6 +263,7 @@ class RemoteClient(object):
             self.log_me("file {} does not exist".format(filepath))
             return False
 
+    @timed('ssh', label=lambda self, command: command, size=_output_size)
     def run(self, command):
         """Run a command in the remote server.
 
@@ -248,11 +288,14 @@ class RemoteClient(object):
             except IOError:
                 output.append('')
 
+        self.exit_status = buffers[1].channel.recv_exit_status()
 
         self.log_me("command result {}".format(str(output)))
 
         return tuple(output)
 
+    @timed('download', label=lambda self, filename: filename,
+           size=_got_size)
     def get_file(self, filename):
         """Reads content of filename on remote server
 
@@ -276,6 +319,9 @@ class RemoteClient(object):
                                                                     err), True)
             return False, err
     
+    @timed('upload', label=lambda self, filename, filecontent: filename,
+           size=lambda self, filename, filecontent, result=None:
+               len(filecontent))
     def put_file(self,  filename, filecontent):
         """Puts content to a file on remote server
 
@@ -0,0 +1,176 @@
+"""replication_lag.py - measures ldap replication lag with marker entries.
+
+Every server gets a marker entry cn=<hostname>,ou=replicationprobes,o=gluu.
+A probe writes a new token into the marker of each server and then reads
+the marker on every other server until the token shows up there. The time
+between the write and the first read that returns the token is the lag
+from the source to the target server. All times are taken on the cluster
+manager, so clock differences between the servers do not matter.
+"""
+import time
+import uuid
+import logging
+from multiprocessing.pool import ThreadPool
+
+from ldap3 import BASE, MODIFY_REPLACE
+
+from clustermgr.core.ldap_functions import ldap_pool
+
+
+logger = logging.getLogger(__name__)
+
+PROBE_BASE = 'ou=replicationprobes,o=gluu'
+
+
+class ProbeTarget(object):
+    """An ldap server taking part in the probe.
+
+    Args:
+        name (string): hostname of the server, used in the marker dn
+        addr (string): address passed to the ldap pool, e.g. host:1636
+        binddn (string): dn to bind with
+        password (string): password of binddn
+    """
+    def __init__(self, name, addr, binddn, password):
+        self.name = name
+        self.addr = addr
+        self.binddn = binddn
+        self.password = password
+
+    @property
+    def marker_dn(self):
+        return 'cn={},{}'.format(self.name, PROBE_BASE)
+
+    def connection(self):
+        return ldap_pool.connection(self.addr, self.binddn, self.password)
+
+
+def ensure_probe_base(server):
+    """Creates the container of the marker entries if it does not exist.
+
+    Args:
+        server (:object:`ProbeTarget`): server to create the container on
+
+    Returns:
+        True if the container was there already, False if it was created,
+        None if the server could not be reached
+    """
+    try:
+        with server.connection() as conn:
+            if not conn.bound:
+                return None
+            return _ensure_probe_base(conn)
+    except Exception as e:
+        logger.warning("Can't prepare replication probe on %s: %s",
+                       server.name, e)
+
+
+def _ensure_probe_base(conn):
+    if conn.search(search_base=PROBE_BASE,
+                   search_filter='(objectClass=*)',
+                   search_scope=BASE, attributes=['1.1']):
+        return True
+    conn.add(PROBE_BASE, attributes={
+        'objectClass': ['top', 'organizationalUnit'],
+        'ou': 'replicationprobes',
+    })
+    return False
+
+
+def write_marker(server):
+    """Writes a new token into the marker entry of the server.
+
+    Returns:
+        tuple: (token, write time) or (None, None) if the write failed
+    """
+    token = uuid.uuid4().hex
+    try:
+        with server.connection() as conn:
+            if not conn.bound:
+                return None, None
+            conn.modify(server.marker_dn,
+                        {'description': [(MODIFY_REPLACE, [token])]})
+            if conn.result['description'] == 'noSuchObject':
+                conn.add(server.marker_dn, attributes={
+                    'objectClass': ['top', 'organizationalRole'],
+                    'cn': server.name,
+                    'description': token,
+                })
+            if conn.result['description'] != 'success':
+                logger.warning("Can't write replication probe on %s: %s",
+                               server.name, conn.result['description'])
+                return None, None
+            return token, time.time()
+    except Exception as e:
+        logger.warning("Can't write replication probe on %s: %s",
+                       server.name, e)
+        return None, None
+
+
+def wait_marker(server, source, token, written_at, deadline, interval):
+    """Reads the marker of `source` on `server` until it has `token`.
+
+    Returns:
+        float: seconds from the write to the first read of the token, or
+            None if it was not read until `deadline`
+    """
+    try:
+        with server.connection() as conn:
+            if not conn.bound:
+                return None
+            while True:
+                conn.search(search_base=source.marker_dn,
+                            search_filter='(objectClass=*)',
+                            search_scope=BASE, attributes=['description'])
+                if conn.response:
+                    values = conn.response[0]['attributes'].get(
+                        'description', [])
+                    if token in values:
+                        return time.time() - written_at
+                if time.time() >= deadline:
+                    return None
+                time.sleep(interval)
+    except Exception as e:
+        logger.warning("Can't read replication probe on %s: %s",
+                       server.name, e)
+
+
+def measure_replication_lag(servers, timeout=30, interval=0.2):
+    """Measures the replication lag between every pair of servers. The
+    markers of all servers are written at once and read concurrently.
+
+    Args:
+        servers (list): :object:`ProbeTarget` of each server
+        timeout (int): seconds to wait for a marker to be replicated
+        interval (float): seconds between reads of a marker
+
+    Returns:
+        dict: {source name: {target name: lag in seconds or None}}, lag is
+            None if the marker did not arrive within `timeout`. Sources
+            whose marker could not be written are left out.
+    """
+    if len(servers) < 2:
+        return {}
+
+    pool = ThreadPool(len(servers) * (len(servers) - 1))
+    try:
+        written = pool.map(write_marker, servers)
+        deadline = time.time() + timeout
+
+        waits = {}
+        for source, (token, written_at) in zip(servers, written):
+            if token is None:
+                continue
+            waits[source.name] = dict(
+                (target.name, pool.apply_async(
+                    wait_marker, (target, source, token, written_at,
+                                  deadline, interval)))
+                for target in servers if target is not source)
+
+        return dict(
+            (source, dict((target, result.get())
+                          for target, result in results.items()))
+            for source, results in waits.items())
+    finally:
+        pool.close()
+        pool.join()
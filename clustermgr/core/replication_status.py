@@ -0,0 +1,182 @@
+"""replication_status.py - parsed and cached OpenDJ replication status.
+
+Running `dsreplication status` starts a JVM on the primary server and takes
+seconds, so it is run periodically by the celery task
+:func:`clustermgr.tasks.cluster.poll_replication_status` and the views read
+the last result from redis.
+"""
+import re
+import json
+import time
+
+from clustermgr.extensions import redis_client
+
+
+# dsreplication status column headers, without the footnote markers
+COLUMNS = {
+    'suffix dn': 'base_dn',
+    'server': 'server',
+    'entries': 'entries',
+    'replication enabled': 'replication_enabled',
+    'ds id': 'ds_id',
+    'rs id': 'rs_id',
+    'rs port': 'replication_port',
+    'm.c.': 'missing_changes',
+    'a.o.m.c.': 'oldest_missing_change_age',
+    'security': 'security',
+}
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_bool(value):
+    if value is None:
+        return None
+    return value.lower() == 'true'
+
+
+def _split(line, bounds):
+    return [line[start:end].strip() for start, end in bounds]
+
+
+def parse_replication_status(text):
+    """Parses the table printed by `dsreplication status`. The columns are
+    located by the ':' separators of the dashed line under the header, since
+    the server column itself contains ':'.
+
+    Args:
+        text (string): standard output of dsreplication status
+
+    Returns:
+        list: a dictionary per server and base DN with the keys base_dn,
+            server, hostname, admin_port, entries, replication_enabled,
+            ds_id, rs_id, replication_port, missing_changes,
+            oldest_missing_change_age and security
+    """
+    records = []
+    header = None
+    columns = None
+
+    for line in (text or '').splitlines():
+        if not line.strip():
+            header = columns = None
+            continue
+
+        if line.lstrip().lower().startswith('suffix dn'):
+            header = line
+            continue
+
+        if header is not None and columns is None:
+            if not set(line.strip()) <= set('-:'):
+                header = None
+                continue
+            cuts = [i for i, c in enumerate(line) if c == ':']
+            bounds = zip([0] + [i + 1 for i in cuts], cuts + [None])
+            names = [re.sub(r'\(\d+\)$', '', c).strip().lower()
+                     for c in _split(header, bounds)]
+            columns = [(COLUMNS.get(name), bound)
+                       for name, bound in zip(names, bounds)]
+            continue
+
+        if columns is None:
+            continue
+
+        row = {}
+        for name, (start, end) in columns:
+            if name:
+                row[name] = line[start:end].strip() or None
+
+        if not row.get('base_dn') or not row.get('server'):
+            continue
+
+        hostname, _, admin_port = row['server'].rpartition(':')
+        if not hostname:
+            hostname, admin_port = admin_port, None
+
+        records.append({
+            'base_dn': row['base_dn'],
+            'server': row['server'],
+            'hostname': hostname,
+            'admin_port': _to_int(admin_port),
+            'entries': _to_int(row.get('entries')),
+            'replication_enabled': _to_bool(row.get('replication_enabled')),
+            'ds_id': row.get('ds_id'),
+            'rs_id': row.get('rs_id'),
+            'replication_port': _to_int(row.get('replication_port')),
+            'missing_changes': _to_int(row.get('missing_changes')),
+            'oldest_missing_change_age': row.get('oldest_missing_change_age'),
+            'security': _to_bool(row.get('security')),
+        })
+
+    return records
+
+
+class ReplicationStatusCache(object):
+    """Keeps the last replication status of the cluster in redis.
+
+    The stored status is a dictionary with the keys:
+        servers: records returned by parse_replication_status()
+        raw: output of dsreplication status
+        updated_at: unix time of the last successful poll
+        error: error message of the last poll, None if it succeeded
+        checked_at: unix time of the last poll
+
+    Args:
+        max_age (int): seconds after which a status is considered stale
+        lock_timeout (int): seconds for which a running poll blocks others
+    """
+    key = 'clustermgr:replication_status'
+
+    def __init__(self, max_age=180, lock_timeout=300):
+        self.max_age = max_age
+        self.lock_timeout = lock_timeout
+        self.r = redis_client
+
+    def get(self):
+        """Returns the stored status or None if there is none"""
+        data = self.r.get(self.key)
+        if data:
+            return json.loads(data)
+
+    def is_stale(self, status):
+        return not status or \
+            time.time() - status.get('checked_at', 0) > self.max_age
+
+    def store(self, raw):
+        """Parses and stores the output of dsreplication status"""
+        now = time.time()
+        status = {
+            'servers': parse_replication_status(raw),
+            'raw': raw,
+            'updated_at': now,
+            'checked_at': now,
+            'error': None,
+        }
+        self.r.set(self.key, json.dumps(status))
+        return status
+
+    def store_error(self, error):
+        """Records a failed poll, keeping the last known status"""
+        status = self.get() or {'servers': [], 'raw': '', 'updated_at': None}
+        status['error'] = error
+        status['checked_at'] = time.time()
+        self.r.set(self.key, json.dumps(status))
+        return status
+
+    def acquire_poll_lock(self):
+        """Returns True if no other poll is running, so that only one
+        dsreplication process runs at a time.
+        """
+        return bool(self.r.set(self.key + ':lock', 1, nx=True,
+                               ex=self.lock_timeout))
+
+    def release_poll_lock(self):
+        self.r.delete(self.key + ':lock')
+
+
+replication_status = ReplicationStatusCache()
@@ -0,0 +1,232 @@
+"""schema_catalog.py - cached, indexed view of the LDAP subschema entry.
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+
+from flask import current_app
+from ldap3 import BASE
+from ldap.schema import AttributeType, ObjectClass
+
+
+logger = logging.getLogger(__name__)
+
+
+def index_keys(element):
+    """Returns the keys an attribute type or object class is indexed by:
+    its lower cased OID and names.
+    """
+    return [element.oid.lower()] + [name.lower() for name in element.names]
+
+
+class Schema(object):
+    """Parsed contents of a cn=schema entry. Attribute types and object
+    classes are parsed once and indexed by lower cased name and by OID.
+
+    The parsed objects are shared between all the users of the catalog and
+    must not be modified, make a copy from the definition string instead.
+
+    Args:
+        timestamp (string): modifyTimestamp of the schema entry
+        attribute_types (list): attributeTypes definition strings
+        object_classes (list): objectClasses definition strings
+        ldap_syntaxes (list): ldapSyntaxes definition strings
+    """
+    def __init__(self, timestamp, attribute_types, object_classes,
+                 ldap_syntaxes):
+        self.timestamp = timestamp
+        self.attribute_types = attribute_types
+        self.object_classes = object_classes
+        self.ldap_syntaxes = ldap_syntaxes
+        self._attribute_items = [(d, AttributeType(str(d)))
+                                 for d in attribute_types]
+        self._attributes = self.__index(self._attribute_items)
+        self._class_items = [(d, ObjectClass(str(d))) for d in object_classes]
+        self._classes = self.__index(self._class_items)
+
+    @staticmethod
+    def __index(items):
+        index = {}
+        for item in items:
+            for key in index_keys(item[1]):
+                index[key] = item
+        return index
+
+    def get_attribute(self, name_or_oid):
+        """Returns the parsed AttributeType or None"""
+        item = self._attributes.get(name_or_oid.lower())
+        if item:
+            return item[1]
+
+    def get_attribute_string(self, name_or_oid):
+        """Returns the attribute type definition as stored in LDAP"""
+        item = self._attributes.get(name_or_oid.lower())
+        if item:
+            return item[0]
+
+    def get_class(self, name_or_oid):
+        """Returns the parsed ObjectClass or None"""
+        item = self._classes.get(name_or_oid.lower())
+        if item:
+            return item[1]
+
+    def get_class_string(self, name_or_oid):
+        """Returns the object class definition as stored in LDAP"""
+        item = self._classes.get(name_or_oid.lower())
+        if item:
+            return item[0]
+
+    def get_attributes(self):
+        """Returns the parsed AttributeType objects"""
+        return [item[1] for item in self._attribute_items]
+
+    def get_classes(self):
+        """Returns the parsed ObjectClass objects"""
+        return [item[1] for item in self._class_items]
+
+    def get_custom_attributes(self, x_origin):
+        """Returns (definition, AttributeType) tuples of the attributes whose
+        definitions contain the given X-ORIGIN
+        """
+        return [item for item in self._attribute_items
+                if x_origin in item[0]]
+
+    def to_dict(self):
+        return {
+            'timestamp': self.timestamp,
+            'attributeTypes': self.attribute_types,
+            'objectClasses': self.object_classes,
+            'ldapSyntaxes': self.ldap_syntaxes,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['timestamp'], data['attributeTypes'],
+                   data['objectClasses'], data['ldapSyntaxes'])
+
+
+class SchemaCatalog(object):
+    """Keeps the subschema of LDAP servers in memory and in a snapshot file
+    per server, so the schema is fetched and parsed only when it changes.
+
+    A cached schema is validated against the modifyTimestamp of cn=schema,
+    at most once in `check_interval` seconds. Code that modifies the schema
+    through this application calls invalidate() to drop the cached copy.
+
+    Args:
+        snapshot_dir (string): directory where the schema snapshots are kept,
+            defaults to schema_catalog in the DATA_DIR of the current app
+        check_interval (int): seconds for which a cached schema is used
+            without checking modifyTimestamp
+    """
+    def __init__(self, snapshot_dir=None, check_interval=5):
+        self._snapshot_dir = snapshot_dir
+        self.check_interval = check_interval
+        self._schemas = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot_dir(self):
+        if self._snapshot_dir:
+            return self._snapshot_dir
+        return os.path.join(current_app.config['DATA_DIR'], 'schema_catalog')
+
+    def __snapshot_file(self, key):
+        return os.path.join(self.snapshot_dir, "{}.json".format(
+                            re.sub(r'[^A-Za-z0-9.-]', '_', key)))
+
+    def __read_snapshot(self, key):
+        path = self.__snapshot_file(key)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path) as f:
+                return Schema.from_dict(json.load(f))
+        except Exception as e:
+            logger.warning("Can't read schema snapshot %s: %s", path, e)
+
+    def __write_snapshot(self, key, schema):
+        if not os.path.isdir(self.snapshot_dir):
+            os.makedirs(self.snapshot_dir)
+        tmp_path = self.__snapshot_file(key) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(schema.to_dict(), f)
+        os.rename(tmp_path, self.__snapshot_file(key))
+
+    @staticmethod
+    def __timestamp(conn):
+        conn.search(search_base='cn=schema', search_filter='(objectclass=*)',
+                    search_scope=BASE, attributes=['modifyTimestamp'])
+        if conn.response:
+            value = conn.response[0]['attributes'].get('modifyTimestamp')
+            if isinstance(value, list):
+                value = value[0] if value else None
+            if value:
+                return str(value)
+
+    @staticmethod
+    def __fetch(conn):
+        conn.search(search_base='cn=schema', search_filter='(objectclass=*)',
+                    search_scope=BASE,
+                    attributes=['attributeTypes', 'objectClasses',
+                                'ldapSyntaxes', 'modifyTimestamp'])
+        attrs = conn.response[0]['attributes']
+        timestamp = attrs.get('modifyTimestamp')
+        if isinstance(timestamp, list):
+            timestamp = timestamp[0] if timestamp else None
+        return Schema(str(timestamp) if timestamp else None,
+                      list(attrs.get('attributeTypes', [])),
+                      list(attrs.get('objectClasses', [])),
+                      list(attrs.get('ldapSyntaxes', [])))
+
+    def get(self, key, conn):
+        """Returns the Schema of the server, loading it if it is not cached
+        or has changed.
+
+        Args:
+            key (string): identifies the server, e.g. its ldap uri
+            conn (ldap3.Connection): bound connection to the server
+
+        Returns:
+            :object:`Schema`
+        """
+        now = time.time()
+        with self._lock:
+            schema = self._schemas.get(key)
+            checked_at = self._checked_at.get(key, 0)
+
+        if schema and now - checked_at < self.check_interval:
+            return schema
+
+        if not schema:
+            schema = self.__read_snapshot(key)
+
+        timestamp = self.__timestamp(conn)
+        if not schema or not timestamp or schema.timestamp != timestamp:
+            logger.debug("Loading LDAP schema of %s", key)
+            schema = self.__fetch(conn)
+            try:
+                self.__write_snapshot(key, schema)
+            except (IOError, OSError) as e:
+                logger.warning("Can't write schema snapshot: %s", e)
+
+        with self._lock:
+            self._schemas[key] = schema
+            self._checked_at[key] = now
+        return schema
+
+    def invalidate(self, key):
+        """Drops the cached schema of the server, the next get() reloads it"""
+        with self._lock:
+            self._schemas.pop(key, None)
+            self._checked_at.pop(key, None)
+        path = self.__snapshot_file(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+schema_catalog = SchemaCatalog()
@@ -0,0 +1,278 @@
+"""schema_changeset.py - batched changes of the LDAP schema.
+
+Attribute type and object class changes are collected in a changeset,
+validated against the cached schema without touching the server and then
+written to cn=schema with one modify. Only attribute types removed for good
+need a second modify, after the object classes no longer refer to them.
+"""
+import re
+from collections import OrderedDict
+
+from ldap3 import MODIFY_ADD, MODIFY_DELETE
+from ldap.schema import AttributeType, ObjectClass
+
+
+def _keys(schema_element):
+    return set([schema_element.oid.lower()] +
+               [name.lower() for name in schema_element.names])
+
+
+class SchemaChangeset(object):
+    """Collects attribute type and object class changes of a schema.
+
+    Usage::
+
+        changeset = SchemaChangeset(ldp.getSchema())
+        for definition in definitions:
+            changeset.add_attribute(definition)
+        changeset.add_to_class('gluuCustomPerson', names)
+        errors = changeset.validate()
+        result = ldp.applySchemaChanges(changeset)
+
+    Args:
+        schema (:object:`clustermgr.core.schema_catalog.Schema`): the
+            current schema of the server
+    """
+    def __init__(self, schema):
+        self.schema = schema
+        # oid of the current or new attribute type ->
+        #     [current definition, current keys, new definition, new keys]
+        self._attributes = OrderedDict()
+        # lower cased class name -> [current definition, ObjectClass]
+        self._classes = OrderedDict()
+        self._changed_classes = set()
+        self._errors = []
+
+    def __len__(self):
+        return len(self._attributes) + len(self._changed_classes)
+
+    def add_attribute(self, definition, replaces=None):
+        """Adds an attribute type.
+
+        Args:
+            definition: AttributeType object or definition string
+            replaces (string): name or OID of the attribute type the new
+                definition replaces, None if it is a new attribute type
+        """
+        definition = str(definition)
+        attribute = AttributeType(definition)
+
+        if replaces:
+            current = self.schema.get_attribute(replaces)
+            if not current:
+                self._errors.append("Attribute {} does not exist".format(
+                                    replaces))
+                return
+        else:
+            current = None
+            for key in _keys(attribute):
+                if self.__attribute_exists(key):
+                    self._errors.append("Attribute {} already exists".format(
+                                        key))
+                    return
+
+        if current and current.oid != attribute.oid:
+            # the OID changes, the old one is removed and the new one added
+            self.remove_attribute(replaces)
+            current = None
+
+        oid = current.oid if current else attribute.oid
+        change = self.__attribute_change(oid)
+        change[2] = definition
+        change[3] = _keys(attribute)
+
+    def remove_attribute(self, name_or_oid):
+        """Removes an attribute type"""
+        current = self.schema.get_attribute(name_or_oid)
+        if not current:
+            self._errors.append("Attribute {} does not exist".format(
+                                name_or_oid))
+            return
+        change = self.__attribute_change(current.oid)
+        change[2] = None
+        change[3] = set()
+
+    def __attribute_change(self, oid):
+        if oid not in self._attributes:
+            current = self.schema.get_attribute_string(oid)
+            self._attributes[oid] = [
+                current, _keys(AttributeType(str(current))) if current
+                else set(), None, set()]
+        return self._attributes[oid]
+
+    def __class(self, class_name, create_oid=None):
+        key = class_name.lower()
+        if key not in self._classes:
+            current = self.schema.get_class_string(class_name)
+            if current:
+                obj = ObjectClass(str(current))
+            elif create_oid:
+                obj = ObjectClass("( {} NAME '{}' SUP top AUXILIARY )".format(
+                                  create_oid, class_name))
+                self._changed_classes.add(key)
+            else:
+                self._errors.append("Object class {} does not exist".format(
+                                    class_name))
+                return
+            self._classes[key] = [current, obj]
+        return self._classes[key][1]
+
+    def add_to_class(self, class_name, attribute_names, create_oid=None):
+        """Adds attribute types to the MAY list of an object class.
+
+        Args:
+            class_name (string): name of the object class
+            attribute_names (list): names of the attribute types
+            create_oid (string): OID of the auxiliary object class to create
+                if it does not exist
+        """
+        obj = self.__class(class_name, create_oid)
+        if obj is None:
+            return
+        may = list(obj.may)
+        present = set(name.lower() for name in may + list(obj.must))
+        for name in attribute_names:
+            if name.lower() not in present:
+                may.append(name)
+                present.add(name.lower())
+                self._changed_classes.add(class_name.lower())
+        obj.may = tuple(may)
+
+    def remove_from_class(self, class_name, attribute_names):
+        """Removes attribute types from the MAY list of an object class"""
+        obj = self.__class(class_name)
+        if obj is None:
+            return
+        remove = set(name.lower() for name in attribute_names)
+        may = tuple(name for name in obj.may if name.lower() not in remove)
+        if may != tuple(obj.may):
+            obj.may = may
+            self._changed_classes.add(class_name.lower())
+
+    def __pending_keys(self):
+        # names and OIDs of the attribute types the changeset adds (True)
+        # or removes (False)
+        pending = {}
+        for current, current_keys, new, new_keys in self._attributes.values():
+            for key in current_keys:
+                pending.setdefault(key, False)
+            for key in new_keys:
+                pending[key] = True
+        return pending
+
+    def __attribute_exists(self, name, pending=None):
+        if pending is None:
+            pending = self.__pending_keys()
+        key = name.lower()
+        if key in pending:
+            return pending[key]
+        return self.schema.get_attribute(name) is not None
+
+    def __syntax_oids(self):
+        return set(m.group(1) for m in (
+            re.match(r'\(\s*([0-9.]+)', syntax)
+            for syntax in self.schema.ldap_syntaxes) if m)
+
+    def validate(self):
+        """Checks the changes against the schema without writing anything.
+
+        Returns:
+            list: error messages, empty if the changes can be applied
+        """
+        errors = list(self._errors)
+        syntaxes = self.__syntax_oids()
+        pending = self.__pending_keys()
+
+        for current, current_keys, new, new_keys in self._attributes.values():
+            if not new:
+                continue
+            attribute = AttributeType(new)
+            name = attribute.names[0] if attribute.names else attribute.oid
+            if syntaxes and attribute.syntax and \
+                    attribute.syntax not in syntaxes:
+                errors.append("Attribute {} has unknown syntax {}".format(
+                              name, attribute.syntax))
+            for sup in attribute.sup:
+                if not self.__attribute_exists(sup, pending):
+                    errors.append("Attribute {} has unknown superior "
+                                  "{}".format(name, sup))
+
+        classes = [obj for current, obj in self._classes.values()]
+        removed = set(key for key, exists in pending.items() if not exists)
+        if removed:
+            # object classes the changeset leaves alone may still refer to
+            # the removed attribute types
+            classes += [obj for obj in self.schema.get_classes()
+                        if not _keys(obj) & set(self._classes) and
+                        set(name.lower() for name in
+                            tuple(obj.must) + tuple(obj.may)) & removed]
+
+        for obj in classes:
+            for name in tuple(obj.must) + tuple(obj.may):
+                if not self.__attribute_exists(name, pending):
+                    errors.append("Object class {} refers to missing "
+                                  "attribute {}".format(obj.names[0], name))
+
+        return errors
+
+    def modifications(self):
+        """Returns the changes of cn=schema as a list of ldap3 modify change
+        dictionaries, to be applied in order.
+        """
+        first = OrderedDict()
+        second = OrderedDict()
+
+        added_keys = set()
+        for current, _, new, new_keys in self._attributes.values():
+            if new:
+                added_keys |= new_keys
+
+        # definitions replaced by a new one, including those whose OID
+        # changes while a name is kept, must be deleted before the add
+        replaced = [current for current, current_keys, new, _ in
+                    self._attributes.values() if current and
+                    (new or current_keys & added_keys)]
+        added = [new for current, _, new, _ in
+                 self._attributes.values() if new]
+        removed = [current for current, current_keys, new, _ in
+                   self._attributes.values() if current and not new and
+                   not current_keys & added_keys]
+
+        if added:
+            # deleting and adding a definition in the same modify replaces it
+            first['attributeTypes'] = ([(MODIFY_DELETE, replaced)]
+                                       if replaced else []) + \
+                                      [(MODIFY_ADD, added)]
+
+        class_changes = [self._classes[key] for key in self._classes
+                         if key in self._changed_classes]
+        if class_changes:
+            deleted = [current for current, obj in class_changes if current]
+            first['objectClasses'] = ([(MODIFY_DELETE, deleted)]
+                                      if deleted else []) + \
+                                     [(MODIFY_ADD, [str(obj) for _, obj in
+                                                    class_changes])]
+
+        if removed:
+            second['attributeTypes'] = [(MODIFY_DELETE, removed)]
+
+        return [changes for changes in (first, second) if changes]
+
+    def apply(self, conn):
+        """Validates the changes and writes them to cn=schema
+
+        Args:
+            conn (ldap3.Connection): bound connection to the server
+
+        Returns:
+            tuple: (True, 'success') or (False, error message)
+        """
+        errors = self.validate()
+        if errors:
+            return False, '; '.join(errors)
+
+        for changes in self.modifications():
+            if not conn.modify('cn=schema', changes):
+                return False, '{} ({})'.format(conn.result['description'],
+                                               conn.result['message'])
+        return True, 'success'
@@ -0,0 +1,194 @@
+"""service_health.py - background checks of the Gluu web services.
+
+The services of all the servers are checked by the celery task
+:func:`clustermgr.tasks.get_remote_stats.check_service_health` and the
+results are kept in redis. The dashboard reads the last results, so
+refreshing it doesn't open any ssh connection, whatever the number of
+servers and open dashboards.
+"""
+import json
+import time
+import logging
+from multiprocessing.pool import ThreadPool
+
+from clustermgr.extensions import redis_client
+from clustermgr.core.remote import RemoteClient
+from clustermgr.core.utils import as_boolean
+
+
+logger = logging.getLogger(__name__)
+
+# url path checked for every service, relative to https://localhost/
+SERVICE_PATHS = {
+    'oxauth': '.well-known/openid-configuration',
+    'identity': 'identity/restv1/scim-configuration',
+    'shib': 'idp/shibboleth',
+    'passport': 'passport',
+}
+
+
+def active_services(setup_prop):
+    """Returns the names of the services installed by Gluu setup
+
+    Args:
+        setup_prop (dict): setup properties of the primary server
+    """
+    services = ['oxauth', 'identity']
+    if as_boolean(setup_prop.get('installSaml')):
+        services.append('shib')
+    if as_boolean(setup_prop.get('installPassport')):
+        services.append('passport')
+    return services
+
+
+def check_services(hostname, services, timeout=10):
+    """Checks the services of a server over a single ssh session. All the
+    urls are requested by one command, which prints the http status code
+    and the response time of every url.
+
+    Args:
+        hostname (string): hostname of the server
+        services (list): names of the services, keys of SERVICE_PATHS
+        timeout (int): seconds curl waits for every service
+
+    Returns:
+        dict: {service: result} where result has the keys
+            up: True if the service answered with 200
+            status_code: http status code, None if the check failed
+            latency: response time in seconds, None if the check failed
+            error: error message, None if the service is up
+            checked_at: unix time of the check
+    """
+    checked_at = time.time()
+    results = dict((service, {'up': False, 'status_code': None,
+                              'latency': None, 'error': None,
+                              'checked_at': checked_at})
+                   for service in services)
+
+    commands = [
+        "curl -kLI https://localhost/{} -o /dev/null -s --max-time {} "
+        "-w '{} %{{http_code}} %{{time_total}}\\n'".format(
+            SERVICE_PATHS[service], timeout, service)
+        for service in services]
+
+    c = RemoteClient(hostname)
+    try:
+        c.startup()
+        output = c.run('; '.join(commands))[1]
+    except Exception as e:
+        for result in results.values():
+            result['error'] = str(e)
+        return results
+    finally:
+        try:
+            c.close()
+        except Exception:
+            pass
+
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) != 3 or fields[0] not in results:
+            continue
+        result = results[fields[0]]
+        result['status_code'] = int(fields[1]) if fields[1].isdigit() \
+            else None
+        result['latency'] = round(float(fields[2]), 4)
+        result['up'] = result['status_code'] == 200
+        if not result['up']:
+            result['error'] = 'HTTP status {}'.format(fields[1])
+
+    for result in results.values():
+        if not result['up'] and not result['error']:
+            result['error'] = 'No response'
+
+    return results
+
+
+def check_servers(hostnames, services, timeout=10):
+    """Checks the services of the servers concurrently, see
+    check_services()
+
+    Args:
+        hostnames (list): hostnames of the servers
+        services (list): names of the services
+        timeout (int): seconds curl waits for every service
+
+    Returns:
+        dict: {hostname: result of check_services()}
+    """
+    if not hostnames:
+        return {}
+
+    pool = ThreadPool(len(hostnames))
+    try:
+        results = pool.map(lambda h: check_services(h, services, timeout),
+                           hostnames)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(hostnames, results))
+
+
+class ServiceHealthCache(object):
+    """Keeps the last service check results of every server in a redis
+    hash keyed by the id of the server, and the history of every server in
+    a capped list.
+
+    Args:
+        max_age (int): seconds after which a result is considered stale
+        history_size (int): number of checks kept in the history
+    """
+    key = 'clustermgr:service_health'
+
+    def __init__(self, max_age=300, history_size=120):
+        self.max_age = max_age
+        self.history_size = history_size
+        self.r = redis_client
+
+    def history_key(self, server_id):
+        return '{}:history:{}'.format(self.key, server_id)
+
+    def store(self, results):
+        """Replaces the stored results, so that removed servers are dropped,
+        and appends them to the history of the servers
+
+        Args:
+            results (dict): {server id: result of check_services()}
+        """
+        pipe = self.r.pipeline()
+        pipe.delete(self.key)
+        if results:
+            pipe.hmset(self.key, dict((str(server_id), json.dumps(result))
+                                      for server_id, result
+                                      in results.items()))
+        for server_id, result in results.items():
+            history_key = self.history_key(server_id)
+            pipe.lpush(history_key, json.dumps(result))
+            pipe.ltrim(history_key, 0, self.history_size - 1)
+        pipe.execute()
+
+    def get_all(self):
+        """Returns {server id: last result} of all the checked servers"""
+        return dict((int(server_id), json.loads(data))
+                    for server_id, data in self.r.hgetall(self.key).items())
+
+    def history(self, server_id):
+        """Returns the stored results of the server, newest first"""
+        return [json.loads(data) for data
+                in self.r.lrange(self.history_key(server_id), 0, -1)]
+
+    def is_stale(self, result):
+        if not result:
+            return True
+        checked_at = min([r.get('checked_at') or 0
+                          for r in result.values()] or [0])
+        return time.time() - checked_at > self.max_age
+
+    def acquire_check_lock(self, timeout=60):
+        """Returns True if no other check was started in the last `timeout`
+        seconds, so that stale results trigger a single check.
+        """
+        return bool(self.r.set(self.key + ':lock', 1, nx=True, ex=timeout))
+
+
+service_health = ServiceHealthCache()
@@ -0,0 +1,358 @@
+"""step_graph.py - runs deployment tasks as a graph of steps.
+
+A deployment is declared as a list of steps. Every step names the steps it
+depends on, the hosts it runs for and optionally a check telling if its
+work is already done. Steps whose dependencies are complete run in
+parallel, so a rollout takes as long as its longest chain of steps. Every
+step is recorded in the database with its timing and result, and a run
+that failed is resumed by the next run with the same key, steps, hosts
+and inputs, starting after the last completed steps.
+
+Usage::
+
+    graph = StepGraph([
+        Step('download_certs', download_certs),
+        Step('enable', enable_replication, hosts=secondaries,
+             check=replication_enabled, lock='primary'),
+        Step('restart', restart_gluu, hosts=all_hosts,
+             requires_all=['download_certs', 'enable']),
+    ])
+    run = graph.run('enable_replication:all', ctx, tid=tid)
+
+Actions and checks are called as ``action(ctx, host)`` in worker threads,
+host being None for steps which don't run per host. An action fails by
+raising an exception or returning False. Since the recording commits the
+database session of the calling thread, `ctx` should hold plain values
+rather than ORM instances.
+"""
+import json
+import time
+import Queue
+import hashlib
+import logging
+from datetime import datetime
+from contextlib import contextmanager
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from flask import current_app, has_app_context
+
+from clustermgr.extensions import db, wlogger
+from clustermgr.models import DeploymentRun, DeploymentStep
+from clustermgr.core import profiling
+
+
+logger = logging.getLogger(__name__)
+
+
+class StepGraphError(Exception):
+    """Raised for graphs with unknown dependencies or cycles"""
+    pass
+
+
+class Step(object):
+    """A step of a deployment.
+
+    Args:
+        name (string): unique name of the step
+        action (callable): does the work, called as action(ctx, host)
+        hosts (list): hostnames the step runs for, one instance per host;
+            None for a single instance
+        requires (list): names of the steps this step depends on. If both
+            steps run per host, only the instance on the same host is
+            waited for, otherwise all the instances.
+        requires_all (list): names of the steps whose instances on all
+            hosts have to complete first
+        check (callable): called as check(ctx, host), returns True if the
+            work of the step is already done, so the action is skipped
+        lock (string): steps with the same lock don't run at the same time
+        rerun (bool): run the step again when resuming, for steps preparing
+            local state such as downloaded files
+    """
+    def __init__(self, name, action, hosts=None, requires=(),
+                 requires_all=(), check=None, lock=None, rerun=False):
+        self.name = name
+        self.action = action
+        self.hosts = list(hosts) if hosts is not None else None
+        self.requires = list(requires)
+        self.requires_all = list(requires_all)
+        self.check = check
+        self.lock = lock
+        self.rerun = rerun
+
+    def instances(self):
+        """Returns the (name, host) nodes of the step"""
+        if self.hosts is None:
+            return [(self.name, None)]
+        return [(self.name, host) for host in self.hosts]
+
+    def __repr__(self):
+        return '<Step {}>'.format(self.name)
+
+
+@contextmanager
+def _app_context(app):
+    if app is None:
+        yield
+    else:
+        with app.app_context():
+            yield
+
+
+def _format_node(node):
+    name, host = node
+    return '{} on {}'.format(name, host) if host else name
+
+
+class StepGraph(object):
+    """The dependency graph of a list of steps.
+
+    Args:
+        steps (list): :class:`Step` instances, in the order they are
+            preferred to start
+    """
+    def __init__(self, steps):
+        self.steps = OrderedDict()
+        for step in steps:
+            if step.name in self.steps:
+                raise StepGraphError("Duplicate step {}".format(step.name))
+            self.steps[step.name] = step
+
+        self.deps = OrderedDict()
+        for step in self.steps.values():
+            for node in step.instances():
+                self.deps[node] = self.__dependencies(step, node[1])
+
+        self.order = self.__sort()
+
+    def __dependencies(self, step, host):
+        deps = set()
+        for name in step.requires + step.requires_all:
+            if name not in self.steps:
+                raise StepGraphError("Step {} requires unknown step {}".format(
+                                                            step.name, name))
+            required = self.steps[name]
+            if name in step.requires and host is not None and \
+                    required.hosts is not None and host in required.hosts:
+                deps.add((name, host))
+            else:
+                deps.update(required.instances())
+        return deps
+
+    def __sort(self):
+        # topological order, keeping the declaration order where possible
+        order = []
+        placed = set()
+        remaining = list(self.deps)
+        while remaining:
+            ready = [n for n in remaining if self.deps[n] <= placed]
+            if not ready:
+                raise StepGraphError("Cycle between steps {}".format(
+                    ', '.join(sorted(set(n[0] for n in remaining)))))
+            for node in ready:
+                order.append(node)
+                placed.add(node)
+                remaining.remove(node)
+        return order
+
+    def estimate(self, durations):
+        """Returns the seconds a run would take if every step started as
+        soon as its dependencies and its lock allow, i.e. the length of the
+        longest chain of steps. The number of workers is not taken into
+        account.
+
+        Args:
+            durations (dict): {(name, host): seconds} of the nodes, missing
+                or None durations count as 0
+        """
+        finished = {}
+        released = {}
+        for node in self.order:
+            step = self.steps[node[0]]
+            start = max([finished[n] for n in self.deps[node]] or [0])
+            if step.lock:
+                start = max(start, released.get(step.lock, 0))
+            finished[node] = start + (durations.get(node) or 0)
+            if step.lock:
+                released[step.lock] = finished[node]
+        return max(finished.values() or [0])
+
+    def fingerprint(self, inputs=None):
+        """Returns a hash of the nodes of the graph and the inputs of a run,
+        so a run is not resumed by a run for other hosts or settings.
+
+        Args:
+            inputs: JSON serializable values the steps depend on
+        """
+        data = json.dumps([[list(node) for node in self.order], inputs],
+                          sort_keys=True, default=str)
+        return hashlib.sha1(data).hexdigest()
+
+    def start_run(self, run_key, task_id=None, resume=True, inputs=None):
+        """Creates the database record of a new run. If the last run with
+        the same key did not succeed and had the same fingerprint, its
+        completed steps are copied as resumed steps.
+
+        Returns:
+            tuple: the :class:`DeploymentRun` and the set of completed nodes
+        """
+        previous = DeploymentRun.query.filter_by(run_key=run_key).order_by(
+                                            DeploymentRun.id.desc()).first()
+
+        run = DeploymentRun(run_key=run_key, task_id=task_id,
+                            status='running', started_at=datetime.utcnow(),
+                            fingerprint=self.fingerprint(inputs))
+        db.session.add(run)
+
+        completed = set()
+        if resume and previous and previous.status != 'success' and \
+                previous.fingerprint == run.fingerprint:
+            run.resumed_from = previous.id
+            for row in previous.steps.filter(
+                    DeploymentStep.status.in_(DeploymentStep.COMPLETED)):
+                node = (row.step, row.host or None)
+                if node not in self.deps or self.steps[row.step].rerun:
+                    continue
+                completed.add(node)
+                db.session.add(DeploymentStep(
+                    run=run, step=row.step, host=row.host, status='resumed',
+                    started_at=row.started_at, finished_at=row.finished_at,
+                    duration=row.duration, result=row.result))
+
+        db.session.commit()
+        return run, completed
+
+    @staticmethod
+    def _execute(app, step, host, ctx, finished):
+        started = time.time()
+        try:
+            with _app_context(app), profiling.step(step.name):
+                if step.check and step.check(ctx, host):
+                    status, result = 'skipped', None
+                else:
+                    result = step.action(ctx, host)
+                    status = 'failed' if result is False else 'success'
+        except Exception as e:
+            logger.exception("Step %s failed", step.name)
+            status, result = 'failed', e
+        finished.put(((step.name, host), status, result,
+                      time.time() - started))
+
+    def __log(self, tid, message, level='info'):
+        if tid:
+            wlogger.log(tid, message, level)
+
+    def run(self, run_key, ctx, tid=None, workers=10, resume=True,
+            inputs=None, timeout=None):
+        """Runs the steps, each as soon as its dependencies completed,
+        until all of them completed or one failed. The steps already
+        running when a step fails are waited for, the others are left for
+        the next run. A step running longer than the timeout fails; its
+        thread is abandoned rather than waited for.
+
+        Args:
+            run_key (string): key of the operation, see start_run()
+            ctx: passed to the actions and checks
+            tid (string): id of the task, steps are logged to its log
+            workers (int): maximum number of steps running at once
+            resume (bool): resume the last run if it failed
+            inputs: JSON serializable values the steps depend on besides
+                the hosts, a failed run is only resumed with equal inputs
+            timeout (int): seconds a step may run, DEPLOYMENT_STEP_TIMEOUT
+                of the app config by default
+
+        Returns:
+            :class:`clustermgr.models.DeploymentRun`: the finished run
+        """
+        run, done = self.start_run(run_key, tid, resume, inputs)
+        if done:
+            self.__log(tid, "Resuming, {} steps completed earlier".format(
+                                                                len(done)))
+
+        app = current_app._get_current_object() if has_app_context() \
+            else None
+        if timeout is None and app is not None:
+            timeout = app.config.get('DEPLOYMENT_STEP_TIMEOUT')
+        pending = [node for node in self.order if node not in done]
+        running = {}
+        started = {}
+        locks = set()
+        failed = False
+        timed_out = False
+        finished = Queue.Queue()
+        pool = ThreadPool(max(1, min(workers, len(pending))))
+
+        try:
+            while pending or running:
+                if not failed:
+                    for node in list(pending):
+                        step = self.steps[node[0]]
+                        if not self.deps[node] <= done or \
+                                (step.lock and step.lock in locks):
+                            continue
+                        pending.remove(node)
+                        if step.lock:
+                            locks.add(step.lock)
+                        row = DeploymentStep(run=run, step=node[0],
+                                             host=node[1] or '',
+                                             status='running',
+                                             started_at=datetime.utcnow())
+                        db.session.add(row)
+                        running[node] = row
+                        started[node] = time.time()
+                        self.__log(tid, "Starting {}".format(
+                                                        _format_node(node)))
+                        pool.apply_async(self._execute, (app, step, node[1],
+                                                         ctx, finished))
+                    db.session.commit()
+
+                if not running:
+                    break
+
+                try:
+                    if timeout is None:
+                        item = finished.get()
+                    else:
+                        # the step running the longest times out first
+                        item = finished.get(timeout=max(
+                            0, min(started.values()) + timeout - time.time()))
+                except Queue.Empty:
+                    node = min(running, key=started.get)
+                    item = (node, 'failed', 'Timed out after {}s'.format(
+                                                timeout), timeout)
+                    timed_out = True
+
+                node, status, result, duration = item
+                if node not in running:
+                    # a timed out step finishing after all
+                    continue
+                row = running.pop(node)
+                del started[node]
+                step = self.steps[node[0]]
+                if step.lock:
+                    locks.discard(step.lock)
+                row.status = status
+                row.finished_at = datetime.utcnow()
+                row.duration = round(duration, 3)
+                row.result = None if result is None else str(result)
+                db.session.commit()
+
+                if status == 'failed':
+                    failed = True
+                    self.__log(tid, "{} failed after {:.1f}s: {}".format(
+                            _format_node(node), duration, result), 'error')
+                else:
+                    done.add(node)
+                    self.__log(tid, "{} {} in {:.1f}s".format(
+                        _format_node(node),
+                        'already done' if status == 'skipped' else 'done',
+                        duration), 'success')
+        finally:
+            pool.close()
+            if not timed_out:
+                pool.join()
+
+        run.status = 'failed' if failed or pending else 'success'
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+        return run
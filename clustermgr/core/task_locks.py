@@ -0,0 +1,271 @@
+"""task_locks.py - locks keeping celery tasks from running over each other.
+
+Deployment tasks run concurrently in the workers of the deploy queue, and
+two of them must not reconfigure the same server at the same time. Periodic
+tasks should not start while their previous run is still going, so that a
+slow run doesn't pile up more runs in the monitoring queue. Both are kept
+apart by locks in redis, shared by the workers of all the queues.
+
+A task declares the servers it reconfigures with the `locked_hosts` option,
+a function called with the task and the arguments of the task, returning
+the hostnames::
+
+    @celery.task(bind=True, locked_hosts=server_hosts)
+    def installGluuServer(self, server_id):
+        ...
+
+The task waits up to HOST_LOCK_WAIT seconds for the tasks holding one of
+its hosts. A periodic task sets the `skip_if_running` option, a run which
+finds the previous one still going returns at once::
+
+    @celery.task(skip_if_running=True)
+    def get_remote_stats():
+        ...
+
+Locks are refreshed by a thread while they are held and expire `timeout`
+seconds later, so the locks of a worker which died are freed. Locks are
+held per process, which fits the prefork pool of the workers: a task called
+by another one in the same process shares the locks of the caller.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import redis
+
+from clustermgr.config import Config
+from clustermgr.extensions import redis_client
+from clustermgr.models import Server
+from clustermgr.core.config_cache import get_servers
+
+
+logger = logging.getLogger(__name__)
+
+
+class LockTimeout(Exception):
+    """Raised when a lock is held by another task for too long"""
+    def __init__(self, name, holder):
+        self.name = name
+        self.holder = holder
+        Exception.__init__(self, "{} is held by task {}".format(name, holder))
+
+
+class TaskLocks(object):
+    """Named locks in redis, owned by the ids of the tasks holding them.
+
+    Args:
+        timeout (int): seconds after which a lock which is not refreshed
+            expires
+    """
+    prefix = 'clustermgr:lock:'
+
+    # the lock is only released or extended by its owner
+    release_script = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+    refresh_script = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('expire', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+
+    def __init__(self, timeout=300):
+        self.timeout = timeout
+        self.r = redis_client
+        # name -> [owner, number of holders in this process]
+        self._held = {}
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    def holder(self, name):
+        """Returns the id of the task holding the lock, None if it is
+        free"""
+        return self.r.get(self.prefix + name)
+
+    def acquire(self, name, owner):
+        """Takes the lock if it is free or already held by this process.
+
+        Returns:
+            bool: True if the lock was taken
+        """
+        with self._lock:
+            held = self._held.get(name)
+            if held:
+                held[1] += 1
+                return True
+            if not self.r.set(self.prefix + name, owner, nx=True,
+                              ex=self.timeout):
+                return False
+            self._held[name] = [owner, 1]
+        self.__start_refresher()
+        return True
+
+    def release(self, name):
+        """Releases the lock once all its holders in this process did"""
+        with self._lock:
+            held = self._held.get(name)
+            if not held:
+                return
+            held[1] -= 1
+            if held[1]:
+                return
+            del self._held[name]
+        self.r.eval(self.release_script, 1, self.prefix + name, held[0])
+
+    def refresh(self):
+        """Extends the locks held by this process"""
+        with self._lock:
+            held = [(name, h[0]) for name, h in self._held.items()]
+        for name, owner in held:
+            self.r.eval(self.refresh_script, 1, self.prefix + name, owner,
+                        self.timeout)
+
+    def __start_refresher(self):
+        # a thread per process, the workers fork after importing the module
+        with self._lock:
+            if self._refresher == os.getpid():
+                return
+            self._refresher = os.getpid()
+        thread = threading.Thread(target=self.__refresh_loop)
+        thread.daemon = True
+        thread.start()
+
+    def __refresh_loop(self):
+        while True:
+            time.sleep(self.timeout / 3.0)
+            try:
+                self.refresh()
+            except redis.RedisError as e:
+                logger.warning("Can't refresh task locks: %s", e)
+
+    @contextmanager
+    def hold(self, names, owner, wait=0, on_wait=None, interval=2):
+        """Holds the locks for the block. The locks are taken in sorted
+        order, so tasks taking several of them don't deadlock.
+
+        Args:
+            names (list): names of the locks
+            owner (string): id of the task taking the locks
+            wait (int): seconds to wait for the locks held by other tasks
+            on_wait (callable): called as on_wait(name, holder) before
+                waiting for a lock
+            interval (int): seconds between attempts to take a lock
+
+        Raises:
+            LockTimeout: if a lock is still held by another task after
+                `wait` seconds
+        """
+        deadline = time.time() + wait
+        taken = []
+        try:
+            for name in sorted(set(names)):
+                waited = False
+                while not self.acquire(name, owner):
+                    holder = self.holder(name)
+                    if time.time() >= deadline:
+                        raise LockTimeout(name, holder)
+                    if not waited and on_wait:
+                        on_wait(name, holder)
+                    waited = True
+                    time.sleep(interval)
+                taken.append(name)
+            yield
+        finally:
+            for name in reversed(taken):
+                try:
+                    self.release(name)
+                except redis.RedisError as e:
+                    logger.warning("Can't release lock %s: %s", name, e)
+
+
+task_locks = TaskLocks(timeout=Config.TASK_LOCK_TIMEOUT)
+
+
+def host_lock_name(hostname):
+    return 'host:' + hostname
+
+
+@contextmanager
+def locked_task(task, args, kwargs, wait=0, on_wait=None):
+    """Holds the locks declared by a celery task while it runs, see the
+    module documentation. Yields False if the task should not run, since
+    its previous run is still going.
+
+    Args:
+        task: the celery task
+        args, kwargs: the arguments of the task
+        wait (int): seconds to wait for the hosts held by other tasks
+        on_wait (callable): called as on_wait(hostname, holder) before
+            waiting for a host
+
+    Raises:
+        LockTimeout: if a host is still held by another task after `wait`
+            seconds
+    """
+    owner = task.request.id or task.name
+    names = []
+    if getattr(task, 'locked_hosts', None):
+        names = [host_lock_name(h) for h in task.locked_hosts(*args, **kwargs)
+                 if h]
+
+    run_lock = 'task:' + task.name
+    if getattr(task, 'skip_if_running', False):
+        if not task_locks.acquire(run_lock, owner):
+            logger.info("Skipping %s, the previous run is still going",
+                        task.name)
+            yield False
+            return
+    else:
+        run_lock = None
+
+    def waiting(name, holder):
+        if on_wait:
+            on_wait(name[len('host:'):], holder)
+
+    try:
+        with task_locks.hold(names, owner, wait, waiting):
+            yield True
+    finally:
+        if run_lock:
+            task_locks.release(run_lock)
+
+
+# functions for the locked_hosts option, called with the task and its
+# arguments
+
+def cluster_hosts(task, *args, **kwargs):
+    """All the servers of the cluster"""
+    return [server.hostname for server in get_servers()]
+
+
+def server_hosts(task, server_id, *args, **kwargs):
+    """The server of the server_id argument, all of them for 'all'"""
+    if server_id == 'all':
+        return cluster_hosts(task)
+    server = Server.query.get(server_id)
+    return [server.hostname] if server else []
+
+
+def replication_hosts(task, server_id, *args, **kwargs):
+    """The server of the server_id argument and the primary server, which
+    replication is configured from"""
+    primary = Server.query.filter_by(primary_server=True).first()
+    return server_hosts(task, server_id) + \
+        ([primary.hostname] if primary else [])
+
+
+def listed_hosts(task, server_ids, *args, **kwargs):
+    """The servers of the server_ids argument"""
+    return [server.hostname for server in get_servers()
+            if server.id in server_ids]
+
+
+def argument_host(task, hostname, *args, **kwargs):
+    """The host named by the first argument"""
+    return [hostname]
@@ -19,7 +19,9 @@ from clustermgr.core.Properties import Properties
 from clustermgr.config import Config
 
 from clustermgr.core.remote import RemoteClient
-from clustermgr.models import Server, AppConfiguration, CacheServer
+from clustermgr.models import CacheServer
+from clustermgr.core.config_cache import get_app_config, get_servers, \
+    get_primary_server
 from clustermgr.extensions import wlogger
 from flask import current_app as app
 
@@ -254,8 +256,11 @@ def get_opendj_replication_status():
     :returns: A string that shows replication status
     """
     
-    primary_server = Server.query.filter_by(primary_server=True).first()
-    app_config = AppConfiguration.query.first()
+    primary_server = get_primary_server()
+    app_config = get_app_config()
+
+    if not primary_server or not app_config:
+        return False, "Primary server is not defined"
 
     #Make ssh connection to primary server
     c = RemoteClient(primary_server.hostname, ip=primary_server.ip)
@@ -289,6 +294,7 @@ def get_opendj_replication_status():
     cmd = cmd_run.format(cmd)
 
     si,so,se = c.run(cmd)
+    c.close()
 
     return True, so
 
@@ -428,8 +434,8 @@ def make_proxy_stunnel_conf(exception=None):
         'output = /var/log/stunnel4/stunnel.log',
         ]
 
-    servers = Server.query.all()
-    app_config = AppConfiguration.query.first()
+    servers = get_servers()
+    app_config = get_app_config()
     
     if app_config.external_load_balancer:
         cache_ip = app_config.cache_ip
@@ -466,7 +472,7 @@ def make_twem_proxy_conf(exception=None):
 
     twemproxy_conf = open(twemproxy_conf_tmp_file).read()
 
-    servers = Server.query.all()
+    servers = get_servers()
 
     for server in servers:
         if (server.id != exception) and server.redis:
@@ -476,8 +482,8 @@ def make_twem_proxy_conf(exception=None):
     return twemproxy_conf
     
 def make_nginx_proxy_conf(exception=None):
-    servers = Server.query.all()
-    app_config = AppConfiguration.query.first()
+    servers = get_servers()
+    app_config = get_app_config()
     nginx_backends = []
 
     server_list = []
@@ -11,6 +11,7 @@ except ImportError:
     from flask_wtf.csrf import CsrfProtect as CSRFProtect
 
 from .weblogger import WebLogger
+from .redis_client import RedisClient
 from clustermgr.config import Config
 
 
@@ -18,6 +19,7 @@ db = SQLAlchemy()
 csrf = CSRFProtect()
 migrate = Migrate()
 wlogger = WebLogger()
+redis_client = RedisClient()
 celery = Celery('clustermgr.application', backend=Config.CELERY_RESULT_BACKEND,
                 broker=Config.CELERY_BROKER_URL
                 )
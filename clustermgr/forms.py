@@ -83,8 +83,9 @@ class LDIFForm(FlaskForm):
     ldif = FileField(validators=[
         FileRequired(),
         FileAllowed(
-            ['ldif'], 'Upload OpenLDAP slapcat exported ldif files only!')
+            ['ldif', 'gz'], 'Upload ldif or gzip compressed ldif files only!')
     ])
+    update_existing = BooleanField('Update existing entries')
 
 
 class KeyRotationForm(FlaskForm):
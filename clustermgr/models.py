@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from datetime import timedelta
 from sqlalchemy.schema import Sequence
@@ -188,6 +189,124 @@ class CacheServer(db.Model):
         return '<Cache Server {} {}>'.format(self.id, self.hostname)
 
 
+class DeploymentRun(db.Model):
+    __tablename__ = "deployment_run"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # identifies the operation, runs with the same key resume each other
+    run_key = db.Column(db.String(250), index=True)
+
+    # id of the celery task executing the run
+    task_id = db.Column(db.String(50))
+
+    # running, success or failed
+    status = db.Column(db.String(16))
+
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # id of the failed run this run continues
+    resumed_from = db.Column(db.Integer)
+
+    # hash of the steps, hosts and inputs, a run is only resumed by a run
+    # with the same fingerprint
+    fingerprint = db.Column(db.String(40))
+
+    steps = db.relationship('DeploymentStep', backref='run', lazy='dynamic',
+                            order_by='DeploymentStep.id')
+
+    def completed(self, step, host=None):
+        """Returns True if the step completed on the host in this run"""
+        return self.steps.filter(
+            DeploymentStep.step == step,
+            DeploymentStep.host == (host or ''),
+            DeploymentStep.status.in_(DeploymentStep.COMPLETED)).count() > 0
+
+    def __repr__(self):
+        return '<DeploymentRun {} {} {}>'.format(self.id, self.run_key,
+                                                 self.status)
+
+
+class DeploymentStep(db.Model):
+    __tablename__ = "deployment_step"
+
+    # statuses of the steps which don't have to run again
+    COMPLETED = ('success', 'skipped', 'resumed')
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('deployment_run.id'),
+                       index=True)
+
+    # name of the step and the host it ran for, empty for cluster wide steps
+    step = db.Column(db.String(100))
+    host = db.Column(db.String(250), default='')
+
+    # running, success, skipped (already done), resumed (completed by the
+    # resumed run) or failed
+    status = db.Column(db.String(16))
+
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # seconds the step took
+    duration = db.Column(db.Float)
+
+    # returned value or error message
+    result = db.Column(db.Text)
+
+    def __repr__(self):
+        return '<DeploymentStep {} {} {}>'.format(self.step, self.host,
+                                                  self.status)
+
+
+class TaskProfile(db.Model):
+    __tablename__ = "task_profile"
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.String(50), index=True)
+    task_name = db.Column(db.String(250))
+
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    # seconds the task took
+    duration = db.Column(db.Float)
+
+    # json list of [host, step, kind, label, count, seconds, bytes]
+    spans = db.Column(db.Text)
+
+    def get_spans(self):
+        return json.loads(self.spans) if self.spans else []
+
+    def __repr__(self):
+        return '<TaskProfile {} {}>'.format(self.task_id, self.task_name)
+
+
+class HostFact(db.Model):
+    """A fact about a server gathered with SSH commands, see
+    :mod:`clustermgr.core.host_facts`"""
+    __tablename__ = "host_fact"
+    __table_args__ = (db.UniqueConstraint('hostname', 'name'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    hostname = db.Column(db.String(250), index=True)
+    name = db.Column(db.String(50))
+
+    # json encoded value
+    value = db.Column(db.Text)
+    gathered_at = db.Column(db.DateTime)
+
+    def get_value(self):
+        return json.loads(self.value) if self.value else None
+
+    def set_value(self, value):
+        self.value = json.dumps(value)
+
+    def __repr__(self):
+        return '<HostFact {} {}>'.format(self.hostname, self.name)
+
+
 @db.event.listens_for(CacheServer, 'before_insert')
 def do_stuff(mapper, connect, target):
     last_entry = CacheServer.query.order_by(CacheServer.id.desc()).first()
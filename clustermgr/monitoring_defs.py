@@ -5,6 +5,8 @@
 left_menu = { 
     'Ldap Monitoring': (
                         'replication_status',
+                        'replication_lag',
+                        'config_drift',
                         #'gluu_authentications',
                         'add_requests',
                         'modify_requests',
@@ -94,6 +96,15 @@ items = {
                     'vAxis': '%'},
                     
         'replication_status': {'end_point': 'monitoring.replication_status'},
+
+        # one chart per source server, a line per target server
+        'replication_lag': {'end_point': 'monitoring.system',
+                    'data_source': 'replication_lag.*',
+                    'aggr': 'AVG',
+                    'chartType': 'LineChart',
+                    'vAxis': 'seconds'},
+
+        'config_drift': {'end_point': 'monitoring.config_drift'},
         
 }
 
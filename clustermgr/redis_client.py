@@ -0,0 +1,56 @@
+"""redis_client.py - flask extension sharing one lazily created redis client.
+"""
+
+import threading
+
+import redis
+
+from clustermgr.config import Config
+
+
+class RedisClient(object):
+    """Redis client shared by the caches, status stores and locks in
+    clustermgr.core. The connection settings are read from the Flask
+    application config (REDIS_HOST, REDIS_PORT, REDIS_LOG_DB) by init_app(),
+    and the client is only created when it is first used, so the modules
+    holding the client can be imported before the app is configured.
+
+    Attributes of the redis.Redis client are available on this object::
+
+        from clustermgr.extensions import redis_client
+
+        redis_client.get('key')
+
+    Without init_app() the defaults of clustermgr.config.Config are used.
+    """
+
+    def __init__(self, app=None):
+        self.host = Config.REDIS_HOST
+        self.port = Config.REDIS_PORT
+        self.db = Config.REDIS_LOG_DB
+        self._client = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        with self._lock:
+            self.host = app.config['REDIS_HOST']
+            self.port = app.config['REDIS_PORT']
+            self.db = app.config['REDIS_LOG_DB']
+            if self._client is not None:
+                self._client.connection_pool.disconnect()
+                self._client = None
+
+    @property
+    def client(self):
+        """The redis.Redis client, created on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = redis.Redis(host=self.host, port=self.port,
+                                               db=self.db)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
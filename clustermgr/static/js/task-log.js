@@ -0,0 +1,83 @@
+/*
+ * Follows the log of a celery task.
+ *
+ * The log is streamed from index.stream_log with server-sent events. If the
+ * browser has no EventSource support or the stream can not be kept open,
+ * index.get_log is polled every second instead. Both deliver the same
+ * payload, which is handed to `show`. `since` returns the number of
+ * messages already shown, so only the new ones are fetched.
+ *
+ * Polls fetch at most PAGE_SIZE messages at a time; when the page falls
+ * behind a long log, the next page is fetched right away. A poll is not
+ * sent while the previous one is pending.
+ *
+ * Returns an object whose stop() method ends the updates, call it once the
+ * task has finished.
+ */
+var TASK_LOG_PAGE_SIZE = 500;
+
+function followTaskLog(logUrl, streamUrl, since, show) {
+    var source = null;
+    var timer = null;
+    var stopped = false;
+    var pending = false;
+
+    function poll() {
+        if (pending) {
+            return;
+        }
+        pending = true;
+        $.get(logUrl, {since: since(), count: TASK_LOG_PAGE_SIZE}, function(data) {
+            var behind = data.next < data.total;
+            if (behind) {
+                // the task may have ended, but the rest of its log is
+                // still to be fetched
+                data.state = 'PROGRESS';
+            }
+            pending = false;
+            show(data);
+            if (behind && timer !== null) {
+                poll();
+            }
+        }).fail(function() {
+            pending = false;
+        });
+    }
+
+    function startPolling() {
+        if (!stopped && timer === null) {
+            timer = setInterval(poll, 1000);
+        }
+    }
+
+    function stop() {
+        stopped = true;
+        if (source !== null) {
+            source.close();
+            source = null;
+        }
+        if (timer !== null) {
+            clearInterval(timer);
+            timer = null;
+        }
+    }
+
+    if (window.EventSource) {
+        source = new EventSource(streamUrl + '?since=' + since());
+        source.onmessage = function(e) {
+            show(JSON.parse(e.data));
+        };
+        source.onerror = function() {
+            // the stream is not available or was cut, fall back to polling
+            if (source !== null) {
+                source.close();
+                source = null;
+            }
+            startPolling();
+        };
+    } else {
+        startPolling();
+    }
+
+    return {stop: stop};
+}
@@ -4,10 +4,13 @@ import re
 import socket
 
 
-from clustermgr.models import Server, AppConfiguration, CacheServer
+from clustermgr.models import Server, CacheServer
+from clustermgr.core.config_cache import get_app_config, get_servers
 from clustermgr.extensions import db, wlogger, celery
 from clustermgr.core.remote import RemoteClient
 from clustermgr.core.ldap_functions import DBManager
+from clustermgr.core.step_graph import Step, StepGraph
+from clustermgr.core.task_locks import listed_hosts
 from clustermgr.tasks.cluster import get_os_type, run_command
 from clustermgr.core.utils import parse_setup_properties, \
         get_redis_config, make_proxy_stunnel_conf, make_twem_proxy_conf, get_cache_servers
@@ -242,227 +245,309 @@ class StunnelInstaller(BaseInstaller):
         self.run_command(cmd)
     
 
-@celery.task(bind=True)
-def install_cache_cluster(self, servers_id_list, cache_servers_id_list):
-
-    tid = self.request.id
+def install_cache_server(ctx, host):
+    """Installs redis and stunnel on a cache server. The stunnel certificate
+    and server configuration are created on the primary cache server.
+    """
+    tid = ctx['tid']
+    server = CacheServer.query.get(ctx['cache_server_ids'][host])
+    app_conf = get_app_config()
 
-    servers = [ Server.query.get(id) for id in servers_id_list ]
-    cache_servers = [ CacheServer.query.get(id) for id in cache_servers_id_list ]
+    rc = __get_remote_client(server, tid)
+    if not rc:
+        wlogger.log(tid, "SSH connection to server failed", "error", server_id=server.id)
+        return False
+    
+    ri = RedisInstaller(server, tid, rc)
+    
+    if app_conf.offline:
+        if not ri.check_installed():
+            wlogger.log(
+                tid, 
+                'Redis Server was not installed. Please install Redis '
+                ' Server and retry.', 
+                'error',
+                server_id=server.id
+                )
+            return False
 
-    app_conf = AppConfiguration.query.first()
+    redis_installed = ri.install()
     
-    primary_cache = None
-    primary_cache_server = CacheServer.query.first()
+    wlogger.log(
+                tid, 
+                'Setting Redis password',
+                'info',
+                server_id=server.id
+                )
+    
+    ri.set_redis_password()
 
-    for server in cache_servers:
+    if redis_installed:
+        wlogger.log(tid, "Redis install successful", "success",
+                    server_id=server.id)
+    else:
+        wlogger.log(tid, "Redis install failed", "fail",
+                    server_id=server.id)
+        return False
+
+    ri.run_sysctl('enable')
+    ri.run_sysctl('restart')
 
-        rc = __get_remote_client(server, tid)
-        if not rc:
-            wlogger.log(tid, "SSH connection to server failed", "error", server_id=server.id)
+    si = StunnelInstaller(server, tid, rc)
+
+    if app_conf.offline:
+        if not si.check_installed():
+            wlogger.log(
+                tid, 
+                'Stunnel was not installed. Please install stunnel '
+                'and retry.', 
+                'error',
+                server_id=server.id
+                )
             return False
-        
-        ri = RedisInstaller(server, tid, rc)
-        
-        if app_conf.offline:
-            if not ri.check_installed():
-                wlogger.log(
-                    tid, 
-                    'Redis Server was not installed. Please install Redis '
-                    ' Server and retry.', 
-                    'error',
-                    server_id=server.id
-                    )
-                return False
 
-        redis_installed = ri.install()
+     
+    if si.check_installed():
+        server.stunnel = True
+    else:
+        wlogger.log(tid, "Installing Stunnel", "info", server_id=server.id)
         
-        wlogger.log(
-                    tid, 
-                    'Setting Redis password',
-                    'info',
-                    server_id=server.id
-                    )
-        
-        ri.set_redis_password()
-    
-        if redis_installed:
-            wlogger.log(tid, "Redis install successful", "success",
+        stunnel_installed = si.install()
+        if stunnel_installed:
+            server.stunnel = True
+            wlogger.log(tid, "Stunnel install successful", "success",
                         server_id=server.id)
         else:
-            wlogger.log(tid, "Redis install failed", "fail",
+            server.stunnel = False
+            wlogger.log(tid, "Stunnel install failed", "fail",
                         server_id=server.id)
+                        
             return False
-
-        ri.run_sysctl('enable')
-        ri.run_sysctl('restart')
-
-        si = StunnelInstaller(server, tid, rc)
-
-        if app_conf.offline:
-            if not si.check_installed():
-                wlogger.log(
-                    tid, 
-                    'Stunnel was not installed. Please install stunnel '
-                    'and retry.', 
-                    'error',
-                    server_id=server.id
-                    )
-                return False
-
-         
-        if si.check_installed():
-            server.stunnel = True
-        else:
-            wlogger.log(tid, "Installing Stunnel", "info", server_id=server.id)
-            
-            stunnel_installed = si.install()
-            if stunnel_installed:
-                server.stunnel = True
-                wlogger.log(tid, "Stunnel install successful", "success",
-                            server_id=server.id)
-            else:
-                server.stunnel = False
-                wlogger.log(tid, "Stunnel install failed", "fail",
+    
+    if si.os_type == 'rpm':
+        si.upload_service_file()
+    
+    if si.os_type == 'deb':
+        wlogger.log(tid, "Enabling stunnel", "debug", server_id=server.id)
+        si.run_command("sed -i 's/ENABLED=0/ENABLED=1/g' /etc/default/stunnel4")
+    
+    if host == ctx['primary_cache']:
+        if not rc.exists('/etc/stunnel/redis-server.crt'):
+            wlogger.log(tid, "Creating SSL certificate for stunnel", "info",
                             server_id=server.id)
-                            
-                return False
+            si.run_command(
+                    'openssl req -x509 -nodes -days 3650 -newkey rsa:2048 '
+                    '-batch -keyout /etc/stunnel/redis-server.key '
+                    '-out /etc/stunnel/redis-server.crt'
+                    )
+            si.run_command('chmod 600 /etc/stunnel/redis-server.key')
         
-        if si.os_type == 'rpm':
-            si.upload_service_file()
         
-        if si.os_type == 'deb':
-            wlogger.log(tid, "Enabling stunnel", "debug", server_id=server.id)
-            si.run_command("sed -i 's/ENABLED=0/ENABLED=1/g' /etc/default/stunnel4")
+        wlogger.log(tid, "Retreiving server certificate", "info",
+                            server_id=server.id)
+
+
+        stunnel_redis_conf = (
+                            'pid = /run/stunnel-redis.pid\n'
+                            '[redis-server]\n'
+                            'cert = /etc/stunnel/redis-server.crt\n'
+                            'key = /etc/stunnel/redis-server.key\n'
+                            'accept = {0}:{1}\n'
+                            'connect = 127.0.0.1:6379\n'
+                            ).format(server.ip, ctx['stunnel_port'])
         
-        if not primary_cache:
-            primary_cache = server.ip
-            if not rc.exists('/etc/stunnel/redis-server.crt'):
-                wlogger.log(tid, "Creating SSL certificate for stunnel", "info",
-                                server_id=server.id)
-                si.run_command(
-                        'openssl req -x509 -nodes -days 3650 -newkey rsa:2048 '
-                        '-batch -keyout /etc/stunnel/redis-server.key '
-                        '-out /etc/stunnel/redis-server.crt'
-                        )
-                si.run_command('chmod 600 /etc/stunnel/redis-server.key')
-            
-            
-            wlogger.log(tid, "Retreiving server certificate", "info",
-                                server_id=server.id)
-
-
-            stunnel_redis_conf = (
-                                'pid = /run/stunnel-redis.pid\n'
-                                '[redis-server]\n'
-                                'cert = /etc/stunnel/redis-server.crt\n'
-                                'key = /etc/stunnel/redis-server.key\n'
-                                'accept = {0}:{1}\n'
-                                'connect = 127.0.0.1:6379\n'
-                                ).format(server.ip, primary_cache_server.stunnel_port)
-            
-            wlogger.log(tid, "Writing redis stunnel configurations", "info",
-                                server_id=server.id)
-            
-            rc.put_file('/etc/stunnel/stunnel.conf', stunnel_redis_conf)
-            
-            si.run_sysctl('enable')
-            si.run_sysctl('restart')
+        wlogger.log(tid, "Writing redis stunnel configurations", "info",
+                            server_id=server.id)
         
-        server.installed = True
-        db.session.commit()
-        rc.close()
+        rc.put_file('/etc/stunnel/stunnel.conf', stunnel_redis_conf)
         
-    wlogger.log(tid, "2", "set_step")
+        si.run_sysctl('enable')
+        si.run_sysctl('restart')
     
-    # retreive stunnel certificate
-    rc = RemoteClient(primary_cache_server.hostname, ip=primary_cache_server.ip)
+    server.installed = True
+    db.session.commit()
+    rc.close()
+
+    return True
+
+
+def fetch_stunnel_cert(ctx, host):
+    """Reads the stunnel certificate of the primary cache server"""
+    tid = ctx['tid']
+    wlogger.log(tid, "2", "set_step")
+
+    rc = RemoteClient(ctx['primary_cache'], ip=ctx['primary_cache_ip'])
     rc.startup()
     stunnel_cert = rc.get_file('/etc/stunnel/redis-server.crt')
+    rc.close()
 
     if not stunnel_cert[0]:
-        print "Can't retreive server certificate from primary cache server"
+        wlogger.log(tid, "Can't retreive server certificate from primary "
+                         "cache server", "error")
         return False
 
-    stunnel_cert = stunnel_cert[1].read()
+    ctx['stunnel_cert'] = stunnel_cert[1].read()
+    return True
 
-    for server in servers:
-                
-        rc = __get_remote_client(server, tid)
-        if not rc:
-            wlogger.log(tid, "SSH connection to server failed", "error", server_id=server.id)
-            return False
 
-        si = StunnelInstaller(server, tid, rc)
+def configure_cache_client(ctx, host):
+    """Installs stunnel on a Gluu server and connects it to the primary
+    cache server
+    """
+    tid = ctx['tid']
+    server = Server.query.get(ctx['server_ids'][host])
 
-        wlogger.log(tid, "Installing Stunnel", "debug", server_id=server.id)
-         
-        if si.rc.exists('/usr/bin/stunnel') or si.rc.exists('/bin/stunnel'):
-            wlogger.log(tid, "Stunnel was allready installed", "info", 
-                        server_id=server.id)
+    rc = __get_remote_client(server, tid)
+    if not rc:
+        wlogger.log(tid, "SSH connection to server failed", "error", server_id=server.id)
+        return False
+
+    si = StunnelInstaller(server, tid, rc)
+
+    wlogger.log(tid, "Installing Stunnel", "debug", server_id=server.id)
+     
+    if si.rc.exists('/usr/bin/stunnel') or si.rc.exists('/bin/stunnel'):
+        wlogger.log(tid, "Stunnel was allready installed", "info", 
+                    server_id=server.id)
+        server.stunnel = True
+    else:
+        wlogger.log(tid, "Installing Stunnel", "info", server_id=server.id)
+        
+        stunnel_installed = si.install()
+        if stunnel_installed:
             server.stunnel = True
+            wlogger.log(tid, "Stunnel install successful", "success",
+                        server_id=server.id)
         else:
-            wlogger.log(tid, "Installing Stunnel", "info", server_id=server.id)
-            
-            stunnel_installed = si.install()
-            if stunnel_installed:
-                server.stunnel = True
-                wlogger.log(tid, "Stunnel install successful", "success",
+            server.stunnel = False
+            wlogger.log(tid, "Stunnel install failed", "fail",
+                        server_id=server.id)
+                        
+            return False
+
+    if si.os_type == 'rpm':
+        si.upload_service_file()
+    
+    
+    if si.os_type == 'deb':
+        wlogger.log(tid, "Enabling stunnel", "debug", server_id=server.id)
+        si.run_command("sed -i 's/ENABLED=0/ENABLED=1/g' /etc/default/stunnel4")
+
+    stunnel_redis_conf = ( 
+                        'pid = /run/stunnel-redis.pid\n'
+                        '[redis-client]\n'
+                        'client = yes\n'
+                        'accept = 127.0.0.1:{1}\n'
+                        'connect = {0}:{1}\n'
+                        'CAfile = /etc/stunnel/redis-server.crt\n'
+                        'verify = 4\n'
+                        ).format(ctx['primary_cache_ip'], ctx['stunnel_port'])
+
+    wlogger.log(tid, "Writing redis stunnel configurations", "info",
                             server_id=server.id)
-            else:
-                server.stunnel = False
-                wlogger.log(tid, "Stunnel install failed", "fail",
+    rc.put_file('/etc/stunnel/stunnel.conf', stunnel_redis_conf)
+
+    wlogger.log(tid, "Uploading server certificate", "info",
                             server_id=server.id)
-                            
-                return False
 
-        if si.os_type == 'rpm':
-            si.upload_service_file()
-        
+    rc.put_file('/etc/stunnel/redis-server.crt', ctx['stunnel_cert'])
+
+    si.run_sysctl('enable')
+    si.run_sysctl('restart')
+
+    if server.primary_server:
         
-        if si.os_type == 'deb':
-            wlogger.log(tid, "Enabling stunnel", "debug", server_id=server.id)
-            si.run_command("sed -i 's/ENABLED=0/ENABLED=1/g' /etc/default/stunnel4")
+        server_string = 'localhost:{0}'.format(ctx['stunnel_port'])
+        __update_LDAP_cache_method(tid, server, server_string, redis_password=ctx['redis_password'])
 
-        stunnel_redis_conf = ( 
-                            'pid = /run/stunnel-redis.pid\n'
-                            '[redis-client]\n'
-                            'client = yes\n'
-                            'accept = 127.0.0.1:{1}\n'
-                            'connect = {0}:{1}\n'
-                            'CAfile = /etc/stunnel/redis-server.crt\n'
-                            'verify = 4\n'
-                            ).format(primary_cache, primary_cache_server.stunnel_port)
+    db.session.commit()
+    rc.close()
 
-        wlogger.log(tid, "Writing redis stunnel configurations", "info",
-                                server_id=server.id)
-        rc.put_file('/etc/stunnel/stunnel.conf', stunnel_redis_conf)
+    return True
 
-        wlogger.log(tid, "Uploading server certificate", "info",
-                                server_id=server.id)
 
-        rc.put_file('/etc/stunnel/redis-server.crt', stunnel_cert)
+def restart_gluu_server(ctx, host):
+    """Restarts the Gluu Server to use the new cache configuration"""
+    tid = ctx['tid']
+    server = Server.query.get(ctx['server_ids'][host])
+    app_conf = get_app_config()
 
-        si.run_sysctl('enable')
-        si.run_sysctl('restart')
+    rc = __get_remote_client(server, tid)
+    if not rc:
+        return False
 
-        if server.primary_server:
-            
-            server_string = 'localhost:{0}'.format(primary_cache_server.stunnel_port)
-            __update_LDAP_cache_method(tid, server, server_string, redis_password=primary_cache_server.redis_password)
-        
+    si = StunnelInstaller(server, tid, rc)
 
-        wlogger.log(tid, "Restarting Gluu Server", "info",
-                                server_id=server.id)
+    wlogger.log(tid, "Restarting Gluu Server", "info",
+                            server_id=server.id)
 
+    if server.os in ('RHEL 7', 'CentOS 7', 'Ubuntu 18'):
+        si.run_command('/sbin/gluu-serverd-{} restart'.format(app_conf.gluu_version))
+    else:
+        si.run_command('systemctl restart gluu-server-{}'.format(app_conf.gluu_version))
 
-        if server.os in ('RHEL 7', 'CentOS 7', 'Ubuntu 18'):
-            si.run_command('/sbin/gluu-serverd-{} restart'.format(app_conf.gluu_version))
-        else:
-            si.run_command('systemctl restart gluu-server-{}'.format(app_conf.gluu_version))
+    rc.close()
+    return True
+
+
+def cache_cluster_hosts(task, servers_id_list, cache_servers_id_list):
+    """The servers and cache servers of a cache cluster installation, for
+    the locked_hosts option of the task"""
+    return listed_hosts(task, servers_id_list) + [
+        server.hostname for server in CacheServer.query.filter(
+                                CacheServer.id.in_(cache_servers_id_list))]
 
-    wlogger.log(tid, "3", "set_step")
 
+@celery.task(bind=True, locked_hosts=cache_cluster_hosts)
+def install_cache_cluster(self, servers_id_list, cache_servers_id_list):
+
+    tid = self.request.id
+
+    servers = [ Server.query.get(id) for id in servers_id_list ]
+    cache_servers = [ CacheServer.query.get(id) for id in cache_servers_id_list ]
+
+    if not cache_servers:
+        wlogger.log(tid, "No cache servers to install", "error")
+        return False
+
+    # the first cache server holds the stunnel certificate, the gluu
+    # servers connect to it
+    primary_cache_server = CacheServer.query.first()
+
+    ctx = {
+        'tid': tid,
+        'server_ids': dict((s.hostname, s.id) for s in servers),
+        'cache_server_ids': dict((s.hostname, s.id) for s in cache_servers),
+        'primary_cache': cache_servers[0].hostname,
+        'primary_cache_ip': cache_servers[0].ip,
+        'stunnel_port': primary_cache_server.stunnel_port,
+        'redis_password': primary_cache_server.redis_password,
+    }
+
+    graph = StepGraph([
+        Step('install_cache_server', install_cache_server,
+             hosts=[s.hostname for s in cache_servers]),
+        Step('fetch_stunnel_cert', fetch_stunnel_cert, rerun=True,
+             requires_all=['install_cache_server']),
+        Step('configure_cache_client', configure_cache_client,
+             hosts=[s.hostname for s in servers],
+             requires_all=['fetch_stunnel_cert']),
+        # gluu servers are restarted one at a time to keep the cluster up
+        Step('restart_gluu_server', restart_gluu_server,
+             hosts=[s.hostname for s in servers],
+             requires=['configure_cache_client'], lock='restart_gluu'),
+    ])
+    run = graph.run('install_cache_cluster', ctx, tid=tid, inputs={
+        'servers': ctx['server_ids'],
+        'cache_servers': ctx['cache_server_ids'],
+        'stunnel_port': ctx['stunnel_port'],
+    })
+
+    if run.status != 'success':
+        return False
+
+    wlogger.log(tid, "3", "set_step")
+    return True
 
 
 def __update_LDAP_cache_method(tid, server, server_string, method='STANDALONE', redis_password=''):
@@ -538,7 +623,7 @@ def run_and_log(rc, cmd, tid, server_id=None):
 @celery.task(bind=True)
 def get_cache_methods(self):
     tid = self.request.id
-    servers = Server.query.all()
+    servers = get_servers()
     methods = []
     for server in servers:
         try:
@@ -9,21 +9,35 @@ import StringIO
 
 from flask import current_app as app
 
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.models import Server
+from clustermgr.core.config_cache import get_app_config, get_servers, \
+    get_primary_server
 from clustermgr.extensions import wlogger, db, celery
-from clustermgr.core.remote import RemoteClient
-from clustermgr.core.ldap_functions import LdapOLC, getLdapConn
+from clustermgr.core.remote import RemoteClient, RemoteCommandError
+from clustermgr.core.ldap_functions import LdapOLC, getLdapConn, ldap_pool
 from clustermgr.core.utils import get_setup_properties, modify_etc_hosts, \
-        make_nginx_proxy_conf, make_twem_proxy_conf, make_proxy_stunnel_conf
+        make_nginx_proxy_conf, get_opendj_replication_status
 from clustermgr.core.clustermgr_installer import Installer
 from clustermgr.core.Properties import Properties
+from clustermgr.core.replication_status import replication_status
+from clustermgr.core.step_graph import Step, StepGraph
+from clustermgr.core.host_facts import host_facts, container_layout, \
+    SETUP_PROPERTIES_LAST
+from clustermgr.core.task_locks import cluster_hosts, server_hosts, \
+    replication_hosts, listed_hosts, argument_host
 
 from clustermgr.config import Config
 
 import uuid
 import select
+import shutil
+import tempfile
+from functools import partial, wraps
+from collections import namedtuple
 
-def run_command(tid, c, command, container=None, no_error='error',  server_id='', exclude_error=None):
+from ldap3 import SUBTREE, BASE
+
+def run_command(tid, c, command, container=None, no_error='error',  server_id='', exclude_error=None, check=False):
     """Shorthand for RemoteClient.run(). This function automatically logs
     the commands output at appropriate levels to the WebLogger to be shared
     in the web frontend.
@@ -35,9 +49,14 @@ def run_command(tid, c, command, container=None, no_error='error',  server_id=''
         command (string): the command to be run on the remote server
         container (string, optional): location where the Gluu Server container
             is installed. For standalone LDAP servers this is not necessary.
+        check (bool, optional): raise if the command exits with a non-zero
+            status, unless its error output is one of the excluded errors
 
     Returns:
         the output of the command or the err thrown by the command as a string
+
+    Raises:
+        RemoteCommandError: if check is set and the command failed
     """
     
     excluded_errors = [
@@ -63,13 +82,13 @@ def run_command(tid, c, command, container=None, no_error='error',  server_id=''
 
     cin, cout, cerr = c.run(command)
     output = ''
+    not_error = False
 
     if cout:
         wlogger.log(tid, cout, "debug", server_id=server_id)
         output += "\n" + cout
 
     if cerr:        
-        not_error = False
         for ee in excluded_errors:
             if cerr.startswith(ee):
                 not_error = True
@@ -82,6 +101,11 @@ def run_command(tid, c, command, container=None, no_error='error',  server_id=''
             wlogger.log(tid, cerr, no_error, server_id=server_id)
         output += "\n" + cerr
 
+    exit_status = getattr(c, 'exit_status', None)
+    if check and exit_status and not not_error:
+        raise RemoteCommandError("Command failed on {} with exit status "
+                                 "{}".format(c.host, exit_status))
+
     return output
 
 
@@ -227,7 +251,7 @@ def get_csync2_config(exclude=None):
 
     csync2_config = ['group gluucluster','{']
 
-    all_servers = Server.query.all()
+    all_servers = get_servers()
 
     cysnc_hosts = []
     for server in all_servers:
@@ -286,7 +310,7 @@ def get_csync2_config(exclude=None):
     return csync2_config
 
 def get_chroot():
-    app_config = AppConfiguration.query.first()
+    app_config = get_app_config()
     chroot = '/opt/gluu-server-' + app_config.gluu_version
     return chroot
 
@@ -294,7 +318,8 @@ def get_run_cmd(server):
     run_cmd = "{}"
     cmd_chroot = get_chroot()
 
-    if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
+    os_type = host_facts.os_type(server.hostname, server.os)
+    if container_layout(os_type) == 'ssh':
         cmd_chroot = None
         run_cmd = ("ssh -o IdentityFile=/etc/gluu/keys/gluu-console -o "
             "Port=60022 -o LogLevel=QUIET -o StrictHostKeyChecking=no "
@@ -333,12 +358,12 @@ def restart_inetd(tid, c, server):
 
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def update_filesystem_replication_paths(self):
     tid = self.request.id
 
-    servers = Server.query.all()
-    app_config = AppConfiguration.query.first()
+    servers = get_servers()
+    app_config = get_app_config()
     
     chroot = '/opt/gluu-server-' + app_config.gluu_version
     csync2_config = get_csync2_config()
@@ -353,237 +378,262 @@ def update_filesystem_replication_paths(self):
         restart_inetd(tid, c, server)
 
 
-@celery.task(bind=True)
-def setup_filesystem_replication(self):
-    """Deploys File System replicaton
+def setup_csync2(ctx, host):
+    """Installs and configures csync2 on the server. Keys and configuration
+    are created on the primary server and copied to the other servers.
     """
+    tid = ctx['tid']
+    server = Server.query.get(ctx['server_ids'][host])
+    app_config = get_app_config()
 
-    tid = self.request.id
+    chroot = '/opt/gluu-server-' + app_config.gluu_version
 
-    servers = Server.query.all()
-    app_config = AppConfiguration.query.first()
+    c = RemoteClient(server.hostname, ip=server.ip)
+    c.startup()
 
-    chroot = '/opt/gluu-server-' + app_config.gluu_version
-    
-    cysnc_hosts = []
-    for server in servers:
-        cysnc_hosts.append(('csync{}.gluu'.format(server.id), server.ip))
+    modify_hosts(tid, c, ctx['csync_hosts'], chroot=chroot,
+                 server_id=server.id)
 
-    server_counter = 0
+    run_cmd , cmd_chroot = get_run_cmd(server)
 
-    for server in servers:
-        
-        c = RemoteClient(server.hostname, ip=server.ip)
-        c.startup()
+    cmd = run_cmd.format('rm -f /etc/csync2*')
+    run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+    
 
-        modify_hosts(tid, c, cysnc_hosts, chroot=chroot, server_id=server.id)
+    cmd = run_cmd.format('rm -f /var/lib/csync2/*.db3')
+    run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
 
-        run_cmd , cmd_chroot = get_run_cmd(server)
 
-        cmd = run_cmd.format('rm -f /etc/csync2*')
-        run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+    if not c.exists(os.path.join(chroot, 'usr/sbin/csync2')):
+
+        if app_config.offline:
         
+            wlogger.log(
+                tid, 
+                'csync2 was not installed. Please install csync2 and retry.', 
+                'error',
+                server_id=server.id
+            )
+            return False
+        else:
 
-        cmd = run_cmd.format('rm -f /var/lib/csync2/*.db3')
-        run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+            if 'Ubuntu' in server.os:
+                
+                print("*"*50)
+                cmd_list = ['localedef -i en_US -f UTF-8 en_US.UTF-8',
+                            'locale-gen en_US.UTF-8',
+                            'apt-get -y update'.format('DEBIAN_FRONTEND=noninteractive apt-get'),
+                            'apt-get install -y apt-utils',
+                            'apt-get install -y csync2',
+                            ]
+                
+                for cmdi in cmd_list:
+                    cmd = run_cmd.format(cmdi)                    
+                    run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
 
+            elif 'CentOS' in server.os:
 
-        if not c.exists(os.path.join(chroot, 'usr/sbin/csync2')):
+                cmd = run_cmd.format('yum install -y epel-release')
+                run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
 
-            if app_config.offline:
-            
-                wlogger.log(
-                    tid, 
-                    'csync2 was not installed. Please install csync2 and retry.', 
-                    'error',
-                    server_id=server.id
-                )
-                return False
-            else:
+                cmd = run_cmd.format('yum repolist')
+                run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
 
-                if 'Ubuntu' in server.os:
-                    
-                    print("*"*50)
-                    cmd_list = ['localedef -i en_US -f UTF-8 en_US.UTF-8',
-                                'locale-gen en_US.UTF-8',
-                                'apt-get -y update'.format('DEBIAN_FRONTEND=noninteractive apt-get'),
-                                'apt-get install -y apt-utils',
-                                'apt-get install -y csync2',
-                                ]
-                    
-                    for cmdi in cmd_list:
-                        cmd = run_cmd.format(cmdi)                    
-                        run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+                if server.os == 'CentOS 7':
+                    csync_rpm = 'https://github.com/mbaser/gluu/raw/master/csync2-2.0-3.gluu.centos7.x86_64.rpm'
+                if server.os == 'CentOS 6':
+                    csync_rpm = 'https://github.com/mbaser/gluu/raw/master/csync2-2.0-3.gluu.centos6.x86_64.rpm'
 
-                elif 'CentOS' in server.os:
+                cmd = run_cmd.format('yum install -y ' + csync_rpm)
+                run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
 
-                    cmd = run_cmd.format('yum install -y epel-release')
-                    run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+                cmd = run_cmd.format('service xinetd stop')
+                run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
 
-                    cmd = run_cmd.format('yum repolist')
-                    run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+            if server.os == 'CentOS 6':
+                cmd = run_cmd.format('yum install -y crontabs')
+                run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+
+            if server.os == 'RHEL 7':
+                #enable centos7 repo
+                centos7_repo = ('[centos]\n'
+                                'name=CentOS-7\n'
+                                'baseurl=http://ftp.heanet.ie/pub/centos/7/os/x86_64/\n'
+                                'enabled=1\n'
+                                'gpgcheck=1\n'
+                                'gpgkey=http://ftp.heanet.ie/pub/centos/7/os/x86_64/RPM-GPG-KEY-CentOS-7\n'
+                                )
+                
+                wlogger.log(tid, "Enabling CentOS 7 repository", 'debug', server_id=server.id)
+                repo_fn = os.path.join(chroot, 'etc/yum.repos.d/centos.repo')
+                c.put_file(repo_fn, centos7_repo)
 
-                    if server.os == 'CentOS 7':
-                        csync_rpm = 'https://github.com/mbaser/gluu/raw/master/csync2-2.0-3.gluu.centos7.x86_64.rpm'
-                    if server.os == 'CentOS 6':
-                        csync_rpm = 'https://github.com/mbaser/gluu/raw/master/csync2-2.0-3.gluu.centos6.x86_64.rpm'
 
-                    cmd = run_cmd.format('yum install -y ' + csync_rpm)
+                cmd_list = ('yum repolist',
+                            'yum install -y sqlite-devel xinetd gnutls librsync',
+                            'yum install -y https://github.com/mbaser/gluu/raw/master/csync2-2.0-3.gluu.centos7.x86_64.rpm',
+                            )
+                
+                for cmdi in cmd_list:
+                    cmd = run_cmd.format(cmdi)
                     run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+                
+                
 
-                    cmd = run_cmd.format('service xinetd stop')
-                    run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+    if server.primary_server:
 
-                if server.os == 'CentOS 6':
-                    cmd = run_cmd.format('yum install -y crontabs')
-                    run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
+        key_command= [
+            'csync2 -k /etc/csync2.key',
+            'openssl genrsa -out /etc/csync2_ssl_key.pem 1024',
+            'openssl req -batch -new -key /etc/csync2_ssl_key.pem -out '
+            '/etc/csync2_ssl_cert.csr',
+            'openssl x509 -req -days 3600 -in /etc/csync2_ssl_cert.csr '
+            '-signkey /etc/csync2_ssl_key.pem -out /etc/csync2_ssl_cert.pem',
+            ]
 
-                if server.os == 'RHEL 7':
-                    #enable centos7 repo
-                    centos7_repo = ('[centos]\n'
-                                    'name=CentOS-7\n'
-                                    'baseurl=http://ftp.heanet.ie/pub/centos/7/os/x86_64/\n'
-                                    'enabled=1\n'
-                                    'gpgcheck=1\n'
-                                    'gpgkey=http://ftp.heanet.ie/pub/centos/7/os/x86_64/RPM-GPG-KEY-CentOS-7\n'
-                                    )
-                    
-                    wlogger.log(tid, "Enabling CentOS 7 repository", 'debug', server_id=server.id)
-                    repo_fn = os.path.join(chroot, 'etc/yum.repos.d/centos.repo')
-                    c.put_file(repo_fn, centos7_repo)
+        for cmdi in key_command:
+            cmd = run_cmd.format(cmdi)
+            wlogger.log(tid, cmd, 'debug', server_id=server.id)
+            run_command(tid, c, cmd, cmd_chroot, no_error=None,  server_id=server.id)
 
 
-                    cmd_list = ('yum repolist',
-                                'yum install -y sqlite-devel xinetd gnutls librsync',
-                                'yum install -y https://github.com/mbaser/gluu/raw/master/csync2-2.0-3.gluu.centos7.x86_64.rpm',
-                                )
-                    
-                    for cmdi in cmd_list:
-                        cmd = run_cmd.format(cmdi)
-                        run_command(tid, c, cmd, cmd_chroot, no_error=None, server_id=server.id)
-                    
-                    
+        csync2_config = get_csync2_config()
 
-        if server.primary_server:
+        remote_file = os.path.join(chroot, 'etc', 'csync2.cfg')
 
-            key_command= [
-                'csync2 -k /etc/csync2.key',
-                'openssl genrsa -out /etc/csync2_ssl_key.pem 1024',
-                'openssl req -batch -new -key /etc/csync2_ssl_key.pem -out '
-                '/etc/csync2_ssl_cert.csr',
-                'openssl x509 -req -days 3600 -in /etc/csync2_ssl_cert.csr '
-                '-signkey /etc/csync2_ssl_key.pem -out /etc/csync2_ssl_cert.pem',
-                ]
+        wlogger.log(tid, "Uploading csync2.cfg", 'debug', server_id=server.id)
+
+        c.put_file(remote_file,  csync2_config)
 
-            for cmdi in key_command:
-                cmd = run_cmd.format(cmdi)
-                wlogger.log(tid, cmd, 'debug', server_id=server.id)
-                run_command(tid, c, cmd, cmd_chroot, no_error=None,  server_id=server.id)
 
+    else:
+        wlogger.log(tid, "Downloading csync2.cfg, csync2.key, "
+                    "csync2_ssl_cert.csr, csync2_ssl_cert.pem, and"
+                    "csync2_ssl_key.pem from primary server and uploading",
+                    'debug', server_id=server.id)
 
-            csync2_config = get_csync2_config()
+        down_list = ['csync2.cfg', 'csync2.key', 'csync2_ssl_cert.csr',
+                'csync2_ssl_cert.pem', 'csync2_ssl_key.pem']
 
-            remote_file = os.path.join(chroot, 'etc', 'csync2.cfg')
+        primary_server = get_primary_server()
+        pc = RemoteClient(primary_server.hostname, ip=primary_server.ip)
+        pc.startup()
+        for f in down_list:
+            remote = os.path.join(chroot, 'etc', f)
+            # secondaries run concurrently, each gets its own copy
+            local = os.path.join('/tmp', 'csync{}_{}'.format(server.id, f))
+            pc.download(remote, local)
+            c.upload(local, remote)
 
-            wlogger.log(tid, "Uploading csync2.cfg", 'debug', server_id=server.id)
+        pc.close()
 
-            c.put_file(remote_file,  csync2_config)
+    csync2_path = '/usr/sbin/csync2'
 
 
-        else:
-            wlogger.log(tid, "Downloading csync2.cfg, csync2.key, "
-                        "csync2_ssl_cert.csr, csync2_ssl_cert.pem, and"
-                        "csync2_ssl_key.pem from primary server and uploading",
-                        'debug', server_id=server.id)
-
-            down_list = ['csync2.cfg', 'csync2.key', 'csync2_ssl_cert.csr',
-                    'csync2_ssl_cert.pem', 'csync2_ssl_key.pem']
-
-            primary_server = Server.query.filter_by(primary_server=True).first()
-            pc = RemoteClient(primary_server.hostname, ip=primary_server.ip)
-            pc.startup()
-            for f in down_list:
-                remote = os.path.join(chroot, 'etc', f)
-                local = os.path.join('/tmp',f)
-                pc.download(remote, local)
-                c.upload(local, remote)
+    if 'Ubuntu' in server.os:
 
-            pc.close()
+        wlogger.log(tid, "Enabling csync2 via inetd", server_id=server.id)
 
-        csync2_path = '/usr/sbin/csync2'
+        fc = []
+        inet_conf_file = os.path.join(chroot, 'etc','inetd.conf')
+        r,f=c.get_file(inet_conf_file)
+        csync_line = 'csync2\tstream\ttcp\tnowait\troot\t/usr/sbin/csync2\tcsync2 -i -l -N csync{}.gluu\n'.format(server.id) 
+        csync_line_exists = False
+        
+        for l in f:
+            
+            if l.startswith('csync2'):
+                l = csync_line
+                csync_line_exists = True
+            fc.append(l)
+        if not csync_line_exists:
+            fc.append(csync_line)
+        fc=''.join(fc)
+        c.put_file(inet_conf_file, fc)
 
 
-        if 'Ubuntu' in server.os:
+        restart_inetd(tid, c, server)
 
-            wlogger.log(tid, "Enabling csync2 via inetd", server_id=server.id)
 
-            fc = []
-            inet_conf_file = os.path.join(chroot, 'etc','inetd.conf')
-            r,f=c.get_file(inet_conf_file)
-            csync_line = 'csync2\tstream\ttcp\tnowait\troot\t/usr/sbin/csync2\tcsync2 -i -l -N csync{}.gluu\n'.format(server.id) 
-            csync_line_exists = False
-            
-            for l in f:
-                
-                if l.startswith('csync2'):
-                    l = csync_line
-                    csync_line_exists = True
-                fc.append(l)
-            if not csync_line_exists:
-                fc.append(csync_line)
-            fc=''.join(fc)
-            c.put_file(inet_conf_file, fc)
 
+    elif 'CentOS' in server.os or 'RHEL' in server.os:
+        inetd_conf = (
+            '# default: off\n'
+            '# description: csync2\n'
+            'service csync2\n'
+            '{\n'
+            'flags           = REUSE\n'
+            'socket_type     = stream\n'
+            'wait            = no\n'
+            'user            = root\n'
+            'group           = root\n'
+            'server          = /usr/sbin/csync2\n'
+            'server_args     = -i -l -N %(HOSTNAME)s\n'
+            'port            = 30865\n'
+            'type            = UNLISTED\n'
+            'disable         = no\n'
+            '}\n')
+
+        inet_conf_file = os.path.join(chroot, 'etc', 'xinetd.d', 'csync2')
+        inetd_conf = inetd_conf % ({'HOSTNAME': 'csync{}.gluu'.format(server.id)})
+        c.put_file(inet_conf_file, inetd_conf)
+
+    #run time sync in every minute
+    cron_file = os.path.join(chroot, 'etc', 'cron.d', 'csync2')
+    c.put_file(cron_file,
+        '{}-59/2 * * * *    root    {} -N csync{}.gluu -xvv 2>/var/log/csync2.log\n'.format(
+        ctx['cron_offsets'][host], csync2_path, server.id))
+
+    wlogger.log(tid, 'Crontab entry was created to sync files in every minute',
+                     'debug', server_id=server.id)
+
+
+    cmd = run_cmd.format('service crond restart')
+    if ('CentOS' in server.os) or ('RHEL' in server.os):
+        restart_inetd(tid, c, server)
+        run_command(tid, c, cmd, cmd_chroot, no_error='debug', server_id=server.id)
+    else:
+        cmd = run_cmd.format('service cron reload')
+        run_command(tid, c, cmd, cmd_chroot, no_error='debug', server_id=server.id)
+
+    c.close()
 
-            restart_inetd(tid, c, server)
+    return True
 
 
+@celery.task(bind=True, locked_hosts=cluster_hosts)
+def setup_filesystem_replication(self):
+    """Deploys File System replicaton
+    """
 
-        elif 'CentOS' in server.os or 'RHEL' in server.os:
-            inetd_conf = (
-                '# default: off\n'
-                '# description: csync2\n'
-                'service csync2\n'
-                '{\n'
-                'flags           = REUSE\n'
-                'socket_type     = stream\n'
-                'wait            = no\n'
-                'user            = root\n'
-                'group           = root\n'
-                'server          = /usr/sbin/csync2\n'
-                'server_args     = -i -l -N %(HOSTNAME)s\n'
-                'port            = 30865\n'
-                'type            = UNLISTED\n'
-                'disable         = no\n'
-                '}\n')
-
-            inet_conf_file = os.path.join(chroot, 'etc', 'xinetd.d', 'csync2')
-            inetd_conf = inetd_conf % ({'HOSTNAME': 'csync{}.gluu'.format(server.id)})
-            c.put_file(inet_conf_file, inetd_conf)
-
-        #run time sync in every minute
-        cron_file = os.path.join(chroot, 'etc', 'cron.d', 'csync2')
-        c.put_file(cron_file,
-            '{}-59/2 * * * *    root    {} -N csync{}.gluu -xvv 2>/var/log/csync2.log\n'.format(
-            server_counter, csync2_path, server.id))
-
-        server_counter += 1
-        
-        wlogger.log(tid, 'Crontab entry was created to sync files in every minute',
-                         'debug', server_id=server.id)
+    tid = self.request.id
 
+    servers = get_servers()
+    primary_server = get_primary_server()
+
+    ctx = {
+        'tid': tid,
+        'server_ids': dict((server.hostname, server.id) for server in servers),
+        'csync_hosts': [('csync{}.gluu'.format(server.id), server.ip)
+                        for server in servers],
+        # servers sync at different minutes
+        'cron_offsets': dict((server.hostname, i)
+                             for i, server in enumerate(servers)),
+    }
 
-        cmd = run_cmd.format('service crond restart')
-        if ('CentOS' in server.os) or ('RHEL' in server.os):
-            restart_inetd(tid, c, server)
-            run_command(tid, c, cmd, cmd_chroot, no_error='debug', server_id=server.id)
-        else:
-            cmd = run_cmd.format('service cron reload')
-            run_command(tid, c, cmd, cmd_chroot, no_error='debug', server_id=server.id)
+    others = [server.hostname for server in servers
+              if not server.primary_server]
 
-        c.close()
+    graph = StepGraph([
+        Step('setup_csync2_primary', setup_csync2,
+             hosts=[primary_server.hostname] if primary_server else []),
+        Step('setup_csync2', setup_csync2, hosts=others,
+             requires_all=['setup_csync2_primary']),
+    ])
+    run = graph.run('setup_filesystem_replication', ctx, tid=tid,
+                    inputs=ctx['csync_hosts'])
 
-    return True
+    return run.status == 'success'
 
 def remove_filesystem_replication_do(server, app_config, tid):
 
@@ -610,12 +660,12 @@ def remove_filesystem_replication_do(server, app_config, tid):
         return True
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def remove_filesystem_replication(self):
     tid = self.request.id
     
-    app_config = AppConfiguration.query.first()
-    servers = Server.query.all()
+    app_config = get_app_config()
+    servers = get_servers()
     
     for server in servers:
         r = remove_filesystem_replication_do(server, app_config, tid)
@@ -625,32 +675,15 @@ def remove_filesystem_replication(self):
 
 
 def get_os_type(c):
-    
-    # 2. Linux Distribution of the server
-    cin, cout, cerr = c.run("ls /etc/*release")
-    files = cout.split()
-    
-    if files[0] == '/etc/alpine-release':
-        return 'Alpine'
-
-    cin, cout, cerr = c.run("cat "+files[0])
-
-    if "Ubuntu" in cout and "14.04" in cout:
-        return "Ubuntu 14"
-    if "Ubuntu" in cout and "16.04" in cout:
-        return "Ubuntu 16"
-    if "Ubuntu" in cout and "18.04" in cout:
-        return "Ubuntu 18"
-    if "CentOS" in cout and "release 6." in cout:
-        return "CentOS 6"
-    if "CentOS" in cout and "release 7." in cout:
-        return "CentOS 7"
-    if 'Red Hat Enterprise Linux' in cout and '7.':
-        return 'RHEL 7'
-    if 'Debian' in cout and "(jessie)" in cout:
-        return 'Debian 8'
-    if 'Debian' in cout and "(stretch)" in cout:
-        return 'Debian 9'
+    """Returns the Linux distribution of the server, from the host facts
+    if they are known
+
+    Args:
+        c (:object:`clustermgr.core.remote.RemoteClient`): client to be used
+            for the SSH communication, FakeRemote for the local machine
+    """
+    hostname = getattr(c, 'host', 'localhost')
+    return host_facts.get(hostname, ['os_type'], client=c)['os_type']
 
 def check_gluu_installation(c):
     """Checks if gluu server is installed
@@ -659,30 +692,30 @@ def check_gluu_installation(c):
         c (:object:`clustermgr.core.remote.RemoteClient`): client to be used
             for the SSH communication
     """
-    appconf = AppConfiguration.query.first()
-    check_file = ('/opt/gluu-server-{}/install/community-edition-setup/'
-                  'setup.properties.last').format(
-                                                appconf.gluu_version
-                                            )
-    result = c.exists(check_file)
+    appconf = get_app_config()
+    installed = host_facts.get(c.host, ['gluu_installed'],
+                               client=c)['gluu_installed']
 
-    return result
+    return appconf.gluu_version in (installed or [])
 
 
 @celery.task
 def collect_server_details(server_id):
     print "Start collecting server details task"
     server = Server.query.get(server_id)
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
     c = RemoteClient(server.hostname, ip=server.ip)
     #try:
     c.startup()
     #except:
     #    return
 
+    # the server may have changed since its facts were gathered
+    facts = host_facts.get(server.hostname, client=c, refresh=True)
+
     # 0. Make sure it is a Gluu Server
     chdir = "/opt/gluu-server-" + appconf.gluu_version
-    if not c.exists(chdir):
+    if appconf.gluu_version not in (facts['gluu_versions'] or []):
         server.gluu_server = False
         chdir = '/'
 
@@ -707,6 +740,37 @@ def collect_server_details(server_id):
     db.session.commit()
 
 
+@celery.task(bind=True)
+def refresh_host_facts(self, server_ids=None):
+    """Gathers the facts of the servers again, all of them at once, see
+    :mod:`clustermgr.core.host_facts`
+
+    Args:
+        server_ids (list): ids of the servers, all the servers by default
+    """
+    tid = self.request.id
+    servers = [s for s in get_servers()
+               if server_ids is None or s.id in server_ids]
+
+    wlogger.log(tid, "Gathering the facts of {} servers".format(len(servers)))
+    facts = host_facts.gather_all(servers, refresh=True)
+
+    for server in servers:
+        os_type = facts[server.hostname]['os_type']
+        if os_type:
+            server.os = os_type
+            wlogger.log(tid, "{}: {}, Gluu Server {}".format(
+                server.hostname, os_type,
+                ', '.join(facts[server.hostname]['gluu_versions'] or [])
+                or 'not installed'), 'success', server_id=server.id)
+        else:
+            wlogger.log(tid, "Can't gather the facts of {}".format(
+                server.hostname), 'warning', server_id=server.id)
+    db.session.commit()
+
+    return True
+
+
 def import_key(suffix, hostname, gluu_version, tid, c, sos):
     """Imports key for identity server
 
@@ -894,7 +958,7 @@ def upload_custom_schema(tid, c, ldap_type, gluu_server):
                                                             
 def makeOpenDjListenIpAddr(tid, c, cmd_chroot, run_cmd, server, ip_addr='0.0.0.0'):
 
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
 
     wlogger.log(tid, "Making openDJ listens all interfaces for port 4444 and 1636")
 
@@ -1005,117 +1069,278 @@ def checkOfflineRequirements(tid, server, c, appconf):
     
     return True
 
-@celery.task(bind=True)
-def installGluuServer(self, server_id):
-    """Install Gluu server
+PRIMARY_SETUP_PROPERTIES = ['passport_rp_client_jks_pass', 'application_max_ram', 'encoded_ldap_pw', 'ldapPass', 'state', 'defaultTrustStorePW', 'passport_rs_client_jks_pass_encoded', 'passportSpJksPass', 'pairwiseCalculationSalt', 'installAsimba', 'installLdap', 'oxauth_client_id', 'oxTrust_log_rotation_configuration', 'scim_rs_client_jks_pass_encoded', 'encoded_openldapJksPass', 'inumApplianceFN', 'inumAppliance', 'oxauthClient_pw', 'opendj_p12_pass', 'passportSpKeyPass', 'scim_rs_client_jks_pass', 'inumOrgFN', 'scim_rs_client_id', 'default_key_algs', 'installOxTrust', 'ldap_port', 'encoded_shib_jks_pw', 'orgName', 'openldapKeyPass', 'city', 'oxVersion', 'baseInum', 'asimbaJksPass', 'oxTrustConfigGeneration', 'passport_rp_client_id', 'pairwiseCalculationKey', 'scim_rp_client_jks_pass', 'encoded_opendj_p12_pass', 'httpdKeyPass', 'installOxAuth', 'admin_email', 'passport_rs_client_jks_pass', 'oxauth_openid_jks_pass', 'countryCode', 'installSaml', 'installJce', 'encoded_ldapTrustStorePass', 'encode_salt', 'inumOrg', 'openldapJksPass', 'encoded_ox_ldap_pw', 'installHttpd', 'passport_rs_client_id', 'scim_rp_client_id', 'ldap_hostname', 'oxauthClient_encoded_pw', 'shibJksPass', 'installPassport', 'installOxAuthRP']
+
+
+def fetch_primary_artifacts(tid, pserver, appconf, server_id=''):
+    """Collects what the installation of other servers needs from the
+    installed primary server: setup.properties.last, stripped down to the
+    properties shared by the cluster, and an archive of the certificates.
 
     Args:
-        server_id: id of server to be installed
+        tid (string): task id of the task to store the log
+        pserver (:object:`clustermgr.models.Server`): the primary server
+        appconf (:object:`clustermgr.models.AppConfiguration`): configuration
+        server_id (int): id of the server the messages are logged for
+
+    Returns:
+        dict with the keys setup_properties (text of the properties),
+        ldap_password and certs (local path of the certificates archive,
+        None for Gluu versions up to 3.0.2); None on failure
     """
+    gluu_server = 'gluu-server-' + appconf.gluu_version
 
-    tid = self.request.id
-    server = Server.query.get(server_id)
+    pc = RemoteClient(pserver.hostname, ip=pserver.ip)
+    try:
+        pc.startup()
+    except:
+        wlogger.log(tid, "Can't make SSH connection to "
+                         "primary server: {}".format(
+                         pserver.hostname), 'error', server_id=server_id)
+        return None
 
+    try:
+        if check_gluu_installation(pc):
+            wlogger.log(tid, "Primary Server is Installed", 'success',
+                        server_id=server_id)
+        else:
+            wlogger.log(tid, "Primary Server is not Installed. "
+                             "Please first install Primary Server", 'fail',
+                             server_id=server_id)
+            return None
 
-    if not server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18','Ubuntu 16', 'Debian 9'):
-        wlogger.log(tid, "Unsopported OS type", "error")
-        return False
-    
+        remote_file = '/opt/{}/install/community-edition-setup/setup.properties.last'.format(gluu_server)
+        wlogger.log(tid, 'Downloading setup.properties.last from primary server',
+                    'debug', server_id=server_id)
 
-    pserver = Server.query.filter_by(primary_server=True).first()
+        r = pc.get_file(remote_file)
+        if not r[0]:
+            wlogger.log(tid, "Can't download setup.properties.last from "
+                             "primary server", 'fail', server_id=server_id)
+            return None
 
-    appconf = AppConfiguration.query.first()
+        prop = Properties()
+        prop.load(r[1])
+        for p in prop.keys()[:]:
+            if not p in PRIMARY_SETUP_PROPERTIES:
+                del prop[p]
 
-    c = RemoteClient(server.hostname, ip=server.ip)
+        prop['ldap_type'] = 'opendj'
+        prop['hostname'] = str(appconf.nginx_host)
 
-    try:
-        c.startup()
-    except:
-        wlogger.log(tid, "Can't establish SSH connection",'fail')
-        wlogger.log(tid, "Ending server installation process.", "error")
-        return
+        setup_properties_io = StringIO.StringIO()
+        prop.store(setup_properties_io)
 
+        artifacts = {
+            'setup_properties': setup_properties_io.getvalue(),
+            'ldap_password': prop['ldapPass'],
+            'certs': None,
+        }
 
-    run_cmd, cmd_chroot = get_run_cmd(server)
+        #If gluu version is greater than 3.0.2 certificates of primary server
+        #are uploaded to the other servers
+        if appconf.gluu_version > '3.0.2':
+            wlogger.log(tid, "Downloading certificates from primary server",
+                        server_id=server_id)
+            certs_remote_tmp = "/tmp/certs_"+str(uuid.uuid4())[:4].upper()+".tgz"
+            certs_local_tmp = "/tmp/certs_"+str(uuid.uuid4())[:4].upper()+".tgz"
 
+            cmd = ('tar -zcf {0} /opt/gluu-server-{1}/etc/certs/ '
+                    '/opt/gluu-server-{1}/install/community-edition-setup'
+                    '/output/scim-rp.jks '
+                    '/opt/gluu-server-{1}'
+                    '/etc/gluu/conf/passport-config.json'
+                    ).format(certs_remote_tmp, appconf.gluu_version)
+            wlogger.log(tid, cmd, 'debug', server_id=server_id)
+            cin, cout, cerr = pc.run(cmd)
+            wlogger.log(tid, cout+cerr, 'debug', server_id=server_id)
 
-    if appconf.offline:
-        if not checkOfflineRequirements(tid, server, c, appconf):
-            return False
+            r = pc.download(certs_remote_tmp, certs_local_tmp)
+            if 'Download successful' in r:
+                wlogger.log(tid, r, 'success', server_id=server_id)
+            else:
+                wlogger.log(tid, r, 'error', server_id=server_id)
+                return None
 
+            artifacts['certs'] = certs_local_tmp
 
-    #setup properties file path
-    setup_properties_file = os.path.join(Config.DATA_DIR, 'setup.properties')
+        return artifacts
+    finally:
+        pc.close()
 
-    setup_prop = get_setup_properties()
 
-    gluu_server = 'gluu-server-' + appconf.gluu_version
+@celery.task(bind=True, locked_hosts=server_hosts)
+def installGluuServer(self, server_id):
+    """Install Gluu server
 
-    
+    Args:
+        server_id: id of server to be installed
+    """
+    tid = self.request.id
+    server = Server.query.get(server_id)
+    ctx = {
+        'tid': tid,
+        'server_ids': {server.hostname: server.id},
+        'artifacts': None,
+    }
 
-    #If os type of this server was not idientified, return to home
-    if not server.os:
-        wlogger.log(tid, "OS type has not been identified.", 'fail')
-        wlogger.log(tid, "Ending server installation process.", "error")
-        return
+    # a failed installation is resumed after its last completed step
+    graph = StepGraph(gluu_install_steps([server.hostname]))
+    run = graph.run('install_gluu_server:{}'.format(server_id), ctx, tid=tid,
+                    inputs=install_inputs([server]))
 
+    if run.status != 'success':
+        wlogger.log(tid, "Ending server installation process.", "error",
+                    server_id=server_id)
+        return False
+    return True
 
-    #If this is not primary server, we will download setup.properties file from
-    #primary server
-    if not server.primary_server:
-        wlogger.log(tid, "Check if Primary Server is Installed")
 
-        if not server.os == pserver.os:
-            wlogger.log(tid, "OS type is not the same as primary server.", 'fail')
-            wlogger.log(tid, "Ending server installation process.", "error")
+def install_step(function):
+    """Wraps a step of the Gluu Server installation. The function is called
+    as function(ctx, server, appconf, c, log, run) with a connected client
+    `c` of the server, `log` and `run` log the messages for the server.
+    """
+    @wraps(function)
+    def action(ctx, host):
+        server = Server.query.get(ctx['server_ids'][host])
+        log = partial(wlogger.log, ctx['tid'], server_id=server.id)
+        run = partial(run_command, ctx['tid'], server_id=server.id)
+
+        c = RemoteClient(server.hostname, ip=server.ip)
+        try:
+            c.startup()
+        except:
+            log("Can't establish SSH connection",'fail')
             return False
+        try:
+            return function(ctx, server, get_app_config(), c, log, run)
+        finally:
+            c.close()
+    return action
+
+
+def install_inputs(servers):
+    """Returns the inputs of the installation of the servers, see
+    StepGraph.run()"""
+    appconf = get_app_config()
+    return {
+        'servers': dict((s.hostname, [s.id, s.ip, s.os]) for s in servers),
+        'gluu_version': appconf.gluu_version,
+        'offline': appconf.offline,
+    }
+
+
+def primary_artifacts(ctx, server_id):
+    """Returns the artifacts of the primary server, see
+    fetch_primary_artifacts(). A cluster installation fetches them once for
+    all the servers, a single installation when they are first needed.
+    """
+    if not ctx.get('artifacts'):
+        ctx['artifacts'] = fetch_primary_artifacts(
+                ctx['tid'], get_primary_server(), get_app_config(), server_id)
+    return ctx['artifacts']
+
+
+def container_commands(server):
+    """Returns the start, stop and enable commands of the Gluu Server
+    container of the server, formatted with the Gluu version"""
+    if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
+        return ('/sbin/gluu-serverd-{0} start', '/sbin/gluu-serverd-{0} stop',
+                '/sbin/gluu-serverd-{0} enable')
+    return ('service gluu-server-{0} start', 'service gluu-server-{0} stop',
+            None)
+
+
+def package_manager(server):
+    """Returns the package manager command of the server"""
+    if ('Ubuntu' in server.os) or ('Debian' in server.os):
+        return 'DEBIAN_FRONTEND=noninteractive apt-get '
+    return 'yum '
+
+
+def stream_command(c, cmd, log, log_id_prefix, progress_res):
+    """Runs the command in a pseudo terminal and logs its output while it
+    runs. Progress bars, the lines matching one of progress_res, are shown
+    in one updated message.
+    """
+    log(cmd, "debug")
+    c.log_me("running command: {}".format(cmd))
 
-        pc = RemoteClient(pserver.hostname, ip=pserver.ip)
+    channel = c.client.get_transport().open_session()
+    channel.get_pty()
+    channel.exec_command(cmd)
 
+    last_debug = False
+    log_id = 0
+    while True:
+        if channel.exit_status_ready():
+            break
+        rl = ''
         try:
-            pc.startup()
+            rl, wl, xl = select.select([channel], [], [], 0.0)
         except:
-            wlogger.log(tid, "Can't make SSH connection to "
-                             "primary server: ".format(
-                             pserver.hostname), 'error')
-            wlogger.log(tid, "Ending server installation process.", "error")
-            return
+            pass
+        if len(rl) > 0:
+            coutt = channel.recv(1024)
+            if coutt:
+                for cout in coutt.split('\n'):
+                    if cout.strip():
+                        if [r for r in progress_res if r.search(cout)]:
+                            if not last_debug:
+                                cout = cout.strip()
+                                log("...", "debug", log_id="{}-{}".format(
+                                    log_id_prefix, log_id), new_log_id=True)
+                                last_debug = True
 
+                            log(cout, "debugc", log_id="{}-{}".format(
+                                                    log_id_prefix, log_id))
 
-        if check_gluu_installation(pc):
-            wlogger.log(tid, "Primary Server is Installed",'success')
-        else:
-            wlogger.log(tid, "Primary Server is not Installed. "
-                             "Please first install Primary Server",'fail')
-            wlogger.log(tid, "Ending server installation process.", "error")
-            return
+                        else:
+                            log_id += 1
+                            last_debug = False
+                            log(cout, "debug")
 
 
-    wlogger.log(tid, "Preparing for Installation")
+@install_step
+def check_install_requirements(ctx, server, appconf, c, log, run):
+    if not server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18','Ubuntu 16', 'Debian 9'):
+        log("Unsopported OS type", "error")
+        return False
 
-    start_command  = 'service gluu-server-{0} start'
-    stop_command   = 'service gluu-server-{0} stop'
-    enable_command = None
+    if appconf.offline:
+        if not checkOfflineRequirements(ctx['tid'], server, c, appconf):
+            return False
+
+    #If this is not primary server, it must run the OS of the primary server
+    if not server.primary_server:
+        if not server.os == get_primary_server().os:
+            log("OS type is not the same as primary server.", 'fail')
+            return False
+
+
+@install_step
+def gluu_repository_added(ctx, server, appconf, c, log, run):
+    if appconf.offline or not c.exists('/usr/bin/python'):
+        return False
+    if ('Ubuntu' in server.os) or ('Debian' in server.os):
+        return c.exists('/etc/apt/sources.list.d/gluu-repo.list')
+    return c.exists('/etc/yum.repos.d/Gluu.repo')
 
-    if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
-        enable_command  = '/sbin/gluu-serverd-{0} enable'
-        stop_command    = '/sbin/gluu-serverd-{0} stop'
-        start_command   = '/sbin/gluu-serverd-{0} start'
+
+@install_step
+def add_gluu_repository(ctx, server, appconf, c, log, run):
+    log("Preparing for Installation")
 
     if appconf.offline:
         gluu_archive_fn = os.path.split(appconf.gluu_archive)[1]
-        wlogger.log(tid, "Uploading {}".format(gluu_archive_fn))
+        log("Uploading {}".format(gluu_archive_fn))
         
         cmd = 'scp {} root@{}:/root'.format(appconf.gluu_archive, server.hostname)
         
-        wlogger.log(tid, cmd,'debug')
+        log(cmd,'debug')
         
         os.system(cmd)
-
-        if ('Ubuntu' in server.os) or ('Debian' in server.os):
-            install_command = 'dpkg -i /root/{}'.format(gluu_archive_fn)
-        else:
-            install_command = 'rpm -i /root/{}'.format(gluu_archive_fn)
     else:
 
 
@@ -1140,9 +1365,9 @@ def installGluuServer(self, server_id):
 
             if not curlexist:
                 cmd = 'DEBIAN_FRONTEND=noninteractive apt-get update'
-                run_command(tid, c, cmd, no_error='debug')
+                run(c, cmd, no_error='debug')
                 cmd = "DEBIAN_FRONTEND=noninteractive apt-get install -y curl"
-                run_command(tid, c, cmd, no_error='debug')
+                run(c, cmd, no_error='debug')
 
 
             if 'Ubuntu' in server.os:
@@ -1150,7 +1375,7 @@ def installGluuServer(self, server_id):
             elif 'Debian' in server.os:
                 cmd = 'curl https://repo.gluu.org/debian/gluu-apt.key | apt-key add -'
 
-            run_command(tid, c, cmd, no_error='debug')
+            run(c, cmd, no_error='debug')
 
             if 'Ubuntu' in server.os:
                 cmd = ('echo "deb https://repo.gluu.org/ubuntu/ {0} main" '
@@ -1164,20 +1389,18 @@ def installGluuServer(self, server_id):
                 cmd = ('echo "deb https://repo.gluu.org/debian/ stable main" '
                    '> /etc/apt/sources.list.d/gluu-repo.list')
 
-            run_command(tid, c, cmd)
-
-            install_command = 'DEBIAN_FRONTEND=noninteractive apt-get '
+            run(c, cmd)
 
             cmd = 'DEBIAN_FRONTEND=noninteractive apt-get update'
-            wlogger.log(tid, cmd, 'debug')
+            log(cmd, 'debug')
             cin, cout, cerr = c.run(cmd)
-            wlogger.log(tid, cout+'\n'+cerr, 'debug')
+            log(cout+'\n'+cerr, 'debug')
 
             if 'dpkg --configure -a' in cerr:
                 cmd = 'dpkg --configure -a'
-                wlogger.log(tid, cmd, 'debug')
+                log(cmd, 'debug')
                 cin, cout, cerr = c.run(cmd)
-                wlogger.log(tid, cout+'\n'+cerr, 'debug')
+                log(cout+'\n'+cerr, 'debug')
 
 
         elif 'CentOS' in server.os or 'RHEL' in server.os:
@@ -1186,13 +1409,11 @@ def installGluuServer(self, server_id):
 
             if not curlexist:
                 cmd = "yum install -y curl"
-                run_command(tid, c, cmd, no_error='debug')
-
-            qury_package = 'yum list installed | grep gluu-server-'
+                run(c, cmd, no_error='debug')
 
             if not c.exists('/usr/bin/wget'):
                 cmd = install_command +'install -y wget'
-                run_command(tid, c, cmd, no_error='debug')
+                run(c, cmd, no_error='debug')
 
             if server.os == 'CentOS 6':
                 cmd = 'wget https://repo.gluu.org/centos/Gluu-centos6.repo -O /etc/yum.repos.d/Gluu.repo'
@@ -1203,16 +1424,16 @@ def installGluuServer(self, server_id):
             elif server.os == 'RHEL 7':
                 cmd = 'wget https://repo.gluu.org/rhel/Gluu-rhel7.repo -O /etc/yum.repos.d/Gluu.repo'
 
-            run_command(tid, c, cmd, no_error='debug')
+            run(c, cmd, no_error='debug')
 
             cmd = 'wget https://repo.gluu.org/centos/RPM-GPG-KEY-GLUU -O /etc/pki/rpm-gpg/RPM-GPG-KEY-GLUU'
-            run_command(tid, c, cmd, no_error='debug')
+            run(c, cmd, no_error='debug')
 
             cmd = 'rpm --import /etc/pki/rpm-gpg/RPM-GPG-KEY-GLUU'
-            run_command(tid, c, cmd, no_error='debug')
+            run(c, cmd, no_error='debug')
 
             cmd = 'yum clean all'
-            run_command(tid, c, cmd, no_error='debug')
+            run(c, cmd, no_error='debug')
 
 
     if not c.exists('/usr/bin/python'):
@@ -1222,186 +1443,150 @@ def installGluuServer(self, server_id):
             cmd = 'DEBIAN_FRONTEND=noninteractive apt-get install -y python'
         else:
             cmd = 'yum install -y python'
-        run_command(tid, c, cmd, no_error='debug')
+        run(c, cmd, no_error='debug')
 
 
+def installed_gluu_containers(c):
+    """Returns the names of the /opt/gluu-server-<version> containers"""
+    r = c.listdir("/opt")
+    if not r[0]:
+        return []
+    return [s for s in r[1] if re.search(
+            'gluu-server-(?P<gluu_version>(\d+).(\d+).(\d+)(.\d+)?)$', s)]
 
-    wlogger.log(tid, "Check if Gluu Server was installed")
 
-    gluu_installed = False
+@install_step
+def no_gluu_server_installed(ctx, server, appconf, c, log, run):
+    return not installed_gluu_containers(c)
 
-    #Determine if a version of gluu server was installed.
-    r = c.listdir("/opt")
-    if r[0]:
-        for s in r[1]:
-            m=re.search('gluu-server-(?P<gluu_version>(\d+).(\d+).(\d+)(.\d+)?)$',s)
-            if m:
-                gluu_version = m.group("gluu_version")
-                gluu_installed = True
-                cmd = stop_command.format(gluu_version)
-                rs = run_command(tid, c, cmd, no_error='debug')
 
-                #If gluu server is installed, first stop it then remove
-                if "Can't stop gluu server" in rs:
-                    cmd = 'rm -f /var/run/{0}.pid'.format(gluu_server)
-                    run_command(tid, c, cmd, no_error='debug')
+@install_step
+def remove_gluu_server(ctx, server, appconf, c, log, run):
+    log("Check if Gluu Server was installed")
 
-                    cmd = "df -aP | grep %s | awk '{print $6}' | xargs -I {} umount -l {}" % (gluu_server)
-                    run_command(tid, c, cmd, no_error='debug')
+    gluu_server = 'gluu-server-' + appconf.gluu_version
+    stop_command = container_commands(server)[1]
 
-                    cmd = stop_command.format(gluu_version)
-                    rs = run_command(tid, c, cmd, no_error='debug')
+    #If gluu server is installed, first stop it then remove
+    for s in installed_gluu_containers(c):
+        gluu_version = s[len('gluu-server-'):]
+        cmd = stop_command.format(gluu_version)
+        rs = run(c, cmd, no_error='debug')
 
+        if "Can't stop gluu server" in rs:
+            cmd = 'rm -f /var/run/{0}.pid'.format(gluu_server)
+            run(c, cmd, no_error='debug')
+
+            cmd = "df -aP | grep %s | awk '{print $6}' | xargs -I {} umount -l {}" % (gluu_server)
+            run(c, cmd, no_error='debug')
+
+            cmd = stop_command.format(gluu_version)
+            rs = run(c, cmd, no_error='debug')
 
-                if appconf.offline:
-                    if ('Ubuntu' in server.os) or ('Debian' in server.os):
-                        cmd = 'apt-get remove -y ' + s
-                    else:
-                        cmd = 'rpm -e ' + s
-                else:
-                    cmd = install_command + "remove -y "+s
-                        
-                run_command(tid, c,cmd)
 
+        if appconf.offline:
+            if ('Ubuntu' in server.os) or ('Debian' in server.os):
+                cmd = 'apt-get remove -y ' + s
+            else:
+                cmd = 'rpm -e ' + s
+        else:
+            cmd = package_manager(server) + "remove -y "+s
+                
+        run(c,cmd)
 
-    if not gluu_installed:
-        wlogger.log(tid, "Gluu Server was not previously installed", "debug")
 
+@install_step
+def gluu_package_installed(ctx, server, appconf, c, log, run):
+    return c.exists('/opt/gluu-server-' + appconf.gluu_version)
 
-    #start installing gluu server
-    wlogger.log(tid, "Installing Gluu Server: " + gluu_server)
 
+@install_step
+def install_gluu_package(ctx, server, appconf, c, log, run):
+    gluu_server = 'gluu-server-' + appconf.gluu_version
+
+    #start installing gluu server
+    log("Installing Gluu Server: " + gluu_server)
 
     if appconf.offline:
-        cmd = install_command 
+        gluu_archive_fn = os.path.split(appconf.gluu_archive)[1]
+        if ('Ubuntu' in server.os) or ('Debian' in server.os):
+            cmd = 'dpkg -i /root/{}'.format(gluu_archive_fn)
+        else:
+            cmd = 'rpm -i /root/{}'.format(gluu_archive_fn)
     else:
-        cmd = install_command + 'install -y ' + gluu_server
-    wlogger.log(tid, cmd, "debug")
-    
-    
-    c.log_me("running command: {}".format(cmd))
-    
-    channel = c.client.get_transport().open_session()
-    channel.get_pty()
-    channel.exec_command(cmd)
-    
-    ubuntu_re = re.compile('\[(\s|\w|%|/|-|\.)*\]')
-    ubuntu_re_2 = re.compile('\(Reading database ... \d*')
-    centos_re = re.compile(' \[(=|-|#|\s)*\] ')
-    
-    last_debug = False
-    log_id = 0
-    while True:
-        if channel.exit_status_ready():
-            break
-        rl = ''
-        try:
-            rl, wl, xl = select.select([channel], [], [], 0.0)
-        except:
-            pass
-        if len(rl) > 0:
-            coutt = channel.recv(1024)
-            if coutt:
-                for cout in coutt.split('\n'):
-                    if cout.strip():
-                        if centos_re.search(cout) or ubuntu_re.search(cout) or ubuntu_re_2.search(cout):
-                            if not last_debug:
-                                cout = cout.strip()
-                                wlogger.log(tid, "...", "debug", log_id="logc-{}".format(log_id), new_log_id=True)
-                                last_debug = True
+        cmd = package_manager(server) + 'install -y ' + gluu_server
 
-                            wlogger.log(tid, cout, "debugc", log_id="logc-{}".format(log_id))
+    stream_command(c, cmd, log, 'logc-{}-package'.format(server.id), [
+                        re.compile('\[(\s|\w|%|/|-|\.)*\]'),
+                        re.compile('\(Reading database ... \d*'),
+                        re.compile(' \[(=|-|#|\s)*\] '),
+                        ])
+
+    if not c.exists('/opt/' + gluu_server):
+        log("Gluu Server package was not installed", "error")
+        return False
 
-                        else:
-                            log_id += 1
-                            last_debug = False
-                            wlogger.log(tid, cout, "debug")
 
+@install_step
+def start_gluu_server(ctx, server, appconf, c, log, run):
+    start_command, stop_command, enable_command = container_commands(server)
 
     if enable_command:
-        run_command(tid, c, enable_command.format(appconf.gluu_version), no_error='debug')
+        run(c, enable_command.format(appconf.gluu_version), no_error='debug')
 
-    run_command(tid, c, start_command.format(appconf.gluu_version))
+    run(c, start_command.format(appconf.gluu_version))
 
 
     #Since we will make ssh inot centos container, we need to wait ssh server to
     #be started properly
     if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
-        wlogger.log(tid, "Sleeping 10 secs to wait for gluu server start properly.")
+        log("Sleeping 10 secs to wait for gluu server start properly.")
         time.sleep(10)
 
 
+@install_step
+def upload_setup_files(ctx, server, appconf, c, log, run):
+    gluu_server = 'gluu-server-' + appconf.gluu_version
+    setup_prop = get_setup_properties()
+
     if setup_prop.get('opendj_type') == 'wrends':
         cmd = 'wget https://ox.gluu.org/maven/org/forgerock/opendj/opendj-server-legacy/4.0.0-M3/opendj-server-legacy-4.0.0-M3.zip -P /opt/{}/opt/dist/app'.format(gluu_server)
-        run_command(tid, c, cmd, no_error='debug')
+        run(c, cmd, no_error='debug')
 
     # If this server is primary, upload local setup.properties to server
     if server.primary_server:
-        wlogger.log(tid, "Uploading setup.properties")
+        log("Uploading setup.properties")
+        setup_properties_file = os.path.join(app.config['DATA_DIR'],
+                                             'setup.properties')
         r = c.upload(setup_properties_file, '/opt/{}/install/community-edition-setup/setup.properties'.format(gluu_server))
-    # If this server is not primary, get setup.properties.last from primary
-    # server and upload to this server
+    # If this server is not primary, upload setup.properties.last of primary
+    # server with the ip of this server
     else:
-        #this is not primary server, so download setup.properties.last
-        #from primary server and upload to this server
-        pc = RemoteClient(pserver.hostname, ip=pserver.ip)
-        try:
-            pc.startup()
-        except:
-            wlogger.log(tid, "Can't establish SSH connection to primary server: ".format(pserver.hostname), 'error')
-            wlogger.log(tid, "Ending server installation process.", "error")
-            return
-
-
-        # ldap_paswwrod of this server should be the same with primary server
-        ldap_passwd = None
-
-
-        remote_file = '/opt/{}/install/community-edition-setup/setup.properties.last'.format(gluu_server)
-        wlogger.log(tid, 'Downloading setup.properties.last from primary server', 'debug')
+        artifacts = primary_artifacts(ctx, server.id)
+        if not artifacts:
+            return False
 
-        prop_list = ['passport_rp_client_jks_pass', 'application_max_ram', 'encoded_ldap_pw', 'ldapPass', 'state', 'defaultTrustStorePW', 'passport_rs_client_jks_pass_encoded', 'passportSpJksPass', 'pairwiseCalculationSalt', 'installAsimba', 'installLdap', 'oxauth_client_id', 'oxTrust_log_rotation_configuration', 'scim_rs_client_jks_pass_encoded', 'encoded_openldapJksPass', 'inumApplianceFN', 'inumAppliance', 'oxauthClient_pw', 'opendj_p12_pass', 'passportSpKeyPass', 'scim_rs_client_jks_pass', 'inumOrgFN', 'scim_rs_client_id', 'default_key_algs', 'installOxTrust', 'ldap_port', 'encoded_shib_jks_pw', 'orgName', 'openldapKeyPass', 'city', 'oxVersion', 'baseInum', 'asimbaJksPass', 'oxTrustConfigGeneration', 'passport_rp_client_id', 'pairwiseCalculationKey', 'scim_rp_client_jks_pass', 'encoded_opendj_p12_pass', 'httpdKeyPass', 'installOxAuth', 'admin_email', 'passport_rs_client_jks_pass', 'oxauth_openid_jks_pass', 'countryCode', 'installSaml', 'installJce', 'encoded_ldapTrustStorePass', 'encode_salt', 'inumOrg', 'openldapJksPass', 'encoded_ox_ldap_pw', 'installHttpd', 'passport_rs_client_id', 'scim_rp_client_id', 'ldap_hostname', 'oxauthClient_encoded_pw', 'shibJksPass', 'installPassport', 'installOxAuthRP']
         prop = Properties()
-        
-       #get setup.properties.last from primary server.
-        r=pc.get_file(remote_file)
-        if r[0]:
-            prop.load(r[1])
-
-            prop_keys = prop.keys()
-
-            for p in prop_keys[:]:
-                if not p in prop_list:
-                    del prop[p]
-
-            prop['ip'] = str(server.ip)
-            prop['ldap_type'] = 'opendj'
-            prop['hostname'] = str(appconf.nginx_host)
-            ldap_passwd = prop['ldapPass']
-
-            new_setup_properties_io = StringIO.StringIO()
-            prop.store(new_setup_properties_io)
-            new_setup_properties_io.seek(0)
-            new_setup_properties = new_setup_properties_io.read()
-
-            #put setup.properties to server
-            remote_file_new = '/opt/{}/install/community-edition-setup/setup.properties'.format(gluu_server)
-            wlogger.log(tid, 'Uploading setup.properties', 'debug')
-            c.put_file(remote_file_new, new_setup_properties)
+        prop.load(StringIO.StringIO(artifacts['setup_properties']))
+        prop['ip'] = str(server.ip)
 
-            if ldap_passwd:
-                server.ldap_password = ldap_passwd
-        else:
-            wlogger.log(tid, "Can't download setup.properties.last from primary server", 'fail')
-            wlogger.log(tid, "Ending server installation process.", "error")
-            return
+        new_setup_properties_io = StringIO.StringIO()
+        prop.store(new_setup_properties_io)
+        new_setup_properties = new_setup_properties_io.getvalue()
 
+        #put setup.properties to server
+        remote_file_new = '/opt/{}/install/community-edition-setup/setup.properties'.format(gluu_server)
+        log('Uploading setup.properties', 'debug')
+        c.put_file(remote_file_new, new_setup_properties)
 
+        # ldap_paswwrod of this server should be the same with primary server
+        if artifacts['ldap_password']:
+            server.ldap_password = artifacts['ldap_password']
+            db.session.commit()
 
-    #run setup.py on the server
 
     if appconf.gluu_version < '3.1.3':
-        wlogger.log(tid, "Downloading setup.py")
+        log("Downloading setup.py")
         cmd = ( 
                 'curl  https://raw.githubusercontent.com/GluuFederation/'
                 'community-edition-setup/master/setup.py  -o /opt/{}/install/'
@@ -1415,22 +1600,32 @@ def installGluuServer(self, server_id):
 
         
         
-        run_command(tid, c, cmd, no_error='debug')
+        run(c, cmd, no_error='debug')
         
         cmd = 'chmod +x /opt/{}/install/community-edition-setup/setup.py'.format(
             gluu_server)
-        run_command(tid, c, cmd)
+        run(c, cmd)
     
     if not server.primary_server:
         setup_py = os.path.join(app.root_path,'setup', 'setup_{}.py'.format(appconf.gluu_version.replace('.','_')))
         remote_py = '/opt/{}/install/community-edition-setup/setup.py'.format(gluu_server)
-        wlogger.log(tid, "Uploading setup.py",'debug')
+        log("Uploading setup.py",'debug')
         c.upload(setup_py, remote_py)
         c.run('chmod +x ' + remote_py)
-        
-    
+
+
+@install_step
+def setup_completed(ctx, server, appconf, c, log, run):
+    return c.exists(SETUP_PROPERTIES_LAST.format(appconf.gluu_version))
+
+
+@install_step
+def run_setup(ctx, server, appconf, c, log, run):
+    gluu_server = 'gluu-server-' + appconf.gluu_version
+    run_cmd, cmd_chroot = get_run_cmd(server)
+
     #run setup.py on the server
-    wlogger.log(tid, "Running setup.py - Be patient this process will take a while ...")
+    log("Running setup.py - Be patient this process will take a while ...")
 
 
     if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
@@ -1443,58 +1638,35 @@ def installGluuServer(self, server_id):
     else:
         cmd = cmd % ''
 
+    stream_command(c, cmd, log, 'logc-{}-setup'.format(server.id),
+                   [re.compile(' \[(#|\s)*\] ')])
 
-    wlogger.log(tid ,cmd, "debug")
-
-    c.log_me("running command: {}".format(cmd))
-
-    channel = c.client.get_transport().open_session()
-    channel.get_pty()
-    channel.exec_command(cmd)
-    
-    last_debug = False
-
-    while True:
-        if channel.exit_status_ready():
-            break
-        rl = ''
-        try:
-            rl, wl, xl = select.select([channel], [], [], 0.0)
-        except:
-            pass
+    if not c.exists(SETUP_PROPERTIES_LAST.format(appconf.gluu_version)):
+        log("setup.py did not complete", "error")
+        return False
 
-        if len(rl) > 0:
-            cout = channel.recv(1024)
-            
-            if re.search(' \[(#|\s)*\] ', cout):
-                if not last_debug:
-                    cout = cout.strip()
-                    wlogger.log(tid, "...", "debug", log_id="logc-{}".format(log_id), new_log_id=True)
-                    last_debug = True
 
-                wlogger.log(tid, cout, "debugc", log_id="logc-{}".format(log_id))
-            else:
-                log_id += 1
-                last_debug = False
-                cout = cout.strip()
-                if cout:
-                    wlogger.log(tid, cout, "debug")
+@install_step
+def configure_gluu_server(ctx, server, appconf, c, log, run):
+    gluu_server = 'gluu-server-' + appconf.gluu_version
+    run_cmd, cmd_chroot = get_run_cmd(server)
+    setup_prop = get_setup_properties()
 
-    
     if appconf.modify_hosts:
-        all_server = Server.query.all()
+        all_server = get_servers()
         
         host_ip = []
         
         for ship in all_server:
             host_ip.append((ship.hostname, ship.ip))
 
-        modify_hosts(tid, c, host_ip, '/opt/'+gluu_server+'/', server.hostname)
+        modify_hosts(ctx['tid'], c, host_ip, '/opt/'+gluu_server+'/',
+                     server.hostname, server_id=server.id)
 
 
     if appconf.gluu_version >= '3.1.4':
         #make opendj listen all interfaces
-        makeOpenDjListenIpAddr(tid, c, cmd_chroot, run_cmd, server)
+        makeOpenDjListenIpAddr(ctx['tid'], c, cmd_chroot, run_cmd, server)
 
     # Get certificates from primary server and upload this server
     if not server.primary_server:
@@ -1503,43 +1675,26 @@ def installGluuServer(self, server_id):
         #from primary server and upload to this server, then will delete and
         #import keys
         if appconf.gluu_version > '3.0.2':
-            wlogger.log(tid, "Downloading certificates from primary "
-                             "server and uploading to this server")
-            certs_remote_tmp = "/tmp/certs_"+str(uuid.uuid4())[:4].upper()+".tgz"
-            certs_local_tmp = "/tmp/certs_"+str(uuid.uuid4())[:4].upper()+".tgz"
-
-            cmd = ('tar -zcf {0} /opt/gluu-server-{1}/etc/certs/ '
-                    '/opt/gluu-server-{1}/install/community-edition-setup'
-                    '/output/scim-rp.jks '
-                    '/opt/gluu-server-{1}'
-                    '/etc/gluu/conf/passport-config.json'
-                    ).format(certs_remote_tmp, appconf.gluu_version)
-            wlogger.log(tid,cmd,'debug')
-            cin, cout, cerr = pc.run(cmd)
-            wlogger.log(tid, cout+cerr, 'debug')
-            wlogger.log(tid,cmd,'debug')
-
-            r = pc.download(certs_remote_tmp, certs_local_tmp)
-            if 'Download successful' in r :
-                wlogger.log(tid, r,'success')
-            else:
-                wlogger.log(tid, r,'error')
+            artifacts = primary_artifacts(ctx, server.id)
+            if not artifacts:
+                return False
 
-            r = c.upload(certs_local_tmp, "/tmp/certs.tgz")
+            log("Uploading certificates of primary server to this server")
+            r = c.upload(artifacts['certs'], "/tmp/certs.tgz")
 
             if 'Upload successful' in r:
-                wlogger.log(tid, r,'success')
+                log(r,'success')
             else:
-                wlogger.log(tid, r,'error')
+                log(r,'error')
 
             cmd = ('cp -r /opt/gluu-server-{0}/etc/certs /opt/gluu-server-{0}/etc/certs.back'.format(appconf.gluu_version))
-            run_command(tid, c, cmd)
+            run(c, cmd)
 
             cmd = 'tar -zxf /tmp/certs.tgz -C /'
-            run_command(tid, c, cmd)
+            run(c, cmd)
 
             #delete old keys and import new ones
-            wlogger.log(tid, 'Manuplating keys')
+            log('Manuplating keys')
             for suffix in (
                     'httpd',
                     'shibIDP',
@@ -1548,33 +1703,50 @@ def installGluuServer(self, server_id):
                     setup_prop['ldap_type'],
                     ):
                 delete_key(suffix, appconf.nginx_host, appconf.gluu_version,
-                            tid, c, server.os)
+                            ctx['tid'], c, server.os)
                 import_key(suffix, appconf.nginx_host, appconf.gluu_version,
-                            tid, c, server.os)
+                            ctx['tid'], c, server.os)
         else:
+            pserver = get_primary_server()
+            pc = RemoteClient(pserver.hostname, ip=pserver.ip)
+            try:
+                pc.startup()
+            except:
+                log("Can't establish SSH connection to primary server: {}".format(
+                                                    pserver.hostname), 'error')
+                return False
             download_and_upload_custom_schema(  
-                                                tid, pc, c, 
+                                                ctx['tid'], pc, c, 
                                                 'opendj', gluu_server
                                             )
+            pc.close()
     else:
         #this is primary server so we need to upload local custom schemas if any
-        upload_custom_schema(tid, c, 
+        upload_custom_schema(ctx['tid'], c,
                             setup_prop['ldap_type'], gluu_server)
 
+
+@install_step
+def time_sync_configured(ctx, server, appconf, c, log, run):
+    return c.exists('/usr/sbin/ntpdate') and c.exists('/etc/cron.d/setdate')
+
+
+@install_step
+def setup_time_sync(ctx, server, appconf, c, log, run):
     #ntp is required for time sync, since ldap replication will be
     #done by time stamp. If not isntalled, install and configure crontab
 
     if c.exists('/usr/sbin/ntpdate'):
-        wlogger.log(tid, "ntp was installed", 'success')
+        log("ntp was installed", 'success')
     else:
 
-        cmd = install_command + 'install -y ntpdate'
-        run_command(tid, c, cmd)
+        cmd = package_manager(server) + 'install -y ntpdate'
+        run(c, cmd)
 
     #run time sync an every minute
     c.put_file('/etc/cron.d/setdate',
                 '* * * * *    root    /usr/sbin/ntpdate -s time.nist.gov\n')
-    wlogger.log(tid, 'Crontab entry was created to update time in every minute',
+    log('Crontab entry was created to update time in every minute',
                      'debug')
 
     if 'CentOS' in server.os or 'RHEL' in server.os:
@@ -1582,22 +1754,16 @@ def installGluuServer(self, server_id):
     else:
         cmd = 'service cron reload'
 
-    run_command(tid, c, cmd, exclude_error="Redirecting to /bin/systemctl reload crond.service")
+    run(c, cmd, exclude_error="Redirecting to /bin/systemctl reload crond.service")
 
-    #We need to fix opendj initscript
-    wlogger.log(tid, 'Uploading fixed opendj init.d script')
-    opendj_init_script = os.path.join(app.root_path, "templates",
-                           "opendj", "opendj")
-    #remote_opendj_init_script = '/opt/{0}/etc/init.d/opendj'.format(gluu_server)
-    #c.upload(opendj_init_script, remote_opendj_init_script)
-    #cmd = 'chmod +x {}'.format(remote_opendj_init_script)
-    run_command(tid, c, cmd)
-    #########
+
+@install_step
+def finish_installation(ctx, server, appconf, c, log, run):
+    run_cmd, cmd_chroot = get_run_cmd(server)
 
     if appconf.gluu_version == '3.1.6':
         #fix oxauth.war for openid connect session
-        wlogger.log(tid, "Fixing oxauth.war for OpenId connect session")
-        rcmd, cmdchr = get_run_cmd(server)
+        log("Fixing oxauth.war for OpenId connect session")
         cmd_list = [
                 '/opt/jre/bin/jar -xf /opt/gluu/jetty/oxauth/webapps/oxauth.war WEB-INF/incl/layout/authorize-template.xhtml',
                 'sed \\\'s/<f:view locale="#{language.localeCode}">/<f:view transient="true" locale="#{language.localeCode}">/\\\' -i WEB-INF/incl/layout/authorize-template.xhtml',
@@ -1605,11 +1771,108 @@ def installGluuServer(self, server_id):
                 ]
 
         for cmd in cmd_list:
-            run_command(tid, c, run_cmd.format(cmd), cmd_chroot)
+            run(c, run_cmd.format(cmd), cmd_chroot)
 
     server.gluu_server = True
     db.session.commit()
-    wlogger.log(tid, "Gluu Server successfully installed")
+    # the containers of the server changed
+    host_facts.invalidate(server.hostname,
+                          ['gluu_versions', 'oxauth_versions', 'gluu_installed'])
+    log("Gluu Server successfully installed")
+
+
+# name, action and check of the steps installing Gluu Server on a server,
+# in the order they run
+INSTALL_STEPS = [
+    ('check_install_requirements', check_install_requirements, None),
+    ('add_gluu_repository', add_gluu_repository, gluu_repository_added),
+    ('remove_gluu_server', remove_gluu_server, no_gluu_server_installed),
+    ('install_gluu_package', install_gluu_package, gluu_package_installed),
+    ('start_gluu_server', start_gluu_server, None),
+    ('upload_setup_files', upload_setup_files, None),
+    ('run_setup', run_setup, setup_completed),
+    ('configure_gluu_server', configure_gluu_server, None),
+    ('setup_time_sync', setup_time_sync, time_sync_configured),
+    ('finish_installation', finish_installation, None),
+]
+
+
+def gluu_install_steps(hosts, prefix='', requires_all=()):
+    """Returns the steps installing Gluu Server on the servers, each server
+    goes through them in order. A failed installation is resumed after the
+    last completed step of each server.
+
+    Args:
+        hosts (list): hostnames of the servers
+        prefix (string): prefix of the step names, so the primary server
+            and the others are installed by the steps of one graph
+        requires_all (list): names of the steps the installations wait for
+    """
+    steps = []
+    previous = None
+    for name, action, check in INSTALL_STEPS:
+        # the requirements are checked again when resuming, they may have
+        # changed meanwhile
+        steps.append(Step(prefix + name, action, hosts=hosts, check=check,
+                          requires=[previous] if previous else [],
+                          requires_all=[] if previous else requires_all,
+                          rerun=name == 'check_install_requirements'))
+        previous = prefix + name
+    return steps
+
+
+def fetch_primary_artifacts_step(ctx, host):
+    ctx['artifacts'] = fetch_primary_artifacts(ctx['tid'], get_primary_server(),
+                                               get_app_config())
+    return bool(ctx['artifacts'])
+
+
+@celery.task(bind=True, locked_hosts=listed_hosts)
+def install_gluu_cluster(self, server_ids, parallelism=None):
+    """Installs Gluu server on the primary server first, then on the other
+    servers concurrently. The setup properties and certificates of the
+    primary server are fetched once for all of them. Messages are logged
+    for each server, see gluu_install_steps().
+
+    Args:
+        server_ids (list): ids of the servers to be installed
+        parallelism (int): maximum number of servers installed at once,
+            CLUSTER_INSTALL_PARALLELISM by default
+    """
+    tid = self.request.id
+    pserver = get_primary_server()
+    servers = [s for s in get_servers() if s.id in server_ids]
+    others = [s.hostname for s in servers if not s.primary_server]
+
+    ctx = {
+        'tid': tid,
+        'server_ids': dict((s.hostname, s.id) for s in servers),
+        'artifacts': None,
+    }
+
+    graph = StepGraph(
+        gluu_install_steps(
+            [pserver.hostname] if pserver.id in server_ids else [],
+            prefix='primary_') + [
+        # local files, fetched again when a failed run is resumed
+        Step('fetch_primary_artifacts', fetch_primary_artifacts_step,
+             hosts=[pserver.hostname] if others else [],
+             requires_all=['primary_finish_installation'], rerun=True),
+        ] + gluu_install_steps(others,
+                               requires_all=['fetch_primary_artifacts']))
+
+    run = graph.run('install_gluu_cluster:{}'.format(
+                        ','.join(str(i) for i in sorted(server_ids))),
+                    ctx, tid=tid,
+                    workers=parallelism or app.config['CLUSTER_INSTALL_PARALLELISM'],
+                    inputs=install_inputs(servers))
+
+    if run.status != 'success':
+        wlogger.log(tid, "Ending cluster installation process.", "error")
+        return False
+
+    wlogger.log(tid, "Gluu Server installed on all servers", "success")
+    return True
 
 
 def do_disable_replication(tid, server, primary_server, app_config):
@@ -1658,7 +1921,7 @@ def do_disable_replication(tid, server, primary_server, app_config):
     wlogger.log(tid, "Checking replication status", 'debug')
 
     cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication status -n -X -h {} '
-            '-p 1444 -I admin -w \\\'{}\\\'').format(
+            '-p 4444 -I admin -w \\\'{}\\\'').format(
                     primary_server.hostname,
                     app_config.replication_pw)
 
@@ -1667,178 +1930,210 @@ def do_disable_replication(tid, server, primary_server, app_config):
 
     return True
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=replication_hosts)
 def opendj_disable_replication_task(self, server_id):
     server = Server.query.get(server_id)
-    primary_server = Server.query.filter_by(primary_server=True).first()
-    app_config = AppConfiguration.query.first()
+    primary_server = get_primary_server()
+    app_config = get_app_config()
     tid = self.request.id
     r = do_disable_replication(tid, server, primary_server, app_config)
+    poll_replication_status.delay()
     return r
 
-@celery.task(bind=True)
-def remove_server_from_cluster(self, server_id, remove_server=False, 
-                                                disable_replication=True):
+def remove_filesystem_replication_step(ctx, host):
+    # the server may be unreachable, its removal goes on anyway
+    server = Server.query.get(ctx['server_id'])
+    remove_filesystem_replication_do(server, get_app_config(), ctx['tid'])
 
-    app_config = AppConfiguration.query.first()
-    primary_server = Server.query.filter_by(primary_server=True).first()
-    server = Server.query.get(server_id)
-    tid = self.request.id
 
-    removed_server_hostname = server.hostname
+def update_proxy_step(ctx, host):
+    tid = ctx['tid']
+    app_config = get_app_config()
+    proxy_c = RemoteClient(app_config.nginx_host, ip=app_config.nginx_ip)
 
-    remove_filesystem_replication_do(server, app_config, tid)
-
-    proxy_c = None
-
-    if not app_config.external_load_balancer:
-        proxy_c = RemoteClient(app_config.nginx_host, ip=app_config.nginx_ip)
-
-        wlogger.log(tid, "Reconfiguring proxy server {}".format(
-                                                            app_config.nginx_host))
-
-        wlogger.log(tid,
-                "Making SSH connection to load balancer {0}".format(
-                app_config.nginx_host), 'debug'
-                )
+    wlogger.log(tid, "Reconfiguring proxy server {}".format(
+                                                        app_config.nginx_host))
 
-        try:
-            proxy_c.startup()
-
-            wlogger.log(tid, "SSH connection successful", 'success')
-
-            # Update nginx
-            nginx_config = make_nginx_proxy_conf(exception=server_id)
-            remote = "/etc/nginx/nginx.conf"
-            r = proxy_c.put_file(remote, nginx_config)
-            
-            if not r[0]:
-                wlogger.log(tid, "An error occurred while uploadng nginx.conf.", "warning")
-
-            wlogger.log(tid, "nginx configuration updated", 'success')
-            wlogger.log(tid, "Restarting nginx", 'debug')
-            run_command(tid, proxy_c, 'service nginx restart', no_error='warning')
+    wlogger.log(tid,
+            "Making SSH connection to load balancer {0}".format(
+            app_config.nginx_host), 'debug'
+            )
 
-            wlogger.log(tid, "Proxy server configuration were not updated", 'success')
+    try:
+        proxy_c.startup()
+    except Exception as e:
+        wlogger.log(
+            tid, "Cannot establish SSH connection {0}".format(e), "warning")
+        wlogger.log(tid, "Proxy server configuration were not updated", "warning")
+        return
 
+    try:
+        wlogger.log(tid, "SSH connection successful", 'success')
 
-        except Exception as e:
-            wlogger.log(
-                tid, "Cannot establish SSH connection {0}".format(e), "warning")
-            wlogger.log(tid, "Proxy server configuration were not updated", "warning")
+        # Update nginx
+        nginx_config = make_nginx_proxy_conf(exception=ctx['server_id'])
+        remote = "/etc/nginx/nginx.conf"
+        r = proxy_c.put_file(remote, nginx_config)
+        
+        if not r[0]:
+            wlogger.log(tid, "An error occurred while uploadng nginx.conf.", "warning")
 
-        if not proxy_c and not app_config.use_ldap_cache:
-            
-            proxy_c = RemoteClient(app_config.cache_host, ip=app_config.cache_ip)
-            
-            wlogger.log(tid,
-                    "Making SSH connection to cache server {0}".format(
-                    app_config.cache_host), 'debug'
-                    )
+        wlogger.log(tid, "nginx configuration updated", 'success')
+        wlogger.log(tid, "Restarting nginx", 'debug')
+        run_command(tid, proxy_c, 'service nginx restart', no_error='warning')
+    finally:
+        proxy_c.close()
 
-            try:
-                proxy_c.startup()
-                # Update Twemproxy
-                wlogger.log(tid, "Updating Twemproxy configuration",'debug')
-                twemproxy_conf = make_twem_proxy_conf(exception=server_id)
-                remote = "/etc/nutcracker/nutcracker.yml"
-                r = proxy_c.put_file(remote, twemproxy_conf)
 
-                if not r[0]:
-                    wlogger.log(tid, "An error occurred while uploading nutcracker.yml.", "warning")
+def replication_disabled(ctx, host):
+    return not Server.query.get(ctx['server_id']).mmr
 
-                wlogger.log(tid, "Twemproxy configuration updated", 'success')
 
-                run_command(tid, proxy_c, 'service nutcracker restart', no_error='warning')
+def disable_replication_step(ctx, host):
+    server = Server.query.get(ctx['server_id'])
+    r = do_disable_replication(ctx['tid'], server, get_primary_server(),
+                               get_app_config())
+    if not r:
+        wlogger.log(ctx['tid'], "An error occurred while disabling replication", "warning")
+    return r
 
-                # Update stunnel
-                proxy_stunnel_conf = make_proxy_stunnel_conf(exception=server_id)
-                proxy_stunnel_conf = '\n'.join(proxy_stunnel_conf)
-                remote = '/etc/stunnel/stunnel.conf'
-                r = proxy_c.put_file(remote, proxy_stunnel_conf)
 
-                if not r[0]:
-                    wlogger.log(tid, "An error occurred while uploadng stunnel.conf.", "warning")
+def reconfigure_csync2_step(ctx, host):
+    tid = ctx['tid']
+    server = ctx['servers'][host]
+    chroot = '/opt/gluu-server-' + ctx['gluu_version']
 
-                wlogger.log(tid, "Stunnel configuration updated", 'success')
+    wlogger.log(tid, "Making SSH connection to the server %s" %
+            server.hostname)
 
+    ct = RemoteClient(server.hostname, ip=server.ip)
+    try:
+        ct.startup()
+    except Exception as e:
+        wlogger.log(
+            tid, "Cannot establish SSH connection {0}".format(e),
+            "warning")
+        return False
 
+    try:
+        remote_file = os.path.join(chroot, 'etc', 'csync2.cfg')
+        
+        if ct.exists(remote_file):
+            wlogger.log(tid, "Reconfiguring file system replication")
+            csync2_config = get_csync2_config(exclude=ctx['removed_host'])
+            wlogger.log(tid, "Uploading csync2.cfg", 'debug')
+            ct.put_file(remote_file,  csync2_config)
+    finally:
+        ct.close()
 
-                os_type = get_os_type(proxy_c)
 
-                if 'CentOS' or 'RHEL' in os_type:
-                    run_command(tid, proxy_c, 'systemctl restart stunnel', no_error='warning')
-                else:
-                    run_command(tid, proxy_c, 'service stunnel4 restart', no_error='warning')
+def restart_gluu_step(ctx, host):
+    tid = ctx['tid']
+    server = ctx['servers'][host]
 
-                proxy_c.close()
+    if server.os == 'CentOS 7' or server.os == 'RHEL 7':
+        restart_command = '/sbin/gluu-serverd-{0} restart'.format(
+                            ctx['gluu_version'])
+    else:
+        restart_command = '/etc/init.d/gluu-server-{0} restart'.format(
+                            ctx['gluu_version'])
 
-            except Exception as e:
-                wlogger.log(
-                    tid, "Cannot establish SSH connection {0}".format(e), "warning")
-                wlogger.log(tid, "Proxy server configuration were not updated", "warning")
+    ct = RemoteClient(server.hostname, ip=server.ip)
+    try:
+        ct.startup()
+    except Exception as e:
+        wlogger.log(
+            tid, "Cannot establish SSH connection {0}".format(e),
+            "warning")
+        return False
 
+    try:
+        wlogger.log(tid, "Restarting Gluu Server on {}".format(
+                            server.hostname))
 
-    if disable_replication:
-        r = do_disable_replication(tid, server, primary_server, app_config)
-        if not r:
-            wlogger.log(tid, "An error occurred while disabling replication", "warning")
+        run_command(tid, ct, restart_command, no_error='warning')
+    finally:
+        ct.close()
 
 
-    if remove_server:
+def delete_server_step(ctx, host):
+    server = Server.query.get(ctx['server_id'])
+    if server:
         db.session.delete(server)
+        db.session.commit()
 
 
-    chroot = '/opt/gluu-server-' + app_config.gluu_version
-
-    for server in Server.query.all():
-        if server.gluu_server:
-        
-            if server.os == 'CentOS 7' or server.os == 'RHEL 7':
-                restart_command = '/sbin/gluu-serverd-{0} restart'.format(
-                                    app_config.gluu_version)
-            else:
-                restart_command = '/etc/init.d/gluu-server-{0} restart'.format(
-                                    app_config.gluu_version)
-
-
-            wlogger.log(tid, "Making SSH connection to the server %s" %
-                    server.hostname)
+# the servers of the whole cluster are reconfigured and restarted
+@celery.task(bind=True, locked_hosts=cluster_hosts)
+def remove_server_from_cluster(self, server_id, remove_server=False, 
+                                                disable_replication=True):
+    """Removes the server from the file system replication, the proxy and
+    the LDAP replication of the cluster, and restarts the other servers. A
+    failed removal is resumed after its last completed step.
 
-            ct = RemoteClient(server.hostname, ip=server.ip)
+    Args:
+        server_id (int): id of the server
+        remove_server (bool): delete the server once it is removed
+        disable_replication (bool): disable the LDAP replication of the
+            server
+    """
+    app_config = get_app_config()
+    server = Server.query.get(server_id)
+    tid = self.request.id
 
-            try:
-                ct.startup()
-            except Exception as e:
-                wlogger.log(
-                    tid, "Cannot establish SSH connection {0}".format(e),
-                    "warning")
-                wlogger.log(tid, "Ending server setup process.", "warning")
+    removed = server.hostname
 
-            remote_file = os.path.join(chroot, 'etc', 'csync2.cfg')
-            
-            if ct.exists(remote_file):
-                wlogger.log(tid, "Reconfiguring file system replication")
-                csync2_config = get_csync2_config(exclude=removed_server_hostname)
-                wlogger.log(tid, "Uploading csync2.cfg", 'debug')
-                ct.put_file(remote_file,  csync2_config)
+    # when the server is deleted, the others are restarted with their new
+    # configuration
+    restarted = [s for s in get_servers() if s.gluu_server and
+                 not (remove_server and s.id == server.id)]
 
-            wlogger.log(tid, "Restarting Gluu Server on {}".format(
-                                server.hostname))
+    ctx = {
+        'tid': tid,
+        'server_id': server.id,
+        'removed_host': removed,
+        'servers': dict((s.hostname, server_info(s)) for s in restarted),
+        'gluu_version': app_config.gluu_version,
+    }
 
-            run_command(tid, ct, restart_command, no_error='warning')
-
-            ct.close()
-
-    db.session.commit()
-    return True
+    hosts = [s.hostname for s in restarted]
+
+    graph = StepGraph([
+        Step('remove_filesystem_replication',
+             remove_filesystem_replication_step, hosts=[removed]),
+        Step('update_proxy', update_proxy_step,
+             hosts=[] if app_config.external_load_balancer
+             else [app_config.nginx_host]),
+        Step('disable_replication', disable_replication_step,
+             hosts=[removed] if disable_replication else [],
+             check=replication_disabled),
+        Step('reconfigure_csync2', reconfigure_csync2_step, hosts=hosts,
+             requires_all=['remove_filesystem_replication']),
+        # servers are restarted one at a time to keep the cluster up
+        Step('restart_gluu', restart_gluu_step, hosts=hosts,
+             requires=['reconfigure_csync2'],
+             requires_all=['update_proxy', 'disable_replication'],
+             lock='restart_gluu'),
+        Step('delete_server', delete_server_step,
+             hosts=[removed] if remove_server else [],
+             requires_all=['restart_gluu']),
+    ])
+
+    run = graph.run('remove_server_from_cluster:{}'.format(server_id), ctx,
+                    tid=tid, inputs={
+                        'remove_server': remove_server,
+                        'disable_replication': disable_replication,
+                        'gluu_version': app_config.gluu_version,
+                    })
+
+    return run.status == 'success'
 
 
 def configure_OxIDPAuthentication(tid, exclude=None):
     
-    primary_server = Server.query.filter_by(primary_server=True).first()
+    primary_server = get_primary_server()
     
-    app_config = AppConfiguration.query.first()
+    app_config = get_app_config()
 
     gluu_installed_servers = Server.query.filter_by(gluu_server=True).all()
 
@@ -1907,258 +2202,405 @@ def configure_OxIDPAuthentication(tid, exclude=None):
                 'success')
 
 
-@celery.task(bind=True)
-def opendjenablereplication(self, server_id):
-
-    primary_server = Server.query.filter_by(primary_server=True).first()
-    tid = self.request.id
-    app_config = AppConfiguration.query.first()
-
-    gluu_installed_servers = Server.query.filter_by(gluu_server=True).all()
-
-    if server_id == 'all':
-        servers = Server.query.all()
-    else:
-        servers = [Server.query.get(server_id)]
+REPLICATION_BASES = ('gluu', 'site')
 
-    if not primary_server.gluu_server:
-        chroot = '/'
-    else:
-        chroot = '/opt/gluu-server-' + app_config.gluu_version
+REPLICATION_CONFIG_BASE = ('cn=Multimaster Synchronization,'
+                           'cn=Synchronization Providers,cn=config')
 
-    chroot_fs = '/opt/gluu-server-' + app_config.gluu_version
 
-    wlogger.log(tid, "Making SSH connection to the primary server %s" %
-                primary_server.hostname)
+def opendj_replication_ready(conn, bases):
+    """Checks if the replication server and the replication domains of bases
+    are configured on the OpenDJ server.
 
-    c = RemoteClient(primary_server.hostname, ip=primary_server.ip)
+    Args:
+        conn (ldap3.Connection): connection bound as directory manager
+        bases (list): names of the base DNs, e.g. 'gluu' for o=gluu
 
-    try:
-        c.startup()
-    except Exception as e:
-        wlogger.log(
-            tid, "Cannot establish SSH connection {0}".format(e), "warning")
-        wlogger.log(tid, "Ending server setup process.", "error")
+    Returns:
+        boolean
+    """
+    if not conn.search(search_base=REPLICATION_CONFIG_BASE,
+                       search_filter='(objectClass=ds-cfg-replication-server)',
+                       search_scope=SUBTREE, attributes=['1.1']):
         return False
 
-    if primary_server.gluu_server:
-        # check if remote is gluu server
-        if c.exists(chroot):
-            wlogger.log(tid, 'Checking if remote is gluu server', 'success')
-        else:
-            wlogger.log(tid, "Remote is not a gluu server.", "error")
-            wlogger.log(tid, "Ending server setup process.", "error")
-            return False
-
+    conn.search(search_base=REPLICATION_CONFIG_BASE,
+                search_filter='(objectClass=ds-cfg-replication-domain)',
+                search_scope=SUBTREE, attributes=['ds-cfg-base-dn'])
+    domains = set()
+    for entry in conn.response:
+        for dn in entry['attributes'].get('ds-cfg-base-dn', []):
+            domains.add(str(dn).lower())
 
-    tmp_dir = os.path.join('/tmp', uuid.uuid1().hex[:12])
-    os.mkdir(tmp_dir)
+    return all('o={}'.format(base) in domains for base in bases)
 
-    wlogger.log(tid, "Downloading opendj certificates")
 
-    opendj_cert_files = ('keystore', 'keystore.pin', 'truststore')
+def wait_for_opendj(tid, server, bases=(), timeout=600, interval=2):
+    """Polls the OpenDJ server until it accepts a bind and answers a read
+    of the root DSE or, if bases are given, until replication is
+    configured for them.
 
-    for cf in opendj_cert_files:
-        remote = os.path.join(chroot_fs, 'opt/opendj/config', cf)
-        local = os.path.join(tmp_dir, cf)
-        result = c.download(remote, local)
-        if not result.startswith('Download successful'):
-            wlogger.log(tid, result, "warning")
-            wlogger.log(tid, "Ending server setup process.", "error")
-            return False
-
-    primary_server_secured = False
-
-    for server in servers:
-        
-        cmd_run, chroot =  get_run_cmd(server)
-        
-        if not server.primary_server:
-            wlogger.log(tid, "Enabling replication on server {}".format(
-                                                            server.hostname))
-                                                            
-            for base in ['gluu', 'site']:
-
-                cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication enable --host1 {} --port1 4444 '
-                        '--bindDN1 \\\'cn=directory manager\\\' --bindPassword1 \\\'{}\\\' '
-                        '--replicationPort1 8989 --host2 {} --port2 4444 --bindDN2 '
-                        '\\\'cn=directory manager\\\' --bindPassword2 \\\'{}\\\' '
-                        '--replicationPort2 8989 --adminUID admin --adminPassword \\\'{}\\\' '
-                        '--baseDN \\\'o={}\\\' --trustAll -X -n').format(
-                            primary_server.ip,
-                            primary_server.ldap_password.replace("'","\\'"),
-                            server.ip,
-                            server.ldap_password.replace("'","\\'"),
-                            app_config.replication_pw.replace("'","\\'"),
-                            base,
-                            )
+    Args:
+        tid (string): task id of the task to store the log
+        server (:object:`clustermgr.models.Server`): server to wait for
+        bases (list): names of the base DNs that should be replicated
+        timeout (int): seconds to wait
+        interval (int): seconds between checks
 
-                cmd = cmd_run.format(cmd)
-                
-                run_command(tid, c, cmd, chroot)
+    Returns:
+        True if the server got ready within timeout
+    """
+    deadline = time.time() + timeout
 
+    while True:
+        try:
+            with ldap_pool.connection('{}:1636'.format(server.ip),
+                                      'cn=directory manager',
+                                      server.ldap_password) as conn:
+                if conn.bound:
+                    if bases:
+                        ready = opendj_replication_ready(conn, bases)
+                    else:
+                        # the server only has to answer, e.g. after a
+                        # restart
+                        ready = conn.search(search_base='',
+                                            search_filter='(objectClass=*)',
+                                            search_scope=BASE,
+                                            attributes=['1.1'])
+                    if ready:
+                        return True
+        except Exception as e:
+            print "OpenDJ on {} is not ready: {}".format(server.hostname, e)
 
-            if not primary_server_secured:
+        if time.time() > deadline:
+            wlogger.log(tid, "OpenDJ on {} is not ready after {} seconds".format(
+                                        server.hostname, timeout), "warning")
+            return False
 
-                wlogger.log(tid, "Securing replication on primary server {}".format(
-                                                                primary_server.hostname))
+        time.sleep(interval)
 
-                cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsconfig -h {} -p 4444 '
-                        ' -D  \\\'cn=Directory Manager\\\' -w \\\'{}\\\' --trustAll '
-                        '-n set-crypto-manager-prop --set ssl-encryption:true'
-                        ).format(primary_server.ip, primary_server.ldap_password.replace("'","\\'"))
 
-                cmd = cmd_run.format(cmd)
-                run_command(tid, c, cmd, chroot)
-                primary_server_secured = True
-                primary_server.mmr = True
+OPENDJ_CERT_FILES = ('keystore', 'keystore.pin', 'truststore')
 
-            wlogger.log(tid, "Securing replication on server {}".format(
-                                                            server.hostname))
-            cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsconfig -h {} -p 4444 '
-                    ' -D  \\\'cn=Directory Manager\\\' -w \\\'{}\\\' --trustAll '
-                    '-n set-crypto-manager-prop --set ssl-encryption:true'
-                    ).format(server.ip, primary_server.ldap_password.replace("'","\\'"))
+ServerInfo = namedtuple('ServerInfo', ['id', 'hostname', 'ip', 'ldap_password',
+                                       'primary_server', 'gluu_server', 'os',
+                                       'cmd_run', 'cmd_chroot'])
 
-            cmd = cmd_run.format(cmd)
-            run_command(tid, c, cmd, chroot)
 
-        server.mmr = True
+def server_info(server):
+    """Returns a plain copy of the server attributes used by the steps of a
+    :class:`clustermgr.core.step_graph.StepGraph`, which run in threads of
+    their own.
+    """
+    cmd_run, cmd_chroot = get_run_cmd(server)
+    return ServerInfo(server.id, server.hostname, server.ip,
+                      server.ldap_password, server.primary_server,
+                      server.gluu_server, server.os, cmd_run, cmd_chroot)
 
 
-    db.session.commit()
+def run_on_primary(ctx, command):
+    """Runs the command in the Gluu container of the primary server over a
+    new SSH connection
 
-    
+    Raises:
+        RemoteCommandError: if the command fails with an error run_command()
+            does not exclude, so the step running it fails
+    """
+    primary = ctx['primary']
+    c = RemoteClient(primary.hostname, ip=primary.ip)
+    c.startup()
+    try:
+        return run_command(ctx['tid'], c, primary.cmd_run.format(command),
+                           primary.cmd_chroot, check=True)
+    finally:
+        c.close()
 
-    servers = Server.query.all()
 
-    for server in servers:
+def download_opendj_certs(ctx, host):
+    primary = ctx['primary']
+    c = RemoteClient(primary.hostname, ip=primary.ip)
+    c.startup()
+    try:
+        for cf in OPENDJ_CERT_FILES:
+            remote = os.path.join(ctx['chroot_fs'], 'opt/opendj/config', cf)
+            local = os.path.join(ctx['cert_dir'], cf)
+            result = c.download(remote, local)
+            if not result.startswith('Download successful'):
+                wlogger.log(ctx['tid'], result, "warning")
+                return False
+    finally:
+        c.close()
 
-        if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
-            restart_command = '/sbin/gluu-serverd-{0} restart'.format(
-                                app_config.gluu_version)
-        else:
-            restart_command = '/etc/init.d/gluu-server-{0} restart'.format(
-                                app_config.gluu_version)
 
+def replication_enabled(ctx, host):
+    server = ctx['servers'][host]
+    try:
+        with ldap_pool.connection('{}:1636'.format(server.ip),
+                                  'cn=directory manager',
+                                  server.ldap_password) as conn:
+            return conn.bound and \
+                opendj_replication_ready(conn, REPLICATION_BASES)
+    except Exception:
+        return False
 
-        wlogger.log(tid, "Making SSH connection to the server %s" %
-                server.hostname)
 
-        ct = RemoteClient(server.hostname, ip=server.ip)
+def enable_replication(ctx, host):
+    primary = ctx['primary']
+    server = ctx['servers'][host]
+
+    for base in REPLICATION_BASES:
+        cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication enable --host1 {} --port1 4444 '
+                '--bindDN1 \\\'cn=directory manager\\\' --bindPassword1 \\\'{}\\\' '
+                '--replicationPort1 8989 --host2 {} --port2 4444 --bindDN2 '
+                '\\\'cn=directory manager\\\' --bindPassword2 \\\'{}\\\' '
+                '--replicationPort2 8989 --adminUID admin --adminPassword \\\'{}\\\' '
+                '--baseDN \\\'o={}\\\' --trustAll -X -n').format(
+                    primary.ip,
+                    primary.ldap_password.replace("'","\\'"),
+                    server.ip,
+                    server.ldap_password.replace("'","\\'"),
+                    ctx['replication_pw'].replace("'","\\'"),
+                    base,
+                    )
+        run_on_primary(ctx, cmd)
 
-        try:
-            ct.startup()
-        except Exception as e:
-            wlogger.log(
-                tid, "Cannot establish SSH connection {0}".format(e),
-                "warning")
-            wlogger.log(tid, "Ending server setup process.", "error")
-            return False
 
+def secure_replication(ctx, host):
+    server = ctx['servers'][host]
 
-        for target in servers:
+    cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsconfig -h {} -p 4444 '
+            ' -D  \\\'cn=Directory Manager\\\' -w \\\'{}\\\' --trustAll '
+            '-n set-crypto-manager-prop --set ssl-encryption:true'
+            ).format(server.ip,
+                     ctx['primary'].ldap_password.replace("'","\\'"))
+    run_on_primary(ctx, cmd)
 
-            if  target != server:
+    # the flag is read by configure_OxIDPAuthentication later in the run
+    server = Server.query.get(server.id)
+    server.mmr = True
+    db.session.commit()
 
-                for base in ['gluu', 'site']:
-                    cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication initialize --baseDN \\\'o={}\\\' '
-                        '--adminUID admin --adminPassword \\\'{}\\\' '
-                        '--hostSource {} --portSource 4444 '
-                        '--hostDestination {} --portDestination 4444 '
-                        '--trustAll --no-prompt').format(
-                            base,
-                            app_config.replication_pw.replace("'","\\'"),
-                            target.ip,
-                            server.ip,
-                            )
 
-                    cmd_run, cmd_chroot = get_run_cmd(server)
+def wait_replication(ctx, host):
+    return wait_for_opendj(ctx['tid'], ctx['servers'][host], REPLICATION_BASES)
 
-                    print "Sleeping 30 seconds"
-                    time.sleep(30)
 
-                    wlogger.log(tid, "Inıtializing replication on server {} for base {}".format(
-                                                                        server.hostname, base))
+def initialize_replica(base, ctx, host):
+    """Initializes the replicas of o=base from the primary server, the one of
+    host or all of them if host is None
+    """
+    primary = ctx['primary']
+
+    if host is None:
+        cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication initialize-all '
+                '--baseDN \\\'o={}\\\' --adminUID admin --adminPassword \\\'{}\\\' '
+                '--hostname {} --port 4444 --trustAll --no-prompt').format(
+                    base,
+                    ctx['replication_pw'].replace("'","\\'"),
+                    primary.ip,
+                    )
+    else:
+        cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication initialize --baseDN \\\'o={}\\\' '
+                '--adminUID admin --adminPassword \\\'{}\\\' '
+                '--hostSource {} --portSource 4444 '
+                '--hostDestination {} --portDestination 4444 '
+                '--trustAll --no-prompt').format(
+                    base,
+                    ctx['replication_pw'].replace("'","\\'"),
+                    primary.ip,
+                    ctx['servers'][host].ip,
+                    )
+    run_on_primary(ctx, cmd)
 
-                    cmd = cmd_run.format(cmd)
-                    run_command(tid, c, cmd, cmd_chroot)
-            
 
-        if not server.primary_server:
+def upload_opendj_certs(ctx, host):
+    server = ctx['servers'][host]
+    ct = RemoteClient(server.hostname, ip=server.ip)
+    ct.startup()
+    try:
+        for cf in OPENDJ_CERT_FILES:
+            remote = os.path.join(ctx['chroot_fs'], 'opt/opendj/config', cf)
+            local = os.path.join(ctx['cert_dir'], cf)
+
+            result = ct.upload(local, remote)
+            if not result or not result.startswith('Upload successful'):
+                wlogger.log(ctx['tid'], result or "An error occurred while "
+                            "uploading OpenDj certificates.", "warning")
+                return False
+    finally:
+        ct.close()
 
-            if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
 
-                print "Sleeping 30 seconds"
-                time.sleep(30)
+def restart_gluu(ctx, host):
+    server = ctx['servers'][host]
 
-                print "Running second initialization on {}".format(ct.host)
+    if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
+        restart_command = '/sbin/gluu-serverd-{0} restart'.format(
+                            ctx['gluu_version'])
+    else:
+        restart_command = '/etc/init.d/gluu-server-{0} restart'.format(
+                            ctx['gluu_version'])
 
+    ct = RemoteClient(server.hostname, ip=server.ip)
+    ct.startup()
+    try:
+        run_command(ctx['tid'], ct, restart_command)
+    finally:
+        ct.close()
 
-                #sometimes we need re-imitialization
-                cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication initialize --adminUID admin '
-                        '--adminPassword \\\'{}\\\' --baseDN o=gluu --hostSource {} '
-                        '--portSource 4444 --hostDestination {} '
-                        '--portDestination 4444 --trustAll --no-prompt').format(
-                                app_config.replication_pw.replace("'","\\'"),
-                                primary_server.ip,
-                                server.ip,
-                                )
+    return wait_for_opendj(ctx['tid'], server)
 
 
-                print "Init command", cmd
+def configure_idp_authentication(ctx, host):
+    configure_OxIDPAuthentication(ctx['tid'])
 
 
-                cmd = cmd_run.format(cmd)
-                run_command(tid, ct, cmd, chroot)
+def check_replication_status(ctx, host):
+    primary = ctx['primary']
+    cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication status -n -X -h {} '
+            '-p 4444 -I admin -w \'{}\'').format(
+                    primary.ip,
+                    ctx['replication_pw'].replace("'","\\'"))
+    run_on_primary(ctx, cmd)
 
-            wlogger.log(tid, "Uploading OpenDj certificate files")
-            for cf in opendj_cert_files:
 
+def replication_steps(primary, targets, cluster, initialize_all):
+    """Returns the steps enabling replication between the primary server and
+    the target servers
 
-                remote = os.path.join(chroot_fs, 'opt/opendj/config', cf)
-                local = os.path.join(tmp_dir, cf)
+    Args:
+        primary (string): hostname of the primary server
+        targets (list): hostnames of the servers to replicate with
+        cluster (list): hostnames of all the servers
+        initialize_all (bool): initialize all replicas at once
+    """
+    secondaries = [h for h in targets if h != primary]
+    secured = [primary] + secondaries
+    others = [h for h in cluster if h != primary]
+
+    steps = [
+        Step('download_opendj_certs', download_opendj_certs, rerun=True),
+        # dsreplication enable changes the admin data of the primary server,
+        # servers are added one at a time
+        Step('enable_replication', enable_replication, hosts=secondaries,
+             check=replication_enabled, lock='dsreplication'),
+        Step('secure_replication', secure_replication, hosts=secured,
+             requires=['enable_replication']),
+        Step('wait_replication', wait_replication,
+             hosts=cluster if initialize_all else secured,
+             requires=['secure_replication']),
+    ]
+
+    # base DNs are independent replication domains, initialized concurrently
+    for base in REPLICATION_BASES:
+        steps.append(Step('initialize_' + base,
+                          partial(initialize_replica, base),
+                          hosts=None if initialize_all else secondaries,
+                          requires_all=['wait_replication']))
+
+    steps.extend([
+        Step('upload_opendj_certs', upload_opendj_certs, hosts=others,
+             requires_all=['download_opendj_certs']),
+        # servers are restarted one by one, so that the cluster keeps serving
+        Step('restart_gluu', restart_gluu, hosts=cluster,
+             requires=['upload_opendj_certs'],
+             requires_all=['initialize_' + base for base in REPLICATION_BASES],
+             lock='restart_gluu'),
+        Step('configure_idp_authentication', configure_idp_authentication,
+             requires_all=['restart_gluu']),
+        Step('check_replication_status', check_replication_status,
+             requires=['configure_idp_authentication']),
+    ])
+    return steps
+
+
+# the steps restart and reconfigure every server of the cluster, not only
+# the ones replication is enabled for
+@celery.task(bind=True, locked_hosts=cluster_hosts)
+def opendjenablereplication(self, server_id):
 
-                result = ct.upload(local, remote)
-                if not result:
-                    wlogger.log(tid, "An error occurred while uploading OpenDj certificates.", "error")
-                    return False
+    primary_server = get_primary_server()
+    tid = self.request.id
+    app_config = get_app_config()
 
-                if not result.startswith('Upload successful'):
-                    wlogger.log(tid, result, "warning")
-                    wlogger.log(tid, "Ending server setup process.", "error")
-                    return False
+    if server_id == 'all':
+        servers = get_servers()
+    else:
+        servers = [Server.query.get(server_id)]
 
-        wlogger.log(tid, "Restarting Gluu Server on {}".format(
-                            server.hostname))
+    if not primary_server.gluu_server:
+        chroot = '/'
+    else:
+        chroot = '/opt/gluu-server-' + app_config.gluu_version
 
-        run_command(tid, ct, restart_command)
+    chroot_fs = '/opt/gluu-server-' + app_config.gluu_version
 
-        ct.close()
+    wlogger.log(tid, "Making SSH connection to the primary server %s" %
+                primary_server.hostname)
 
+    c = RemoteClient(primary_server.hostname, ip=primary_server.ip)
 
-    if server.os in ('CentOS 7', 'RHEL 7', 'Ubuntu 18'):
-        wlogger.log(tid, "Waiting for Gluu to finish starting")
-        time.sleep(60)
+    try:
+        c.startup()
+    except Exception as e:
+        wlogger.log(
+            tid, "Cannot establish SSH connection {0}".format(e), "warning")
+        wlogger.log(tid, "Ending server setup process.", "error")
+        return False
 
-    configure_OxIDPAuthentication(tid)
+    if primary_server.gluu_server:
+        # check if remote is gluu server
+        if c.exists(chroot):
+            wlogger.log(tid, 'Checking if remote is gluu server', 'success')
+        else:
+            wlogger.log(tid, "Remote is not a gluu server.", "error")
+            wlogger.log(tid, "Ending server setup process.", "error")
+            return False
 
-    wlogger.log(tid, "Checking replication status")
+    c.close()
 
-    cmd = ('OPENDJ_JAVA_HOME=/opt/jre /opt/opendj/bin/dsreplication status -n -X -h {} '
-            '-p 1444 -I admin -w \'{}\'').format(
-                    primary_server.ip,
-                    app_config.replication_pw.replace("'","\\'"))
+    # holds the OpenDJ keystore of the primary while it is copied over
+    tmp_dir = tempfile.mkdtemp(prefix='opendj-certs-')
+
+    cluster = get_servers()
+    ctx = {
+        'tid': tid,
+        'primary': server_info(primary_server),
+        'servers': dict((s.hostname, server_info(s)) for s in cluster),
+        'replication_pw': app_config.replication_pw,
+        'gluu_version': app_config.gluu_version,
+        'chroot_fs': chroot_fs,
+        'cert_dir': tmp_dir,
+    }
 
-    cmd = cmd_run.format(cmd)
-    run_command(tid, c, cmd, chroot)
+    # independent steps run in parallel, a failed run is resumed by the
+    # next one for the same servers
+    graph = StepGraph(replication_steps(
+                            primary_server.hostname,
+                            [s.hostname for s in servers],
+                            [s.hostname for s in cluster],
+                            initialize_all=server_id == 'all'))
+    try:
+        run = graph.run('opendjenablereplication:{}'.format(server_id), ctx,
+                        tid=tid, inputs={
+                            'primary': primary_server.hostname,
+                            'ips': dict((h, s.ip) for h, s in
+                                        ctx['servers'].items()),
+                            'gluu_version': app_config.gluu_version,
+                        })
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if run.status != 'success':
+        wlogger.log(tid, "Ending server setup process.", "error")
+        return False
 
-    c.close()
+    poll_replication_status.delay()
 
     return True
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=argument_host)
 def installNGINX(self, nginx_host):
     """Installs nginx load balancer
 
@@ -2166,8 +2608,8 @@ def installNGINX(self, nginx_host):
         nginx_host: hostname of server on which we will install nginx
     """
     tid = self.request.id
-    app_config = AppConfiguration.query.first()
-    pserver = Server.query.filter_by(primary_server=True).first()
+    app_config = get_app_config()
+    pserver = get_primary_server()
     wlogger.log(tid, "Making SSH connection to the server {}".format(
                                                                 nginx_host))
     c = RemoteClient(nginx_host)
@@ -2316,7 +2758,7 @@ def installNGINX(self, nginx_host):
         
         host_ip = []
 
-        servers = Server.query.all()
+        servers = get_servers()
 
         for ship in servers:
             host_ip.append((ship.hostname, ship.ip))
@@ -2347,14 +2789,14 @@ def upgrade_clustermgr_task(self, pip=False):
     return
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def register_objectclass(self, objcls):
     
     tid = self.request.id
-    primary = Server.query.filter_by(primary_server=True).first()
+    primary = get_primary_server()
 
-    servers = Server.query.all()
-    appconf = AppConfiguration.query.first()
+    servers = get_servers()
+    appconf = get_app_config()
 
     
     wlogger.log(tid, "Making LDAP connection to primary server {}".format(primary.hostname))
@@ -2385,13 +2827,13 @@ def register_objectclass(self, objcls):
     return True
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def update_httpd_certs_task(self, httpd_key, httpd_crt):
     
     tid = self.request.id
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
 
-    servers = Server.query.all()
+    servers = get_servers()
 
     if not appconf.external_load_balancer:
         mock_server = Server()
@@ -2442,9 +2884,9 @@ def update_httpd_certs_task(self, httpd_key, httpd_crt):
 
     return True
 
-@celery.task
+@celery.task(skip_if_running=True)
 def check_latest_version():
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
     if appconf:
         print "Checking latest version from github"
         result = requests.get('https://raw.githubusercontent.com/GluuFederation/cluster-mgr/master/clustermgr/__init__.py')
@@ -2454,3 +2896,41 @@ def check_latest_version():
         print "Latest github version is %s" % latest_version
         db.session.commit()
 
+
+@celery.task
+def poll_replication_status():
+    """Runs dsreplication status on the primary server and stores the parsed
+    result, see :object:`clustermgr.core.replication_status`
+    """
+    appconf = get_app_config()
+    primary = get_primary_server()
+    if not appconf or not primary or not appconf.replication_pw:
+        return
+
+    if not replication_status.acquire_poll_lock():
+        return
+    try:
+        result = get_opendj_replication_status()
+        if result[0]:
+            replication_status.store(result[1])
+        else:
+            replication_status.store_error(result[1])
+    finally:
+        replication_status.release_poll_lock()
+
+
+def get_replication_status(refresh=False):
+    """Returns the cached replication status and schedules a poll if it is
+    stale or `refresh` is set. The returned dictionary additionally has
+    the key `age`, seconds since the last successful poll.
+
+    Returns:
+        dict or None if the status has not been collected yet
+    """
+    status = replication_status.get()
+    if refresh or replication_status.is_stale(status):
+        poll_replication_status.delay()
+    if status:
+        status['age'] = int(time.time() - status['updated_at']) \
+            if status.get('updated_at') else None
+    return status
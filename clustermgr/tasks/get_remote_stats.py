@@ -6,8 +6,19 @@ import sys
 from clustermgr.extensions import celery
 from influxdb import InfluxDBClient
 from clustermgr.core.remote import RemoteClient
+from clustermgr.core.profiling import span
 from clustermgr.monitoring_scripts import sqlite_monitoring_tables
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.models import Server
+from clustermgr.core.config_cache import get_app_config, get_servers
+from clustermgr.core.utils import get_setup_properties
+from clustermgr.core.replication_lag import ProbeTarget, ensure_probe_base, \
+    measure_replication_lag
+from clustermgr.core.ldap_health import ldap_health, check_ldap_servers
+from clustermgr.core.service_health import service_health, check_servers, \
+    active_services
+from clustermgr.core.config_drift import ConfigNode, config_drift
+
+from flask import current_app as app
 
 #Python client of influxdb
 client = InfluxDBClient(
@@ -40,7 +51,9 @@ def write_influx(host, measurement, data):
                             "fields": fields,
                             })
     
-    client.write_points(json_body, time_precision='s')
+    with span('influxdb', 'localhost', measurement) as s:
+        client.write_points(json_body, time_precision='s')
+        s['bytes'] = len(json.dumps(json_body))
 
 
 def get_last_update_time(host, measurement):
@@ -127,13 +140,13 @@ def get_age(host, c):
     print "Monitoring: uptime {}".format(data['data'])
     write_influx(host, 'uptime', arg_d)
     
-@celery.task
+@celery.task(skip_if_running=True)
 def get_remote_stats():
-    app_conf = AppConfiguration.query.first()
+    app_conf = get_app_config()
     if app_conf:
         if app_conf.monitoring:
         
-            servers = Server.query.all()
+            servers = get_servers()
             for server in servers:
                 print "Monitoring: getting data for server {}".format(server.hostname)
                 c = RemoteClient(server.hostname, ip=server.ip)
@@ -144,3 +157,100 @@ def get_remote_stats():
                         get_age(server.hostname, c)
                 except Exception as e:
                     print "Monitoring: An error occurred while retreiveing monitoring data from server {}. Error {}".format(server.hostname, e)
+
+
+@celery.task(skip_if_running=True)
+def probe_replication_lag():
+    """Measures the replication lag between all replicating ldap servers and
+    writes it to influxdb. The measurement <source>_replication_lag has a
+    field per target server. A marker that did not arrive is recorded with
+    the timeout as its lag.
+    """
+    app_conf = get_app_config()
+    if not app_conf or not app_conf.monitoring:
+        return
+
+    binddn = "cn=directory manager"
+    if get_setup_properties()['ldap_type'] == "openldap":
+        binddn += ",o=gluu"
+
+    servers = [
+        ProbeTarget(server.hostname, '{}:1636'.format(server.hostname),
+                    binddn, server.ldap_password)
+        for server in get_servers()
+        if server.primary_server or server.mmr
+        ]
+    if len(servers) < 2:
+        return
+
+    for server in servers:
+        base_exists = ensure_probe_base(server)
+        if base_exists is not None:
+            break
+    if not base_exists:
+        # either no server is reachable or the container of the markers has
+        # just been created and should be replicated before probing
+        return
+
+    timeout = app.config['REPLICATION_LAG_TIMEOUT']
+    lags = measure_replication_lag(servers, timeout)
+    now = int(time.time())
+
+    for source, targets in lags.items():
+        fields = sorted(targets)
+        data = {
+            'fields': ['time'] + fields,
+            'data': [[now] + [float(timeout) if targets[f] is None
+                              else targets[f] for f in fields]],
+        }
+        print "Monitoring: replication lag from {}: {}".format(source, targets)
+        write_influx(source, 'replication_lag', data)
+
+
+@celery.task(skip_if_running=True)
+def probe_ldap_health():
+    """Checks all the ldap servers concurrently and stores the results for
+    the dashboard, see :mod:`clustermgr.core.ldap_health`
+    """
+    servers = get_servers()
+    results = check_ldap_servers([server.hostname for server in servers],
+                                 timeout=app.config['LDAP_HEALTH_TIMEOUT'])
+    ldap_health.store(dict((server.id, results[server.hostname])
+                           for server in servers))
+
+
+@celery.task(skip_if_running=True)
+def check_service_health():
+    """Checks the web services of all the servers concurrently and stores
+    the results for the dashboard, see :mod:`clustermgr.core.service_health`
+    """
+    servers = get_servers()
+    services = active_services(get_setup_properties())
+    results = check_servers([server.hostname for server in servers], services,
+                            timeout=app.config['SERVICE_HEALTH_TIMEOUT'])
+    service_health.store(dict((server.id, results[server.hostname])
+                              for server in servers))
+
+
+@celery.task(skip_if_running=True)
+def check_config_drift():
+    """Compares the Gluu configuration of all the ldap servers with the one
+    of the primary server, see :mod:`clustermgr.core.config_drift`
+    """
+    servers = Server.query.order_by(Server.primary_server.desc()).all()
+    if len(servers) < 2:
+        return
+
+    setup_prop = get_setup_properties()
+    binddn = "cn=directory manager"
+    if setup_prop['ldap_type'] == "openldap":
+        binddn += ",o=gluu"
+
+    nodes = [ConfigNode(server.hostname, '{}:1636'.format(server.hostname),
+                        binddn, server.ldap_password)
+             for server in servers]
+
+    report = config_drift.check(nodes, setup_prop['inumAppliance'])
+    if report['drift']:
+        print "Monitoring: configuration drift in {}".format(
+                                            ', '.join(sorted(report['drift'])))
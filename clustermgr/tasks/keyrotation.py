@@ -3,21 +3,20 @@ import os
 from datetime import datetime
 
 from celery.utils.log import get_task_logger
-from ldap3 import Connection
 from ldap3 import BASE
 from ldap3 import MODIFY_REPLACE
-from ldap3 import Server as Ldap3Server
 from ldap3.core.exceptions import LDAPSocketOpenError
 
 from ..core.remote import RemoteClient
 from ..core.utils import random_chars
 from ..core.utils import exec_cmd
 from ..core.utils import parse_setup_properties
+from ..core.ldap_functions import ldap_pool
 from ..extensions import celery
 from ..extensions import db
 from ..models import KeyRotation
 from ..models import Server
-from ..models import AppConfiguration
+from ..core.config_cache import get_app_config
 
 task_logger = get_task_logger(__name__)
 
@@ -70,71 +69,74 @@ def modify_oxauth_config(kr, pub_keys=None, openid_jks_pass=""):
         task_logger.warn("Public keys are not available.")
         return False
 
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
 
     for server in Server.query:
         props = get_props(server, appconf.gluu_version)
         binddn = "cn=Directory Manager"
 
-        s = Ldap3Server(host=server.ip, port=1636, use_ssl=True)
         try:
-            conn = Connection(s, user=binddn, password=server.ldap_password, auto_bind=True)
+            # the connection goes back to the pool however the block is left
+            with ldap_pool.connection("{}:1636".format(server.ip), binddn,
+                                      server.ldap_password) as conn:
+                if not conn.bound:
+                    task_logger.warn("Unable to bind to LDAP at {}; trying other server (if possible).".format(server.hostname))
+                    continue
+
+                # base DN for oxAuth config
+                oxauth_base = ",".join([
+                    "ou=oxauth",
+                    "ou=configuration",
+                    "inum={}".format(props.get("inumAppliance")),
+                    "ou=appliances",
+                    "o=gluu",
+                ])
+
+                conn.search(search_base=oxauth_base,
+                            search_filter="(objectClass=*)",
+                            search_scope=BASE, attributes=['*'])
+
+                if not conn.entries:
+                    # search failed due to missing entry
+                    task_logger.warn("Unable to find oxAuth config.")
+                    continue
+
+                entry = conn.entries[0]
+
+                # oxRevision is increased to make update
+                ox_rev = str(int(entry['oxRevision'].values[0]) + 1)
+
+                # update public keys if necessary
+                keys_conf = json.loads(entry['oxAuthConfWebKeys'].values[0])
+                keys_conf["keys"] = pub_keys
+                serialized_keys_conf = json.dumps(keys_conf)
+
+                dyn_conf = json.loads(entry["oxAuthConfDynamic"].values[0])
+                dyn_conf.update({
+                    "keyRegenerationEnabled": False,  # always set to False
+                    "keyRegenerationInterval": kr.interval,
+                    "defaultSignatureAlgorithm": "RS512",
+                })
+
+                dyn_conf.update({
+                    "webKeysStorage": "keystore",
+                    "keyStoreSecret": openid_jks_pass,
+                })
+                serialized_dyn_conf = json.dumps(dyn_conf)
+
+                # update the attributes
+                task_logger.info("Modifying oxAuth configuration.")
+                conn.modify(entry.entry_dn, {
+                    'oxRevision': [(MODIFY_REPLACE, [ox_rev])],
+                    'oxAuthConfWebKeys': [(MODIFY_REPLACE, [serialized_keys_conf])],
+                    'oxAuthConfDynamic': [(MODIFY_REPLACE, [serialized_dyn_conf])],
+                })
+
+                return conn.result["description"] == "success"
         except LDAPSocketOpenError:
             task_logger.warn("Unable to connecto to LDAP at {}; trying other server (if possible).".format(server.hostname))
             continue
 
-        # base DN for oxAuth config
-        oxauth_base = ",".join([
-            "ou=oxauth",
-            "ou=configuration",
-            "inum={}".format(props.get("inumAppliance")),
-            "ou=appliances",
-            "o=gluu",
-        ])
-
-        conn.search(search_base=oxauth_base, search_filter="(objectClass=*)",
-                    search_scope=BASE, attributes=['*'])
-
-        if not conn.entries:
-            # search failed due to missing entry
-            task_logger.warn("Unable to find oxAuth config.")
-            continue
-
-        entry = conn.entries[0]
-
-        # oxRevision is increased to make update
-        ox_rev = str(int(entry['oxRevision'].values[0]) + 1)
-
-        # update public keys if necessary
-        keys_conf = json.loads(entry['oxAuthConfWebKeys'].values[0])
-        keys_conf["keys"] = pub_keys
-        serialized_keys_conf = json.dumps(keys_conf)
-
-        dyn_conf = json.loads(entry["oxAuthConfDynamic"].values[0])
-        dyn_conf.update({
-            "keyRegenerationEnabled": False,  # always set to False
-            "keyRegenerationInterval": kr.interval,
-            "defaultSignatureAlgorithm": "RS512",
-        })
-
-        dyn_conf.update({
-            "webKeysStorage": "keystore",
-            "keyStoreSecret": openid_jks_pass,
-        })
-        serialized_dyn_conf = json.dumps(dyn_conf)
-
-        # update the attributes
-        task_logger.info("Modifying oxAuth configuration.")
-        conn.modify(entry.entry_dn, {
-            'oxRevision': [(MODIFY_REPLACE, [ox_rev])],
-            'oxAuthConfWebKeys': [(MODIFY_REPLACE, [serialized_keys_conf])],
-            'oxAuthConfDynamic': [(MODIFY_REPLACE, [serialized_dyn_conf])],
-        })
-
-        result = conn.result["description"]
-        conn.unbind()
-        return result == "success"
-
     # default return value
     return False
 
@@ -174,7 +176,7 @@ def _rotate_keys(kr, javalibs_dir, jks_path):
         db.session.add(kr)
         db.session.commit()
 
-        appconf = AppConfiguration.query.first()
+        appconf = get_app_config()
 
         for server in Server.query:
             c = RemoteClient(server.hostname, ip=server.ip)
@@ -190,7 +192,7 @@ def _rotate_keys(kr, javalibs_dir, jks_path):
             c.close()
 
 
-@celery.task
+@celery.task(skip_if_running=True)
 def schedule_key_rotation():
     kr = KeyRotation.query.first()
 
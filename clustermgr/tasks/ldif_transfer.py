@@ -0,0 +1,106 @@
+import os
+import time
+
+from flask import current_app as app
+
+from clustermgr.models import Server
+from clustermgr.extensions import wlogger, celery
+from clustermgr.core.utils import get_setup_properties
+from clustermgr.core.ldif_pipeline import LdifImporter, export_ldif
+from clustermgr.core.task_locks import server_hosts
+
+
+def get_bind_dn():
+    binddn = "cn=directory manager"
+    if get_setup_properties()['ldap_type'] == "openldap":
+        binddn += ",o=gluu"
+    return binddn
+
+
+def log_progress(tid, action):
+    """Returns a progress callback writing throughput to the task log"""
+    def progress(stats):
+        wlogger.log(tid, "{} {} entries in {} seconds, {} entries/s".format(
+                    action, stats.get('entries', 0), stats['elapsed'],
+                    stats['rate']))
+    return progress
+
+
+@celery.task(bind=True, locked_hosts=server_hosts)
+def import_ldif(self, server_id, ldif_file, update_existing=False):
+    """Imports an LDIF file into the LDAP server. An interrupted import is
+    resumed when the task is started again for the same file.
+
+    Args:
+        server_id (int): id of the server to import to
+        ldif_file (string): path of the LDIF file
+        update_existing (boolean): replace the attributes of existing entries
+    """
+    tid = self.request.id
+    server = Server.query.get(server_id)
+
+    importer = LdifImporter(
+        ldif_file, '{}:1636'.format(server.ip), get_bind_dn(),
+        server.ldap_password,
+        workers=app.config['LDIF_IMPORT_WORKERS'],
+        batch_size=app.config['LDIF_IMPORT_BATCH_SIZE'],
+        update_existing=update_existing,
+        checkpoint_file=ldif_file + '.checkpoint',
+        progress=log_progress(tid, "Imported"),
+        )
+
+    if importer.checkpoint.entries:
+        wlogger.log(tid, "Resuming import after entry {} ({})".format(
+                    importer.checkpoint.entries, importer.checkpoint.dn))
+
+    wlogger.log(tid, "Importing {} to {}".format(
+                os.path.basename(ldif_file), server.hostname))
+
+    try:
+        stats = importer.run()
+    except Exception as e:
+        wlogger.log(tid, "Import failed: {}".format(e), "error")
+        wlogger.log(tid, "Start the import of the same file again to resume "
+                    "it", "warning")
+        return False
+
+    wlogger.log(tid, "{} entries added, {} updated, {} skipped".format(
+                stats.get('added', 0), stats.get('updated', 0),
+                stats.get('skipped', 0)), "success")
+
+    if stats.get('rejected'):
+        wlogger.log(tid, "{} entries were rejected and written to {}".format(
+                    stats['rejected'], importer.rejects_file), "warning")
+
+    return True
+
+
+@celery.task(bind=True)
+def export_ldif_task(self, server_id, base_dn):
+    """Exports the subtree under base_dn of the LDAP server to a gzip
+    compressed LDIF file in LDIF_DIR.
+
+    Args:
+        server_id (int): id of the server to export from
+        base_dn (string): base of the subtree to export
+    """
+    tid = self.request.id
+    server = Server.query.get(server_id)
+
+    ldif_file = os.path.join(app.config['LDIF_DIR'], '{}-{}-{}.ldif.gz'.format(
+                    server.hostname, base_dn.replace('=', '_').replace(',', '_'),
+                    time.strftime('%Y%m%d%H%M%S')))
+
+    wlogger.log(tid, "Exporting {} from {}".format(base_dn, server.hostname))
+
+    try:
+        stats = export_ldif('{}:1636'.format(server.ip), get_bind_dn(),
+                            server.ldap_password, base_dn, ldif_file,
+                            progress=log_progress(tid, "Exported"))
+    except Exception as e:
+        wlogger.log(tid, "Export failed: {}".format(e), "error")
+        return False
+
+    wlogger.log(tid, "{} entries were exported to {}".format(
+                stats.get('entries', 0), ldif_file), "success")
+    return True
@@ -21,7 +21,7 @@ Thank you!
 Gluu, Inc."""
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, skip_if_running=True)
 def send_reminder_email(self):
     data, _ = license_manager.validate_license()
 
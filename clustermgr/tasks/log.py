@@ -6,11 +6,12 @@ from flask import render_template
 from influxdb import InfluxDBClient
 
 from ..core.remote import RemoteClient
+from ..core.profiling import span
 from ..extensions import celery
 from ..extensions import db
 from ..extensions import wlogger
-from ..models import AppConfiguration
-from ..models import Server
+from ..core.config_cache import get_app_config, get_servers
+from ..core.task_locks import cluster_hosts
 
 task_logger = get_task_logger(__name__)
 
@@ -119,7 +120,10 @@ def collect_logs(host, ip, path, influx_fmt=True):
     influx = InfluxDBClient(database=dbname)
     try:
         influx.create_database(dbname)
-        if influx.write_points(logs):
+        with span('influxdb', 'localhost', dbname) as s:
+            written = influx.write_points(logs)
+            s['bytes'] = len(json.dumps(logs))
+        if written:
             logs_collected = True
     except Exception as exc:
         task_logger.warn(
@@ -171,7 +175,7 @@ def _render_filebeat_config(task_id, server, rc):
     """Renders filebeat config and upload to a server.
     """
     # render filebeat.yml and upload to server
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
 
     with current_app.app_context():
         ctx = {
@@ -211,13 +215,13 @@ def _restart_filebeat(task_id, server, rc):
     return stdout, stderr
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def setup_filebeat(self, force_install=False):
     """Setup filebeat to collect logs.
     """
     tid = self.request.id
-    servers = Server.query.all()
-    appconf = AppConfiguration.query.first()
+    servers = get_servers()
+    appconf = get_app_config()
 
 
     for server in servers:
@@ -342,12 +346,12 @@ def _uninstall_filebeat(task_id, server, rc):
     return stdout, stderr
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def remove_filebeat(self):
     """Removes filebeat.
     """
     tid = self.request.id
-    servers = Server.query.all()
+    servers = get_servers()
 
     for server in servers:
         # establishes SSH connection
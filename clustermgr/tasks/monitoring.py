@@ -3,10 +3,11 @@ import os
 import getpass
 import time
 
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.core.config_cache import get_app_config, get_servers
 from clustermgr.extensions import db, wlogger, celery
 from clustermgr.core.remote import RemoteClient
 from clustermgr.core.ldap_functions import DBManager
+from clustermgr.core.task_locks import cluster_hosts
 from clustermgr.tasks.cluster import get_os_type
 
 from flask import current_app as app
@@ -104,9 +105,9 @@ def install_local(self):
     """
     
     tid = self.request.id
-    servers = Server.query.all()
+    servers = get_servers()
     
-    app_config = AppConfiguration.query.first()
+    app_config = get_app_config()
     
     #create fake remote class that provides the same interface with RemoteClient
     fc = FakeRemote()
@@ -258,7 +259,7 @@ def install_local(self):
     return True
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def install_monitoring(self):
     
     """Celery task that installs monitoring components to remote server.
@@ -270,8 +271,8 @@ def install_monitoring(self):
     
     tid = self.request.id
     installed = 0
-    servers = Server.query.all()
-    app_config = AppConfiguration.query.first()
+    servers = get_servers()
+    app_config = get_app_config()
     
     for server in servers:
         # 1. Make SSH Connection to the remote server
@@ -421,7 +422,7 @@ def install_monitoring(self):
     db.session.commit()
     return True
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def remove_monitoring(self, local_id):
     
     """Celery task that removes monitoring components to remote server.
@@ -432,8 +433,8 @@ def remove_monitoring(self, local_id):
     """
     tid = self.request.id
     installed = 0
-    servers = Server.query.all()
-    app_config = AppConfiguration.query.first()
+    servers = get_servers()
+    app_config = get_app_config()
     for server in servers:
         # 1. Make SSH Connection to the remote server
         wlogger.log(tid, "Making SSH connection to the server {0}".format(
@@ -517,7 +518,7 @@ def remove_monitoring(self, local_id):
 
 
     #Flag database that configuration is done for local machine
-    app_config = AppConfiguration.query.first()
+    app_config = get_app_config()
     app_config.monitoring = False
     db.session.commit()
 
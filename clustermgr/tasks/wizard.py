@@ -1,26 +1,28 @@
 import json
 import os
 import getpass
-import re
 import time
 
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.models import Server
+from clustermgr.core.config_cache import get_app_config, get_primary_server
 from clustermgr.extensions import db, wlogger, celery
 from clustermgr.core.remote import RemoteClient
 from clustermgr.core.utils import run_and_log
-from clustermgr.tasks.cluster import get_os_type, makeOpenDjListenIpAddr,\
+from clustermgr.tasks.cluster import makeOpenDjListenIpAddr,\
         get_chroot, get_run_cmd
 from clustermgr.core.clustermgr_installer import Installer
 from clustermgr.config import Config
 from clustermgr.core.utils import get_setup_properties, \
         write_setup_properties_file, get_oxauth_version
 from clustermgr.core.change_gluu_host import ChangeGluuHostname
+from clustermgr.core.host_facts import host_facts
+from clustermgr.core.task_locks import cluster_hosts
 
 from flask import current_app as app
 
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def wizard_step1(self):
     
     """Celery task that collects information about server.
@@ -35,9 +37,9 @@ def wizard_step1(self):
 
     wlogger.log(tid, "Analayzing Current Server")
 
-    server = Server.query.filter_by(primary_server=True).first()
+    server = get_primary_server()
 
-    app_conf = AppConfiguration.query.first()
+    app_conf = get_app_config()
     
     c = RemoteClient(server.hostname, ip=server.ip)
 
@@ -49,7 +51,8 @@ def wizard_step1(self):
         wlogger.log(tid, "Ending analyzation of server.", 'error')
         return
 
-    os_type = get_os_type(c)
+    facts = host_facts.get(server.hostname, client=c)
+    os_type = facts['os_type']
     
     server.os = os_type
     
@@ -59,41 +62,20 @@ def wizard_step1(self):
     oxauth_version = None
 
     #Determine if a version of gluu server was installed.
-    r = c.listdir("/opt")
-    if r[0]:
-        for s in r[1]:
-            m=re.search('gluu-server-(?P<gluu_version>(\d+).(\d+).(\d+)(.\d+)?)$',s)
-            if m:
-                gluu_path_version = m.group("gluu_version")
-                
-                wlogger.log(tid, "Gluu path was determined as gluu-server-{}".format(
-                                                        gluu_path_version), 'debug')
-                
-                
-                oxauth_path = '/opt/gluu-server-{0}/opt/gluu/jetty/oxauth/webapps/oxauth.war'.format(gluu_path_version)
-                
-                try:
-                    result = c.run('''python -c "import zipfile;zf=zipfile.ZipFile('{}','r');print zf.read('META-INF/MANIFEST.MF')"'''.format(oxauth_path))
-                
-                    menifest = result[1]
-
-                    for l in menifest.split('\n'):
-                        ls = l.strip()
-                        if 'Implementation-Version:' in ls:
-                            version = ls.split(':')[1].strip()
-                            oxauth_version = '.'.join(version.split('.')[:3])
-                            
-                            wlogger.log(tid, "oxauth version was determined as {}".format(
-                                                                oxauth_version), 'debug')
-                            app_conf.gluu_version = oxauth_version
-                            break
-                except:
-                    pass
-
-                if not oxauth_version:
-                    wlogger.log(tid, "Error determining oxauth version.", 'debug')
-                    wlogger.log(tid, "Setting gluu version to path version", 'debug')            
-                    app_conf.gluu_version = gluu_path_version
+    for gluu_path_version in facts['gluu_versions'] or []:
+        wlogger.log(tid, "Gluu path was determined as gluu-server-{}".format(
+                                                gluu_path_version), 'debug')
+
+        oxauth_version = (facts['oxauth_versions'] or {}).get(
+                                                        gluu_path_version)
+        if oxauth_version:
+            wlogger.log(tid, "oxauth version was determined as {}".format(
+                                                oxauth_version), 'debug')
+            app_conf.gluu_version = oxauth_version
+        else:
+            wlogger.log(tid, "Error determining oxauth version.", 'debug')
+            wlogger.log(tid, "Setting gluu version to path version", 'debug')
+            app_conf.gluu_version = gluu_path_version
 
     
     if not gluu_path_version:
@@ -132,14 +114,14 @@ def wizard_step1(self):
     db.session.commit()
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, locked_hosts=cluster_hosts)
 def wizard_step2(self):
     tid = self.request.id
 
     setup_prop = get_setup_properties()
     
-    server = Server.query.filter_by(primary_server=True).first()
-    app_conf = AppConfiguration.query.first()
+    server = get_primary_server()
+    app_conf = get_app_config()
     
     gluu_path_version = None
     
@@ -157,12 +139,10 @@ def wizard_step2(self):
         wlogger.log(tid, "Ending changing name.", 'error')
         return
     
-    r = c.listdir("/opt")
-    if r[0]:
-        for s in r[1]:
-            m=re.search('gluu-server-(?P<gluu_version>(\d+).(\d+).(\d+)(.\d+)?)$',s)
-            if m:
-                gluu_path_version = m.group("gluu_version")
+    gluu_versions = host_facts.get(server.hostname, ['gluu_versions'],
+                                   client=c)['gluu_versions']
+    if gluu_versions:
+        gluu_path_version = gluu_versions[-1]
                 
     if not gluu_path_version:
         wlogger.log(tid, "Error determining version from path", 'error')
@@ -191,6 +171,9 @@ def wizard_step2(self):
                 wlogger.log(tid, "Executing " + cmd, 'debug')
                 c.run(cmd)
 
+            # the container was moved to the path of the oxauth version
+            host_facts.invalidate(server.hostname)
+
             #wait server to start
             time.sleep(30)
         
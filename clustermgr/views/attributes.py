@@ -11,7 +11,7 @@ from celery.result import AsyncResult
 
 
 from clustermgr.extensions import db, wlogger
-from clustermgr.models import AppConfiguration, Server  # , KeyRotation
+from clustermgr.core.config_cache import get_app_config, get_primary_server
 from clustermgr.forms import AppConfigForm, SchemaForm, \
     TestUser, InstallServerForm, LdapSchema  # , KeyRotationForm
 
@@ -38,7 +38,7 @@ attributes.before_request(license_reminder)
 @login_required
 def home():
     try:
-        appconf = AppConfiguration.query.first()
+        appconf = get_app_config()
     except:
         return render_template('index_nodb.html')
     
@@ -50,21 +50,18 @@ def home():
     if not appconf.object_class_base:
         return redirect(url_for('attributes.object_class'))
    
-    server = Server.query.filter_by(primary_server=True).first()
+    server = get_primary_server()
    
     ldp = getLdapConn(  server.hostname,
                         "cn=directory manager",
                         server.ldap_password
                         )
     attrib_list_in_class = []
-    objcl_s = ldp.getObjectClass(appconf.object_class_base)
-    if objcl_s:
-        objcl_obj = ObjectClass(objcl_s)
+    objcl_obj = ldp.getSchema().get_class(appconf.object_class_base)
+    if objcl_obj:
         attrib_list_in_class = list(objcl_obj.may)
    
-    attrib_list = []
-    attrib_list_s = ldp.getCustomAttributes()
-    attrib_list = [ AttributeType(str(a)) for a in attrib_list_s ]
+    attrib_list = ldp.getCustomAttributeTypes()
    
    
     return render_template('attributes.html', 
@@ -75,7 +72,7 @@ def home():
     
 @attributes.route('/objectclass')
 def object_class():
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
     if appconf.object_class_base:
         flash("Object classname was allready determined")
         return redirect(url_for('attributes.home'))
@@ -83,7 +80,7 @@ def object_class():
     
 @attributes.route('/createobjecclass')
 def create_objecclass():
-    server = Server.query.filter_by(primary_server=True).first()
+    server = get_primary_server()
     #object_class_choice = request.args.get('gluuObjectClass', '1')
     #if object_class_choice == '1':
     #    object_class = 'gluuCustomPerson'
@@ -119,8 +116,8 @@ def get_custom_schema_path():
 
 @attributes.route('/editattribute', methods=['GET', 'POST'])
 def edit_attribute():
-    server = Server.query.filter_by(primary_server=True).first()
-    appconf = AppConfiguration.query.first()
+    server = get_primary_server()
+    appconf = get_app_config()
         
     editing = request.args.get('oid')
     syntax_file = os.path.join(app.config["DATA_DIR"],'syntaxes.json')
@@ -156,7 +153,7 @@ def edit_attribute():
         
             a_s=ldp.getAttributebyOID(editing)
             if a_s:
-                a = AttributeType(str(a_s))
+                a = ldp.getSchema().get_attribute(editing)
         
                 form.oid.data = a.oid
                 form.names.data = ' '.join(a.names)
@@ -222,20 +219,15 @@ def edit_attribute():
                 flash(result[1], 'danger')
             else:
                 flash('Attribute {} was added'.format(names), 'success')
-                
-                r = ldp.addAtributeToObjectClass(appconf.object_class_base, names)
-                if r[0]:
-                    flash('Attribute {} was added to object class {}'.format(names, appconf.object_class_base), 'success')
-                    return redirect(url_for('attributes.home'))
-                else:
-                    flash('Could not add attribute {} to object class {}. Reason: {}'.format(names, appconf.object_class_base, r[1]), 'danger')
+                flash('Attribute {} was added to object class {}'.format(names, appconf.object_class_base), 'success')
+                return redirect(url_for('attributes.home'))
         
     return render_template('schema_form.html', form=form)
 
 @attributes.route('/uploadschemaprimary')
 def upload_schema_to_primary():
-    server = Server.query.filter_by(primary_server=True).first()
-    appconf = AppConfiguration.query.first()
+    server = get_primary_server()
+    appconf = get_app_config()
     
     my_schema = OpenDjSchema(custom_schema_path)
     custom_schema = OpenDjSchema('/tmp/77-customAttributes.ldif')
@@ -260,22 +252,23 @@ def upload_schema_to_primary():
 
 @attributes.route('/removeattribute/<oid>/<name>')
 def remove_attribute(oid,name):
-    server = Server.query.filter_by(primary_server=True).first()
-    appconf = AppConfiguration.query.first()
+    server = get_primary_server()
+    appconf = get_app_config()
     ldp = getLdapConn(  server.hostname,
                         "cn=directory manager",
                         server.ldap_password
                         )
-    ldp.removeAtributeFromObjectClass(appconf.object_class_base, name)
-    ldp.removeAttribute(oid)
+    r = ldp.removeAttribute(oid, appconf.object_class_base)
+    if not r[0]:
+        flash(r[1], 'danger')
 
     return redirect(url_for('attributes.home'))
 
 
 @attributes.route('/repopulateobjectclass')
 def repopulate_objectclass():
-    server = Server.query.filter_by(primary_server=True).first()
-    appconf = AppConfiguration.query.first()
+    server = get_primary_server()
+    appconf = get_app_config()
         
     setup_prop = get_setup_properties()
     inumOrg = setup_prop['inumOrg']
@@ -292,10 +285,7 @@ def repopulate_objectclass():
                         
     attrib_list_in_class = []
     
-    objcl_s = ldp.getObjectClass(appconf.object_class_base)
-
-    attrib_list_s = ldp.getCustomAttributes()
-    attrib_list = [ AttributeType(str(a)) for a in attrib_list_s ]
+    attrib_list = ldp.getCustomAttributeTypes()
     attrib_name_list = [ a.names[0] for a in attrib_list ]
 
     r = ldp.addAtributeToObjectClass(appconf.object_class_base, attrib_name_list)
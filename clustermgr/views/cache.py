@@ -7,7 +7,7 @@ from flask import Blueprint, render_template, url_for, flash, redirect, \
 
 from flask_login import login_required
 
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.models import Server
 from clustermgr.tasks.cache import install_cache_cluster
 
 
@@ -19,6 +19,7 @@ from clustermgr.core.utils import get_redis_config, get_cache_servers, random_ch
 from clustermgr.forms import CacheSettingsForm, cacheServerForm
 
 from clustermgr.models import db, CacheServer
+from clustermgr.core.config_cache import get_app_config, get_servers
 
 
 cache_mgr = Blueprint('cache_mgr', __name__, template_folder='templates')
@@ -30,8 +31,8 @@ cache_mgr.before_request(license_reminder)
 @cache_mgr.route('/')
 @login_required
 def index():
-    servers = Server.query.all()
-    appconf = AppConfiguration.query.first()
+    servers = get_servers()
+    appconf = get_app_config()
 
     if not appconf:
         flash("The application needs to be configured first. Kindly set the "
@@ -69,7 +70,7 @@ def get_servers_and_list():
     if server_id:
         servers = [ Server.query.get(int(server_id)) ]
     else:
-        servers = Server.query.all()
+        servers = get_servers()
 
     server_id_list = [ s.id for s in servers ]
     
@@ -87,7 +88,7 @@ def install():
 
     else:
         cache_servers = get_cache_servers()
-        servers = Server.query.all()
+        servers = get_servers()
 
     if not servers:
         return redirect(url_for('cache_mgr.index'))
@@ -153,7 +154,7 @@ def add_cache_server():
 def get_status():
 
     status={'redis':{}, 'stunnel':{}}
-    servers = Server.query.all()
+    servers = get_servers()
     
     check_cmd = 'python -c "import socket;s=socket.socket(socket.AF_INET,socket.SOCK_STREAM);print s.connect_ex((\'{0}\', {1}))"'
     
@@ -8,17 +8,22 @@ from requests.packages.urllib3.exceptions import InsecureRequestWarning
 http_requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
 from flask import Blueprint, render_template, url_for, flash, redirect, \
-    session, request
+    session, request, jsonify, abort
 from flask_login import login_required
 from flask import current_app as app
 
 from clustermgr.core.ldap_functions import LdapOLC, getLdapConn
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.models import Server
+from clustermgr.core.config_cache import get_app_config, get_servers, \
+    get_primary_server
 from clustermgr.tasks.cluster import  \
-    installGluuServer, installNGINX, \
+    installGluuServer, install_gluu_cluster, installNGINX, \
     setup_filesystem_replication, opendjenablereplication, \
     remove_server_from_cluster, remove_filesystem_replication, \
     opendj_disable_replication_task, update_filesystem_replication_paths
+from clustermgr.tasks.cache import install_cache_cluster
+from clustermgr.core.dry_run import plan_task
+from clustermgr.core.utils import get_cache_servers
 
 from clustermgr.core.remote import RemoteClient
 
@@ -201,7 +206,7 @@ def install_gluu_server(server_id):
     """
 
     server = Server.query.get(server_id)
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
 
     # Start gluu server installation celery task
     task = installGluuServer.delay(server_id)
@@ -216,6 +221,38 @@ def install_gluu_server(server_id):
     return render_template("logger.html", heading=head, server=server.hostname,
                            task=task, nextpage=nextpage, whatNext=whatNext)
 
+@cluster.route('/install_gluu_cluster/')
+@login_required
+def install_gluu_cluster_view():
+    """Initiates installation of gluu server on the primary server, if it is
+    not installed or include_primary is requested, and on all the servers
+    which are not installed yet
+    """
+    pserver = get_primary_server()
+    if not pserver:
+        flash("Please identify primary server before starting to install Gluu "
+              "Server.", "warning")
+        return redirect(url_for('index.home'))
+
+    servers = [server for server in get_servers() if not server.primary_server
+               and not server.gluu_server]
+    if request.args.get('include_primary') or not pserver.gluu_server:
+        servers.insert(0, pserver)
+
+    if not servers:
+        flash("Gluu Server is installed on all servers", "info")
+        return redirect(url_for('index.home'))
+
+    appconf = get_app_config()
+    task = install_gluu_cluster.delay([server.id for server in servers])
+
+    head = "Installing Gluu Server ({0}) on {1} servers".format(
+                                                    appconf.gluu_version,
+                                                    len(servers))
+    return render_template("cluster_install_logger.html", heading=head,
+                           servers=servers, task_id=task.id)
+
+
 def checkNginxStatus(nginxhost):
     try:
         r=  http_requests.get('https://{}/clustermgrping'.format(nginxhost),
@@ -232,7 +269,7 @@ def checkNginxStatus(nginxhost):
 @login_required
 def install_nginx():
     """Initiates installation of nginx load balancer"""
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
 
     if not request.args.get('next') == 'install':
         status = checkNginxStatus(appconf.nginx_host)
@@ -271,6 +308,34 @@ def opendj_enable_replication(server_id):
 
 
 
+@cluster.route('/plan/<operation>/')
+@login_required
+def plan_operation(operation):
+    """Shows the commands, file transfers and LDAP changes the operation
+    would make on every server and its estimated duration, without running
+    it."""
+
+    if operation == 'opendjenablereplication':
+        server_id = request.args.get('server_id', 'all')
+        plan = plan_task(opendjenablereplication, server_id)
+        head = "Enabling Replication"
+    elif operation == 'setup_filesystem_replication':
+        plan = plan_task(setup_filesystem_replication)
+        head = "File System Replication"
+    elif operation == 'install_cache_cluster':
+        plan = plan_task(install_cache_cluster,
+                         [server.id for server in get_servers()],
+                         [server.id for server in get_cache_servers()])
+        head = "Cache Cluster Setup"
+    else:
+        abort(404)
+
+    if request.args.get('format') == 'json':
+        return jsonify(plan.to_dict())
+
+    return render_template('operation_plan.html', heading=head, plan=plan)
+
+
 def chekFSR(server, gluu_version):
     c = RemoteClient(server.hostname, ip=server.ip)
     
@@ -311,8 +376,8 @@ def chekFSR(server, gluu_version):
 def file_system_replication():
     """File System Replication view"""
 
-    app_config = AppConfiguration.query.first()
-    servers = Server.query.all()
+    app_config = get_app_config()
+    servers = get_servers()
 
     csync = 0
 
@@ -388,7 +453,7 @@ def file_system_replication():
 @cluster.route('/updatefsreppath', methods=["POST"])
 @login_required
 def update_fsrep_path():
-    servers = Server.query.all()
+    servers = get_servers()
 
     fsr_paths = request.form['fs_paths']
 
@@ -404,7 +469,7 @@ def update_fsrep_path():
 @cluster.route('/removefsrep')
 @login_required
 def remove_file_system_replication():
-    servers = Server.query.all()
+    servers = get_servers()
     task = remove_filesystem_replication.delay()
 
     return render_template('fsr_remove_logger.html', step=1,
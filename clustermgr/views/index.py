@@ -5,7 +5,7 @@ import json
 import glob
 
 from flask import Blueprint, render_template, redirect, url_for, flash, \
-    request, jsonify, session, current_app
+    request, jsonify, session, current_app, Response, stream_with_context
 from flask import current_app as app
 from flask_login import login_required
 from flask_login import current_user
@@ -14,7 +14,9 @@ from celery.result import AsyncResult
 
 
 from clustermgr.extensions import db, wlogger, csrf
-from clustermgr.models import AppConfiguration, Server  # , KeyRotation
+from clustermgr.models import AppConfiguration, Server, TaskProfile  # , KeyRotation
+from clustermgr.core.config_cache import get_app_config, get_servers, \
+    get_primary_server
 from clustermgr.forms import AppConfigForm, SchemaForm, \
     TestUser, InstallServerForm, LdapSchema  # , KeyRotationForm
 
@@ -26,7 +28,8 @@ from clustermgr.core.ldifschema_utils import OpenDjSchema
 
 
 
-from clustermgr.tasks.cluster import upgrade_clustermgr_task
+from clustermgr.tasks.cluster import upgrade_clustermgr_task, \
+    get_replication_status
 # from clustermgr.core.utils import encrypt_text
 # from clustermgr.core.utils import generate_random_key
 # from clustermgr.core.utils import generate_random_iv
@@ -39,7 +42,8 @@ from clustermgr.core.remote import RemoteClient, FakeRemote, ClientNotSetupExcep
 from clustermgr.core.clustermgr_installer import Installer
 from clustermgr.tasks.cluster import get_os_type
 
-from clustermgr.core.utils import get_opendj_replication_status, as_boolean
+from clustermgr.core.utils import as_boolean
+from clustermgr.core.profiling import flame_tree
 
 from clustermgr.core.ldifschema_utils import OpenDjSchema
 
@@ -67,14 +71,14 @@ def home():
         del session['nongluuldapinfo']
     
     try:
-        appconf = AppConfiguration.query.first()
+        appconf = get_app_config()
     except:
         return render_template('index_nodb.html')
     
     if not appconf:
         return render_template('intro.html', setup='cluster')
 
-    servers = Server.query.all()
+    servers = get_servers()
     if not servers:
         return render_template('intro.html', setup='server')
 
@@ -142,7 +146,7 @@ def app_configuration():
     # create forms
     conf_form = AppConfigForm()
     sch_form = SchemaForm()
-    config = AppConfiguration.query.first()
+    config = get_app_config()
     schemafiles = os.listdir(app.config['SCHEMA_DIR'])
 
 
@@ -399,13 +403,21 @@ def app_configuration():
 
 
 
-@index.route('/log/<task_id>')
-@login_required
-def get_log(task_id):
-    
+def _since_arg():
+    # index of the first message the client has not seen yet
+    since = request.args.get('since', 0, type=int)
+    if since < 0:
+        since = 0
+    return since
+
+
+def _task_log(task_id, since, count=None):
+    """Collects the task messages starting at `since` along with the task
+    state and result, the payload shared by the log poll and stream views.
+    """
     global msg_text
-    
-    msgs = wlogger.get_messages(task_id)
+
+    msgs = wlogger.get_messages(task_id, since, count)
     result = AsyncResult(id=task_id, app=celery)
     value = 0
     
@@ -422,8 +434,12 @@ def get_log(task_id):
                     value = result.result.message
                 except:
                     value = result.result
-        wlogger.clean(task_id)
+        # keep the log for a while, so it can still be paged through
+        wlogger.clean_later(task_id,
+                            current_app.config['WEBLOGGER_KEEP_FINISHED'])
     log = {'task_id': task_id, 'state': result.state, 'messages': msgs,
+           'since': since, 'next': since + len(msgs),
+           'total': wlogger.count_messages(task_id),
            'result': value, 'error_message': error_message}
 
     ts = strftime('[%Y-%b-%d %H:%M]')
@@ -446,7 +462,123 @@ def get_log(task_id):
                           error_message
                     )
 
-    return jsonify(log)
+    return log
+
+
+@index.route('/log/<task_id>')
+@login_required
+def get_log(task_id):
+    # `count` limits the number of messages, so earlier parts of long logs
+    # can be fetched page by page
+    count = request.args.get('count', None, type=int)
+    return jsonify(_task_log(task_id, _since_arg(), count))
+
+
+@index.route('/log/<task_id>/stream')
+@login_required
+def stream_log(task_id):
+    """Streams the task log as server-sent events. Every event carries the
+    same payload as get_log(). The stream waits on the task's redis channel,
+    so the log is only read when the task writes to it and the result
+    backend is only queried when the task state changes.
+
+    Responds with 204 when TASK_LOG_STREAM is off, the browser then polls
+    get_log() instead.
+    """
+    if not current_app.config['TASK_LOG_STREAM']:
+        return Response(status=204)
+
+    since = _since_arg()
+
+    def event(log):
+        return 'data: {}\n\n'.format(json.dumps(log))
+
+    def generate():
+        events = wlogger.subscribe(task_id)
+        try:
+            log = _task_log(task_id, since)
+            yield event(log)
+
+            while log['state'] not in ('SUCCESS', 'FAILURE'):
+                message = events.get_message(timeout=15)
+
+                if message and message['data'] == 'log':
+                    msgs = wlogger.get_messages(task_id, log['next'])
+                    if not msgs:
+                        continue
+                    log = {'task_id': task_id, 'state': log['state'],
+                           'messages': msgs, 'since': log['next'],
+                           'next': log['next'] + len(msgs),
+                           'total': log['next'] + len(msgs),
+                           'result': 0, 'error_message': ''}
+                    yield event(log)
+                    continue
+
+                # either the state changed or the task was quiet for a
+                # while; re-check the state in case the worker went away
+                # without announcing it
+                state = log['state']
+                log = _task_log(task_id, log['next'])
+                if log['messages'] or log['state'] != state:
+                    yield event(log)
+                else:
+                    yield ': keepalive\n\n'
+        finally:
+            events.close()
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # keep nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@index.route('/log/<task_id>/pages/')
+@login_required
+def task_log(task_id):
+    """Shows the log of a task one page at a time"""
+    per_page = current_app.config['LOG_PAGE_SIZE']
+    total = wlogger.count_messages(task_id)
+    pages = max(1, (total + per_page - 1) // per_page)
+    page = min(max(request.args.get('page', pages, type=int), 1), pages)
+
+    messages = wlogger.get_messages(task_id, (page - 1) * per_page, per_page)
+    return render_template('task_log.html', task_id=task_id,
+                           messages=messages, page=page, pages=pages,
+                           page_numbers=range(max(page - 3, 1),
+                                              min(page + 3, pages) + 1),
+                           first=(page - 1) * per_page + 1, total=total)
+
+
+@index.route('/profiles/')
+@login_required
+def task_profiles():
+    """Lists the stored task profiles, latest first"""
+    profiles = TaskProfile.query.order_by(TaskProfile.id.desc()).limit(100)
+    return render_template('task_profiles.html', profiles=profiles)
+
+
+@index.route('/log/<task_id>/profile')
+@login_required
+def task_profile(task_id):
+    """Shows where a task spent its time, per host, step and operation"""
+    profile = TaskProfile.query.filter_by(task_id=task_id).first()
+    if not profile:
+        flash("No profile was stored for this task. Tasks shorter than {} "
+              "seconds are not profiled.".format(
+                  app.config.get('TASK_PROFILE_MIN_DURATION', 0)), "info")
+        return redirect(url_for('index.task_profiles'))
+
+    spans = profile.get_spans()
+    if request.args.get('format') == 'json':
+        return jsonify(task_id=profile.task_id, task_name=profile.task_name,
+                       duration=profile.duration, spans=spans)
+
+    slowest = sorted(spans, key=lambda s: -s[5])[:25]
+    return render_template('task_profile.html', profile=profile,
+                           hosts=flame_tree(spans), slowest=slowest)
+
 
 @index.route('/mmr/')
 @login_required
@@ -454,9 +586,9 @@ def multi_master_replication():
     """Multi Master Replication view for OpenLDAP"""
 
     # Check if replication user (dn) and password has been configured
-    app_config = AppConfiguration.query.first()
-    ldaps = Server.query.all()
-    primary_server = Server.query.filter_by(primary_server=True).first()
+    app_config = get_app_config()
+    ldaps = get_servers()
+    primary_server = get_primary_server()
     if not app_config:
         flash("Repication user and/or password has not been defined."
               " Please go to 'Configuration' and set these before proceed.",
@@ -471,19 +603,33 @@ def multi_master_replication():
 
 
 
-    rep_status = get_opendj_replication_status()
+    rep_status = get_replication_status()
 
     stat = ''
-    if not rep_status[0]:
-        flash(rep_status[1], "warning")
-    else:
-        stat = rep_status[1]
+    if rep_status:
+        if rep_status['error']:
+            flash(rep_status['error'], "warning")
+        stat = rep_status['raw']
+
     return render_template('opendjmmr.html',
                            servers=ldaps,
                            stat = stat,
+                           rep_status=rep_status,
                            app_conf=app_config,
                             )
 
+
+@index.route('/mmr/status')
+@login_required
+def replication_status_json():
+    """Returns the cached replication status as json. The status is
+    refreshed in the background when it is stale or ?refresh=true is given.
+    """
+    refresh = as_boolean(request.args.get('refresh'))
+    rep_status = get_replication_status(refresh) or {}
+    rep_status.pop('raw', None)
+    return jsonify(rep_status)
+
 @index.route('/removecustomschema/<schema_file>')
 @login_required
 def remove_custom_schema(schema_file):
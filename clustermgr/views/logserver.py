@@ -21,6 +21,7 @@ from ..core.utils import as_boolean
 from ..forms import LogSearchForm
 from ..models import Server
 from ..models import AppConfiguration
+from ..core.config_cache import get_app_config, get_servers
 from ..tasks.log import collect_logs
 from ..tasks.log import setup_filebeat
 from ..tasks.log import remove_filebeat
@@ -107,8 +108,8 @@ def index():
 @log_mgr.route("/setup/")
 @login_required
 def setup():
-    servers = Server.query.all()
-    appconf = AppConfiguration.query.first()
+    servers = get_servers()
+    appconf = get_app_config()
     
     return render_template("log_setup.html", servers=servers, appconf=appconf)
 
@@ -123,7 +124,7 @@ def install_filebeat():
         return redirect(url_for("index.app_configuration"))
 
     # checks for existing servers
-    servers = Server.query.all()
+    servers = get_servers()
 
     if not servers:
         flash("Add servers to the cluster before attempting to manage logs",
@@ -155,7 +156,7 @@ def collect():
         return redirect(url_for("index.app_configuration"))
 
     # checks for existing servers
-    servers = Server.query.all()
+    servers = get_servers()
 
     if not servers:
         flash("Add servers to the cluster before attempting to manage logs",
@@ -177,7 +178,7 @@ def collect():
 @log_mgr.route("/uninstall_filebeat")
 @login_required
 def uninstall_filebeat():
-    servers = Server.query.all()
+    servers = get_servers()
     task = remove_filebeat.delay()
     return render_template("log_setup_logger.html", step=1,
                            task_id=task.id, servers=servers)
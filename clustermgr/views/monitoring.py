@@ -2,6 +2,7 @@
 # import os
 import time
 import json
+import math
 from datetime import timedelta
 import requests
 
@@ -18,15 +19,20 @@ from clustermgr.core.license import license_reminder
 from clustermgr.core.license import license_required
 from clustermgr.core.license import prompt_license
 
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.models import Server
+from clustermgr.core.config_cache import get_app_config, get_servers, \
+    get_primary_server
 
 from clustermgr.tasks.monitoring import install_monitoring, install_local, \
     remove_monitoring
 
 from clustermgr.monitoring_defs import left_menu, items, periods
 
-from clustermgr.core.utils import get_setup_properties, \
-    get_opendj_replication_status
+from clustermgr.tasks.cluster import get_replication_status
+from clustermgr.tasks.get_remote_stats import check_config_drift, \
+    check_service_health
+from clustermgr.core.service_health import service_health
+from clustermgr.core.config_drift import config_drift as config_drift_detector
 
 monitoring = Blueprint('monitoring', __name__)
 monitoring.before_request(prompt_license)
@@ -112,12 +118,12 @@ def getData(item, step=None):
         A compound data will be returned to be visualized by Google graphipcs.
     """
 
-    servers = Server.query.all()
+    servers = get_servers()
 
 
     # Gluu authentications will only be for primary server
     if item == 'gluu_authentications':
-        servers = ( Server.query.filter_by(primary_server=True).first() ,)
+        servers = ( get_primary_server() ,)
 
     # Determine period
     period = request.args.get('period','d')
@@ -301,9 +307,9 @@ def home():
     
     """This view provides home page of monitoring."""
     
-    servers = Server.query.all()
+    servers = get_servers()
 
-    app_config = AppConfiguration.query.first()
+    app_config = get_app_config()
 
     #If configuration was not done redirect to configuration page
     if not app_config:
@@ -371,7 +377,7 @@ def setup_index():
     
     """This view provides setting up monitoring"""
     
-    servers = Server.query.all()
+    servers = get_servers()
     return render_template("monitoring_setup.html", servers=servers)
 
 
@@ -393,8 +399,8 @@ def setup():
     
     """This view provides setting up monitoring components on remote servers"""
     
-    servers = Server.query.all()
-    appconf = AppConfiguration.query.first()
+    servers = get_servers()
+    appconf = get_app_config()
     if not appconf:
         flash("The application needs to be configured first. Kindly set the "
               "values before attempting clustering.", "warning")
@@ -406,7 +412,7 @@ def setup():
         return redirect(url_for('index.home'))
 
 
-    servers = Server.query.all()
+    servers = get_servers()
     task = install_monitoring.delay()
     return render_template('monitoring_setup_logger.html', step=1,
                            task_id=task.id, servers=servers)
@@ -474,8 +480,8 @@ def system(item):
                             max_value = v
                         if v < min_value:
                             min_value = v
-        max_value = int(1.1 * max_value)
-        min_value = int(1.1 * min_value)
+        max_value = int(math.ceil(1.1 * max_value))
+        min_value = int(math.floor(1.1 * min_value))
 
 
     return render_template(temp,
@@ -498,23 +504,50 @@ def replication_status():
 
     """This view displays replication status of ldap servers"""
 
-    prop = get_setup_properties()
-    rep_status = get_opendj_replication_status()
+    rep_status = get_replication_status()
 
     stat = ''
-    if not rep_status[0]:
-        flash(rep_status[1], "warning")
-    else:
-        stat = rep_status[1]
+    if rep_status:
+        if rep_status['error']:
+            flash(rep_status['error'], "warning")
+        stat = rep_status['raw']
 
     return render_template('monitoring_replication_status.html',
                         left_menu=left_menu,
                         stat=stat,
+                        rep_status=rep_status,
                         items=items,
                         )
 
 
 
+@monitoring.route('/configdrift')
+def config_drift():
+
+    """This view displays configuration differences between ldap servers"""
+
+    if request.args.get('refresh'):
+        check_config_drift.delay()
+        flash("Configuration of the servers is being checked, please "
+              "refresh the page in a minute.", "info")
+        return redirect(url_for('monitoring.config_drift'))
+
+    report = config_drift_detector.get_report()
+    if request.args.get('format') == 'json':
+        return jsonify(report or {})
+
+    age = None
+    if report:
+        age = int(time.time() - report['checked_at'])
+
+    return render_template('monitoring_config_drift.html',
+                        left_menu=left_menu,
+                        report=report,
+                        age=age,
+                        items=items,
+                        )
+
+
 @monitoring.route('/allldap/<item>')
 def ldap_all(item):
     """This view will displaye selected ldap statistics on a single page"""
@@ -547,8 +580,8 @@ def ldap_single(item):
 def remove():
     """This view will remove monitoring components"""
     
-    servers = Server.query.all()
-    appconf = AppConfiguration.query.first()
+    servers = get_servers()
+    appconf = get_app_config()
     if not appconf:
         flash("The application needs to be configured first. Kindly set the "
               "values before attempting clustering.", "warning")
@@ -559,7 +592,7 @@ def remove():
               "warning")
         return redirect(url_for('index.home'))
 
-    servers = Server.query.all()
+    servers = get_servers()
     local_id = 100000000
     local_server = Server( hostname='localhost', id=local_id)
     servers.append(local_server)
@@ -570,49 +603,43 @@ def remove():
 
 
 
-@monitoring.route('/serverstat')
-def get_server_status():
+def service_health_results():
+    """Returns the cached service check results of all the servers. A check
+    is started in the background if any result is missing or stale.
+    """
+    cached = service_health.get_all()
+    results = {}
+    refresh = False
 
-    servers = Server.query.all()
+    for server in get_servers():
+        result = cached.get(server.id)
+        refresh = refresh or service_health.is_stale(result)
+        results[server.id] = result or {}
 
-    services = {
-                'oxauth': '.well-known/openid-configuration',
-                'identity': 'identity/restv1/scim-configuration',
-                'shib': 'idp/shibboleth',
-                'passport': 'passport'
-            }
+    if refresh and service_health.acquire_check_lock():
+        check_service_health.delay()
 
-    status = {}
-    active_services = ['oxauth', 'identity']
-    prop = get_setup_properties()
+    return results
 
-    if prop['installSaml']:
-        active_services.append('shib')
 
-    if prop['installPassport']:
-        active_services.append('passport')
+@monitoring.route('/serverstat')
+def get_server_status():
+    """Returns {server id: {service: True if up}} from the last background
+    check, or the full results with ?detail
+    """
+    results = service_health_results()
+    if 'detail' in request.args:
+        return jsonify(results)
 
+    return jsonify(dict(
+        (server_id, dict((service, result['up'])
+                         for service, result in services.items()))
+        for server_id, services in results.items()))
 
-    for server in servers:
-        status[server.id] = {}
-        c = RemoteClient(server.hostname)
-        c.ok = False
-        try:
-            c.startup()
-            c.ok = True
-        except Exception as e:
-            pass
-        
-        
-        for service in active_services:
-            status[server.id][service] = False
-
-            if c.ok:
-                try:
-                    result = c.run("curl -kLI https://localhost/"+services[service]+ " -o /dev/null -w '%{http_code}\n' -s")
-                    if result[1].strip() == '200':
-                        status[server.id][service] = True
-                except Exception as e:
-                    print "Error getting service status of {0} for {1}. ERROR: {2}".format(server.hostname,service, e)
-
-    return jsonify(status)
+
+@monitoring.route('/serverstat/<int:server_id>/history')
+def get_server_status_history(server_id):
+    """Returns the stored service check results of the server, newest
+    first
+    """
+    return jsonify(history=service_health.history(server_id))
@@ -8,7 +8,7 @@ from flask import current_app as app
 from flask_login import login_required
 from flask_login import current_user
 from celery.result import AsyncResult
-from clustermgr.models import AppConfiguration, Server
+from clustermgr.core.config_cache import get_app_config, get_primary_server
 
 
 from clustermgr.core.license import license_reminder
@@ -29,9 +29,9 @@ msg_text = ''
 @operations.route('/httpdcerts')
 def httpd_certs():
 
-    app_config = AppConfiguration.query.first()
+    app_config = get_app_config()
     
-    server = Server.query.filter_by(primary_server=True).first()
+    server = get_primary_server()
 
     installer = Installer(server, app_config.gluu_version, logger_tid=None)
     httpd_key_io = installer.c.get_file(os.path.join(installer.container, 'etc/certs/httpd.key'))
@@ -10,13 +10,18 @@ from flask import Blueprint, render_template, redirect, url_for, flash, \
 from flask_login import login_required
 
 from clustermgr.extensions import db
-from clustermgr.models import Server, AppConfiguration
+from clustermgr.models import Server
+from clustermgr.core.config_cache import get_app_config, get_servers, \
+    get_primary_server
 
-import ldap3
+from werkzeug.utils import secure_filename
 
 from clustermgr.forms import ServerForm, InstallServerForm, \
-    SetupPropertiesLastForm
-from clustermgr.tasks.cluster import collect_server_details
+    SetupPropertiesLastForm, LDIFForm
+from clustermgr.tasks.cluster import collect_server_details, \
+    refresh_host_facts
+from clustermgr.tasks.ldif_transfer import import_ldif, export_ldif_task
+from clustermgr.tasks.get_remote_stats import probe_ldap_health
 from clustermgr.core.remote import RemoteClient, ClientNotSetupException
 from ..core.license import license_required
 from ..core.license import license_reminder
@@ -26,6 +31,7 @@ from clustermgr.core.utils import parse_setup_properties, \
     write_setup_properties_file, get_setup_properties, get_inums
 
 from clustermgr.core.ldap_functions import getLdapConn
+from clustermgr.core.ldap_health import ldap_health
 
 
 server_view = Blueprint('server', __name__)
@@ -49,7 +55,7 @@ def index():
     POST accepts the ServerForm, validates and creates a new Server object
     """
     
-    appconfig = AppConfiguration.query.first()
+    appconfig = get_app_config()
     if not appconfig:
         flash("Kindly set default values for the application before adding"
               " servers.", "info")
@@ -211,9 +217,9 @@ def remove_provider_from_consumer(consumer_id, provider_addr):
 @login_required
 def remove_server(server_id):
 
-    appconfig = AppConfiguration.query.first()
+    appconfig = get_app_config()
     server = Server.query.filter_by(id=server_id).first()
-    all_servers = Server.query.all()
+    all_servers = get_servers()
     
     if len(all_servers) > 1:
         if server.primary_server:
@@ -271,7 +277,7 @@ def install_gluu(server_id):
     # If current server is not primary server, first we should identify
     # primary server. If primary server is not installed then redirect
     # to home to install primary.
-    pserver = Server.query.filter_by(primary_server=True).first()
+    pserver = get_primary_server()
     if not pserver:
         flash("Please identify primary server before starting to install Gluu "
               "Server.", "warning")
@@ -298,7 +304,7 @@ def install_gluu(server_id):
 
     # If we come up here, it is primary server and we will ask admin which
     # components will be installed. So prepare form by InstallServerForm
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
     form = InstallServerForm()
 
     # We don't require these for server installation. These fields are required
@@ -467,7 +473,7 @@ def upload_setup_properties(server_id):
             if rf in setup_prop:
                 del setup_prop[rf]
 
-        appconf = AppConfiguration.query.first()
+        appconf = get_app_config()
         server = Server.query.get(server_id)
 
         setup_prop['hostname'] = appconf.nginx_host
@@ -497,7 +503,7 @@ def confirm_setup_properties(server_id):
 
     setup_prop = get_setup_properties()
 
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
     server = Server.query.get(server_id)
 
     setup_prop['hostname'] = appconf.nginx_host
@@ -515,18 +521,44 @@ def confirm_setup_properties(server_id):
                     )
 
 
+def ldap_health_results():
+    """Returns the cached ldap health check results of all the servers,
+    marking the stale ones. A probe is started in the background if any
+    result is missing or stale.
+    """
+    cached = ldap_health.get_all()
+    results = {}
+    refresh = False
+
+    for server in get_servers():
+        result = cached.get(server.id)
+        stale = ldap_health.is_stale(result)
+        refresh = refresh or stale
+        result = result or {'up': False, 'checked_at': None}
+        result['stale'] = stale
+        results[server.id] = result
+
+    if refresh and ldap_health.acquire_probe_lock():
+        probe_ldap_health.delay()
+
+    return results
+
+
+@server_view.route('/ldapstat/')
+@login_required
+def get_ldap_stats():
+    """Returns the ldap health of all the servers as json, keyed by the id
+    of the server
+    """
+    return jsonify(ldap_health_results())
+
+
 @server_view.route('/ldapstat/<int:server_id>/')
+@login_required
 def get_ldap_stat(server_id):
-
-    server = Server.query.get(server_id)
-    if server:
-        try:
-            ldap_server = ldap3.Server('ldaps://{}:1636'.format(server.hostname))
-            conn = ldap3.Connection(ldap_server)
-            if conn.bind(): 
-                return "1"
-        except:
-            pass
+    result = ldap_health_results().get(server_id)
+    if result and result['up']:
+        return "1"
     return "0"
 
 
@@ -566,7 +598,7 @@ def dry_run(server_id):
         result['server']['port_status'][p] = False
     
     server = Server.query.get(server_id)
-    appconf = AppConfiguration.query.first()
+    appconf = get_app_config()
 
 
     c = RemoteClient(server.hostname, server.ip)
@@ -617,7 +649,7 @@ def dry_run(server_id):
 def make_primary(server_id):
     
 
-    cur_primary = Server.query.filter_by(primary_server=True).first()
+    cur_primary = get_primary_server()
     
     if cur_primary:
         cur_primary.primary_server = None
@@ -633,13 +665,93 @@ def make_primary(server_id):
     return redirect(url_for('index.home'))
 
 
+@server_view.route('/facts/refresh/')
+@login_required
+def refresh_facts():
+    """Gathers the OS type and the Gluu Server containers of all the
+    servers again, see :mod:`clustermgr.core.host_facts`
+    """
+    task = refresh_host_facts.delay()
+    head = "Gathering the facts of the servers"
+    return render_template("logger.html", heading=head, server="",
+                           task=task, nextpage="index.home",
+                           whatNext="Dashboard")
+
+
 @server_view.route('/getostype', methods=['GET'])
 @login_required
 def get_os_type():
-    servers = Server.query.all()
+    servers = get_servers()
 
     data = {}
     for server in servers:
         data[str(server.id)] = server.os
 
     return jsonify(data)
+
+
+@server_view.route('/ldif/import/<int:server_id>/', methods=['GET', 'POST'])
+@login_required
+def ldif_import(server_id):
+    """Uploads an LDIF file and imports it into the LDAP server of the
+    server. ?resume=<file name> starts the import of an uploaded file again,
+    continuing from where it was interrupted.
+    """
+    server = Server.query.get_or_404(server_id)
+    form = LDIFForm()
+
+    ldif_file = None
+    update_existing = False
+
+    if request.args.get('resume'):
+        ldif_file = os.path.join(current_app.config['LDIF_DIR'],
+                                 secure_filename(request.args['resume']))
+        if not os.path.exists(ldif_file):
+            flash("LDIF file {} does not exist".format(
+                  request.args['resume']), "warning")
+            return redirect(url_for('server.ldif_import', server_id=server_id))
+        update_existing = request.args.get('update_existing') == 'true'
+
+    elif form.validate_on_submit():
+        ldif_file = os.path.join(current_app.config['LDIF_DIR'],
+                                 secure_filename(form.ldif.data.filename))
+        # a new upload starts from the beginning
+        if os.path.exists(ldif_file + '.checkpoint'):
+            os.remove(ldif_file + '.checkpoint')
+        form.ldif.data.save(ldif_file)
+        update_existing = form.update_existing.data
+
+    if not ldif_file:
+        # uploads whose import was interrupted can be resumed
+        ldif_dir = current_app.config['LDIF_DIR']
+        interrupted = []
+        if os.path.isdir(ldif_dir):
+            interrupted = sorted(name[:-len('.checkpoint')]
+                                 for name in os.listdir(ldif_dir)
+                                 if name.endswith('.checkpoint'))
+        return render_template('ldif_upload.html', form=form, server=server,
+                               interrupted=interrupted)
+
+    task = import_ldif.delay(server.id, ldif_file, update_existing)
+    head = "Importing LDIF to {}".format(server.hostname)
+    nextpage = "index.home"
+    whatNext = "Dashboard"
+    return render_template("logger.html", heading=head, server=server,
+                           task=task, nextpage=nextpage, whatNext=whatNext)
+
+
+@server_view.route('/ldif/export/<int:server_id>/')
+@login_required
+def ldif_export(server_id):
+    """Exports the LDAP data of the server to LDIF_DIR. The base DN is given
+    with ?base=, o=gluu by default.
+    """
+    server = Server.query.get_or_404(server_id)
+    base_dn = request.args.get('base', 'o=gluu')
+
+    task = export_ldif_task.delay(server.id, base_dn)
+    head = "Exporting {} from {}".format(base_dn, server.hostname)
+    nextpage = "index.home"
+    whatNext = "Dashboard"
+    return render_template("logger.html", heading=head, server=server,
+                           task=task, nextpage=nextpage, whatNext=whatNext)
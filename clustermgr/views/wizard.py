@@ -14,6 +14,7 @@ from flask import redirect
 
 from clustermgr.extensions import db, wlogger
 from clustermgr.models import AppConfiguration, Server  # , KeyRotation
+from clustermgr.core.config_cache import get_servers, get_primary_server
 from clustermgr.forms import WizardStep1
 
 
@@ -38,7 +39,7 @@ wizard.before_request(license_reminder)
 @wizard.route('/step1',methods=['GET', 'POST'])
 def step1():
     
-    pserver = Server.query.filter_by(primary_server=True).first()
+    pserver = get_primary_server()
     if pserver and request.args.get('pass_set') != 'true':
         flash("Oops this service is not for you.",'warning')
         return redirect(url_for('index.home'))
@@ -67,7 +68,7 @@ def step1():
 
     if request.method == 'POST' or request.args.get('pass_set') == 'true':
 
-        servers = Server.query.all()
+        servers = get_servers()
 
         ask_passphrase = False
         
@@ -99,7 +100,7 @@ def step1():
         task = wizard_step1.delay()
         print "TASK STARTED", task.id
 
-        servers = Server.query.all()
+        servers = get_servers()
         return render_template('wizard/wizard_logger.html', step=1,
                        task_id=task.id, servers=servers)
                            
@@ -112,6 +113,6 @@ def step2():
     task = wizard_step2.delay()
     print "TASK STARTED", task.id
 
-    servers = Server.query.all()
+    servers = get_servers()
     return render_template('wizard/wizard_logger.html', step=2,
                            task_id=task.id, servers=servers)
@@ -1,8 +1,37 @@
 """weblogger.py - flask extension providing storage facility via Redis.
 """
 
+import os
+import gzip
 import redis
 import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+# reads the spilled message count and the messages starting at ARGV[1]
+# (at most ARGV[2] of them, all if negative) in one step, so a spill
+# between the two reads can not shift the indexes
+READ_SCRIPT = """
+local trimmed = tonumber(redis.call('GET', KEYS[2]) or 0)
+local start = tonumber(ARGV[1]) - trimmed
+local limit = tonumber(ARGV[2])
+if start < 0 then
+    if limit >= 0 then
+        limit = math.max(limit + start, 0)
+    end
+    start = 0
+end
+if limit == 0 then
+    return {trimmed, {}}
+end
+local stop = -1
+if limit > 0 then
+    stop = start + limit - 1
+end
+return {trimmed, redis.call('LRANGE', KEYS[1], start, stop)}
+"""
 
 
 class WebLogger(object):
@@ -50,12 +79,39 @@ class WebLogger(object):
 
     Cleanup:
         Refer clean()
+
+    Notifications:
+        Every write to a task's log and every change of the task state is
+        announced on the redis channel <app.name>:<taskid>:events. Refer
+        subscribe() and publish().
+
+    Buffering:
+        Refer buffered(). The buffer thresholds can be set in the Flask
+        application config using WEBLOGGER_BUFFER_SIZE (number of messages)
+        and WEBLOGGER_FLUSH_INTERVAL (seconds).
+
+    Size limit:
+        When WEBLOGGER_MAX_MESSAGES is set, a task keeps at most that many
+        messages in redis. The oldest messages are moved to a gzip file per
+        task under WEBLOGGER_SPILL_DIR and are still returned by
+        get_messages(), so message indexes never change.
     """
 
     def __init__(self, app=None):
         self.app = app
         self.r = redis.Redis()
         self.prefix = 'weblogger'
+        self.expiry = 86400  # TODO make this configurable
+        self.buffer_size = 50
+        self.flush_interval = 1.0
+        self.max_messages = None
+        self.spill_dir = None
+        self._buffers = {}
+        self._flushed_at = {}
+        self._timers = {}
+        self._expiring = set()
+        self._lock = threading.RLock()
+        self._read = self.r.register_script(READ_SCRIPT)
         if app is not None:
             self.init_app(app)
 
@@ -64,13 +120,32 @@ class WebLogger(object):
         port = app.config['REDIS_PORT']
         db = app.config['REDIS_LOG_DB']
         self.prefix = app.name
+        self.buffer_size = app.config.get('WEBLOGGER_BUFFER_SIZE',
+                                          self.buffer_size)
+        self.flush_interval = app.config.get('WEBLOGGER_FLUSH_INTERVAL',
+                                             self.flush_interval)
+        self.max_messages = app.config.get('WEBLOGGER_MAX_MESSAGES')
+        self.spill_dir = app.config.get('WEBLOGGER_SPILL_DIR')
 
         self.r.connection_pool.disconnect()
         self.r = redis.Redis(host=host, port=port, db=db)
+        self._read = self.r.register_script(READ_SCRIPT)
 
     def __key(self, taskid):
         return "{0}:{1}".format(self.prefix, taskid)
 
+    def __meta_key(self, taskid):
+        return self.__key(taskid) + ":meta"
+
+    def __channel(self, taskid):
+        return self.__key(taskid) + ":events"
+
+    def __trimmed_key(self, taskid):
+        return self.__key(taskid) + ":trimmed"
+
+    def __spill_file(self, taskid):
+        return os.path.join(self.spill_dir, "{}.log.gz".format(taskid))
+
     def log(self, taskid, message, level=None, **kwargs):
         """R Pushes the message into REDIS as a list for that task id with the key
         <app.name>:<taskid>.
@@ -97,23 +172,226 @@ class WebLogger(object):
         for k, v in kwargs.iteritems():
             logitem[k] = v
 
-        self.r.rpush(self.__key(taskid), json.dumps(logitem))
-        self.r.expire(self.__key(taskid), 86400)  # TODO make this configurable
+        if taskid in self._buffers:
+            self.__buffer(taskid, json.dumps(logitem))
+            return
 
-    def get_messages(self, taskid):
-        """Returns all the messages pushed by a task.
+        length = self.r.rpush(self.__key(taskid), json.dumps(logitem))
+        self.r.expire(self.__key(taskid), self.expiry)
+        if self.max_messages and length > self.max_messages:
+            self.__spill(taskid)
+        self.r.publish(self.__channel(taskid), 'log')
+
+    def __spill(self, taskid):
+        """Moves the oldest messages of the task to its spill file, leaving
+        half of `max_messages` in redis so spilling happens in chunks.
+        """
+        key = self.__key(taskid)
+        with self._lock:
+            # another thread may have spilled since the caller pushed
+            length = self.r.llen(key)
+            if length <= self.max_messages:
+                return
+            count = length - self.max_messages // 2
+            entries = self.r.lrange(key, 0, count - 1)
+
+            if not os.path.isdir(self.spill_dir):
+                os.makedirs(self.spill_dir)
+            if not os.path.exists(self.__spill_file(taskid)):
+                self.__purge_spill_dir()
+            # every spill is appended as a new gzip member, gzip reads them
+            # back as one stream
+            with gzip.open(self.__spill_file(taskid), 'ab') as f:
+                for entry in entries:
+                    f.write(entry + "\n")
+
+            # the file is written first, so readers who see the new trimmed
+            # count find the entries there
+            pipe = self.r.pipeline()
+            pipe.ltrim(key, count, -1)
+            pipe.incrby(self.__trimmed_key(taskid), count)
+            pipe.expire(self.__trimmed_key(taskid), self.expiry)
+            pipe.execute()
+
+    def __purge_spill_dir(self):
+        """Removes the spill files of tasks whose logs have expired"""
+        expired = time.time() - self.expiry
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+
+    def get_spilled_messages(self, taskid, start=0, count=None):
+        """Returns the messages of a task which were moved out of redis to
+        the spill file.
 
         Args:
-            taskid (string) - The unique id of the task
+            taskid (string) - the unique id of the task
+            start (int) - index of the first message to return
+            count (int) - maximum number of messages to return, all the
+                spilled messages after `start` if not given
 
         Returns:
-            list of dicts containing all the messages posted with the given
-            task id
+            list of dicts of the spilled messages
         """
-        messages = self.r.lrange(self.__key(taskid), 0, -1)
-        if not messages:
+        if not self.spill_dir or not os.path.exists(
+                self.__spill_file(taskid)):
             return []
-        return [json.loads(msg) for msg in messages]
+
+        messages = []
+        with gzip.open(self.__spill_file(taskid), 'rb') as f:
+            for i, line in enumerate(f):
+                if i < start:
+                    continue
+                if count is not None and len(messages) >= count:
+                    break
+                messages.append(json.loads(line))
+        return messages
+
+    def __buffer(self, taskid, entry):
+        with self._lock:
+            self._buffers[taskid].append(entry)
+            elapsed = time.time() - self._flushed_at[taskid]
+            if len(self._buffers[taskid]) >= self.buffer_size or \
+                    elapsed >= self.flush_interval:
+                self.flush(taskid)
+            elif taskid not in self._timers:
+                # make sure the messages reach redis even if the task goes
+                # quiet for a while, e.g. during a long running command
+                timer = threading.Timer(self.flush_interval, self.flush,
+                                        [taskid])
+                timer.daemon = True
+                self._timers[taskid] = timer
+                timer.start()
+
+    def flush(self, taskid):
+        """Writes the buffered messages of a task to redis in a single
+        pipelined transaction. Does nothing if the task is not buffered or
+        there are no pending messages.
+
+        Args:
+            taskid (string) - the unique id of the task
+        """
+        with self._lock:
+            timer = self._timers.pop(taskid, None)
+            if timer:
+                timer.cancel()
+
+            entries = self._buffers.get(taskid)
+            if not entries:
+                return
+            self._buffers[taskid] = []
+            self._flushed_at[taskid] = time.time()
+
+            key = self.__key(taskid)
+            pipe = self.r.pipeline()
+            pipe.rpush(key, *entries)
+            if key not in self._expiring:
+                pipe.expire(key, self.expiry)
+                self._expiring.add(key)
+            pipe.publish(self.__channel(taskid), 'log')
+            length = pipe.execute()[0]
+
+            if self.max_messages and length > self.max_messages:
+                self.__spill(taskid)
+
+    @contextmanager
+    def buffered(self, taskid):
+        """Context manager that collects the messages logged for a task and
+        writes them to redis in batches. A batch is flushed once it holds
+        `buffer_size` messages or `flush_interval` seconds have passed since
+        the last flush, and whatever is left is flushed when the block exits.
+
+        Usage::
+
+            with wlogger.buffered(task_id):
+                wlogger.log(task_id, "Installing packages")
+
+        Args:
+            taskid (string) - the unique id of the task
+        """
+        if not taskid or taskid in self._buffers:
+            yield
+            return
+
+        with self._lock:
+            self._buffers[taskid] = []
+            self._flushed_at[taskid] = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.flush(taskid)
+                del self._buffers[taskid]
+                del self._flushed_at[taskid]
+                self._expiring.discard(self.__key(taskid))
+
+    def get_messages(self, taskid, since=0, count=None):
+        """Returns the messages pushed by a task.
+
+        Args:
+            taskid (string) - The unique id of the task
+            since (int) - index of the first message to return. Clients
+                polling for progress pass the number of messages they have
+                already seen, so only the new entries are read from redis.
+            count (int) - maximum number of messages to return, used to page
+                through the log. All the messages after `since` if not given
+
+        Returns:
+            list of dicts containing the messages posted with the given
+            task id starting from the index `since`
+        """
+        trimmed, messages = self._read(
+            keys=[self.__key(taskid), self.__trimmed_key(taskid)],
+            args=[since, -1 if count is None else count])
+        trimmed = int(trimmed)
+
+        spilled = []
+        if since < trimmed:
+            # only the part spilled before the read above, later spills
+            # are already in `messages`
+            spilled_count = trimmed - since
+            if count is not None:
+                spilled_count = min(count, spilled_count)
+            spilled = self.get_spilled_messages(taskid, since, spilled_count)
+        return spilled + [json.loads(msg) for msg in messages]
+
+    def publish(self, taskid, event):
+        """Announces an event of the task to its subscribers.
+
+        Args:
+            taskid (string) - the unique id of the task
+            event (string) - name of the event, `log` for new messages and
+                `state` for a change of the task state
+        """
+        self.r.publish(self.__channel(taskid), event)
+
+    def subscribe(self, taskid):
+        """Subscribes to the events of a task.
+
+        Args:
+            taskid (string) - the unique id of the task
+
+        Returns:
+            a redis PubSub object, use get_message() to wait for the events
+            and close() once done
+        """
+        pubsub = self.r.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.__channel(taskid))
+        return pubsub
+
+    def count_messages(self, taskid):
+        """Returns the number of messages pushed by a task, including the
+        ones moved to the spill file.
+
+        Args:
+            taskid (string) - the unique id of the task
+        """
+        pipe = self.r.pipeline()
+        pipe.get(self.__trimmed_key(taskid))
+        pipe.llen(self.__key(taskid))
+        trimmed, length = pipe.execute()
+        return int(trimmed or 0) + length
 
     def clean(self, taskid):
         """Removes the log for the particular task id
@@ -121,17 +399,25 @@ class WebLogger(object):
         Args:
             taskid (string) - the unique id of the task
         """
-        self.r.delete(self.__key(taskid))
+        self.r.delete(self.__key(taskid), self.__meta_key(taskid),
+                      self.__trimmed_key(taskid))
+        if self.spill_dir and os.path.exists(self.__spill_file(taskid)):
+            os.remove(self.__spill_file(taskid))
 
     def set_meta(self, taskid, **kwargs):
-        """Adds metadata for a task
+        """Adds metadata for a task. The metadata of a task is kept in a
+        single redis hash which expires along with the task's log.
 
         :param taskid: the unique id of the task
         :param kwargs: keyword arguments for the metadata key and value
         """
-        key = self.__key(taskid) + ":meta"
-        for (k, v) in kwargs.iteritems():
-            self.r.set(key + ":" + k, v)
+        if not kwargs:
+            return
+        key = self.__meta_key(taskid)
+        pipe = self.r.pipeline()
+        pipe.hmset(key, kwargs)
+        pipe.expire(key, self.expiry)
+        pipe.execute()
 
     def get_meta(self, taskid, key):
         """Retrieves a particular metadata for a task
@@ -140,8 +426,7 @@ class WebLogger(object):
         :param key: the key of the metadata
         :return: the metadata value
         """
-        key = self.__key(taskid) + ":meta:" + key
-        return self.r.get(key)
+        return self.r.hget(self.__meta_key(taskid), key)
 
     def get_all_meta(self, taskid):
         """Retrieves all the metadata stored under a task id
@@ -149,20 +434,39 @@ class WebLogger(object):
         :param taskid: the unique id of the task
         :return: a dict of the metadata keys and their values
         """
-        keys = self.r.keys(self.__key(taskid) + ":meta:*")
-        data = dict()
-        for k in keys:
-            meta_key = k.replace(self.__key(taskid) + ":meta:", "")
-            data[meta_key] = self.r.get(k)
-        return data
+        return self.r.hgetall(self.__meta_key(taskid))
+
+    def migrate_meta(self):
+        """Moves metadata stored by older versions as one string key per
+        metadata item (<prefix>:<taskid>:meta:<key>) into the per task
+        hashes. The keyspace is walked with SCAN so redis is not blocked.
+
+        :return: the number of keys migrated
+        """
+        migrated = 0
+        for old_key in self.r.scan_iter(match=self.prefix + ":*:meta:*"):
+            key, _, meta_key = old_key.rpartition(":")
+            value = self.r.get(old_key)
+            pipe = self.r.pipeline()
+            if value is not None:
+                pipe.hsetnx(key, meta_key, value)
+                pipe.expire(key, self.expiry)
+            pipe.delete(old_key)
+            pipe.execute()
+            migrated += 1
+        return migrated
 
     def clean_later(self, taskid, timeout):
-        """Cleans the given key after the given timeout. Equivalent ot EXPIRE
-        command in redis.
+        """Cleans the log of the task after the given timeout. Equivalent to
+        the EXPIRE command in redis, the spill file is removed along with
+        the other expired spill files.
 
         :param taskid: the unique of the task
         :param timeout: the number of seconds after which the task's logs have
             to be cleaned up
         """
-        self.r.expire(self.__key(taskid), timeout)
-
+        pipe = self.r.pipeline()
+        for key in (self.__key(taskid), self.__meta_key(taskid),
+                    self.__trimmed_key(taskid)):
+            pipe.expire(key, timeout)
+        pipe.execute()
@@ -12,8 +12,8 @@ redis-server /etc/redis.conf &
 # upgrade database schema
 clusterapp.py db upgrade
 
-# run celery worker
-celery multi start worker -A clusterapp.celery &
+# run a celery worker per queue
+celery multi start `clusterapp.py worker-options` -A clusterapp.celery -Ofair &
 
 # run celery beat
 celery beat -A clusterapp.celery -s "/root/.clustermgr/celerybeat-schedule" &
@@ -25,5 +25,6 @@ if [ ! -f $CUSTOM_CONFIG ]; then
     echo "LICENSE_ENFORCEMENT_ENABLED = False" >> $CUSTOM_CONFIG
 fi
 
-# a workaround to catch SIG properly
-exec gunicorn -b 0.0.0.0:5000 -w 2 clusterapp:app
+# a workaround to catch SIG properly; gevent workers keep the task log
+# streams open, see TASK_LOG_STREAM in clustermgr/config.py
+exec gunicorn -b 0.0.0.0:5000 -w 2 -k gevent --worker-connections 200 clusterapp:app
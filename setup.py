@@ -59,6 +59,7 @@ setup(
         "oxdpython",
         "influxdb",
         'gunicorn',
+        'gevent',
         'psutil',
     ],
     scripts=['clusterapp.py', 'clustermgr-cli'],
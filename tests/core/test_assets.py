@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from clustermgr.core.assets import AssetManifest
+
+
+class AssetManifestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static)
+        os.mkdir(os.path.join(self.static, 'build'))
+        self.touch('build/main.3e1f2a.js')
+        self.touch('build/vendor.9b8c7d.js')
+        self.touch('css/style.css')
+
+    def touch(self, path, mtime=None):
+        path = os.path.join(self.static, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        open(path, 'w').close()
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def test_hashed_builds_are_returned(self):
+        manifest = AssetManifest(self.static)
+        self.assertEqual(manifest.url('build/main.js'),
+                         '/static/build/main.3e1f2a.js')
+        self.assertEqual(manifest.url('build/vendor.js'),
+                         '/static/build/vendor.9b8c7d.js')
+
+    def test_files_without_hashed_build_are_returned_unchanged(self):
+        manifest = AssetManifest(self.static)
+        self.assertEqual(manifest.url('css/style.css'), '/static/css/style.css')
+        self.assertEqual(manifest.url('build/runtime.js'),
+                         '/static/build/runtime.js')
+
+    def test_newest_build_is_used(self):
+        self.touch('build/main.aaaaaa.js', mtime=1000)
+        self.touch('build/main.bbbbbb.js', mtime=2000)
+        os.unlink(os.path.join(self.static, 'build/main.3e1f2a.js'))
+        manifest = AssetManifest(self.static)
+        self.assertEqual(manifest.url('build/main.js'),
+                         '/static/build/main.bbbbbb.js')
+
+    def test_lookups_do_not_read_the_static_folder(self):
+        manifest = AssetManifest(self.static)
+        with patch('os.walk') as walk, patch('os.listdir') as listdir:
+            manifest.url('build/main.js')
+        self.assertFalse(walk.called)
+        self.assertFalse(listdir.called)
+
+    def test_build_picks_up_new_files(self):
+        manifest = AssetManifest(self.static)
+        self.touch('build/runtime.5f4e3d.js')
+        manifest.build()
+        self.assertEqual(manifest.url('build/runtime.js'),
+                         '/static/build/runtime.5f4e3d.js')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from mock import patch
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import Server, AppConfiguration
+from clustermgr.core.config_cache import config_cache, get_app_config, \
+    get_servers, get_primary_server
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def incr(self, key):
+        self.values[key] = str(int(self.values.get(key, 0)) + 1)
+
+
+class ConfigCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.app.config['CONFIG_CACHE_ENABLED'] = True
+        patcher = patch.object(config_cache, 'r', FakeRedis())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        config_cache.bump()
+
+        with self.app.app_context():
+            db.create_all()
+            appconf = AppConfiguration()
+            appconf.gluu_version = '3.1.6'
+            db.session.add(appconf)
+            server = Server()
+            server.hostname = 'primary.example.com'
+            server.primary_server = True
+            db.session.add(server)
+            db.session.commit()
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.drop_all()
+
+    def test_results_are_reused_between_app_contexts(self):
+        with self.app.app_context():
+            self.assertEqual(get_app_config().gluu_version, '3.1.6')
+        with self.app.app_context():
+            with patch.object(AppConfiguration, 'query') as query:
+                self.assertEqual(get_app_config().gluu_version, '3.1.6')
+                self.assertFalse(query.first.called)
+
+    def test_commit_of_a_server_invalidates_the_cache(self):
+        with self.app.app_context():
+            self.assertEqual(len(get_servers()), 1)
+            server = Server()
+            server.hostname = 'second.example.com'
+            db.session.add(server)
+            db.session.commit()
+            self.assertEqual(len(get_servers()), 2)
+        with self.app.app_context():
+            self.assertEqual(len(get_servers()), 2)
+
+    def test_cached_instances_can_be_modified(self):
+        with self.app.app_context():
+            get_app_config()
+        with self.app.app_context():
+            get_app_config().gluu_version = '3.1.5'
+            db.session.commit()
+        with self.app.app_context():
+            self.assertEqual(get_app_config().gluu_version, '3.1.5')
+            self.assertEqual(get_primary_server().hostname,
+                             'primary.example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
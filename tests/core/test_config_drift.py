@@ -0,0 +1,72 @@
+import json
+import unittest
+from contextlib import contextmanager
+
+from mock import MagicMock, patch
+
+from clustermgr.core.config_drift import ConfigNode, json_diff, load_value, \
+    read_node
+
+
+class JsonDiffTestCase(unittest.TestCase):
+    def test_differing_nested_keys_are_reported_by_path(self):
+        expected = {'a': 1, 'b': {'c': 2, 'd': 3}}
+        actual = {'a': 1, 'b': {'c': 5}, 'e': 6}
+        self.assertEqual(json_diff(expected, actual), [
+            {'key': 'b.c', 'expected': 2, 'actual': 5},
+            {'key': 'b.d', 'expected': 3, 'actual': None},
+            {'key': 'e', 'expected': None, 'actual': 6},
+        ])
+
+    def test_equal_documents_have_no_diff(self):
+        self.assertEqual(json_diff({'a': [1, 2]}, {'a': [1, 2]}), [])
+
+    def test_nested_json_strings_are_loaded(self):
+        value = load_value([json.dumps({'config': json.dumps({'a': 1})})])
+        self.assertEqual(value, {'config': {'a': 1}})
+
+
+class ReadNodeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.bound = True
+        self.searched = []
+
+        def search(search_base, attributes, **kwargs):
+            self.searched.append(sorted(attributes))
+            values = {'oxRevision': ['7'], 'modifyTimestamp': ['20180101'],
+                      'oxAuthConfDynamic': ['{"issuer": "a"}'],
+                      'oxCacheConfiguration': ['{"cacheProviderType": "IN_MEMORY"}'],
+                      'oxIDPAuthentication': ['{"type": "auth"}']}
+            self.conn.response = [{'attributes': dict(
+                (a, values[a]) for a in attributes)}]
+
+        self.conn.search.side_effect = search
+
+        @contextmanager
+        def leased(*args):
+            yield self.conn
+
+        patcher = patch('clustermgr.core.config_drift.ldap_pool')
+        self.pool = patcher.start()
+        self.pool.connection.side_effect = leased
+        self.addCleanup(patcher.stop)
+        self.node = ConfigNode('ldp', 'ldp:1636', 'cn=dm', 'secret')
+
+    def test_values_are_read_on_the_first_check(self):
+        state = read_node(self.node, '1234', {})
+        self.assertEqual(state['oxAuthConfDynamic']['value'], {'issuer': 'a'})
+        self.assertEqual(state['oxAuthConfDynamic']['version'], '7')
+        self.assertIsNotNone(state['oxIDPAuthentication']['hash'])
+
+    def test_values_are_not_read_when_versions_are_unchanged(self):
+        known = read_node(self.node, '1234', {})
+        self.searched = []
+        state = read_node(self.node, '1234', known)
+        self.assertEqual(state, known)
+        self.assertEqual(sorted(self.searched),
+                         [['modifyTimestamp'], ['oxRevision']])
+
+
+if __name__ == '__main__':
+    unittest.main()
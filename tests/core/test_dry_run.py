@@ -0,0 +1,110 @@
+import unittest
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import Server, DeploymentRun, DeploymentStep
+from clustermgr.core import dry_run
+from clustermgr.core.dry_run import Plan, RecordingRemoteClient, \
+    estimate_durations, plan_task
+from clustermgr.core.step_graph import Step, StepGraph
+
+
+class RecordingRemoteClientTestCase(unittest.TestCase):
+    def setUp(self):
+        self.plan = Plan()
+        self.plan.add_server('h1', '10.0.0.1', 'CentOS 7')
+        dry_run._state.plan = self.plan
+
+    def tearDown(self):
+        dry_run._state.plan = None
+
+    def test_operations_are_recorded_per_host(self):
+        c = RecordingRemoteClient('h1', ip='10.0.0.1')
+        c.startup()
+        c.run('service gluu-server restart')
+        c.upload('/tmp/keystore', '/opt/opendj/config/keystore')
+        c.put_file('/etc/csync2.cfg', 'group gluucluster')
+        self.assertEqual([o['kind'] for o in self.plan.hosts['h1']],
+                         ['run', 'upload', 'write'])
+
+    def test_written_files_exist_and_can_be_read_back(self):
+        c = RecordingRemoteClient('h1')
+        self.assertFalse(c.exists('/etc/csync2.cfg'))
+        self.assertTrue(c.exists('/opt/gluu-server-3.1.6'))
+        c.put_file('/etc/csync2.cfg', 'group gluucluster')
+        self.assertTrue(c.exists('/etc/csync2.cfg'))
+        self.assertEqual(c.get_file('/etc/csync2.cfg')[1].read(),
+                         'group gluucluster')
+
+    def test_os_is_answered_from_the_server(self):
+        c = RecordingRemoteClient('h1')
+        files = c.run('ls /etc/*release')[1].split()
+        self.assertIn('CentOS Linux release 7.',
+                      c.run('cat ' + files[0])[1])
+
+
+class EstimateTestCase(unittest.TestCase):
+    def test_timings_of_other_hosts_are_used(self):
+        graph = StepGraph([Step('a', None, hosts=['h1', 'h2', 'h3']),
+                           Step('b', None)])
+        durations = estimate_durations(graph, {('a', 'h1'): 2.0,
+                                               ('a', 'h2'): 4.0})
+        self.assertEqual(durations[('a', 'h1')], 2.0)
+        self.assertEqual(durations[('a', 'h3')], 3.0)
+        self.assertIsNone(durations[('b', None)])
+
+
+class FakeTask(object):
+    name = 'fake'
+
+    def __init__(self, body):
+        self.run = body
+
+
+class PlanTaskTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_task_is_planned_without_changes(self):
+        from clustermgr.tasks import cluster
+
+        def restart(ctx, host):
+            c = cluster.RemoteClient(host)
+            c.startup()
+            c.run('/sbin/gluu-serverd-3.1.6 restart')
+
+        def body(hostname):
+            db.session.add(Server(hostname=hostname))
+            db.session.commit()
+            graph = StepGraph([Step('restart', restart, hosts=[hostname])])
+            return graph.run('restart', {}, inputs={'host': hostname},
+                             timeout=60).status == 'success'
+
+        run = DeploymentRun(run_key='restart', status='success')
+        db.session.add(run)
+        db.session.add(DeploymentStep(run=run, step='restart', host='h1',
+                                      status='success', duration=12.0))
+        db.session.commit()
+        original = cluster.RemoteClient
+
+        plan = plan_task(FakeTask(body), 'h1')
+
+        self.assertTrue(plan.result)
+        self.assertEqual(plan.hosts['h1'][0]['detail'],
+                         '/sbin/gluu-serverd-3.1.6 restart')
+        self.assertEqual(plan.estimate, 12.0)
+        self.assertEqual(Server.query.count(), 0)
+        self.assertIs(cluster.RemoteClient, original)
+        self.assertEqual(DeploymentRun.query.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import unittest
+from datetime import datetime, timedelta
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import HostFact
+from clustermgr.core.host_facts import HostFactStore, gather, \
+    parse_os_release, parse_manifest_version, container_layout
+
+
+class FakeClient(object):
+    host = 'c1.example.com'
+
+    def __init__(self):
+        self.commands = []
+
+    def run(self, cmd):
+        self.commands.append(cmd)
+        if cmd == 'ls /etc/*release':
+            return '', '/etc/centos-release\n/etc/os-release\n', ''
+        if cmd.startswith('cat '):
+            return '', 'CentOS Linux release 7.5.1804 (Core)\n', ''
+        if 'MANIFEST.MF' in cmd:
+            return '', ('Manifest-Version: 1.0\n'
+                        'Implementation-Version: 3.1.6.Final\n'), ''
+        return '', '', ''
+
+    def listdir(self, dirname):
+        self.commands.append('listdir ' + dirname)
+        return True, ['jre', 'gluu-server-3.1.6']
+
+    def exists(self, path):
+        self.commands.append('exists ' + path)
+        return True
+
+
+class ParseTestCase(unittest.TestCase):
+    def test_os_release(self):
+        self.assertEqual(parse_os_release(
+            'CentOS Linux release 7.5.1804 (Core)'), 'CentOS 7')
+        self.assertEqual(parse_os_release(
+            'DISTRIB_ID=Ubuntu\nDISTRIB_RELEASE=18.04'), 'Ubuntu 18')
+        self.assertIsNone(parse_os_release('Fedora release 28'))
+
+    def test_manifest_version(self):
+        self.assertEqual(parse_manifest_version(
+            'Implementation-Version: 3.1.4.sp1.Final\n'), '3.1.4')
+        self.assertIsNone(parse_manifest_version('Manifest-Version: 1.0'))
+
+    def test_container_layout(self):
+        self.assertEqual(container_layout('CentOS 7'), 'ssh')
+        self.assertEqual(container_layout('Ubuntu 18'), 'ssh')
+        self.assertEqual(container_layout('Ubuntu 16'), 'chroot')
+
+
+class GatherTestCase(unittest.TestCase):
+    def test_facts_depending_on_others_use_the_known_ones(self):
+        c = FakeClient()
+        facts = gather(c, ['gluu_installed'], {'gluu_versions': ['3.1.4']})
+        self.assertEqual(facts, {'gluu_installed': ['3.1.4']})
+        self.assertNotIn('listdir /opt', c.commands)
+
+    def test_all_facts(self):
+        facts = gather(FakeClient(), ['os_type', 'oxauth_versions',
+                                      'gluu_installed'])
+        self.assertEqual(facts['os_type'], 'CentOS 7')
+        self.assertEqual(facts['gluu_versions'], ['3.1.6'])
+        self.assertEqual(facts['oxauth_versions'], {'3.1.6': '3.1.6'})
+        self.assertEqual(facts['gluu_installed'], ['3.1.6'])
+
+    def test_failed_facts_are_left_out(self):
+        c = FakeClient()
+        c.listdir = None
+        facts = gather(c, ['os_type', 'gluu_installed'])
+        self.assertEqual(facts, {'os_type': 'CentOS 7'})
+
+
+class HostFactStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.store = HostFactStore({'os_type': 3600, 'gluu_versions': 60,
+                                    'oxauth_versions': 60,
+                                    'gluu_installed': 60})
+
+    def tearDown(self):
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_facts_are_gathered_once(self):
+        c = FakeClient()
+        facts = self.store.get(c.host, ['os_type'], client=c)
+        self.assertEqual(facts, {'os_type': 'CentOS 7'})
+        gathered = len(c.commands)
+
+        self.assertEqual(self.store.get(c.host, ['os_type'], client=c),
+                         {'os_type': 'CentOS 7'})
+        self.assertEqual(len(c.commands), gathered)
+        self.assertEqual(self.store.os_type(c.host), 'CentOS 7')
+
+    def test_expired_facts_are_gathered_again(self):
+        c = FakeClient()
+        self.store.get(c.host, ['gluu_versions', 'os_type'], client=c)
+        row = HostFact.query.filter_by(name='gluu_versions').first()
+        row.gathered_at = datetime.utcnow() - timedelta(seconds=120)
+        db.session.commit()
+
+        c.commands = []
+        self.store.get(c.host, ['gluu_versions', 'os_type'], client=c)
+        self.assertEqual(c.commands, ['listdir /opt'])
+
+    def test_invalidated_facts_are_gathered_again(self):
+        c = FakeClient()
+        self.store.get(c.host, client=c)
+        self.store.invalidate(c.host, ['gluu_installed'])
+        self.assertNotIn('gluu_installed', self.store.cached(c.host))
+        self.assertIn('os_type', self.store.cached(c.host))
+
+    def test_unknown_os_type_is_not_stored(self):
+        c = FakeClient()
+        run = c.run
+        c.run = lambda cmd: ('', 'Fedora release 28\n', '') \
+            if cmd.startswith('cat ') else run(cmd)
+
+        self.assertEqual(self.store.get(c.host, ['os_type'], client=c),
+                         {'os_type': None})
+        self.assertEqual(self.store.cached(c.host), {})
+
+        c.commands = []
+        self.store.get(c.host, ['os_type'], client=c)
+        self.assertIn('ls /etc/*release', c.commands)
+
+    def test_unknown_os_type_falls_back_to_the_default(self):
+        self.assertEqual(self.store.os_type('c2.example.com', 'RHEL 7'),
+                         'RHEL 7')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
+import threading
 import unittest
 
-from mock import patch
+from mock import patch, MagicMock
 
-from clustermgr.core.ldap_functions import LdapOLC, MODIFY_ADD, MODIFY_DELETE
+from clustermgr.core.ldap_functions import LdapOLC, LdapPool, MODIFY_ADD, \
+    MODIFY_DELETE, LdapPoolTimeout, paged_search, search_first
 
 
 class LdapOlcTestCase(unittest.TestCase):
@@ -30,5 +32,112 @@ class LdapOlcTestCase(unittest.TestCase):
         assert self.mgr.conn.modify.call_count == 2
 
 
+class LdapPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.pool = LdapPool(max_idle=1)
+
+    @patch('clustermgr.core.ldap_functions.Connection')
+    def test_released_connection_is_reused(self, mockconn):
+        conn = mockconn.return_value
+        conn.closed = False
+        self.pool.release(self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's'))
+        self.assertIs(self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's'), conn)
+        mockconn.assert_called_once()
+        conn.unbind.assert_not_called()
+
+    @patch('clustermgr.core.ldap_functions.Connection')
+    def test_connections_are_pooled_per_bind_dn(self, mockconn):
+        conn = mockconn.return_value
+        conn.closed = False
+        self.pool.release(self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's'))
+        self.pool.acquire('ldaps://ldp:1636', 'cn=config', 's')
+        assert mockconn.call_count == 2
+
+    @patch('clustermgr.core.ldap_functions.Connection')
+    def test_idle_connections_are_evicted(self, mockconn):
+        conn = mockconn.return_value
+        conn.closed = False
+        self.pool.idle_timeout = -1
+        self.pool.release(self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's'))
+        self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's')
+        conn.unbind.assert_called_once()
+        assert mockconn.call_count == 2
+
+    @patch('clustermgr.core.ldap_functions.Connection')
+    def test_full_pool_times_out(self, mockconn):
+        mockconn.return_value.closed = False
+        self.pool.max_size = 2
+        self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's')
+        self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's')
+        with self.assertRaises(LdapPoolTimeout):
+            self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's', timeout=0.1)
+        assert mockconn.call_count == 2
+
+        # other bind dns have their own pool
+        self.pool.acquire('ldaps://ldp:1636', 'cn=config', 's', timeout=0)
+
+    @patch('clustermgr.core.ldap_functions.Connection')
+    def test_full_pool_waits_for_a_release(self, mockconn):
+        conns = [MagicMock(closed=False), MagicMock(closed=False)]
+        mockconn.side_effect = conns
+        self.pool.max_size = 1
+        conn = self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's')
+
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(
+            self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 's', timeout=5)))
+        waiter.start()
+        waiter.join(0.2)
+        self.assertEqual(acquired, [])
+
+        self.pool.release(conn)
+        waiter.join(5)
+        self.assertEqual(acquired, [conn])
+        mockconn.assert_called_once()
+
+    @patch('clustermgr.core.ldap_functions.Connection')
+    def test_unbound_connections_free_their_slot(self, mockconn):
+        conn = mockconn.return_value
+        conn.closed = False
+        conn.bind.return_value = False
+        self.pool.max_size = 1
+        self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 'wrong')
+        self.pool.acquire('ldaps://ldp:1636', 'cn=dm', 'wrong', timeout=0)
+        assert mockconn.call_count == 2
+
+
+class PagedSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.conn = MagicMock()
+
+    def test_yields_only_entries(self):
+        self.conn.extend.standard.paged_search.return_value = iter([
+            {'type': 'searchResEntry', 'dn': 'inum=1,o=gluu'},
+            {'type': 'searchResRef', 'uri': ['ldap://other']},
+            {'type': 'searchResEntry', 'dn': 'inum=2,o=gluu'},
+        ])
+        dns = [e['dn'] for e in paged_search(self.conn, 'o=gluu',
+                                              '(inum=*)', ['inum'])]
+        self.assertEqual(dns, ['inum=1,o=gluu', 'inum=2,o=gluu'])
+        kwargs = self.conn.extend.standard.paged_search.call_args[1]
+        self.assertEqual(kwargs['attributes'], ['inum'])
+        self.assertTrue(kwargs['generator'])
+
+    def test_attributes_are_required(self):
+        with self.assertRaises(ValueError):
+            list(paged_search(self.conn, 'o=gluu', '(inum=*)', []))
+
+    def test_search_first_limits_the_search_to_one_entry(self):
+        self.conn.response = [{'type': 'searchResEntry', 'dn': 'inum=1'}]
+        self.assertEqual(search_first(self.conn, 'o=gluu', '(inum=*)',
+                                      ['inum'])['dn'], 'inum=1')
+        self.assertEqual(self.conn.search.call_args[1]['size_limit'], 1)
+
+    def test_search_first_returns_none_without_match(self):
+        self.conn.response = []
+        self.assertIsNone(search_first(self.conn, 'o=gluu', '(inum=*)',
+                                       ['inum']))
+
+
 if __name__ == '__main__':
     unittest.main()
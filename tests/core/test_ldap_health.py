@@ -0,0 +1,47 @@
+import unittest
+
+from mock import patch
+
+from clustermgr.core.ldap_health import check_ldap, check_ldap_servers
+
+
+class CheckLdapTestCase(unittest.TestCase):
+    @patch('clustermgr.core.ldap_health.Connection')
+    def test_server_answering_the_root_dse_search_is_up(self, mockconn):
+        conn = mockconn.return_value
+        conn.bind.return_value = True
+        conn.search.return_value = True
+        result = check_ldap('ldp.example.com')
+        self.assertTrue(result['up'])
+        self.assertTrue(result['bind'])
+        self.assertIsNone(result['error'])
+        self.assertIsNotNone(result['search_time'])
+        conn.unbind.assert_called_once()
+
+    @patch('clustermgr.core.ldap_health.Connection')
+    def test_failed_bind_is_reported(self, mockconn):
+        conn = mockconn.return_value
+        conn.bind.return_value = False
+        conn.result = {'description': 'invalidCredentials'}
+        result = check_ldap('ldp.example.com')
+        self.assertFalse(result['up'])
+        self.assertEqual(result['error'], 'invalidCredentials')
+        conn.search.assert_not_called()
+
+    @patch('clustermgr.core.ldap_health.Connection')
+    def test_unreachable_server_is_down(self, mockconn):
+        mockconn.return_value.open.side_effect = Exception('timed out')
+        result = check_ldap('ldp.example.com')
+        self.assertFalse(result['up'])
+        self.assertIsNone(result['connect_time'])
+        self.assertEqual(result['error'], 'timed out')
+
+    @patch('clustermgr.core.ldap_health.check_ldap')
+    def test_all_servers_are_checked(self, mockcheck):
+        mockcheck.side_effect = lambda h, port, timeout: {'up': h == 'a'}
+        results = check_ldap_servers(['a', 'b'])
+        self.assertEqual(results, {'a': {'up': True}, 'b': {'up': False}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mock import MagicMock, patch
+
+from clustermgr.core.ldif_pipeline import Checkpoint, LdifImporter
+
+
+LDIF = """dn: o=gluu
+objectClass: top
+objectClass: organization
+o: gluu
+entryUUID: 8f9c0a4e-0000-0000-0000-000000000000
+
+dn: ou=people,o=gluu
+objectClass: top
+objectClass: organizationalUnit
+ou: people
+
+dn: uid=user1,ou=people,o=gluu
+objectClass: top
+objectClass: inetOrgPerson
+uid: user1
+cn: User 1
+sn: One
+
+dn: uid=user2,ou=people,o=gluu
+objectClass: top
+objectClass: inetOrgPerson
+uid: user2
+cn: User 2
+sn: Two
+
+"""
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'import.checkpoint')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_checkpoint_advances_over_contiguous_batches_only(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.complete(1, 'cn=b', 2)
+        self.assertEqual(checkpoint.entries, 0)
+        self.assertFalse(os.path.exists(self.path))
+
+        checkpoint.complete(0, 'cn=a', 2)
+        self.assertEqual(checkpoint.entries, 4)
+        self.assertEqual(checkpoint.dn, 'cn=b')
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {'dn': 'cn=b', 'entries': 4})
+
+    def test_wait_returns_when_earlier_batches_complete(self):
+        checkpoint = Checkpoint(None)
+        timer = threading.Timer(0.1, checkpoint.complete, [0, 'cn=a', 1])
+        timer.start()
+        self.assertTrue(checkpoint.wait(1, lambda: False))
+        self.assertTrue(checkpoint.wait(0, lambda: True))
+        self.assertFalse(checkpoint.wait(2, lambda: True))
+
+    def test_checkpoint_is_loaded(self):
+        Checkpoint(self.path).complete(0, 'cn=a', 3)
+        checkpoint = Checkpoint(self.path)
+        self.assertEqual((checkpoint.entries, checkpoint.dn), (3, 'cn=a'))
+
+
+class LdifImporterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.ldif_file = os.path.join(self.tmp_dir, 'data.ldif')
+        with open(self.ldif_file, 'w') as f:
+            f.write(LDIF)
+        self.added = []
+
+        def add(dn, attributes):
+            self.added.append((dn, attributes))
+            conn.result = {'description': 'success'}
+
+        conn = MagicMock()
+        conn.bound = True
+        conn.closed = False
+        conn.add.side_effect = add
+        self.conn = conn
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_import(self, **kwargs):
+        with patch('clustermgr.core.ldif_pipeline.ldap_pool') as pool:
+            pool.acquire.return_value = self.conn
+            importer = LdifImporter(self.ldif_file, 'localhost:1636',
+                                    'cn=directory manager', 'secret',
+                                    workers=2, batch_size=1, **kwargs)
+            return importer.run()
+
+    def test_all_entries_are_added(self):
+        stats = self.run_import()
+        self.assertEqual(stats['added'], 4)
+        self.assertEqual(len(self.added), 4)
+
+    def test_operational_attributes_are_not_added(self):
+        self.run_import()
+        attributes = dict(self.added)['o=gluu']
+        self.assertNotIn('entryUUID', attributes)
+
+    def test_import_resumes_after_the_checkpoint(self):
+        checkpoint_file = self.ldif_file + '.checkpoint'
+        with open(checkpoint_file, 'w') as f:
+            json.dump({'dn': 'ou=people,o=gluu', 'entries': 2}, f)
+
+        stats = self.run_import(checkpoint_file=checkpoint_file)
+
+        self.assertEqual(stats['added'], 2)
+        self.assertEqual(sorted(dn for dn, _ in self.added),
+                         ['uid=user1,ou=people,o=gluu',
+                          'uid=user2,ou=people,o=gluu'])
+        self.assertFalse(os.path.exists(checkpoint_file))
+
+    def test_child_waits_for_a_parent_written_by_another_worker(self):
+        lock = threading.Lock()
+
+        def connection(*args):
+            conn = MagicMock(bound=True, closed=False)
+
+            def add(dn, attributes):
+                if dn == 'ou=people,o=gluu':
+                    # slower than the retries of the children
+                    threading.Event().wait(0.5)
+                parent = dn.split(',', 1)[1] if ',' in dn else None
+                with lock:
+                    if parent and parent not in dict(self.added):
+                        conn.result = {'description': 'noSuchObject'}
+                        return
+                    self.added.append((dn, attributes))
+                conn.result = {'description': 'success'}
+            conn.add.side_effect = add
+            return conn
+
+        with patch('clustermgr.core.ldif_pipeline.ldap_pool') as pool, \
+                patch('clustermgr.core.ldif_pipeline.time.sleep'):
+            pool.acquire.side_effect = connection
+            importer = LdifImporter(self.ldif_file, 'localhost:1636',
+                                    'cn=directory manager', 'secret',
+                                    workers=3, batch_size=1)
+            stats = importer.run()
+
+        self.assertEqual(stats['added'], 4)
+        self.assertNotIn('rejected', stats)
+        self.assertFalse(os.path.exists(self.ldif_file + '.rejects'))
+
+if __name__ == '__main__':
+    unittest.main()
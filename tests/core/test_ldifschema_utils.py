@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from clustermgr.core.ldifschema_utils import OpenDjSchema
+
+
+SCHEMA = """dn: cn=schema
+objectClass: top
+objectClass: ldapSubentry
+objectClass: subschema
+attributeTypes: ( 1.3.6.1.4.1.48710.1.3.1 NAME 'myAttr' SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 X-ORIGIN 'Gluu custom' )
+objectClasses: ( 1.3.6.1.4.1.48710.1.4.200 NAME 'gluuCustomPerson' SUP top AUXILIARY MAY myAttr )
+"""
+
+
+class OpenDjSchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.schema_file = os.path.join(self.tmp_dir, '77-customAttributes.ldif')
+        with open(self.schema_file, 'w') as f:
+            f.write(SCHEMA)
+        self.schema = OpenDjSchema(self.schema_file)
+
+    def test_attributes_are_found_by_name_and_oid(self):
+        self.assertEqual(self.schema.get_attribute_by_name('myattr').names,
+                         ('myAttr',))
+        self.assertIs(
+            self.schema.get_attribute_by_name('1.3.6.1.4.1.48710.1.3.1'),
+            self.schema.get_attribute_by_name('myAttr'))
+        self.assertIsNone(self.schema.get_attribute_by_name('missing'))
+
+    def test_added_attributes_are_indexed(self):
+        self.schema.add_attribute(oid='1.3.6.1.4.1.48710.1.3.2',
+                                  names=['otherAttr'],
+                                  syntax='1.3.6.1.4.1.1466.115.121.1.15',
+                                  origin='Gluu custom')
+        self.assertEqual(self.schema.get_attribute_by_name('otherAttr').oid,
+                         '1.3.6.1.4.1.48710.1.3.2')
+
+    def test_attribute_is_added_to_class_found_by_name(self):
+        self.schema.add_attribute_to_class('gluucustomperson', 'otherAttr')
+        self.assertEqual(self.schema.get_class_by_name('gluuCustomPerson').may,
+                         ('myAttr', 'otherAttr'))
+
+
+if __name__ == '__main__':
+    unittest.main()
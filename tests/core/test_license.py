@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from mock import patch
+
+from clustermgr.core.license import LicenseManager
+
+
+class LicenseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        app = Flask(__name__)
+        app.config["LICENSE_CONFIG_FILE"] = os.path.join(self.tmp, "license.ini")
+        app.config["LICENSE_SIGNED_FILE"] = os.path.join(self.tmp, "signed")
+        self.manager = LicenseManager(app)
+        self.manager.dump_license_config({"license_id": "1"})
+        with open(app.config["LICENSE_SIGNED_FILE"], "w") as f:
+            f.write("signed")
+
+        patcher = patch.object(self.manager, "validate_license_uncached",
+                               return_value=({"valid": True, "metadata": {}}, ""))
+        self.validate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_license_is_validated_once(self):
+        self.manager.validate_license()
+        self.manager.validate_license()
+        self.validate.assert_called_once()
+
+    def test_changed_config_is_validated_again(self):
+        self.manager.validate_license()
+        self.manager.dump_license_config({"license_id": "2"})
+        self.manager.validate_license()
+        self.assertEqual(self.validate.call_count, 2)
+
+    def test_removed_signed_license_is_validated_again(self):
+        self.manager.validate_license()
+        os.unlink(self.manager.app.config["LICENSE_SIGNED_FILE"])
+        self.manager.validate_license()
+        self.assertEqual(self.validate.call_count, 2)
+
+    def test_expired_result_is_returned_and_refreshed(self):
+        self.manager.validate_license()
+        self.manager.app.config["LICENSE_CACHE_TTL"] = -1
+        with patch.object(self.manager, "_refresh_in_background") as refresh:
+            data, err = self.manager.validate_license()
+        self.assertTrue(data["valid"])
+        refresh.assert_called_once()
+        self.validate.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import TaskProfile
+from clustermgr.core import profiling
+from clustermgr.core.profiling import TaskProfiler, flame_tree, profile, \
+    span, step, timed
+
+
+class Client(object):
+    def __init__(self, host):
+        self.host = host
+
+    @timed('ssh', label=lambda self, command: command,
+           size=lambda self, command, result: len(result))
+    def run(self, command):
+        return 'output'
+
+
+class TaskProfilerTestCase(unittest.TestCase):
+    def test_operations_are_summed_per_host_step_kind_and_label(self):
+        profiler = TaskProfiler('tid', 'task')
+        profiler.add('h1', 'ssh', 'ls  -l\n/opt', 1.0, 10)
+        profiler.add('h1', 'ssh', 'ls -l /opt', 0.5, 5)
+        with step('install'):
+            profiler.add('h1', 'ssh', 'ls -l /opt', 2.0)
+
+        rows = sorted(profiler.rows())
+        self.assertEqual(rows, [['h1', '', 'ssh', 'ls -l /opt', 2, 1.5, 15],
+                                ['h1', 'install', 'ssh', 'ls -l /opt', 1,
+                                 2.0, 0]])
+
+    def test_labels_are_cut(self):
+        profiler = TaskProfiler('tid', 'task')
+        profiler.add('h1', 'ssh', 'x' * 500, 1.0)
+        self.assertEqual(len(profiler.rows()[0][3]), profiling.LABEL_LENGTH)
+
+
+class TimedTestCase(unittest.TestCase):
+    def tearDown(self):
+        profiling._active = None
+
+    def test_nothing_is_recorded_outside_of_a_profile(self):
+        self.assertEqual(Client('h1').run('ls'), 'output')
+        self.assertIsNone(profiling.active_profiler())
+
+    def test_calls_are_recorded_with_host_and_size(self):
+        profiler = TaskProfiler('tid', 'task')
+        profiling._active = profiler
+        with step('configure'):
+            Client('h1').run('ls')
+        with span('influxdb', 'localhost', 'cpu_info') as s:
+            s['bytes'] = 42
+
+        rows = sorted(profiler.rows())
+        self.assertEqual(rows[0][:5], ['h1', 'configure', 'ssh', 'ls', 1])
+        self.assertEqual(rows[0][6], len('output'))
+        self.assertEqual(rows[1][:5], ['localhost', '', 'influxdb',
+                                       'cpu_info', 1])
+        self.assertEqual(rows[1][6], 42)
+
+
+class FlameTreeTestCase(unittest.TestCase):
+    def test_rows_are_nested_and_sorted(self):
+        tree = flame_tree([
+            ['h1', 'install', 'ssh', 'yum install', 1, 10.0, 0],
+            ['h1', 'install', 'upload', '/tmp/a', 2, 1.0, 100],
+            ['h2', '', 'ldap', 'search', 3, 20.0, 0],
+        ])
+        self.assertEqual([n['name'] for n in tree], ['h2', 'h1'])
+        h1 = tree[1]
+        self.assertEqual(h1['seconds'], 11.0)
+        self.assertEqual(h1['count'], 3)
+        self.assertEqual(h1['bytes'], 100)
+        install = h1['children'][0]
+        self.assertEqual(install['name'], 'install')
+        self.assertEqual([n['name'] for n in install['children']],
+                         ['ssh', 'upload'])
+        self.assertEqual(tree[0]['children'][0]['name'], 'task')
+
+
+class ProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_profile_is_stored_when_the_task_ends(self):
+        with profile('tid-1', 'install'):
+            Client('h1').run('ls')
+        self.assertIsNone(profiling.active_profiler())
+
+        stored = TaskProfile.query.filter_by(task_id='tid-1').first()
+        self.assertEqual(stored.task_name, 'install')
+        self.assertEqual(stored.get_spans()[0][:5],
+                         ['h1', '', 'ssh', 'ls', 1])
+
+    def test_short_and_empty_profiles_are_not_stored(self):
+        with profile('tid-1', 'install', min_duration=60):
+            Client('h1').run('ls')
+        with profile('tid-2', 'install'):
+            pass
+        self.assertEqual(TaskProfile.query.count(), 0)
+
+    def test_nested_profiles_are_part_of_the_outer_one(self):
+        with profile('tid-1', 'outer') as outer:
+            with profile('tid-2', 'inner') as inner:
+                Client('h1').run('ls')
+            self.assertIs(inner, outer)
+        self.assertEqual([p.task_id for p in TaskProfile.query.all()],
+                         ['tid-1'])
+
+    def test_only_the_latest_profiles_are_kept(self):
+        for i in range(4):
+            with profile('tid-{}'.format(i), 'install', keep=2):
+                Client('h1').run('ls')
+        self.assertEqual(sorted(p.task_id for p in TaskProfile.query.all()),
+                         ['tid-2', 'tid-3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
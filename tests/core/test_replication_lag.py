@@ -0,0 +1,70 @@
+import unittest
+from contextlib import contextmanager
+
+from mock import MagicMock, patch
+
+from clustermgr.core.replication_lag import ProbeTarget, \
+    measure_replication_lag
+
+
+class FakeDirectory(object):
+    """Marker entries replicated only to the servers in `replicates_to`"""
+    def __init__(self, replicates_to):
+        self.replicates_to = replicates_to
+        self.entries = {}
+
+    def connection(self, server):
+        conn = MagicMock()
+        conn.bound = True
+        conn.result = {'description': 'success'}
+
+        def modify(dn, changes):
+            token = changes['description'][0][1][0]
+            for name in self.replicates_to + [server.name]:
+                self.entries[(name, dn)] = token
+
+        def search(search_base, **kwargs):
+            token = self.entries.get((server.name, search_base))
+            conn.response = [{'attributes': {'description': [token]}}] \
+                if token else []
+            return bool(token)
+
+        conn.modify.side_effect = modify
+        conn.search.side_effect = search
+
+        @contextmanager
+        def leased():
+            yield conn
+        return leased()
+
+
+class MeasureReplicationLagTestCase(unittest.TestCase):
+    def setUp(self):
+        self.servers = [ProbeTarget(name, name + ':1636', 'cn=dm', 'secret')
+                        for name in ('a', 'b', 'c')]
+
+    def measure(self, directory):
+        with patch.object(ProbeTarget, 'connection',
+                          lambda server: directory.connection(server)):
+            return measure_replication_lag(self.servers, timeout=0.3,
+                                           interval=0.05)
+
+    def test_lag_is_measured_for_every_pair(self):
+        lags = self.measure(FakeDirectory(['a', 'b', 'c']))
+        self.assertEqual(sorted(lags), ['a', 'b', 'c'])
+        self.assertEqual(sorted(lags['a']), ['b', 'c'])
+        for targets in lags.values():
+            for lag in targets.values():
+                self.assertIsNotNone(lag)
+
+    def test_markers_that_do_not_arrive_have_no_lag(self):
+        lags = self.measure(FakeDirectory(['a']))
+        self.assertIsNone(lags['b']['c'])
+        self.assertIsNotNone(lags['b']['a'])
+
+    def test_a_single_server_is_not_probed(self):
+        self.assertEqual(measure_replication_lag(self.servers[:1]), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
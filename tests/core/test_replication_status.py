@@ -0,0 +1,49 @@
+import unittest
+
+from clustermgr.core.replication_status import parse_replication_status
+
+
+STATUS = """
+Suffix DN : Server           : Entries : Replication enabled : DS ID : RS ID : RS Port (1) : M.C. (2) : A.O.M.C. (3) : Security (4)
+----------:------------------:---------:---------------------:-------:-------:-------------:----------:--------------:-------------
+o=gluu    : c1.gluu.org:4444 : 1250    : true                : 2236  : 16104 : 8989        : 0        :              : true
+o=gluu    : c2.gluu.org:4444 : 1248    : true                : 30466 : 31570 : 8989        : 2        : 5            : true
+o=site    : c2.gluu.org:4444 : 4       : false               :       :       :             :          :              :
+
+[1] The port used to communicate between the servers whose contents are
+being replicated.
+"""
+
+
+class ParseReplicationStatusTestCase(unittest.TestCase):
+    def setUp(self):
+        self.records = parse_replication_status(STATUS)
+
+    def test_a_record_is_returned_per_server_and_base_dn(self):
+        self.assertEqual(
+            [(r['base_dn'], r['hostname']) for r in self.records],
+            [('o=gluu', 'c1.gluu.org'), ('o=gluu', 'c2.gluu.org'),
+             ('o=site', 'c2.gluu.org')])
+
+    def test_values_are_converted(self):
+        record = self.records[1]
+        self.assertEqual(record['admin_port'], 4444)
+        self.assertEqual(record['entries'], 1248)
+        self.assertEqual(record['replication_port'], 8989)
+        self.assertEqual(record['missing_changes'], 2)
+        self.assertEqual(record['oldest_missing_change_age'], '5')
+        self.assertTrue(record['replication_enabled'])
+
+    def test_empty_cells_are_none(self):
+        record = self.records[2]
+        self.assertFalse(record['replication_enabled'])
+        self.assertIsNone(record['replication_port'])
+        self.assertIsNone(record['missing_changes'])
+
+    def test_output_without_table_returns_no_records(self):
+        self.assertEqual(parse_replication_status('Error connecting'), [])
+        self.assertEqual(parse_replication_status(None), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
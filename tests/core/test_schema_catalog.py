@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+from mock import MagicMock
+
+from clustermgr.core.schema_catalog import Schema, SchemaCatalog
+
+
+ATTRIBUTE = "( 1.3.6.1.4.1.48710.1.3.1 NAME 'myAttr' " \
+    "SYNTAX 1.3.6.1.4.1.1466.115.121.1.15 X-ORIGIN 'Gluu custom' )"
+OBJECT_CLASS = "( 1.3.6.1.4.1.48710.1.4.200 NAME 'gluuCustomPerson' " \
+    "SUP top AUXILIARY MAY myAttr )"
+
+
+def schema_response(timestamp):
+    return [{'attributes': {
+        'modifyTimestamp': [timestamp],
+        'attributeTypes': [ATTRIBUTE],
+        'objectClasses': [OBJECT_CLASS],
+        'ldapSyntaxes': [],
+    }}]
+
+
+class SchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.schema = Schema('1', [ATTRIBUTE], [OBJECT_CLASS], [])
+
+    def test_attributes_are_indexed_by_name_and_oid(self):
+        self.assertEqual(self.schema.get_attribute('myattr').names[0],
+                         'myAttr')
+        self.assertEqual(
+            self.schema.get_attribute_string('1.3.6.1.4.1.48710.1.3.1'),
+            ATTRIBUTE)
+        self.assertIsNone(self.schema.get_attribute('missing'))
+
+    def test_object_classes_are_indexed_by_name(self):
+        self.assertEqual(self.schema.get_class('gluuCustomPerson').may,
+                         ('myAttr',))
+
+    def test_custom_attributes_are_filtered_by_x_origin(self):
+        self.assertEqual(len(self.schema.get_custom_attributes(
+            "X-ORIGIN 'Gluu custom'")), 1)
+        self.assertEqual(self.schema.get_custom_attributes(
+            "X-ORIGIN 'other'"), [])
+
+
+class SchemaCatalogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.snapshot_dir = tempfile.mkdtemp()
+        self.catalog = SchemaCatalog(self.snapshot_dir, check_interval=0)
+        self.conn = MagicMock()
+        self.conn.response = schema_response('20180101000000Z')
+
+    def tearDown(self):
+        shutil.rmtree(self.snapshot_dir)
+
+    def test_schema_is_not_refetched_while_timestamp_is_unchanged(self):
+        first = self.catalog.get('server', self.conn)
+        second = self.catalog.get('server', self.conn)
+        self.assertIs(first, second)
+        # one full fetch and one timestamp check per get()
+        self.assertEqual(self.conn.search.call_count, 3)
+
+    def test_schema_is_reloaded_when_timestamp_changes(self):
+        first = self.catalog.get('server', self.conn)
+        self.conn.response = schema_response('20180202000000Z')
+        second = self.catalog.get('server', self.conn)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.timestamp, '20180202000000Z')
+
+    def test_snapshot_is_used_by_a_new_catalog(self):
+        self.catalog.get('server', self.conn)
+        catalog = SchemaCatalog(self.snapshot_dir, check_interval=0)
+        self.conn.reset_mock()
+        catalog.get('server', self.conn)
+        self.assertEqual(self.conn.search.call_count, 1)
+
+    def test_invalidate_drops_the_cached_schema(self):
+        first = self.catalog.get('server', self.conn)
+        self.catalog.invalidate('server')
+        self.assertIsNot(self.catalog.get('server', self.conn), first)
+
+    def test_snapshots_are_kept_in_the_data_dir_of_the_app(self):
+        app = Flask(__name__)
+        app.config['DATA_DIR'] = self.snapshot_dir
+        catalog = SchemaCatalog(check_interval=0)
+        with app.app_context():
+            catalog.get('server', self.conn)
+        self.assertTrue(os.path.exists(os.path.join(
+            self.snapshot_dir, 'schema_catalog', 'server.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from mock import MagicMock
+
+from clustermgr.core.schema_catalog import Schema
+from clustermgr.core.schema_changeset import SchemaChangeset, MODIFY_ADD, \
+    MODIFY_DELETE
+
+
+DIRECTORY_STRING = '1.3.6.1.4.1.1466.115.121.1.15'
+SYNTAX = "( {} DESC 'Directory String' )".format(DIRECTORY_STRING)
+ATTRIBUTE = "( 1.3.6.1.4.1.48710.1.3.1 NAME 'myAttr' " \
+    "SYNTAX {} X-ORIGIN 'Gluu custom' )".format(DIRECTORY_STRING)
+OBJECT_CLASS = "( 1.3.6.1.4.1.48710.1.4.200 NAME 'gluuCustomPerson' " \
+    "SUP top AUXILIARY MAY myAttr )"
+
+
+def attribute(n, syntax=DIRECTORY_STRING):
+    return "( 1.3.6.1.4.1.48710.1.3.{0} NAME 'attr{0}' SYNTAX {1} " \
+        "X-ORIGIN 'Gluu custom' )".format(n, syntax)
+
+
+class SchemaChangesetTestCase(unittest.TestCase):
+    def setUp(self):
+        schema = Schema('1', [ATTRIBUTE], [OBJECT_CLASS], [SYNTAX])
+        self.changeset = SchemaChangeset(schema)
+
+    def test_attributes_and_class_are_added_in_one_modify(self):
+        for n in range(10, 110):
+            self.changeset.add_attribute(attribute(n))
+        self.changeset.add_to_class(
+            'gluuCustomPerson', ['attr{}'.format(n) for n in range(10, 110)])
+
+        self.assertEqual(self.changeset.validate(), [])
+        modifications = self.changeset.modifications()
+        self.assertEqual(len(modifications), 1)
+        changes = modifications[0]
+        self.assertEqual(list(changes), ['attributeTypes', 'objectClasses'])
+        self.assertEqual(changes['attributeTypes'][0][0], MODIFY_ADD)
+        self.assertEqual(len(changes['attributeTypes'][0][1]), 100)
+        self.assertEqual(changes['objectClasses'][0],
+                         (MODIFY_DELETE, [OBJECT_CLASS]))
+
+    def test_existing_attribute_is_rejected(self):
+        self.changeset.add_attribute(ATTRIBUTE)
+        self.assertIn('already exists', self.changeset.validate()[0])
+
+    def test_unknown_syntax_is_rejected(self):
+        self.changeset.add_attribute(attribute(10, '1.2.3'))
+        self.assertIn('unknown syntax', self.changeset.validate()[0])
+
+    def test_class_must_not_refer_to_missing_attributes(self):
+        self.changeset.add_to_class('gluuCustomPerson', ['missing'])
+        self.assertIn('missing', self.changeset.validate()[0])
+
+    def test_attribute_in_use_can_not_be_removed(self):
+        self.changeset.remove_attribute('myAttr')
+        self.assertIn('gluuCustomPerson', self.changeset.validate()[0])
+
+    def test_removed_attribute_is_deleted_after_the_class_change(self):
+        self.changeset.remove_from_class('gluuCustomPerson', ['myAttr'])
+        self.changeset.remove_attribute('myAttr')
+        self.assertEqual(self.changeset.validate(), [])
+        modifications = self.changeset.modifications()
+        self.assertEqual(list(modifications[0]), ['objectClasses'])
+        self.assertEqual(modifications[1]['attributeTypes'],
+                         [(MODIFY_DELETE, [ATTRIBUTE])])
+
+    def test_replaced_attribute_is_deleted_and_added_in_one_modify(self):
+        new = ATTRIBUTE.replace("'myAttr'", "'myAttr' DESC 'changed'")
+        self.changeset.add_attribute(new, replaces='myAttr')
+        self.assertEqual(self.changeset.validate(), [])
+        self.assertEqual(self.changeset.modifications(), [
+            {'attributeTypes': [(MODIFY_DELETE, [ATTRIBUTE]),
+                                (MODIFY_ADD, [new])]}])
+
+    def test_attribute_with_a_new_oid_replaces_the_old_one_in_one_modify(self):
+        new = ATTRIBUTE.replace('1.3.6.1.4.1.48710.1.3.1',
+                                '1.3.6.1.4.1.48710.1.3.2')
+        self.changeset.add_attribute(new, replaces='myAttr')
+        self.assertEqual(self.changeset.validate(), [])
+        self.assertEqual(self.changeset.modifications(), [
+            {'attributeTypes': [(MODIFY_DELETE, [ATTRIBUTE]),
+                                (MODIFY_ADD, [new])]}])
+
+    def test_invalid_changes_are_not_applied(self):
+        conn = MagicMock()
+        self.changeset.add_to_class('missingClass', ['myAttr'])
+        result = self.changeset.apply(conn)
+        self.assertFalse(result[0])
+        conn.modify.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
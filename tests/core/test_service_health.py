@@ -0,0 +1,50 @@
+import unittest
+
+from mock import patch
+
+from clustermgr.core.service_health import check_services, check_servers, \
+    active_services
+
+
+class CheckServicesTestCase(unittest.TestCase):
+    @patch('clustermgr.core.service_health.RemoteClient')
+    def test_services_are_checked_with_one_command(self, mockclient):
+        c = mockclient.return_value
+        c.run.return_value = ('', 'oxauth 200 0.120\nidentity 503 0.050\n', '')
+        results = check_services('gluu.example.com', ['oxauth', 'identity'])
+
+        c.run.assert_called_once()
+        self.assertTrue(results['oxauth']['up'])
+        self.assertEqual(results['oxauth']['latency'], 0.12)
+        self.assertFalse(results['identity']['up'])
+        self.assertEqual(results['identity']['status_code'], 503)
+        c.close.assert_called_once()
+
+    @patch('clustermgr.core.service_health.RemoteClient')
+    def test_services_without_output_are_down(self, mockclient):
+        mockclient.return_value.run.return_value = ('', 'oxauth 200 0.1\n', '')
+        results = check_services('gluu.example.com', ['oxauth', 'passport'])
+        self.assertFalse(results['passport']['up'])
+        self.assertEqual(results['passport']['error'], 'No response')
+
+    @patch('clustermgr.core.service_health.RemoteClient')
+    def test_unreachable_server_has_all_services_down(self, mockclient):
+        mockclient.return_value.startup.side_effect = Exception('timed out')
+        results = check_services('gluu.example.com', ['oxauth', 'identity'])
+        self.assertFalse(any(r['up'] for r in results.values()))
+        self.assertEqual(results['oxauth']['error'], 'timed out')
+
+    @patch('clustermgr.core.service_health.check_services')
+    def test_all_servers_are_checked(self, mockcheck):
+        mockcheck.side_effect = lambda h, services, timeout: {'oxauth': h}
+        results = check_servers(['a', 'b'], ['oxauth'])
+        self.assertEqual(results, {'a': {'oxauth': 'a'}, 'b': {'oxauth': 'b'}})
+
+    def test_active_services_follow_setup_properties(self):
+        self.assertEqual(active_services({'installSaml': 'True',
+                                          'installPassport': 'False'}),
+                         ['oxauth', 'identity', 'shib'])
+
+
+if __name__ == '__main__':
+    unittest.main()
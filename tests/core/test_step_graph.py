@@ -0,0 +1,165 @@
+import threading
+import unittest
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import DeploymentRun
+from clustermgr.core.step_graph import Step, StepGraph, StepGraphError
+
+
+class StepGraphDependencyTestCase(unittest.TestCase):
+    def test_per_host_steps_require_the_same_host(self):
+        graph = StepGraph([
+            Step('a', None, hosts=['h1', 'h2']),
+            Step('b', None, hosts=['h1', 'h2', 'h3'], requires=['a']),
+        ])
+        self.assertEqual(graph.deps[('b', 'h1')], set([('a', 'h1')]))
+        self.assertEqual(graph.deps[('b', 'h3')],
+                         set([('a', 'h1'), ('a', 'h2')]))
+
+    def test_requires_all_waits_for_every_host(self):
+        graph = StepGraph([
+            Step('a', None, hosts=['h1', 'h2']),
+            Step('b', None, hosts=['h1'], requires_all=['a']),
+        ])
+        self.assertEqual(graph.deps[('b', 'h1')],
+                         set([('a', 'h1'), ('a', 'h2')]))
+
+    def test_cycles_and_unknown_steps_are_rejected(self):
+        with self.assertRaises(StepGraphError):
+            StepGraph([Step('a', None, requires=['b']),
+                       Step('b', None, requires=['a'])])
+        with self.assertRaises(StepGraphError):
+            StepGraph([Step('a', None, requires=['c'])])
+
+    def test_estimate_follows_the_longest_chain_and_the_locks(self):
+        graph = StepGraph([
+            Step('a', None),
+            Step('b', None, hosts=['h1', 'h2'], requires=['a'],
+                 lock='restart'),
+            Step('c', None, requires=['a']),
+        ])
+        durations = {('a', None): 1, ('b', 'h1'): 2, ('b', 'h2'): 2,
+                     ('c', None): 3}
+        # b runs on one host at a time: 1 + 2 + 2
+        self.assertEqual(graph.estimate(durations), 5)
+        self.assertEqual(graph.estimate({}), 0)
+
+
+class StepGraphRunTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        self.calls = []
+
+    def tearDown(self):
+        db.drop_all()
+        self.ctx.pop()
+
+    def record(self, ctx, host):
+        self.calls.append(host)
+
+    def test_independent_steps_run_in_parallel(self):
+        started = threading.Event()
+
+        def first(ctx, host):
+            return started.wait(5)
+
+        def second(ctx, host):
+            started.set()
+
+        graph = StepGraph([Step('first', first), Step('second', second)])
+        run = graph.run('parallel', None)
+        self.assertEqual(run.status, 'success')
+
+    def test_locked_steps_run_one_at_a_time(self):
+        running = []
+
+        def step(ctx, host):
+            running.append(host)
+            ok = len(running) == 1
+            threading.Event().wait(0.05)
+            running.remove(host)
+            return ok
+
+        graph = StepGraph([Step('restart', step, hosts=['h1', 'h2', 'h3'],
+                                lock='restart')])
+        self.assertEqual(graph.run('locked', None).status, 'success')
+
+    def test_checked_steps_are_skipped(self):
+        graph = StepGraph([Step('a', self.record, hosts=['h1', 'h2'],
+                                check=lambda ctx, host: host == 'h1')])
+        run = graph.run('checked', None)
+        self.assertEqual(self.calls, ['h2'])
+        self.assertEqual(run.steps.filter_by(host='h1').one().status,
+                         'skipped')
+
+    def test_failed_run_is_resumed_after_the_completed_steps(self):
+        fail = [True]
+
+        def flaky(ctx, host):
+            if fail[0]:
+                raise Exception('connection refused')
+
+        graph = StepGraph([
+            Step('prepare', self.record),
+            Step('flaky', flaky, requires=['prepare']),
+            Step('finish', self.record, requires=['flaky']),
+        ])
+        run = graph.run('resume', None)
+        self.assertEqual(run.status, 'failed')
+        self.assertEqual(run.steps.filter_by(step='flaky').one().result,
+                         'connection refused')
+        self.assertFalse(run.completed('finish'))
+
+        fail[0] = False
+        self.calls = []
+        run = graph.run('resume', None)
+        self.assertEqual(run.status, 'success')
+        self.assertEqual(run.resumed_from, DeploymentRun.query.first().id)
+        self.assertEqual(run.steps.filter_by(step='prepare').one().status,
+                         'resumed')
+        # only finish recorded a call, prepare was not run again
+        self.assertEqual(self.calls, [None])
+
+    def test_successful_run_is_not_resumed(self):
+        graph = StepGraph([Step('a', self.record)])
+        graph.run('again', None)
+        graph.run('again', None)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_failed_run_is_not_resumed_with_other_inputs(self):
+        graph = StepGraph([Step('a', self.record),
+                           Step('b', lambda ctx, host: False,
+                                requires=['a'])])
+        graph.run('inputs', None, inputs={'primary': 'h1'})
+        run = graph.run('inputs', None, inputs={'primary': 'h2'})
+        self.assertIsNone(run.resumed_from)
+        self.assertEqual(self.calls, [None, None])
+
+    def test_failed_run_is_not_resumed_for_other_hosts(self):
+        fail = lambda ctx, host: False
+        StepGraph([Step('a', fail, hosts=['h1'])]).run('hosts', None)
+        run = StepGraph([Step('a', fail, hosts=['h2'])]).run('hosts', None)
+        self.assertIsNone(run.resumed_from)
+
+    def test_step_running_too_long_fails_the_run(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        graph = StepGraph([
+            Step('hang', lambda ctx, host: release.wait(5)),
+            Step('after', self.record, requires=['hang']),
+        ])
+        run = graph.run('timeout', None, timeout=0.1)
+        self.assertEqual(run.status, 'failed')
+        self.assertEqual(run.steps.filter_by(step='hang').one().result,
+                         'Timed out after 0.1s')
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import unittest
+
+from mock import patch, Mock
+
+from clustermgr.core import task_locks as task_locks_module
+from clustermgr.core.task_locks import TaskLocks, LockTimeout, \
+    locked_task, argument_host
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, owner, *args):
+        if self.values.get(key) != owner:
+            return 0
+        if script == TaskLocks.release_script:
+            del self.values[key]
+        return 1
+
+
+def make_locks(r):
+    locks = TaskLocks()
+    locks.r = r
+    # no refreshing thread in the tests
+    locks._refresher = os.getpid()
+    return locks
+
+
+class FakeTask(object):
+    name = 'clustermgr.tasks.cluster.installNGINX'
+    locked_hosts = argument_host
+    skip_if_running = False
+
+    def __init__(self, task_id):
+        self.request = Mock(id=task_id)
+
+
+class TaskLocksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.r = FakeRedis()
+        self.locks = make_locks(self.r)
+        # the workers of other processes
+        self.other = make_locks(self.r)
+
+    def test_lock_held_by_another_process_is_not_taken(self):
+        self.assertTrue(self.locks.acquire('host:a', 'task-1'))
+        self.assertFalse(self.other.acquire('host:a', 'task-2'))
+        self.assertEqual(self.other.holder('host:a'), 'task-1')
+
+        self.locks.release('host:a')
+        self.assertTrue(self.other.acquire('host:a', 'task-2'))
+
+    def test_lock_is_shared_within_the_process(self):
+        self.assertTrue(self.locks.acquire('host:a', 'task-1'))
+        self.assertTrue(self.locks.acquire('host:a', 'task-1'))
+        self.locks.release('host:a')
+        self.assertEqual(self.r.get(TaskLocks.prefix + 'host:a'), 'task-1')
+        self.locks.release('host:a')
+        self.assertIsNone(self.r.get(TaskLocks.prefix + 'host:a'))
+
+    def test_expired_lock_taken_by_another_task_is_not_released(self):
+        self.locks.acquire('host:a', 'task-1')
+        self.r.values[TaskLocks.prefix + 'host:a'] = 'task-2'
+        self.locks.release('host:a')
+        self.assertEqual(self.r.get(TaskLocks.prefix + 'host:a'), 'task-2')
+
+    def test_hold_gives_up_after_waiting(self):
+        self.other.acquire('host:b', 'task-2')
+        on_wait = Mock()
+        with self.assertRaises(LockTimeout) as cm:
+            with self.locks.hold(['host:b', 'host:a'], 'task-1', wait=0,
+                                 on_wait=on_wait):
+                pass
+        self.assertEqual(cm.exception.holder, 'task-2')
+        # the lock taken before is released
+        self.assertIsNone(self.r.get(TaskLocks.prefix + 'host:a'))
+
+    def test_hold_releases_the_locks_after_the_block(self):
+        with self.locks.hold(['host:a', 'host:b'], 'task-1'):
+            self.assertFalse(self.other.acquire('host:b', 'task-2'))
+        self.assertEqual(self.r.values, {})
+
+
+class LockedTaskTestCase(unittest.TestCase):
+    def setUp(self):
+        self.r = FakeRedis()
+        self.locks = make_locks(self.r)
+        patcher = patch.object(task_locks_module, 'task_locks', self.locks)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_declared_hosts_are_locked_while_the_task_runs(self):
+        with locked_task(FakeTask('task-1'), ('nginx.example.com',), {}) \
+                as free:
+            self.assertTrue(free)
+            self.assertEqual(self.locks.holder('host:nginx.example.com'),
+                             'task-1')
+        self.assertEqual(self.r.values, {})
+
+    def test_periodic_task_is_skipped_while_running(self):
+        task = FakeTask('task-2')
+        task.locked_hosts = None
+        task.skip_if_running = True
+        make_locks(self.r).acquire('task:' + task.name, 'task-1')
+
+        with locked_task(task, (), {}) as free:
+            self.assertFalse(free)
+        self.assertEqual(self.locks.holder('task:' + task.name), 'task-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import threading
+import unittest
+
+from mock import patch
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import Server, CacheServer
+from clustermgr.tasks.cache import install_cache_cluster
+
+
+STEPS = ('install_cache_server', 'fetch_stunnel_cert',
+         'configure_cache_client', 'restart_gluu_server')
+
+
+class InstallCacheClusterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        for i, name in enumerate(['gluu1', 'gluu2']):
+            db.session.add(Server(hostname=name + '.example.com',
+                                  ip='10.0.0.{0}'.format(i + 1),
+                                  primary_server=(i == 0)))
+        db.session.commit()
+        # the ids of cache servers are assigned from the last stored one,
+        # so they are added one at a time
+        for i, name in enumerate(['cache1', 'cache2']):
+            db.session.add(CacheServer(hostname=name + '.example.com',
+                                       ip='10.0.1.{0}'.format(i + 1),
+                                       stunnel_port=16379,
+                                       redis_password='secret'))
+            db.session.commit()
+
+        self.calls = []
+        self.failing = set()
+        self.lock = threading.Lock()
+        for name in STEPS:
+            patcher = patch('clustermgr.tasks.cache.' + name,
+                            side_effect=self.recorder(name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch('clustermgr.tasks.cache.wlogger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        try:
+            db.session.remove()
+            db.drop_all()
+        finally:
+            self.ctx.pop()
+
+    def recorder(self, name):
+        def record(ctx, host):
+            with self.lock:
+                self.calls.append((name, host))
+                self.step_ctx = ctx
+            if (name, host) in self.failing:
+                return False
+        return record
+
+    def run_task(self):
+        return install_cache_cluster.run(
+            [s.id for s in Server.query.all()],
+            [s.id for s in CacheServer.query.all()])
+
+    def positions(self, name):
+        return [i for i, call in enumerate(self.calls) if call[0] == name]
+
+    def test_gluu_servers_are_configured_after_every_cache_server(self):
+        self.assertTrue(self.run_task())
+
+        installs = self.positions('install_cache_server')
+        fetches = self.positions('fetch_stunnel_cert')
+        configures = self.positions('configure_cache_client')
+        restarts = self.positions('restart_gluu_server')
+        self.assertEqual(len(installs), 2)
+        self.assertEqual(len(fetches), 1)
+        self.assertEqual(len(configures), 2)
+        self.assertEqual(len(restarts), 2)
+        self.assertLess(max(installs), fetches[0])
+        self.assertLess(fetches[0], min(configures))
+        for host in ('gluu1.example.com', 'gluu2.example.com'):
+            self.assertLess(
+                self.calls.index(('configure_cache_client', host)),
+                self.calls.index(('restart_gluu_server', host)))
+
+    def test_first_cache_server_is_the_primary(self):
+        self.run_task()
+
+        ctx = self.step_ctx
+        self.assertEqual(ctx['primary_cache'], 'cache1.example.com')
+        self.assertEqual(ctx['primary_cache_ip'], '10.0.1.1')
+        self.assertEqual(ctx['stunnel_port'], 16379)
+        self.assertEqual(ctx['redis_password'], 'secret')
+
+    def test_failed_cache_server_stops_the_installation(self):
+        self.failing.add(('install_cache_server', 'cache2.example.com'))
+
+        self.assertFalse(self.run_task())
+        self.assertEqual(self.positions('fetch_stunnel_cert'), [])
+        self.assertEqual(self.positions('configure_cache_client'), [])
+
+    def test_no_cache_servers_fails_without_running_steps(self):
+        result = install_cache_cluster.run(
+            [s.id for s in Server.query.all()], [])
+
+        self.assertFalse(result)
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
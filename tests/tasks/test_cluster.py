@@ -0,0 +1,240 @@
+import threading
+import unittest
+
+from mock import patch, MagicMock
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import Server, AppConfiguration
+from clustermgr.core.ldap_functions import ldap_pool
+from clustermgr.core.remote import RemoteCommandError
+from clustermgr.core.step_graph import StepGraph
+from clustermgr.tasks.cluster import setup_filesystem_replication, \
+    wait_for_opendj, run_on_primary, gluu_install_steps, \
+    remove_server_from_cluster, INSTALL_STEPS
+
+
+class SetupFilesystemReplicationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        for i, name in enumerate(['gluu1', 'gluu2', 'gluu3']):
+            db.session.add(Server(hostname=name + '.example.com',
+                                  ip='10.0.0.{0}'.format(i + 1),
+                                  primary_server=(i == 0)))
+        db.session.commit()
+
+        self.calls = []
+        self.failing = set()
+        self.lock = threading.Lock()
+        patcher = patch('clustermgr.tasks.cluster.setup_csync2',
+                        side_effect=self.record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('clustermgr.tasks.cluster.wlogger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.drop_all()
+        self.ctx.pop()
+
+    def record(self, ctx, host):
+        with self.lock:
+            self.calls.append(host)
+            self.step_ctx = ctx
+        if host in self.failing:
+            return False
+
+    def test_primary_is_set_up_before_the_other_servers(self):
+        self.assertTrue(setup_filesystem_replication.run())
+
+        self.assertEqual(self.calls[0], 'gluu1.example.com')
+        self.assertEqual(sorted(self.calls[1:]),
+                         ['gluu2.example.com', 'gluu3.example.com'])
+
+    def test_servers_share_the_csync_hosts_and_stagger_the_cron(self):
+        setup_filesystem_replication.run()
+
+        ctx = self.step_ctx
+        self.assertEqual(ctx['csync_hosts'], [
+            ('csync1.gluu', '10.0.0.1'),
+            ('csync2.gluu', '10.0.0.2'),
+            ('csync3.gluu', '10.0.0.3'),
+        ])
+        self.assertEqual(sorted(ctx['cron_offsets'].values()), [0, 1, 2])
+
+    def test_failed_primary_skips_the_other_servers(self):
+        self.failing.add('gluu1.example.com')
+
+        self.assertFalse(setup_filesystem_replication.run())
+        self.assertEqual(self.calls, ['gluu1.example.com'])
+
+
+class WaitForOpendjTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = MagicMock(hostname='gluu1.example.com', ip='10.0.0.1',
+                                ldap_password='secret')
+        self.conn = MagicMock(bound=True, response=[])
+        for name in ('acquire', 'release'):
+            patcher = patch.object(ldap_pool, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        ldap_pool.acquire.return_value = self.conn
+        patcher = patch('clustermgr.tasks.cluster.wlogger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_without_bases_a_read_of_the_root_dse_is_enough(self):
+        self.conn.search.return_value = True
+
+        self.assertTrue(wait_for_opendj('tid', self.server))
+        self.assertEqual(self.conn.search.call_count, 1)
+        self.assertEqual(self.conn.search.call_args[1]['search_base'], '')
+
+    def test_bases_wait_for_the_replication_domains(self):
+        # a replication server without domains
+        self.conn.search.return_value = True
+
+        self.assertFalse(wait_for_opendj('tid', self.server, ['gluu'],
+                                         timeout=0))
+
+
+class RunOnPrimaryTestCase(unittest.TestCase):
+    def setUp(self):
+        primary = MagicMock(hostname='gluu1.example.com', ip='10.0.0.1',
+                            cmd_run='{}', cmd_chroot=None)
+        self.ctx = {'tid': 'tid', 'primary': primary}
+        patcher = patch('clustermgr.tasks.cluster.RemoteClient')
+        self.client = patcher.start().return_value
+        self.client.host = 'gluu1.example.com'
+        self.addCleanup(patcher.stop)
+        patcher = patch('clustermgr.tasks.cluster.wlogger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_output_is_returned_when_the_command_succeeds(self):
+        self.client.run.return_value = ('', 'output', '')
+        self.client.exit_status = 0
+
+        self.assertEqual(run_on_primary(self.ctx, 'true'), '\noutput')
+        self.client.close.assert_called_once_with()
+
+    def test_failed_command_raises(self):
+        self.client.run.return_value = ('', '', 'Invalid credentials')
+        self.client.exit_status = 1
+
+        with self.assertRaises(RemoteCommandError):
+            run_on_primary(self.ctx, 'false')
+        self.client.close.assert_called_once_with()
+
+    def test_excluded_errors_do_not_fail(self):
+        self.client.run.return_value = (
+            '', '', 'There are no base DNs available to enable replication '
+            'between the two servers.')
+        self.client.exit_status = 1
+
+        run_on_primary(self.ctx, 'dsreplication enable')
+
+class GluuInstallStepsTestCase(unittest.TestCase):
+    def test_steps_of_a_server_run_in_order(self):
+        graph = StepGraph(gluu_install_steps(['gluu1']))
+        self.assertEqual([name for name, host in graph.order],
+                         [name for name, _, _ in INSTALL_STEPS])
+
+    def test_other_servers_wait_for_the_primary(self):
+        graph = StepGraph(
+            gluu_install_steps(['gluu1'], prefix='primary_') +
+            gluu_install_steps(['gluu2', 'gluu3'],
+                               requires_all=['primary_finish_installation']))
+        self.assertEqual(graph.deps[('check_install_requirements', 'gluu2')],
+                         set([('primary_finish_installation', 'gluu1')]))
+        self.assertEqual(graph.deps[('run_setup', 'gluu3')],
+                         set([('upload_setup_files', 'gluu3')]))
+
+
+REMOVAL_STEPS = ('remove_filesystem_replication_step', 'update_proxy_step',
+                 'disable_replication_step', 'reconfigure_csync2_step',
+                 'restart_gluu_step')
+
+
+class RemoveServerFromClusterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add(AppConfiguration(gluu_version='3.1.6',
+                                        nginx_host='nginx.example.com'))
+        for i, name in enumerate(['gluu1', 'gluu2', 'gluu3']):
+            db.session.add(Server(hostname=name + '.example.com',
+                                  ip='10.0.0.{0}'.format(i + 1),
+                                  primary_server=(i == 0), gluu_server=True,
+                                  mmr=True, os='CentOS 7'))
+        db.session.commit()
+
+        self.calls = []
+        self.failing = set()
+        self.lock = threading.Lock()
+        for name in REMOVAL_STEPS:
+            patcher = patch('clustermgr.tasks.cluster.' + name,
+                            side_effect=self.recorder(name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch('clustermgr.tasks.cluster.wlogger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def recorder(self, name):
+        def record(ctx, host):
+            with self.lock:
+                self.calls.append((name, host))
+            if (name, host) in self.failing:
+                return False
+        return record
+
+    def removed_id(self):
+        return Server.query.filter_by(hostname='gluu3.example.com').one().id
+
+    def test_other_servers_are_restarted_before_the_server_is_deleted(self):
+        self.assertTrue(remove_server_from_cluster.run(self.removed_id(),
+                                                       remove_server=True))
+
+        restarted = [host for name, host in self.calls
+                     if name == 'restart_gluu_step']
+        self.assertEqual(sorted(restarted),
+                         ['gluu1.example.com', 'gluu2.example.com'])
+        self.assertIn(('disable_replication_step', 'gluu3.example.com'),
+                      self.calls)
+        self.assertIsNone(Server.query.filter_by(
+                                    hostname='gluu3.example.com').first())
+
+    def test_failed_removal_is_resumed(self):
+        server_id = self.removed_id()
+        self.failing.add(('restart_gluu_step', 'gluu2.example.com'))
+        self.assertFalse(remove_server_from_cluster.run(server_id,
+                                                        remove_server=True))
+        self.assertIsNotNone(Server.query.get(server_id))
+
+        self.failing.clear()
+        self.calls = []
+        self.assertTrue(remove_server_from_cluster.run(server_id,
+                                                       remove_server=True))
+        self.assertEqual(self.calls,
+                         [('restart_gluu_step', 'gluu2.example.com')])
+        self.assertIsNone(Server.query.get(server_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
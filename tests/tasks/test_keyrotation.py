@@ -0,0 +1,81 @@
+import json
+import unittest
+
+from mock import patch, MagicMock
+from ldap3.core.exceptions import LDAPSocketOpenError
+
+from clustermgr.application import create_app
+from clustermgr.extensions import db
+from clustermgr.models import Server
+from clustermgr.core.ldap_functions import ldap_pool
+from clustermgr.tasks.keyrotation import modify_oxauth_config
+
+
+class ModifyOxauthConfigTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app()
+        self.app.config.from_object('clustermgr.config.TestingConfig')
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        db.session.add(Server(hostname='gluu1.example.com', ip='10.0.0.1',
+                              ldap_password='secret'))
+        db.session.add(Server(hostname='gluu2.example.com', ip='10.0.0.2',
+                              ldap_password='secret'))
+        db.session.commit()
+
+        self.kr = MagicMock(interval=48)
+        for target in ('get_props', 'get_app_config'):
+            patcher = patch('clustermgr.tasks.keyrotation.' + target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(ldap_pool, 'release')
+        self.release = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(ldap_pool, 'acquire')
+        self.acquire = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        db.drop_all()
+        self.ctx.pop()
+
+    def entry(self):
+        entry = MagicMock()
+        values = {
+            'oxRevision': ['1'],
+            'oxAuthConfWebKeys': [json.dumps({'keys': []})],
+            'oxAuthConfDynamic': [json.dumps({})],
+        }
+        entry.__getitem__.side_effect = lambda name: MagicMock(
+            values=values[name])
+        return entry
+
+    def test_connection_is_released_after_the_update(self):
+        conn = self.acquire.return_value
+        conn.entries = [self.entry()]
+        conn.result = {'description': 'success'}
+
+        self.assertTrue(modify_oxauth_config(self.kr, [{'kid': 'k1'}]))
+        self.release.assert_called_once_with(conn)
+
+    def test_connection_is_released_when_the_update_fails(self):
+        conn = self.acquire.return_value
+        conn.entries = [self.entry()]
+        conn.modify.side_effect = ValueError('broken entry')
+
+        with self.assertRaises(ValueError):
+            modify_oxauth_config(self.kr, [{'kid': 'k1'}])
+        self.release.assert_called_once_with(conn)
+
+    def test_unreachable_server_is_skipped(self):
+        conn = MagicMock(entries=[self.entry()],
+                         result={'description': 'success'})
+        self.acquire.side_effect = [LDAPSocketOpenError('down'), conn]
+
+        self.assertTrue(modify_oxauth_config(self.kr, [{'kid': 'k1'}]))
+        self.release.assert_called_once_with(conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+from mock import patch, MagicMock
+
+from clustermgr.redis_client import RedisClient
+
+
+class RedisClientTestCase(unittest.TestCase):
+    def app(self, host):
+        return MagicMock(config={'REDIS_HOST': host, 'REDIS_PORT': 6380,
+                                 'REDIS_LOG_DB': 2})
+
+    @patch('clustermgr.redis_client.redis.Redis')
+    def test_client_is_created_on_first_use(self, mockredis):
+        client = RedisClient()
+        client.init_app(self.app('redis.example.com'))
+        mockredis.assert_not_called()
+
+        client.get('key')
+        client.get('other')
+        mockredis.assert_called_once_with(host='redis.example.com',
+                                          port=6380, db=2)
+        self.assertEqual(mockredis.return_value.get.call_count, 2)
+
+    @patch('clustermgr.redis_client.redis.Redis')
+    def test_init_app_replaces_the_client(self, mockredis):
+        client = RedisClient()
+        client.get('key')
+        old = mockredis.return_value
+
+        client.init_app(self.app('redis.example.com'))
+        old.connection_pool.disconnect.assert_called_once()
+        client.get('key')
+        mockredis.assert_called_with(host='redis.example.com', port=6380,
+                                     db=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 import unittest
 import json
+import gzip
+import os
+import shutil
+import tempfile
 
 from mock import patch, MagicMock
 
@@ -36,23 +40,120 @@ class WebLoggerTestCase(unittest.TestCase):
         assert json.loads(self.r.rpush.call_args[0][1])['run'] == 1
 
     def test_get_message_returns_empty_list_for_no_messages(self):
-        self.r.lrange.return_value = None
+        self.r.register_script.return_value.return_value = [0, []]
         assert self.wlog.get_messages('non existent id') == []
 
     def test_get_message_returns_list_of_messages(self):
         message = [json.dumps(dict(level="info", msg="test message"))]
-        self.r.lrange.return_value = message
+        self.r.register_script.return_value.return_value = [0, message]
         assert len(self.wlog.get_messages('test id')) == 1
         assert self.wlog.get_messages('test id') == [dict(level="info", msg="test message")]
 
+    def test_get_message_reads_from_the_given_index(self):
+        read = self.r.register_script.return_value
+        read.return_value = [0, [json.dumps(dict(level="info", msg="new"))]]
+        assert self.wlog.get_messages('test id', 5) == [dict(level="info", msg="new")]
+        read.assert_called_with(
+            keys=['weblogger:test id', 'weblogger:test id:trimmed'],
+            args=[5, -1])
+
     def test_clean_deletes_all_messages(self):
         self.wlog.clean('test-id')
-        self.r.delete.assert_called_with('weblogger:test-id')
+        self.r.delete.assert_called_with('weblogger:test-id',
+                                         'weblogger:test-id:meta',
+                                         'weblogger:test-id:trimmed')
 
     def test_set_meta(self):
         self.wlog.set_meta('dummy_id', total_tasks=10)
-        assert self.r.set.call_args[0][0] == 'weblogger:dummy_id:meta:total_tasks'
+        pipe = self.r.pipeline.return_value
+        pipe.hmset.assert_called_with('weblogger:dummy_id:meta',
+                                      {'total_tasks': 10})
+        pipe.expire.assert_called_with('weblogger:dummy_id:meta', 86400)
+
+    def test_get_all_meta_reads_the_meta_hash(self):
+        self.r.hgetall.return_value = {'total_tasks': '10'}
+        assert self.wlog.get_all_meta('dummy_id') == {'total_tasks': '10'}
+        self.r.hgetall.assert_called_with('weblogger:dummy_id:meta')
+        self.r.keys.assert_not_called()
+
+    def test_migrate_meta_moves_string_keys_into_hash(self):
+        self.r.scan_iter.return_value = ['weblogger:dummy_id:meta:total_tasks']
+        self.r.get.return_value = '10'
+        assert self.wlog.migrate_meta() == 1
+        pipe = self.r.pipeline.return_value
+        pipe.hsetnx.assert_called_with('weblogger:dummy_id:meta',
+                                       'total_tasks', '10')
+        pipe.delete.assert_called_with('weblogger:dummy_id:meta:total_tasks')
+
+    def test_buffered_log_does_not_write_until_flushed(self):
+        self.wlog.flush_interval = 60
+        with self.wlog.buffered('id1'):
+            self.wlog.log('id1', 'message 1')
+            self.wlog.log('id1', 'message 2')
+            self.r.rpush.assert_not_called()
+            self.r.pipeline.assert_not_called()
+        pipe = self.r.pipeline.return_value
+        assert pipe.rpush.call_args[0][0] == 'weblogger:id1'
+        assert len(pipe.rpush.call_args[0][1:]) == 2
+        pipe.expire.assert_called_once_with('weblogger:id1', 86400)
+        pipe.execute.assert_called_once()
+
+    def test_buffered_log_flushes_on_buffer_size(self):
+        self.wlog.flush_interval = 60
+        self.wlog.buffer_size = 2
+        with self.wlog.buffered('id1'):
+            for i in range(4):
+                self.wlog.log('id1', 'message {}'.format(i))
+            pipe = self.r.pipeline.return_value
+            assert pipe.execute.call_count == 2
+            # expiry is set once per key
+            pipe.expire.assert_called_once_with('weblogger:id1', 86400)
+
+    def test_get_messages_reads_spilled_messages_from_file(self):
+        self.wlog.max_messages = 10
+        self.wlog.spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.wlog.spill_dir)
+        with gzip.open(os.path.join(self.wlog.spill_dir, 'id1.log.gz'), 'wb') as f:
+            for msg in ['message 0', 'message 1']:
+                f.write(json.dumps(dict(level="info", msg=msg)) + "\n")
+        read = self.r.register_script.return_value
+        read.return_value = [2, [json.dumps(dict(level="info", msg="message 2"))]]
+
+        messages = self.wlog.get_messages('id1', 1)
+        assert [m['msg'] for m in messages] == ['message 1', 'message 2']
+
+    def test_get_messages_reads_only_the_spilled_part_from_file(self):
+        self.wlog.max_messages = 10
+        self.wlog.spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.wlog.spill_dir)
+        # the file already holds a later spill, whose messages the read
+        # script returned from redis
+        with gzip.open(os.path.join(self.wlog.spill_dir, 'id1.log.gz'), 'wb') as f:
+            for i in range(4):
+                f.write(json.dumps(dict(level="info", msg="message {}".format(i))) + "\n")
+        read = self.r.register_script.return_value
+        read.return_value = [2, [json.dumps(dict(level="info", msg="message 2"))]]
+
+        messages = self.wlog.get_messages('id1', 0, 3)
+        assert [m['msg'] for m in messages] == ['message 0', 'message 1', 'message 2']
+        read.assert_called_with(
+            keys=['weblogger:id1', 'weblogger:id1:trimmed'], args=[0, 3])
+
+    def test_count_messages_includes_spilled_messages(self):
+        self.r.pipeline.return_value.execute.return_value = ['20', 5]
+        assert self.wlog.count_messages('id1') == 25
+
+    def test_log_spills_once_when_another_thread_spilled_first(self):
+        self.wlog.max_messages = 10
+        self.wlog.spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.wlog.spill_dir)
+        self.r.rpush.return_value = 11
+        # the list was already trimmed by the time the lock was taken
+        self.r.llen.return_value = 6
 
+        self.wlog.log('id1', 'message')
+        self.r.lrange.assert_not_called()
+        self.r.pipeline.return_value.ltrim.assert_not_called()
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -89,13 +89,15 @@ class IndexViewTestCase(unittest.TestCase):
 
     @patch('clustermgr.views.index.wlogger')
     @patch('clustermgr.views.index.AsyncResult')
-    def test_get_log_cleans_messages_when_task_completes(self, mockresult, mocklogger):
+    def test_get_log_expires_messages_when_task_completes(self, mockresult, mocklogger):
         instance = mockresult.return_value
         instance.state = 'SUCCESS'
         instance.result = 5
         mocklogger.get_messages.return_value = [{'level': 'info', 'msg': 'message 1'}]
+        mocklogger.count_messages.return_value = 1
         self.client.get('/log/test-id')
-        mocklogger.clean.assert_called_once()
+        mocklogger.clean_later.assert_called_once_with('test-id', 3600)
+        mocklogger.clean.assert_not_called()
 
 
     @patch('clustermgr.views.index.wlogger')
@@ -104,6 +106,7 @@ class IndexViewTestCase(unittest.TestCase):
         instance = mockresult.return_value
         instance.state = 'PENDING'
         mocklogger.get_messages.return_value = [{'level': 'info', 'msg': 'message 1'}]
+        mocklogger.count_messages.return_value = 1
         rv = self.client.get('/log/test-id')
         assert json.loads(rv.data)['result'] == 0
 
@@ -113,6 +116,58 @@ class IndexViewTestCase(unittest.TestCase):
         rv = self.client.get('/log/test-id')
         self.assertEqual(json.loads(rv.data)['result'], 'TASK RESULT')
 
+    @patch('clustermgr.views.index.wlogger')
+    @patch('clustermgr.views.index.AsyncResult')
+    def test_get_log_returns_only_messages_after_since(self, mockresult, mocklogger):
+        instance = mockresult.return_value
+        instance.state = 'PENDING'
+        mocklogger.get_messages.return_value = [{'level': 'info', 'msg': 'message 4'}]
+        mocklogger.count_messages.return_value = 10
+        rv = self.client.get('/log/test-id?since=3')
+        mocklogger.get_messages.assert_called_with('test-id', 3, None)
+        data = json.loads(rv.data)
+        self.assertEqual(data['since'], 3)
+        self.assertEqual(data['next'], 4)
+        self.assertEqual(data['total'], 10)
+
+    @patch('clustermgr.views.index.wlogger')
+    def test_task_log_shows_the_last_page_by_default(self, mocklogger):
+        mocklogger.count_messages.return_value = 250
+        mocklogger.get_messages.return_value = [{'level': 'info', 'msg': 'message 201'}]
+        rv = self.client.get('/log/test-id/pages/')
+        mocklogger.get_messages.assert_called_with('test-id', 200, 100)
+        self.assertIn('message 201', rv.data)
+        self.assertIn('Previous', rv.data)
+
+    @patch('clustermgr.views.index.wlogger')
+    def test_task_log_keeps_the_page_in_range(self, mocklogger):
+        mocklogger.count_messages.return_value = 0
+        mocklogger.get_messages.return_value = []
+        rv = self.client.get('/log/test-id/pages/?page=7')
+        mocklogger.get_messages.assert_called_with('test-id', 0, 100)
+        self.assertIn('has expired', rv.data)
+
+    @patch('clustermgr.views.index.wlogger')
+    @patch('clustermgr.views.index.AsyncResult')
+    def test_stream_log_sends_messages_as_events(self, mockresult, mocklogger):
+        instance = mockresult.return_value
+        instance.state = 'SUCCESS'
+        instance.result = True
+        mocklogger.get_messages.return_value = [{'level': 'info', 'msg': 'message 1'}]
+        mocklogger.count_messages.return_value = 1
+        rv = self.client.get('/log/test-id/stream')
+        self.assertEqual(rv.mimetype, 'text/event-stream')
+        self.assertIn('data: ', rv.data)
+        self.assertIn('message 1', rv.data)
+        mocklogger.subscribe.return_value.close.assert_called_once()
+
+    @patch('clustermgr.views.index.wlogger')
+    def test_stream_log_is_empty_when_streams_are_off(self, mocklogger):
+        self.app.config['TASK_LOG_STREAM'] = False
+        rv = self.client.get('/log/test-id/stream')
+        self.assertEqual(rv.status_code, 204)
+        mocklogger.subscribe.assert_not_called()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import unittest
 import json
 
@@ -159,6 +162,20 @@ class ServerViewTestCase(unittest.TestCase):
         self.client.get("/server/remove/1/")
         mocktask.delay.assert_called_once_with(1)
 
+    def test_ldif_import_lists_interrupted_imports(self):
+        ldif_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, ldif_dir)
+        self.app.config['LDIF_DIR'] = ldif_dir
+        for name in ('people.ldif', 'people.ldif.checkpoint', 'groups.ldif'):
+            open(os.path.join(ldif_dir, name), 'w').close()
+        with self.app.app_context():
+            db.session.add(Server(hostname='server.example.com', ip='1.1.1.1'))
+            db.session.commit()
+
+        rv = self.client.get('/server/ldif/import/1/')
+        self.assertIn('resume=people.ldif', rv.data)
+        self.assertNotIn('resume=groups.ldif', rv.data)
+
 
 if __name__ == '__main__':
     unittest.main()